@@ -1,9 +1,18 @@
+import hashlib
 import os
 from typing import Any, Dict, Optional
-import requests
 
 class CNPJAClientError(Exception):
-    """Erro ao consultar a API PRO do CNPJÁ."""
+    """Erro ao consultar a API PRO do CNPJÁ; `status` é o HTTP da resposta, quando houve."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def id_chave(api_key: str) -> str:
+    """Identificador curto e estável de uma chave (para logs e métricas, sem expô-la)."""
+    return hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:8]
 
 class CNPJAClient:
     def __init__(self, api_key: str | None = None, base_url: str | None = None):
@@ -11,6 +20,12 @@ class CNPJAClient:
         if not self.api_key:
             raise CNPJAClientError("CNPJA_API_KEY não configurada no ambiente.")
         self.base_url = (base_url or os.getenv("CNPJA_BASE_URL") or "https://api.cnpja.com").rstrip("/")
+        # Cabeçalhos da última resposta de get_office (ex.: custo em créditos, quando informado)
+        self.last_headers: Dict[str, str] = {}
+
+    @property
+    def chave_id(self) -> str:
+        return id_chave(self.api_key)
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -38,10 +53,41 @@ class CNPJAClient:
             params["maxAge"] = max_age_days
         if max_stale_days is not None:
             params["maxStale"] = max_stale_days
+        import requests  # importado no primeiro uso (boot mais rápido)
+
+        resp = requests.get(url, headers=self._headers(), params=params, timeout=timeout)
+        self.last_headers = dict(resp.headers)
+        if resp.status_code != 200:
+            detail = resp.text[:500]
+            raise CNPJAClientError(f"Erro {resp.status_code} ao consultar CNPJ {cnpj}: {detail}", status=resp.status_code)
+        return resp.json()
+
+    def search_offices(
+        self,
+        company_id: str,
+        limit: int = 100,
+        token: Optional[str] = None,
+        timeout: int = 30,
+    ) -> Dict[str, Any]:
+        """Pesquisa os estabelecimentos (matriz e filiais) de uma empresa pela raiz do CNPJ.
+
+        Uma página da pesquisa `/office` filtrada por `company.id.in`: `records` com os
+        estabelecimentos e `next` com o token da próxima página (ausente na última).
+        """
+        company_id = "".join(filter(str.isdigit, company_id))
+        if len(company_id) != 8:
+            raise CNPJAClientError("Raiz de CNPJ inválida. Deve conter 8 dígitos.")
+        params: Dict[str, Any] = {"company.id.in": company_id, "limit": limit}
+        if token:
+            params["token"] = token
+        import requests
+
+        url = f"{self.base_url}/office"
         resp = requests.get(url, headers=self._headers(), params=params, timeout=timeout)
+        self.last_headers = dict(resp.headers)
         if resp.status_code != 200:
             detail = resp.text[:500]
-            raise CNPJAClientError(f"Erro {resp.status_code} ao consultar CNPJ {cnpj}: {detail}")
+            raise CNPJAClientError(f"Erro {resp.status_code} ao pesquisar a raiz {company_id}: {detail}", status=resp.status_code)
         return resp.json()
 
     def get_credits(self, timeout: int = 15) -> Dict[str, Any]:
@@ -49,9 +95,11 @@ class CNPJAClient:
 
         Retorna o JSON original da API. Levanta CNPJAClientError em caso de erro.
         """
+        import requests
+
         url = f"{self.base_url}/credit"
         resp = requests.get(url, headers=self._headers(), timeout=timeout)
         if resp.status_code != 200:
             detail = resp.text[:500]
-            raise CNPJAClientError(f"Erro {resp.status_code} ao obter créditos: {detail}")
+            raise CNPJAClientError(f"Erro {resp.status_code} ao obter créditos: {detail}", status=resp.status_code)
         return resp.json()
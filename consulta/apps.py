@@ -6,3 +6,8 @@ from django.apps import AppConfig
 class ConsultaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'consulta'
+
+    def ready(self):
+        # Com vários workers, cache/sessões locais quebram rate limit, créditos e jobs
+        from .checks import recusar_configuracao_insegura
+        recusar_configuracao_insegura()
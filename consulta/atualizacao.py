@@ -0,0 +1,205 @@
+"""Atualização em background de CNPJs perto de vencer o `CNPJA_MAX_AGE_DAYS`.
+
+Com a estratégia `CACHE_IF_FRESH`, um CNPJ cujo dado no CNPJÁ passou de `maxAge` dias é
+buscado de novo na Receita durante a consulta do usuário (lento e mais caro). Aqui os
+CNPJs consultados nos últimos `CNPJ_REFRESH_JANELA_DIAS` dias cujo dado mais recente
+(`updated` do JSON, extraído na coluna `atualizado`) está a menos de `CNPJ_REFRESH_ANTECEDENCIA_DIAS` dias de vencer são
+renovados antes, fora do horário de pico:
+
+- a chamada usa `CACHE_IF_FRESH` com `maxAge` reduzido pela antecedência, então só os
+  dados realmente velhos são buscados na Receita;
+- o resultado alimenta o cache compartilhado por CNPJ, como qualquer consulta;
+- as consultas usam o fluxo próprio `refresh` do rate limit (peso `CNPJ_REFRESH_PESO`) e
+  no máximo `CNPJ_REFRESH_FRACAO` do limite por minuto, sobrando o resto para usuários;
+- só roda no horário `CNPJ_REFRESH_HORARIO` (hora local) e um processo por vez (trava no cache).
+
+Usado pelo comando `atualizar_cnpjs` (Heroku Scheduler/cron ou processo `refresher`).
+"""
+import logging
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clients.cnpja import CNPJAClientError
+from .chaves import cliente, disponiveis, pausar_se_bloqueada
+from .models import ConsultaHistorico, ConsultaResultado
+from .services import (
+    RATE_LIMIT_WINDOW, _office_cache_key, clean_cnpj, custo_consulta, limite_janela,
+    registrar_consumo_creditos, reservar_slot_api, salvar_office_cache, slots_usados_fluxo,
+)
+
+logger = logging.getLogger('consulta.refresh')
+
+FLUXO_REFRESH = 'refresh'
+REFRESH_LOCK_KEY = 'cnpj:refresh:lock'
+REFRESH_LOCK_TTL = 600
+
+
+def _marca_key(cnpj):
+    return f"cnpj:refresh:v1:{cnpj}"
+
+
+def _max_age_renovacao():
+    """`maxAge` (dias) usado na renovação: o do settings menos a antecedência."""
+    return max(1, settings.CNPJA_MAX_AGE_DAYS - settings.CNPJ_REFRESH_ANTECEDENCIA_DIAS)
+
+
+def _data_atualizacao(valor):
+    """`updated` do JSON do CNPJÁ como datetime com fuso, ou None."""
+    if not isinstance(valor, str):
+        return None
+    try:
+        quando = parse_datetime(valor)
+    except ValueError:
+        return None
+    if quando is not None and timezone.is_naive(quando):
+        quando = timezone.make_aware(quando, dt_timezone.utc)
+    return quando
+
+
+def em_horario(agora=None):
+    """True se a hora local está dentro de `CNPJ_REFRESH_HORARIO` ('22-6'; vazio = sempre)."""
+    faixa = (settings.CNPJ_REFRESH_HORARIO or '').strip()
+    if not faixa:
+        return True
+    try:
+        inicio, fim = (int(h) % 24 for h in faixa.split('-', 1))
+    except ValueError:
+        logger.warning('CNPJ_REFRESH_HORARIO inválido (%r); ignorando o horário', faixa)
+        return True
+    hora = timezone.localtime(agora).hour
+    if inicio <= fim:
+        return inicio <= hora < fim
+    return hora >= inicio or hora < fim
+
+
+def cnpjs_vencendo(agora=None):
+    """[(cnpj, atualizado_em)] a renovar, do dado mais antigo para o mais novo.
+
+    Considera o snapshot mais recente de cada CNPJ nos resultados gravados (e no JSON dos
+    registros antigos); CNPJs cujo dado no cache compartilhado já é novo, ou que já foram
+    renovados (marca no cache), ficam de fora.
+    """
+    agora = agora or timezone.now()
+    limiar = agora - timedelta(days=_max_age_renovacao())
+    desde = agora - timedelta(days=settings.CNPJ_REFRESH_JANELA_DIAS)
+    mais_recente = {}
+
+    def _registrar(cnpj, quando):
+        if cnpj and (cnpj not in mais_recente or quando > mais_recente[cnpj]):
+            mais_recente[cnpj] = quando
+
+    linhas = (
+        ConsultaResultado.objects.filter(ConsultaResultado.com_detalhes(), historico__data__gte=desde, historico__status='concluido')
+        .values_list('cnpj', 'atualizado', 'historico__data')
+    )
+    # `updated` vem da coluna extraída, sem abrir o `detalhes` de cada linha
+    for cnpj, atualizado, consultado in linhas.iterator(chunk_size=2000):
+        _registrar(cnpj, atualizado or consultado)
+    # Registros antigos, com os resultados em JSON
+    antigos = ConsultaHistorico.objects.filter(data__gte=desde).exclude(resultado=[]).values_list('resultado', 'data')
+    for resultado, consultado in antigos.iterator(chunk_size=200):
+        for r in resultado if isinstance(resultado, list) else []:
+            if isinstance(r, dict) and isinstance(r.get('detalhes'), dict):
+                _registrar(clean_cnpj(r.get('cnpj')), _data_atualizacao(r['detalhes'].get('updated')) or consultado)
+
+    vencendo = {c: q for c, q in mais_recente.items() if q <= limiar}
+    cnpjs = list(vencendo)
+    for i in range(0, len(cnpjs), 1000):
+        bloco = cnpjs[i:i + 1000]
+        try:
+            marcas = cache.get_many([_marca_key(c) for c in bloco])
+            offices = cache.get_many([_office_cache_key(c) for c in bloco])
+        except Exception:
+            continue
+        for c in bloco:
+            if _marca_key(c) in marcas:
+                vencendo.pop(c, None)
+                continue
+            data = offices.get(_office_cache_key(c))
+            quando = _data_atualizacao(data.get('updated')) if isinstance(data, dict) else None
+            if quando and quando > limiar:
+                vencendo.pop(c, None)
+    return sorted(vencendo.items(), key=lambda par: par[1])
+
+
+def atualizar_cnpj(cnpj, client=None):
+    """Renova um CNPJ no CNPJÁ (slot do fluxo `refresh`) e no cache compartilhado.
+
+    Sem `client`, usa a chave reservada junto com o slot.
+    """
+    chave = reservar_slot_api(fluxo=FLUXO_REFRESH, peso=settings.CNPJ_REFRESH_PESO)
+    client = client or cliente(chave)
+    max_age = _max_age_renovacao()
+    try:
+        data = client.get_office(
+            cnpj,
+            timeout=30,
+            strategy='CACHE_IF_FRESH',
+            max_age_days=max_age,
+            max_stale_days=settings.CNPJA_MAX_STALE_DAYS,
+        )
+    except CNPJAClientError as e:
+        pausar_se_bloqueada(client.chave_id, e)
+        raise
+    registrar_consumo_creditos(custo_consulta('CACHE_IF_FRESH', client.last_headers), client.chave_id)
+    salvar_office_cache(cnpj, data)
+    # Marca até o novo dado voltar a vencer (mínimo 1 dia, caso o CNPJÁ devolva dado velho)
+    agora = timezone.now()
+    quando = _data_atualizacao(data.get('updated')) or agora
+    validade = int((quando + timedelta(days=max_age) - agora).total_seconds())
+    cache.set(_marca_key(cnpj), quando.isoformat(), max(86400, validade))
+    return data
+
+
+def _aguardar_cota(cota):
+    """Espera a próxima janela do rate limit enquanto o fluxo `refresh` já usou sua fração."""
+    while slots_usados_fluxo(FLUXO_REFRESH) >= cota:
+        time.sleep(RATE_LIMIT_WINDOW - (time.time() % RATE_LIMIT_WINDOW) + 0.01)
+
+
+def executar_atualizacao(limite=None, ignorar_horario=False):
+    """Uma passada de renovação. Retorna um resumo com `status` e contagens."""
+    resumo = {'status': 'ok', 'candidatos': 0, 'atualizados': 0, 'erros': 0}
+    cota = int(limite_janela() * settings.CNPJ_REFRESH_FRACAO)
+    if cota <= 0:
+        return {**resumo, 'status': 'desligado'}
+    if not ignorar_horario and not em_horario():
+        return {**resumo, 'status': 'fora_do_horario'}
+    if not cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TTL):
+        return {**resumo, 'status': 'ocupado'}
+    import requests  # importado no primeiro uso (boot mais rápido)
+
+    try:
+        candidatos = cnpjs_vencendo()
+        limite = settings.CNPJ_REFRESH_MAX_POR_EXECUCAO if limite is None else limite
+        candidatos = candidatos[:limite] if limite > 0 else candidatos
+        resumo['candidatos'] = len(candidatos)
+        if not candidatos:
+            return resumo
+        for cnpj, _ in candidatos:
+            if not ignorar_horario and not em_horario():
+                resumo['status'] = 'fora_do_horario'
+                break
+            _aguardar_cota(cota)
+            cache.set(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TTL)
+            try:
+                atualizar_cnpj(cnpj)
+                resumo['atualizados'] += 1
+            except CNPJAClientError as e:
+                resumo['erros'] += 1
+                logger.warning('Falha ao renovar CNPJ %s: %s', cnpj, e)
+                if '429' in str(e) and not disponiveis():
+                    # Todas as chaves no limite: deixa o orçamento para os usuários
+                    resumo['status'] = 'limite_api'
+                    break
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                resumo['erros'] += 1
+                logger.warning('Timeout/conexão ao renovar CNPJ %s: %s', cnpj, e)
+        return resumo
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
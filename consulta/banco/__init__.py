@@ -0,0 +1,9 @@
+"""Backend PostgreSQL com pool de conexões (`ENGINE = 'consulta.banco'`).
+
+O Django 4.2 não tem pool próprio: com `CONN_MAX_AGE` cada thread guarda a sua conexão,
+e no ASGI cada requisição roda numa thread nova, o que multiplica conexões abertas. Aqui
+a conexão sai de um pool do processo no primeiro acesso ao banco da requisição e volta
+a ele no fim (`CONN_MAX_AGE = 0`). Opcional (`DB_POOL=True`); configuração em
+`DATABASES['default']['POOL']` (montada em settings a partir de `DB_POOL_*`); métricas
+em `pool.metricas_pools()`.
+"""
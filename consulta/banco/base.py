@@ -0,0 +1,81 @@
+"""DatabaseWrapper do PostgreSQL que pega e devolve conexões de `PoolConexoes`."""
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as CriacaoPostgres
+
+from .pool import PoolEsgotado, pool_para, pools
+
+# Status de transação da libpq (iguais no psycopg2 e no psycopg 3)
+_OCIOSA, _DESCONHECIDO = 0, 4
+
+
+def _validar(conexao):
+    with conexao.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def _reiniciar(conexao):
+    """Deixa a conexão pronta para o próximo uso; False se ela deve ser descartada."""
+    if conexao.closed:
+        return False
+    status = int(conexao.info.transaction_status)
+    if status == _DESCONHECIDO:
+        return False
+    if status != _OCIOSA:
+        conexao.rollback()
+    return True
+
+
+def _fechar(conexao):
+    if not conexao.closed:
+        conexao.close()
+
+
+class DatabaseCreation(CriacaoPostgres):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # DROP DATABASE falha com conexões abertas: fecha as ociosas do pool antes
+        for pool in pools().values():
+            pool.fechar_ociosas()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool_atual = None
+
+    def _pool(self):
+        opcoes = self.settings_dict.get('POOL') or {}
+        d = self.settings_dict
+        chave = (self.alias, d.get('NAME'), d.get('HOST'), d.get('PORT'), d.get('USER'))
+        return pool_para(
+            chave, nome=self.alias, validar=_validar, reiniciar=_reiniciar, fechar=_fechar,
+            maximo=opcoes.get('MAXIMO', 10), espera=opcoes.get('ESPERA', 10),
+            vida_maxima=opcoes.get('VIDA_MAXIMA', 1800), checar_apos=opcoes.get('CHECAR_APOS', 30),
+        )
+
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)  # criação/remoção do banco de testes
+        pool = self._pool()
+        try:
+            conexao = pool.obter(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolEsgotado as e:
+            raise self.Database.OperationalError(str(e)) from e
+        # O super() define o nível de isolamento ao abrir; conexões reaproveitadas também precisam
+        nivel = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = base.IsolationLevel(nivel) if nivel is not None else base.IsolationLevel.READ_COMMITTED
+        self._pool_atual = pool
+        return conexao
+
+    def _close(self):
+        pool, self._pool_atual = self._pool_atual, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Fechada dentro de um atomic(), a conexão continua referenciada até o rollback:
+            # não pode voltar ao pool para outra thread
+            pool.devolver(self.connection, descartar=self.in_atomic_block)
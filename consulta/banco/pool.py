@@ -0,0 +1,220 @@
+"""Pool de conexões por processo, compartilhado entre as threads do worker.
+
+Independente do driver: quem cria, valida, reinicia e fecha conexões são as funções
+passadas pelo backend (`consulta.banco.base`). Regras:
+
+- no máximo `maximo` conexões abertas; quem pede além disso espera até `espera` segundos
+  e recebe `PoolEsgotado` se nenhuma voltar;
+- conexões ociosas há mais de `checar_apos` segundos são testadas (`validar`) antes de
+  sair do pool; as que falham são descartadas e substituídas (health check);
+- conexões com mais de `vida_maxima` segundos são fechadas ao sair ou voltar ao pool
+  (reciclagem);
+- na devolução, `reiniciar` desfaz transações abertas; se a conexão não serve mais,
+  é descartada;
+- conexões de threads que terminaram sem devolver (ex.: thread de requisição ASGI
+  encerrada) são recuperadas quando o pool esgota.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão livre dentro do tempo de espera."""
+
+
+class _Entrada:
+    __slots__ = ('conexao', 'criada_em', 'usada_em', 'dono')
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = self.usada_em = time.monotonic()
+        self.dono = None
+
+
+class PoolConexoes:
+    def __init__(self, validar, reiniciar, fechar, maximo=10, espera=10.0,
+                 vida_maxima=1800.0, checar_apos=30.0, nome='default'):
+        self.validar = validar
+        self.reiniciar = reiniciar
+        self.fechar = fechar
+        self.maximo = max(1, maximo)
+        self.espera = espera
+        self.vida_maxima = vida_maxima
+        self.checar_apos = checar_apos
+        self.nome = nome
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._ociosas = deque()
+        self._em_uso = {}  # id(conexao) -> _Entrada
+        self._reservadas = 0
+        self._contadores = dict.fromkeys((
+            'checkouts', 'criadas', 'descartadas', 'recicladas', 'falhas_checagem',
+            'esperas', 'esgotamentos', 'recuperadas',
+        ), 0)
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+    # --------------------------------------------------------------- uso
+
+    def obter(self, criar):
+        """Conexão do pool; `criar()` abre uma nova quando não há ociosa e cabe no limite."""
+        inicio = time.monotonic()
+        esperou = False
+        while True:
+            with self._cond:
+                while True:
+                    if self._ociosas:
+                        entrada = self._ociosas.pop()  # LIFO: a mais quente primeiro
+                        break
+                    if self._abertas() < self.maximo:
+                        entrada = None
+                        break
+                    if self._recuperar_orfas():
+                        continue
+                    if not esperou:
+                        esperou = True
+                        self._contadores['esperas'] += 1
+                    restante = self.espera - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self._contadores['esgotamentos'] += 1
+                        raise PoolEsgotado(
+                            f'Pool de conexões "{self.nome}" esgotado: {self.maximo} em uso após {self.espera:g}s de espera'
+                        )
+                    self._cond.wait(restante)
+                self._reservadas += 1  # a vaga fica reservada durante a checagem/abertura
+            # Checagem e connect fora da trava (podem levar dezenas de ms)
+            try:
+                if entrada is None:
+                    entrada = _Entrada(criar())
+                    self._contar('criadas')
+                elif not self._utilizavel(entrada):
+                    entrada = None
+            finally:
+                with self._cond:
+                    self._reservadas -= 1
+                    if entrada is None:
+                        self._cond.notify()
+            if entrada is not None:
+                break
+        with self._cond:
+            if esperou:
+                duracao = time.monotonic() - inicio
+                self._espera_total += duracao
+                self._espera_max = max(self._espera_max, duracao)
+            entrada.dono = weakref.ref(threading.current_thread())
+            entrada.usada_em = time.monotonic()
+            self._em_uso[id(entrada.conexao)] = entrada
+            self._contadores['checkouts'] += 1
+        return entrada.conexao
+
+    def devolver(self, conexao, descartar=False):
+        """Devolve uma conexão obtida com `obter` (ou a fecha, com `descartar`)."""
+        with self._cond:
+            entrada = self._em_uso.pop(id(conexao), None)
+        if entrada is None:
+            self._fechar(conexao)  # não é do pool (ex.: aberta antes de um fork)
+            return
+        agora = time.monotonic()
+        reciclar = self.vida_maxima and agora - entrada.criada_em > self.vida_maxima
+        try:
+            utilizavel = not descartar and not reciclar and self.reiniciar(conexao)
+        except Exception:
+            utilizavel = False
+        with self._cond:
+            if utilizavel:
+                entrada.dono = None
+                entrada.usada_em = agora
+                self._ociosas.append(entrada)
+            else:
+                self._contadores['recicladas' if reciclar else 'descartadas'] += 1
+            self._cond.notify()
+        if not utilizavel:
+            self._fechar(conexao)
+
+    def fechar_ociosas(self):
+        """Fecha as conexões ociosas (ex.: antes de apagar o banco de testes)."""
+        with self._cond:
+            ociosas, self._ociosas = list(self._ociosas), deque()
+        for entrada in ociosas:
+            self._fechar(entrada.conexao)
+
+    def metricas(self):
+        with self._cond:
+            em_uso = len(self._em_uso)
+            ociosas = len(self._ociosas)
+            return {
+                'abertas': self._abertas(),
+                'em_uso': em_uso,
+                'ociosas': ociosas,
+                'maximo': self.maximo,
+                **self._contadores,
+                'espera_media_ms': round(self._espera_total / self._contadores['esperas'] * 1000, 1) if self._contadores['esperas'] else 0.0,
+                'espera_max_ms': round(self._espera_max * 1000, 1),
+            }
+
+    # ----------------------------------------------------------- interno
+
+    def _abertas(self):
+        return len(self._em_uso) + len(self._ociosas) + self._reservadas
+
+    def _utilizavel(self, entrada):
+        """Recicla conexões velhas e testa as ociosas há mais de `checar_apos` (health check)."""
+        agora = time.monotonic()
+        if self.vida_maxima and agora - entrada.criada_em > self.vida_maxima:
+            self._contar('recicladas')
+        elif self.checar_apos is None or agora - entrada.usada_em < self.checar_apos:
+            return True
+        else:
+            try:
+                if self.validar(entrada.conexao):
+                    return True
+            except Exception:
+                pass
+            self._contar('falhas_checagem')
+        self._fechar(entrada.conexao)
+        return False
+
+    def _contar(self, contador):
+        with self._cond:
+            self._contadores[contador] += 1
+
+    def _recuperar_orfas(self):
+        """Libera vagas de conexões cujas threads terminaram sem devolver. Chamar com a trava."""
+        orfas = [k for k, e in self._em_uso.items() if e.dono is not None and (e.dono() is None or not e.dono().is_alive())]
+        for chave in orfas:
+            entrada = self._em_uso.pop(chave)
+            self._contadores['recuperadas'] += 1
+            self._fechar(entrada.conexao)
+        return bool(orfas)
+
+    def _fechar(self, conexao):
+        try:
+            self.fechar(conexao)
+        except Exception:
+            pass
+
+
+_pools = {}
+_trava = threading.Lock()
+
+
+def pool_para(chave, **opcoes):
+    """Pool do processo para `chave` (criado na primeira chamada; recriado após fork)."""
+    with _trava:
+        pool = _pools.get(chave)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[chave] = PoolConexoes(**opcoes)
+        return pool
+
+
+def pools():
+    """{nome: PoolConexoes} deste processo."""
+    with _trava:
+        return {p.nome: p for p in _pools.values() if p.pid == os.getpid()}
+
+
+def metricas_pools():
+    return {nome: p.metricas() for nome, p in pools().items()}
@@ -0,0 +1,102 @@
+"""Pool de chaves da API do CNPJÁ (`CNPJA_API_KEYS`).
+
+Cada chave tem o seu orçamento de `RATE_LIMIT_PER_MINUTE` por janela e o seu saldo de
+créditos. O orçamento da divisão justa entre fluxos (`services._rate_limit_acquire`) é a
+soma das chaves em rotação; depois de ganhar um slot, a consulta reserva a chave menos
+usada na janela que ainda tem folga e saldo (`services._reservar_chave`) e usa um
+cliente dessa chave (`cliente`).
+
+Uma chave que recebe 401/403 (revogada, sem permissão) ou 429 (limite do contrato) sai
+de rotação por `CNPJA_CHAVE_PAUSA_401` / `CNPJA_CHAVE_PAUSA_429` segundos (ou o `ttl` do
+429, se maior). A marca fica no cache compartilhado, então vale para todos os workers.
+
+As chaves nunca vão para logs ou respostas: aparecem pelo `id` (sha1 curto).
+"""
+import logging
+import random
+import re
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from clients.cnpja import CNPJAClient, id_chave
+
+logger = logging.getLogger('consulta.ratelimit')
+
+
+@lru_cache(maxsize=4)
+def _indice(chaves):
+    return {id_chave(c): c for c in chaves}
+
+
+def chaves():
+    """{id: chave} das chaves configuradas, na ordem de `CNPJA_API_KEYS`."""
+    return _indice(tuple(getattr(settings, 'CNPJA_API_KEYS', None) or ()))
+
+
+def _fora_key(chave_id):
+    return f"cnpja:chave:{chave_id}:fora"
+
+
+def fora_de_rotacao():
+    """{id: {'motivo', 'ate'}} das chaves pausadas agora."""
+    ids = list(chaves())
+    if not ids:
+        return {}
+    try:
+        marcas = cache.get_many([_fora_key(i) for i in ids])
+    except Exception:
+        return {}
+    return {i: marcas[_fora_key(i)] for i in ids if _fora_key(i) in marcas}
+
+
+def disponiveis():
+    """Ids das chaves não pausadas, na ordem configurada (pode ser vazio)."""
+    fora = fora_de_rotacao()
+    return [i for i in chaves() if i not in fora]
+
+
+def em_rotacao():
+    """Chaves a usar: as disponíveis ou, se todas estão pausadas, todas.
+
+    Sem alternativa, a consulta segue com uma chave pausada e o erro (401/429) volta ao
+    chamador, que já trata retry e espera; bloquear até o fim da pausa só atrasaria.
+    """
+    return disponiveis() or list(chaves())
+
+
+def tirar_de_rotacao(chave_id, segundos, motivo):
+    if not chave_id or segundos <= 0:
+        return
+    try:
+        cache.set(_fora_key(chave_id), {'motivo': motivo, 'ate': time.time() + segundos}, segundos)
+    except Exception:
+        return
+    logger.warning('Chave %s fora de rotação por %ss (%s)', chave_id, segundos, motivo)
+
+
+def pausar_se_bloqueada(chave_id, erro):
+    """Tira a chave de rotação se `erro` (CNPJAClientError) indica 401/403 ou 429. Retorna True se tirou."""
+    status = getattr(erro, 'status', None)
+    if status in (401, 403):
+        tirar_de_rotacao(chave_id, settings.CNPJA_CHAVE_PAUSA_401, f'HTTP {status}')
+        return True
+    if status == 429:
+        m = re.search(r'"ttl"\s*:\s*(\d+)', str(erro))
+        pausa = max(settings.CNPJA_CHAVE_PAUSA_429, int(m.group(1)) + 1 if m else 0)
+        tirar_de_rotacao(chave_id, pausa, 'HTTP 429')
+        return True
+    return False
+
+
+def cliente(chave_id=None):
+    """CNPJAClient da chave `chave_id`; sem id, de uma chave em rotação qualquer.
+
+    Sem `CNPJA_API_KEYS`, o cliente padrão (lê `CNPJA_API_KEY`).
+    """
+    todas = chaves()
+    if chave_id is None and todas:
+        chave_id = random.choice(em_rotacao())
+    return CNPJAClient(api_key=todas.get(chave_id))
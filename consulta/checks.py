@@ -0,0 +1,40 @@
+"""Verificações de configuração feitas na inicialização da app 'consulta'."""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends cujo estado fica no processo (ou no disco de uma única máquina)
+CACHES_LOCAIS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+SESSOES_LOCAIS = ('django.contrib.sessions.backends.file',)
+
+
+def problemas_escala():
+    """Lista o que impede rodar com vários workers/dynos quando `SCALE_OUT` está ligado.
+
+    Rate limit, saldo de créditos, cache de CNPJ, single-flight e travas de job vivem
+    no cache padrão; o estado dos jobs vive na sessão. Ambos precisam ser compartilhados.
+    """
+    if not getattr(settings, 'SCALE_OUT', False):
+        return []
+    problemas = []
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend in CACHES_LOCAIS:
+        problemas.append(f'cache padrão local ao processo ({backend}); defina REDIS_URL')
+    if settings.SESSION_ENGINE in SESSOES_LOCAIS:
+        problemas.append(f'sessões em arquivo ({settings.SESSION_ENGINE}); use db, cached_db ou cache')
+    if settings.DATABASES.get('default', {}).get('ENGINE', '').endswith('sqlite3'):
+        problemas.append('banco SQLite; use PostgreSQL (DATABASE_URL ou PG*)')
+    return problemas
+
+
+def recusar_configuracao_insegura():
+    """Impede a inicialização em modo escalado com estado por processo."""
+    problemas = problemas_escala()
+    if problemas:
+        raise ImproperlyConfigured(
+            'SCALE_OUT/WEB_CONCURRENCY > 1 exige estado compartilhado entre workers: ' + '; '.join(problemas)
+        )
@@ -0,0 +1,175 @@
+"""JSON comprimido no banco: zlib com dicionário pré-definido (`JSONComprimidoField`).
+
+Os documentos do CNPJÁ repetem as mesmas chaves e boa parte dos valores (situações,
+naturezas, portes, descrições de CNAE, sufixos de data...). Sozinho, o zlib só aproveita
+as repetições dentro de um documento; com um dicionário (`zdict`) que já traz esse
+vocabulário, mesmo um documento pequeno comprime bem. O formato gravado é:
+
+    1 byte de versão do dicionário (0 = sem dicionário) + fluxo zlib
+
+Um dicionário publicado nunca muda: um vocabulário novo entra como uma versão nova em
+`_DICIONARIOS` e passa a ser usado nas gravações, e os bytes antigos continuam legíveis
+pela versão do cabeçalho. Fluxos zlib sem cabeçalho (primeiro byte 0x78, como os de
+`ConsultaDocumento` anteriores a este formato) também são lidos.
+
+`treinar_dicionario` monta um dicionário candidato a partir de documentos reais;
+`python manage.py bench_json` compara tamanho e tempo de leitura com o JSON puro.
+"""
+import json
+import zlib
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+NIVEL = 6
+TAMANHO_MAXIMO_DICIONARIO = 32 * 1024  # janela do zlib: o que passar disso é ignorado
+
+# Vocabulário v1: esqueleto de um documento /office e valores frequentes. Os fragmentos
+# no fim do dicionário custam menos bytes para referenciar, então os mais comuns vêm por
+# último. NÃO ALTERAR: os dados gravados com a versão 1 dependem destes bytes exatos.
+_FRAGMENTOS_V1 = (
+    'Comércio varejista de ', 'Comércio atacadista de ', 'Fabricação de ', 'Atividades de ',
+    'Serviços de ', 'Extração de ', 'Transporte rodoviário de ', 'Aluguel de ', 'Construção de ',
+    'Manutenção e reparação de ', 'Instalação de ', 'Representantes comerciais e agentes do comércio de ',
+    'exceto ', 'não especificad', ' e ', ' em geral', 'produtos ', 'máquinas e equipamentos',
+    '"Empresário (Individual)"', '"Sociedade Anônima Fechada"', '"Associação Privada"',
+    '"Empresa Individual de Responsabilidade Limitada (de Natureza Empresária)"',
+    '"Sociedade Empresária Limitada"', '"Empresa de Pequeno Porte"', '"Microempresa"', '"Demais"',
+    '"acronym":"ME"', '"acronym":"EPP"', '"acronym":"DEMAIS"',
+    '"Sócio-Administrador"', '"Administrador"', '"Sócio"', '"Titular Pessoa Física Residente ou Domiciliado no Brasil"',
+    '"Baixada"', '"Inapta"', '"Suspensa"', '"Nula"', '"Sem restrição"', '"IE Normal"',
+    '"NATURAL"', '"LEGAL"', '"FOREIGN"', '"ACCOUNTING"', '"PERSONAL"', '"LANDLINE"', '"MOBILE"',
+    '@gmail.com"', '@hotmail.com"', '@yahoo.com.br"', '.com.br"', 'contabil', 'LTDA"', ' ME"', ' EIRELI"',
+    '"age":"41-50"', '"age":"51-60"', '"age":"31-40"', '"age":"61-70"',
+    '"simples":{"optant":true,"since":"', '"simei":{"optant":false,"since":null}',
+    '"registrations":[{"number":"', '"enabled":true,"statusDate":"', '"type":{"id":1,"text":"IE Normal"}}',
+    '"suframa":[]', '"details":null', '"alias":null', '"head":true', '"head":false',
+    '"company":{"members":[{"since":"', '"person":{"id":"', '"type":"NATURAL","name":"',
+    '"taxId":"***', '"role":{"id":49,"text":"Sócio-Administrador"}}',
+    '"nature":{"id":2062,"text":"Sociedade Empresária Limitada"}', '"size":{"id":1,"acronym":"ME","text":"Microempresa"}',
+    '"equity":', '"address":{"municipality":', '"street":"', '"number":"', '"district":"',
+    '"city":"', '"state":"', '"zip":"', '"country":{"id":76,"name":"Brasil"}}',
+    '"mainActivity":{"id":', '"sideActivities":[{"id":', '"phones":[{"type":"LANDLINE","area":"',
+    '"emails":[{"ownership":"CORPORATE","address":"', '","domain":"',
+    '"status":{"id":2,"text":"Ativa"}', '"statusDate":"', '"founded":"', '"updated":"', '"taxId":"',
+    '"name":"', '"text":"', '},{"id":', 'T00:00:00.000Z"', '"id":',
+)
+_DICIONARIOS = {1: ''.join(_FRAGMENTOS_V1).encode('utf-8')}
+VERSAO_ATUAL = 1
+
+
+def _serializar(valor):
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def comprimir(valor, versao=None, dicionario=None):
+    """JSON de `valor` comprimido no formato do campo (versão do dicionário + zlib).
+
+    `dicionario` (bytes) só é usado para medir um dicionário candidato; os bytes
+    gerados assim não são legíveis por `descomprimir`.
+    """
+    versao = VERSAO_ATUAL if versao is None else versao
+    if dicionario is None:
+        dicionario = _DICIONARIOS.get(versao)
+    if dicionario:
+        compressor = zlib.compressobj(NIVEL, zdict=dicionario)
+    else:
+        compressor = zlib.compressobj(NIVEL)
+    return bytes([versao]) + compressor.compress(_serializar(valor)) + compressor.flush()
+
+
+def descomprimir(dados, dicionario=None):
+    """Inverso de `comprimir`; aceita também fluxos zlib sem cabeçalho."""
+    dados = bytes(dados)
+    if not dados:
+        return None
+    if dados[0] == 0x78:  # zlib puro (formato anterior, sem versão)
+        return json.loads(zlib.decompress(dados).decode('utf-8'))
+    versao = dados[0]
+    if dicionario is None and versao:
+        try:
+            dicionario = _DICIONARIOS[versao]
+        except KeyError:
+            raise ValueError(f'Versão de dicionário desconhecida: {versao}')
+    descompressor = zlib.decompressobj(zdict=dicionario) if dicionario else zlib.decompressobj()
+    texto = descompressor.decompress(dados[1:]) + descompressor.flush()
+    return json.loads(texto.decode('utf-8'))
+
+
+def _fragmentos(valor, saida):
+    """Pedaços do JSON compacto de `valor` que tendem a se repetir entre documentos."""
+    if isinstance(valor, dict):
+        for k, v in valor.items():
+            if isinstance(v, (dict, list)) or v is None or isinstance(v, bool):
+                saida.append(f'"{k}":' + _serializar(v).decode('utf-8')[:1])
+            else:
+                saida.append(f'"{k}":' + _serializar(v).decode('utf-8'))
+            _fragmentos(v, saida)
+    elif isinstance(valor, list):
+        for v in valor:
+            _fragmentos(v, saida)
+    elif isinstance(valor, str) and len(valor) > 3:
+        saida.append(_serializar(valor).decode('utf-8'))
+
+
+def treinar_dicionario(amostras, tamanho=TAMANHO_MAXIMO_DICIONARIO, minimo=2):
+    """Dicionário candidato (bytes) a partir de documentos de exemplo.
+
+    Conta os pares `"chave":valor` e os textos de cada documento (uma vez por documento)
+    e mantém os que aparecem em ao menos `minimo` documentos, priorizando os que mais
+    economizam (frequência x tamanho). Os mais valiosos ficam no fim do dicionário.
+    """
+    contagem = Counter()
+    for doc in amostras:
+        saida = []
+        _fragmentos(doc, saida)
+        contagem.update(set(saida))
+    candidatos = sorted(
+        ((n * len(f.encode('utf-8')), f) for f, n in contagem.items() if n >= minimo),
+        reverse=True,
+    )
+    escolhidos, total = [], 0
+    for _, fragmento in candidatos:
+        b = fragmento.encode('utf-8')
+        if total + len(b) > tamanho:
+            continue
+        escolhidos.append(b)
+        total += len(b)
+    return b''.join(reversed(escolhidos))
+
+
+class JSONComprimidoField(models.BinaryField):
+    """JSON gravado comprimido (`comprimir`) e lido de volta como objeto Python.
+
+    Transparente para quem lê o modelo (`obj.campo`, `values_list`) e para `update()`.
+    Não há consultas por chave do JSON (`campo__chave`): extraia para uma coluna.
+    """
+    description = 'JSON comprimido (zlib com dicionário)'
+    empty_values = [None]
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return descomprimir(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            try:
+                return descomprimir(value)
+            except (ValueError, zlib.error) as e:
+                raise ValidationError(f'JSON comprimido inválido: {e}')
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return comprimir(value)
+
+    def get_default(self):
+        if self.has_default():
+            return self.default() if callable(self.default) else self.default
+        return None
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)  # serializadores (dumpdata) gravam o JSON, não os bytes
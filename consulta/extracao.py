@@ -0,0 +1,117 @@
+"""Extração de colunas tipadas do JSON do CNPJÁ (`detalhes`).
+
+Cada consulta bem-sucedida passa uma vez pelo pipeline em `_montar_resultado`; os campos
+extraídos vão junto do item de resultado (sessão/UI) e viram colunas indexáveis de
+`ConsultaResultado` ao lado do JSON bruto. Exportações e filtros leem as colunas em vez de
+abrir o JSON de cada linha.
+
+O pipeline é a lista `CNPJ_EXTRATORES` (caminhos pontuados). Cada extrator recebe o JSON e
+devolve um dict parcial; chaves que não são colunas de `ConsultaResultado.CAMPOS_EXTRAIDOS`
+são descartadas. Para trocar o pipeline em registros já gravados, rode `extrair_campos --todos`.
+"""
+import logging
+from functools import lru_cache
+
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.module_loading import import_string
+
+EXTRATORES_PADRAO = (
+    'consulta.extracao.extrair_situacao',
+    'consulta.extracao.extrair_atividade',
+    'consulta.extracao.extrair_endereco',
+    'consulta.extracao.extrair_contatos',
+    'consulta.extracao.extrair_atualizacao',
+)
+
+logger = logging.getLogger('consulta.extracao')
+
+
+def _texto(valor, tamanho):
+    return str(valor).strip()[:tamanho] if valor not in (None, '') else ''
+
+
+def _inteiro(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def extrair_situacao(data):
+    """Situação cadastral (texto) e a data da situação (ISO, 'AAAA-MM-DD')."""
+    status = data.get('status') or {}
+    dia = parse_date(str(data.get('statusDate') or '')[:10])
+    return {
+        'situacao': _texto(status.get('text') if isinstance(status, dict) else status, 50),
+        'situacao_data': dia.isoformat() if dia else None,
+    }
+
+
+def extrair_atividade(data):
+    """CNAE e descrição da atividade principal."""
+    atividade = data.get('mainActivity') or {}
+    if not isinstance(atividade, dict):
+        return {}
+    return {
+        'cnae_principal': _inteiro(atividade.get('id')),
+        'atividade_principal': _texto(atividade.get('text'), 255),
+    }
+
+
+def extrair_endereco(data):
+    """Município (nome e código IBGE) e UF do endereço."""
+    endereco = data.get('address') or {}
+    if not isinstance(endereco, dict):
+        return {}
+    return {
+        'municipio': _texto(endereco.get('city'), 100),
+        'municipio_ibge': _inteiro(endereco.get('municipality')),
+        'uf': _texto(endereco.get('state'), 2).upper(),
+    }
+
+
+def extrair_contatos(data):
+    """Todos os e-mails e telefones, separados por ' | ' (como no modal de detalhes)."""
+    emails = [e.get('address') for e in data.get('emails') or [] if isinstance(e, dict) and e.get('address')]
+    telefones = []
+    for t in data.get('phones') or []:
+        if isinstance(t, dict):
+            numero = f"{t.get('area') or ''} {t.get('number') or ''}".strip()
+            if numero:
+                telefones.append(numero)
+    return {'emails': ' | '.join(emails), 'telefones': ' | '.join(telefones)}
+
+
+def extrair_atualizacao(data):
+    """Data do dado no CNPJÁ (`updated`, ISO com fuso; sem fuso = UTC)."""
+    try:
+        quando = parse_datetime(str(data.get('updated') or ''))
+    except ValueError:
+        quando = None
+    if quando is not None and timezone.is_naive(quando):
+        quando = timezone.make_aware(quando, dt_timezone.utc)
+    return {'atualizado': quando.isoformat() if quando else None}
+
+
+@lru_cache(maxsize=1)
+def _extratores():
+    return tuple(import_string(caminho) for caminho in getattr(settings, 'CNPJ_EXTRATORES', EXTRATORES_PADRAO))
+
+
+def extrair_campos(data):
+    """Roda o pipeline sobre o JSON do CNPJÁ; retorna só as colunas conhecidas."""
+    from .models import ConsultaResultado
+
+    if not isinstance(data, dict):
+        return {}
+    campos = {}
+    for extrator in _extratores():
+        try:
+            campos.update(extrator(data) or {})
+        except Exception as e:
+            logger.warning('Extrator %s falhou: %s', extrator.__name__, e)
+    return {k: v for k, v in campos.items() if k in ConsultaResultado.CAMPOS_EXTRAIDOS}
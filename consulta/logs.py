@@ -0,0 +1,132 @@
+"""Logging estruturado e não bloqueante da app 'consulta'.
+
+- Categorias (loggers) por área: `consulta.api`, `consulta.ratelimit`, `consulta.upload`,
+  `consulta.jobs`, `consulta.creditos`, `consulta.retencao`, `consulta.refresh`...; o
+  nível de cada uma vem de `LOG_LEVELS` (ex.: `consulta.upload=DEBUG`), o geral de `LOG_LEVEL`;
+- `FilaHandler`: a requisição só enfileira o registro (sem escrever em stdout); uma thread
+  (`QueueListener`) formata e escreve. Com a fila cheia o registro é descartado e contado,
+  nunca bloqueia;
+- `FiltroAmostragem`: linhas por item marcadas com `extra=AMOSTRAR` passam 1 a cada
+  `LOG_AMOSTRAGEM` por mensagem (a primeira sempre passa);
+- `FormatadorEstruturado`: `chave=valor` (padrão) ou JSON por linha (`LOG_FORMAT=json`),
+  com os campos de `extra`.
+
+Nos caminhos quentes, mensagens por item usam DEBUG e argumentos `%s` (formatados só se
+o nível estiver ligado); com DEBUG desligado o custo é a checagem de nível do logger.
+"""
+import atexit
+import copy
+import itertools
+import json
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# `extra` das linhas por item sujeitas à amostragem
+AMOSTRAR = {'amostrar': True}
+
+# Atributos padrão de LogRecord (o que sobra veio de `extra`)
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'amostrar'}
+
+
+class FilaHandler(QueueHandler):
+    """QueueHandler com fila limitada e listener próprio escrevendo em stdout."""
+
+    def __init__(self, tamanho=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=max(1, tamanho)))
+        self._destino = logging.StreamHandler(stream or sys.stdout)
+        self._descartadas = 0
+        self._trava = threading.Lock()
+        self._listener = QueueListener(self.queue, self._destino, respect_handler_level=False)
+        self._listener.start()
+        atexit.register(self.parar)
+
+    def parar(self):
+        """Esvazia a fila e encerra o listener (idempotente)."""
+        if self._listener._thread is not None:
+            self._listener.stop()
+
+    def setFormatter(self, fmt):
+        # A formatação acontece na thread do listener, não na requisição
+        self._destino.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self._descartadas:
+                # O aviso entra antes do registro; o contador só zera se coube na fila
+                with self._trava:
+                    descartadas = self._descartadas
+                    aviso = logging.makeLogRecord({
+                        'name': 'consulta.logs', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                        'msg': f'{descartadas} registros de log descartados (fila cheia)',
+                    })
+                    self.queue.put_nowait(aviso)
+                    self._descartadas -= descartadas
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._trava:
+                self._descartadas += 1
+
+
+class FiltroAmostragem(logging.Filter):
+    """Deixa passar 1 a cada `taxa` registros marcados com `amostrar`, por mensagem."""
+
+    def __init__(self, taxa=100):
+        super().__init__()
+        self.taxa = max(1, int(taxa))
+        self._contadores = {}
+
+    def filter(self, record):
+        if self.taxa == 1 or not getattr(record, 'amostrar', False):
+            return True
+        chave = (record.name, record.msg)
+        contador = self._contadores.get(chave)
+        if contador is None:
+            contador = self._contadores.setdefault(chave, itertools.count())
+        n = next(contador)
+        if n % self.taxa:
+            return False
+        if n:
+            record.amostra = f'1/{self.taxa}'
+        return True
+
+
+class FormatadorEstruturado(logging.Formatter):
+    """Uma linha por registro: `ts nivel categoria mensagem chave=valor` ou JSON."""
+
+    def __init__(self, como_json=False):
+        super().__init__()
+        self.como_json = como_json
+
+    def format(self, record):
+        campos = {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_PADRAO}
+        mensagem = record.getMessage()
+        if self.como_json:
+            dados = {
+                'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+                'nivel': record.levelname,
+                'categoria': record.name,
+                'msg': mensagem,
+                **campos,
+            }
+            if record.exc_text:
+                dados['exc'] = record.exc_text
+            return json.dumps(dados, ensure_ascii=False, default=str)
+        linha = f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')} {record.levelname} {record.name} {mensagem}"
+        if campos:
+            linha += ' ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        if record.exc_text:
+            linha += '\n' + record.exc_text
+        return linha
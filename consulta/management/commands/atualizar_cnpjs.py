@@ -0,0 +1,47 @@
+"""Renova no CNPJÁ, fora do pico, os CNPJs do histórico perto de vencer o `maxAge`.
+
+Ver `consulta.atualizacao`. Cada passada respeita `CNPJ_REFRESH_HORARIO`, usa no máximo
+`CNPJ_REFRESH_FRACAO` do limite por minuto da API e renova até
+`CNPJ_REFRESH_MAX_POR_EXECUCAO` CNPJs, dos dados mais antigos para os mais novos.
+
+Uso:
+    python manage.py atualizar_cnpjs                 # uma passada (Heroku Scheduler/cron)
+    python manage.py atualizar_cnpjs --continuo      # processo `refresher` do Procfile
+    python manage.py atualizar_cnpjs --simular       # lista os candidatos, sem consultar
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from consulta import atualizacao
+
+
+class Command(BaseCommand):
+    help = 'Renova em background os CNPJs do histórico cujo dado no CNPJÁ está perto de vencer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=None,
+                            help='Máximo de CNPJs por passada (padrão: CNPJ_REFRESH_MAX_POR_EXECUCAO; 0 = todos)')
+        parser.add_argument('--ignorar-horario', action='store_true',
+                            help='Roda fora de CNPJ_REFRESH_HORARIO')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Repete as passadas indefinidamente')
+        parser.add_argument('--intervalo', type=int, default=900,
+                            help='Segundos entre passadas no modo contínuo (padrão: 900)')
+        parser.add_argument('--simular', action='store_true',
+                            help='Só lista os CNPJs que seriam renovados')
+
+    def handle(self, *args, **opts):
+        if opts['simular']:
+            candidatos = atualizacao.cnpjs_vencendo()
+            for cnpj, quando in candidatos[:50]:
+                self.stdout.write(f"{cnpj}  dado de {quando:%d/%m/%Y}")
+            self.stdout.write(f"{len(candidatos)} CNPJs a renovar")
+            return
+        while True:
+            resumo = atualizacao.executar_atualizacao(limite=opts['limite'], ignorar_horario=opts['ignorar_horario'])
+            self.stdout.write(f"[{resumo['status']}] {resumo['atualizados']}/{resumo['candidatos']} CNPJs renovados, "
+                              f"{resumo['erros']} erros")
+            if not opts['continuo']:
+                break
+            time.sleep(max(1, opts['intervalo']))
@@ -0,0 +1,214 @@
+"""Teste de carga: views síncronas x assíncronas sob ASGI, num único processo.
+
+Sobe um CNPJÁ falso local (latência configurável em /office/<cnpj> e /credit), cria um
+banco de teste e dispara requisições concorrentes direto num handler ASGI (o mesmo de
+`consulta_cnpj_cpf.asgi`, com todos os middlewares), em três fases:
+
+- wsgi: views síncronas atendidas uma por vez, como o worker síncrono único do
+  Procfile anterior (`gunicorn ...wsgi --workers 1`);
+- asgi-sync: as mesmas views síncronas sob ASGI — o Django dá uma thread a cada
+  requisição, então a espera se sobrepõe, ao custo de uma thread presa por requisição;
+- async: rotas de `views_async` (as usadas com `ASYNC_VIEWS` ligado); a espera é
+  `asyncio.sleep` e as chamadas ao CNPJÁ ocupam o pool `ASYNC_UPSTREAM_THREADS`.
+
+Cenários:
+- cnpj: N GETs /cnpj/<cnpj>/ simultâneos, cada um com miss no cache (uma chamada lenta);
+- step: N usuários com um job de um item chamando /jobs/step/ ao mesmo tempo
+  (delay `JOB_DELAY_SECONDS` + chamada lenta).
+
+Uso:
+    python manage.py bench_async
+    python manage.py bench_async --requisicoes 50 --latencia 0.5 --cenario cnpj
+
+Mantenha `--requisicoes` abaixo do rate limit da API (60/min) e do throttle do DRF
+(100/min), senão o teste mede a espera por slot e não a concorrência. Com SQLite o
+banco de teste vai para um arquivo temporário (o padrão em memória não aceita escritas
+concorrentes de sessão).
+"""
+import asyncio
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+import types
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.test.utils import get_runner
+from django.urls import path
+
+from consulta import views, views_async
+
+
+class _CnpjaFalso(BaseHTTPRequestHandler):
+    latencia = 0.5
+
+    def do_GET(self):
+        time.sleep(self.latencia)
+        caminho = self.path.split('?')[0]
+        if caminho.startswith('/office/'):
+            cnpj = caminho.rsplit('/', 1)[-1]
+            corpo = {'taxId': cnpj, 'company': {'name': f'Empresa {cnpj}'}, 'emails': [{'address': f'{cnpj}@exemplo.com'}]}
+        elif caminho == '/credit':
+            corpo = {'perpetual': 1000, 'transient': 0}
+        else:
+            self.send_error(404)
+            return
+        dados = json.dumps(corpo).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def _urlconf(modulo):
+    """URLconf mínimo com as rotas do teste apontando para `views` ou `views_async`."""
+    urls = types.ModuleType(f'bench_async_urls_{modulo.__name__.rsplit(".", 1)[-1]}')
+    consulta_cnpj = modulo.consulta_cnpj if modulo is views_async else views.ConsultaCNPJView.as_view()
+    urls.urlpatterns = [
+        path('login/', views.login_view, name='login'),
+        path('cnpj/<str:cnpj>/', consulta_cnpj, name='consulta_cnpj'),
+        path('jobs/start/', modulo.jobs_start, name='jobs_start'),
+        path('jobs/step/', modulo.jobs_step, name='jobs_step'),
+    ]
+    return urls
+
+
+def _cnpj(i, prefixo):
+    """CNPJ sintético com dígitos verificadores válidos."""
+    base = [int(d) for d in f'{prefixo:02d}{i:06d}0001']
+    for pesos in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        resto = sum(d * p for d, p in zip(base, pesos)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+    return ''.join(map(str, base))
+
+
+async def _requisicao(app, metodo, caminho, cookies, corpo=b'', content_type=None):
+    """Executa uma requisição HTTP direto na aplicação ASGI; retorna o status."""
+    headers = [(b'host', b'testserver'), (b'cookie', cookies.encode())]
+    if content_type:
+        headers.append((b'content-type', content_type.encode()))
+        headers.append((b'content-length', str(len(corpo)).encode()))
+    if metodo == 'POST':
+        csrf = SimpleCookie(cookies)['csrftoken'].value
+        headers.append((b'x-csrftoken', csrf.encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': metodo, 'scheme': 'http', 'path': caminho, 'raw_path': caminho.encode(),
+        'root_path': '', 'query_string': b'', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    enviado = False
+    status = {}
+
+    async def receive():
+        nonlocal enviado
+        if not enviado:
+            enviado = True
+            return {'type': 'http.request', 'body': corpo, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(msg):
+        if msg['type'] == 'http.response.start':
+            status['codigo'] = msg['status']
+
+    await app(scope, receive, send)
+    return status.get('codigo')
+
+
+def _sessao(usuario):
+    """Cookie de sessão (login) + CSRF para o usuário."""
+    client = Client()
+    client.force_login(usuario)
+    return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; csrftoken={secrets.token_hex(16)}"
+
+
+class Command(BaseCommand):
+    help = 'Mede o ganho de concorrência das views assíncronas sob ASGI com um CNPJÁ falso lento.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=40, help='Requisições simultâneas por fase')
+        parser.add_argument('--latencia', type=float, default=0.5, help='Latência (s) de cada chamada ao CNPJÁ falso')
+        parser.add_argument('--cenario', choices=('cnpj', 'step', 'todos'), default='todos')
+
+    def handle(self, *args, **opts):
+        _CnpjaFalso.latencia = opts['latencia']
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), _CnpjaFalso)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        os.environ['CNPJA_BASE_URL'] = f'http://127.0.0.1:{servidor.server_port}'
+        os.environ['CNPJA_API_KEY'] = 'bench'
+        banco = settings.DATABASES['default']
+        arquivo = None
+        if banco['ENGINE'].endswith('sqlite3'):
+            fd, arquivo = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            banco.setdefault('TEST', {})['NAME'] = arquivo
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        bancos = runner.setup_databases()
+        try:
+            # Sem redirect para HTTPS; os middlewares leem os settings ao montar o handler
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], SECURE_SSL_REDIRECT=False):
+                self._cenarios(ASGIHandler(), opts)
+        finally:
+            runner.teardown_databases(bancos)
+            servidor.shutdown()
+            if arquivo and os.path.exists(arquivo):
+                os.remove(arquivo)
+
+    def _cenarios(self, application, opts):
+        cenarios = ('cnpj', 'step') if opts['cenario'] == 'todos' else (opts['cenario'],)
+        for cenario in cenarios:
+            tempos = {}
+            for fase, modulo in (('wsgi', views), ('asgi-sync', views), ('async', views_async)):
+                tempos[fase] = self._fase(application, cenario, fase, modulo, opts['requisicoes'])
+            ganho = tempos['wsgi'] / tempos['async'] if tempos['async'] else 0
+            self.stdout.write(self.style.SUCCESS(f'{cenario}: async {ganho:.1f}x mais rápido que o worker WSGI único'))
+
+    def _fase(self, app, cenario, fase, modulo, n):
+        prefixo = (10 if cenario == 'cnpj' else 20) + ('wsgi', 'asgi-sync', 'async').index(fase)
+        # Cache novo por fase: sem hits da fase anterior, throttle e rate limit zerados
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'bench-{cenario}-{fase}'}}
+        with override_settings(ROOT_URLCONF=_urlconf(modulo), CACHES=caches):
+            User = get_user_model()
+            if cenario == 'cnpj':
+                usuario, _ = User.objects.get_or_create(username=f'bench-{fase}')
+                cookies = _sessao(usuario)
+                pedidos = [('GET', f'/cnpj/{_cnpj(i, prefixo)}/', cookies, b'', None) for i in range(n)]
+            else:
+                pedidos = []
+                for i in range(n):
+                    usuario, _ = User.objects.get_or_create(username=f'bench-{fase}-{i}')
+                    cookies = _sessao(usuario)
+                    corpo = json.dumps({'cnpjs': _cnpj(i, prefixo)}).encode()
+                    codigo = asyncio.run(_requisicao(app, 'POST', '/jobs/start/', cookies, corpo, 'application/json'))
+                    if codigo != 200:
+                        self.stderr.write(f'jobs/start retornou {codigo}')
+                    pedidos.append(('POST', '/jobs/step/', cookies, b'', None))
+
+            async def _todas():
+                # wsgi: um worker síncrono atende uma requisição por vez
+                limite = asyncio.Semaphore(1 if fase == 'wsgi' else len(pedidos))
+
+                async def _uma(p):
+                    async with limite:
+                        return await _requisicao(app, *p)
+                return await asyncio.gather(*(_uma(p) for p in pedidos))
+
+            t0 = time.perf_counter()
+            codigos = asyncio.run(_todas())
+            dt = time.perf_counter() - t0
+        erros = sum(1 for c in codigos if c != 200)
+        self.stdout.write(f'{cenario:>4} {fase:>9}: {n} requisições em {dt:6.2f}s ({n / dt:5.1f} req/s)'
+                          + (f'  [{erros} com status != 200]' if erros else ''))
+        return dt
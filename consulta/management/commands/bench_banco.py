@@ -0,0 +1,113 @@
+"""Teste de carga do acesso ao banco: latência conforme cresce o número de usuários.
+
+Sobe a aplicação ASGI no próprio processo (como um worker do uvicorn) e, para cada
+degrau de `--usuarios`, mantém N usuários virtuais fazendo requisições seguidas a
+`--caminho` (padrão: `/saude/`, um `SELECT 1` por requisição) durante `--duracao`
+segundos. Para cada degrau mostra vazão, p50/p95/p99, erros e o estado do pool
+(`consulta.banco`): conexões abertas, esperas por conexão livre e a maior espera.
+
+Com o pool, as conexões abertas param em `DB_POOL_MAXIMO` e a latência cresce só com
+a fila; sem ele (`DB_POOL=False`), cada requisição ASGI abre a sua conexão.
+
+Uso (contra o PostgreSQL de verdade):
+    DATABASE_URL=postgres://... python manage.py bench_banco
+    python manage.py bench_banco --usuarios 1,10,50,100 --duracao 10
+"""
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+from consulta.banco.pool import metricas_pools
+from consulta.management.commands.bench_boot import _host_permitido
+
+
+async def _requisicao(app, caminho, host):
+    """Uma requisição GET direto no handler ASGI; retorna o status."""
+    eventos = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if eventos:
+            return eventos.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(msg):
+        if msg['type'] == 'http.response.start':
+            status.append(msg['status'])
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'https', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', host.encode())],
+        'client': ('127.0.0.1', 50000), 'server': (host, 443),
+    }
+    await app(scope, receive, send)
+    return status[0] if status else None
+
+
+async def _degrau(app, caminho, host, usuarios, duracao):
+    latencias, erros = [], 0
+    fim = time.perf_counter() + duracao
+
+    async def _usuario():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                status = await _requisicao(app, caminho, host)
+            except Exception:
+                status = None
+            latencias.append(time.perf_counter() - inicio)
+            if status != 200:
+                erros += 1
+
+    await asyncio.gather(*(_usuario() for _ in range(usuarios)))
+    return latencias, erros
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Mede latência e conexões do banco com número crescente de usuários simultâneos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', default='1,5,10,25,50', help='Degraus de usuários simultâneos (padrão: 1,5,10,25,50)')
+        parser.add_argument('--duracao', type=float, default=5, help='Segundos por degrau (padrão: 5)')
+        parser.add_argument('--caminho', default='/saude/', help='Rota requisitada (padrão: /saude/)')
+
+    def handle(self, *args, **opts):
+        try:
+            degraus = [max(1, int(u)) for u in opts['usuarios'].split(',') if u.strip()]
+        except ValueError:
+            raise CommandError('--usuarios deve ser uma lista de inteiros separados por vírgula')
+        banco = settings.DATABASES['default']
+        self.stdout.write(f"Banco: {banco['ENGINE']} (CONN_MAX_AGE={banco.get('CONN_MAX_AGE')}, pool={banco.get('POOL') or '-'})")
+        if banco['ENGINE'].endswith('sqlite3'):
+            self.stdout.write(self.style.WARNING('SQLite: sem pool; configure DATABASE_URL/POSTGRES_* para medir o PostgreSQL.'))
+
+        app = get_asgi_application()
+        host = _host_permitido()
+        self.stdout.write(
+            f"\n  {'usuários':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8} {'erros':>6}"
+            f" {'conexões':>9} {'esperas':>8} {'espera máx':>11}"
+        )
+        for usuarios in degraus:
+            latencias, erros = asyncio.run(_degrau(app, opts['caminho'], host, usuarios, opts['duracao']))
+            if not latencias:
+                continue
+            pool = next(iter(metricas_pools().values()), None)
+            estado = (f"{pool['abertas']:>9} {pool['esperas']:>8} {pool['espera_max_ms']:>9.1f}ms" if pool
+                      else f"{'-':>9} {'-':>8} {'-':>11}")
+            ms = [l * 1000 for l in latencias]
+            self.stdout.write(
+                f"  {usuarios:>8} {len(ms) / opts['duracao']:>8.0f} {statistics.median(ms):>7.1f}ms"
+                f" {_percentil(ms, 0.95):>6.1f}ms {_percentil(ms, 0.99):>6.1f}ms {max(ms):>6.1f}ms {erros:>6}"
+                f" {estado}"
+            )
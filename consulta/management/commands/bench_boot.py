@@ -0,0 +1,139 @@
+"""Benchmark do boot: tempo de import e tempo até a primeira requisição.
+
+Cada repetição sobe um interpretador novo (`python -X importtime`) que, como um worker
+do gunicorn/uvicorn, importa `consulta_cnpj_cpf.asgi` e atende uma requisição GET direto
+no handler ASGI (todos os middlewares, URLconf e view carregados sob demanda). Mede:
+
+- interpretador: do início do processo filho até o primeiro import do projeto;
+- setup: `django.setup()` (settings, apps, models, checks de import);
+- asgi: handler ASGI e middlewares;
+- primeira requisição: inclui o import do URLconf, das views e de tudo que elas importam;
+- total: do `spawn` do processo até a resposta (visão de quem espera o dyno subir).
+
+Ao fim lista os módulos mais caros (tempo cumulativo de import, mediana das repetições),
+para achar dependências pesadas que poderiam ser importadas no primeiro uso.
+
+Uso:
+    python manage.py bench_boot
+    python manage.py bench_boot --repeticoes 10 --caminho /login/ --top 25
+
+Sem bytecode (`__pycache__`) gravado, o primeiro import compila o fonte; o Heroku compila
+no build. Rode uma vez antes de comparar (ou `python -m compileall -q .`).
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Roda no processo filho; imprime as fases em JSON na última linha do stdout
+_SCRIPT_FILHO = r'''
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+from consulta_cnpj_cpf.asgi import application
+t2 = time.perf_counter()
+
+async def _requisicao(caminho, host):
+    eventos = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        return eventos.pop(0) if eventos else {'type': 'http.disconnect'}
+
+    async def send(msg):
+        if msg['type'] == 'http.response.start':
+            status.append(msg['status'])
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'https', 'path': caminho, 'raw_path': caminho.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', host.encode())],
+        'client': ('127.0.0.1', 50000), 'server': (host, 443),
+    }
+    await application(scope, receive, send)
+    return status[0] if status else None
+
+status = asyncio.run(_requisicao(sys.argv[1], sys.argv[2]))
+t3 = time.perf_counter()
+print(json.dumps({'setup': t1 - t0, 'asgi': t2 - t1, 'requisicao': t3 - t2, 'status': status}))
+'''
+
+_PREFIXOS_PROJETO = ('consulta', 'clients')
+
+
+def _host_permitido():
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'localhost'
+
+
+def _ler_importtime(stderr):
+    """{módulo: tempo cumulativo (s)} a partir da saída de `-X importtime`."""
+    tempos = {}
+    for linha in stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        try:
+            _, cumulativo, nome = linha.split('|')
+            tempos[nome.strip()] = int(cumulativo) / 1e6
+        except ValueError:
+            continue
+    return tempos
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo de import e o tempo até a primeira requisição de um worker novo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Processos medidos (padrão: 5)')
+        parser.add_argument('--caminho', default='/login/', help='Rota da primeira requisição (padrão: /login/)')
+        parser.add_argument('--top', type=int, default=15, help='Módulos mais caros listados (padrão: 15)')
+
+    def _rodar(self, caminho, host):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'consulta_cnpj_cpf.settings'))
+        inicio = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _SCRIPT_FILHO, caminho, host],
+            cwd=str(settings.BASE_DIR), env=env, capture_output=True, text=True,
+        )
+        total = time.perf_counter() - inicio
+        if proc.returncode != 0:
+            erro = [l for l in proc.stderr.splitlines() if not l.startswith('import time:')]
+            raise RuntimeError('\n'.join(erro[-15:]))
+        fases = json.loads(proc.stdout.strip().splitlines()[-1])
+        fases['total'] = total
+        # O que não é setup/asgi/requisição é o interpretador subindo (site, encodings...)
+        fases['interpretador'] = total - fases['setup'] - fases['asgi'] - fases['requisicao']
+        return fases, _ler_importtime(proc.stderr)
+
+    def handle(self, *args, **opts):
+        repeticoes = max(1, opts['repeticoes'])
+        host = _host_permitido()
+        medicoes, imports = [], []
+        for i in range(repeticoes):
+            fases, tempos = self._rodar(opts['caminho'], host)
+            medicoes.append(fases)
+            imports.append(tempos)
+            self.stdout.write(f"  #{i + 1}: total {fases['total'] * 1000:.0f}ms (status {fases['status']})")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nBoot até GET {opts['caminho']} (mediana de {repeticoes})"))
+        for fase in ('interpretador', 'setup', 'asgi', 'requisicao', 'total'):
+            valores = [m[fase] for m in medicoes]
+            self.stdout.write(f"  {fase:<14} {statistics.median(valores) * 1000:>8.1f}ms"
+                              f"   (min {min(valores) * 1000:.1f} / max {max(valores) * 1000:.1f})")
+
+        # Pacotes de topo e módulos do projeto, pelo tempo cumulativo mediano
+        nomes = {n for t in imports for n in t if '.' not in n or n.startswith(_PREFIXOS_PROJETO)}
+        medianas = {n: statistics.median(t.get(n, 0) for t in imports) for n in nomes}
+        self.stdout.write(self.style.MIGRATE_HEADING('\nImports mais caros (cumulativo)'))
+        for nome, tempo in sorted(medianas.items(), key=lambda x: x[1], reverse=True)[:max(1, opts['top'])]:
+            self.stdout.write(f"  {tempo * 1000:>8.1f}ms  {nome}")
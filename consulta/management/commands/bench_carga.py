@@ -0,0 +1,500 @@
+"""Teste de carga da aplicação web: login, jobs, detalhes e exportações do histórico.
+
+Sobe o servidor do `Procfile` de verdade (`gunicorn consulta_cnpj_cpf.asgi` com workers do
+uvicorn) sobre um banco de teste e um CNPJÁ falso local, e solta N usuários virtuais que
+fazem o mesmo caminho do frontend (`static/js/home.js`):
+
+1. GET e POST /login/ (senha de verdade: o hash PBKDF2 entra na conta);
+2. POST /jobs/start/ com um CSV de `--linhas` CNPJs (um arquivo diferente por usuário);
+3. POST /jobs/plan/ até o plano terminar ou por `--max-plano` lotes;
+4. POST /jobs/step/ em sequência até o fim do degrau, e depois de cada passo, com as
+   probabilidades de `_MIX`, GET /api/detalhes/<cnpj>/ do item recebido e as exportações
+   do histórico (/export/historico/csv/, /xlsx/ e /delta/);
+5. POST /jobs/cancel/.
+
+O CNPJÁ falso responde /office/<cnpj> com documentos completos em `--latencia` segundos;
+com `strategy=CACHE` (planejamento), responde em `--latencia-cache` e só tem uma fração
+fixa dos CNPJs (`--fracao-cache`). Antes dos degraus, o histórico recebe `--historico`
+resultados sintéticos, para as exportações terem o que ler.
+
+Para cada configuração (`--workers` x `--views`) e degrau de `--usuarios`, mostra por
+endpoint: requisições, vazão, p50/p95/p99, máximo e erros (status diferente do esperado
+ou falha de conexão). `--saida` grava os números em JSON; `--comparar` mostra a
+diferença de vazão e p95 contra um arquivo gravado antes. A linha de base do projeto
+fica em `docs/carga-baseline.json` (ver docs/operations.md).
+
+O rate limit do CNPJÁ (60/min por chave) é o gargalo de propósito em produção; aqui o
+servidor recebe `--chaves` chaves falsas (padrão: uma por usuário do maior degrau) para o
+teste medir a aplicação, não o contrato. Mais de um worker exige estado compartilhado
+(`REDIS_URL` e PostgreSQL, ver `consulta/checks.py`); sem isso, essas configurações são
+puladas.
+
+Uso:
+    python manage.py bench_carga
+    python manage.py bench_carga --usuarios 5,20,50 --duracao 60 --linhas 20000
+    DATABASE_URL=postgres://... REDIS_URL=redis://... python manage.py bench_carga --workers 1,2,4
+    python manage.py bench_carga --saida docs/carga-baseline.json
+    python manage.py bench_carga --comparar docs/carga-baseline.json
+"""
+import io
+import json
+import os
+import platform
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import get_runner
+
+from consulta.management.commands.bench_async import _CnpjaFalso, _cnpj
+from consulta.management.commands.bench_banco import _percentil
+from consulta.management.commands.bench_json import _documento_sintetico
+from consulta.management.commands.preparar_boot import estaticos_desatualizados
+from consulta.models import ConsultaHistorico, ConsultaResultado
+from consulta.services import _montar_resultado, format_cnpj
+
+# Chamadas extras depois de cada passo do job: (endpoint, rota, probabilidade)
+_MIX = (
+    ('GET /api/detalhes/', '/api/detalhes/{cnpj}/', 0.3),
+    ('GET /export/historico/csv/', '/export/historico/csv/', 0.02),
+    ('GET /export/historico/xlsx/', '/export/historico/xlsx/', 0.01),
+    ('GET /export/historico/delta/', '/export/historico/delta/?format=csv', 0.02),
+)
+# Ordem das linhas no relatório
+_ENDPOINTS = (
+    'GET /login/', 'POST /login/', 'POST /jobs/start/', 'POST /jobs/plan/', 'POST /jobs/step/',
+    *(rotulo for rotulo, _, _ in _MIX), 'POST /jobs/cancel/',
+)
+_CSRF_FORM = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+_SENHA = 'carga-Senha-123'
+
+
+class _CnpjaCarga(_CnpjaFalso):
+    """CNPJÁ falso com documentos completos e cache parcial (`strategy=CACHE`)."""
+    latencia = 0.2
+    latencia_cache = 0.05
+    fracao_cache = 0.3
+
+    def do_GET(self):
+        try:
+            self._get()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # o servidor da aplicação desistiu (timeout ou encerramento)
+
+    def _get(self):
+        caminho, _, consulta = self.path.partition('?')
+        if not caminho.startswith('/office/'):
+            return super().do_GET()
+        cnpj = caminho.rsplit('/', 1)[-1]
+        raiz = int(cnpj[:8]) if cnpj[:8].isdigit() else 0
+        if parse_qs(consulta).get('strategy') == ['CACHE']:
+            time.sleep(self.latencia_cache)
+            if raiz % 100 >= self.fracao_cache * 100:
+                return self._responder(404, {'message': 'Not found in cache'})
+        else:
+            time.sleep(self.latencia)
+        documento = _documento_sintetico(raiz)
+        documento['taxId'] = cnpj
+        self._responder(200, documento)
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+
+class _Medidas:
+    """Latências e erros por endpoint, preenchidos pelas threads dos usuários."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.latencias = {}
+        self.erros = {}
+
+    def registrar(self, endpoint, segundos, ok):
+        with self._trava:
+            self.latencias.setdefault(endpoint, []).append(segundos)
+            self.erros[endpoint] = self.erros.get(endpoint, 0) + (0 if ok else 1)
+
+    def resumo(self, duracao):
+        """Linhas do relatório: uma por endpoint, na ordem de `_ENDPOINTS`, e o total."""
+        linhas = []
+        todas, erros = [], 0
+        for endpoint in _ENDPOINTS:
+            latencias = self.latencias.get(endpoint)
+            if not latencias:
+                continue
+            linhas.append(_linha(endpoint, latencias, self.erros[endpoint], duracao))
+            todas.extend(latencias)
+            erros += self.erros[endpoint]
+        if todas:
+            linhas.append(_linha('total', todas, erros, duracao))
+        return linhas
+
+
+def _linha(endpoint, latencias, erros, duracao):
+    ms = [l * 1000 for l in latencias]
+    return {
+        'endpoint': endpoint,
+        'requisicoes': len(ms),
+        'req_s': round(len(ms) / duracao, 2),
+        'p50_ms': round(_percentil(ms, 0.5), 1),
+        'p95_ms': round(_percentil(ms, 0.95), 1),
+        'p99_ms': round(_percentil(ms, 0.99), 1),
+        'max_ms': round(max(ms), 1),
+        'erros': erros,
+        'taxa_erros': round(erros / len(ms), 4),
+    }
+
+
+class _Usuario:
+    """Usuário virtual com conexão keep-alive própria.
+
+    Os cookies ficam num dict e vão no cabeçalho: os de sessão/CSRF são `Secure` e o
+    cliente não os mandaria por HTTP. O `X-Forwarded-Proto` faz o papel do roteador
+    HTTPS da plataforma (`SECURE_PROXY_SSL_HEADER`).
+    """
+
+    def __init__(self, base, medidas):
+        import requests
+
+        self.base = base
+        self.host = base.split('://', 1)[1]
+        self.medidas = medidas
+        self.http = requests.Session()
+        self.cookies = {}
+
+    def pedir(self, metodo, caminho, endpoint, esperado=200, **kwargs):
+        """Faz a requisição e registra a latência; devolve a resposta ou None se falhou."""
+        import requests
+
+        headers = {'X-Forwarded-Proto': 'https', 'Referer': f'https://{self.host}/'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if metodo == 'POST' and 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        inicio = time.perf_counter()
+        try:
+            resposta = self.http.request(metodo, self.base + caminho, headers=headers, allow_redirects=False,
+                                         timeout=130, **kwargs)
+        except requests.RequestException:
+            resposta = None
+        self.medidas.registrar(endpoint, time.perf_counter() - inicio, resposta is not None and resposta.status_code == esperado)
+        if resposta is None:
+            return None
+        self.cookies.update(resposta.cookies.get_dict())
+        return resposta if resposta.status_code == esperado else None
+
+
+def _csv_carga(inicio, linhas):
+    """CSV de upload com `linhas` CNPJs distintos a partir do índice global `inicio`."""
+    saida = io.StringIO()
+    saida.write('processo,cnpj\n')
+    for n in range(inicio, inicio + linhas):
+        saida.write(f'{n},{format_cnpj(_cnpj(n % 1_000_000, 10 + n // 1_000_000))}\n')
+    return saida.getvalue().encode()
+
+
+def _percorrer(usuario, nome, arquivo, fim, rnd, max_plano):
+    """Caminho de um usuário virtual até `fim` (time.monotonic)."""
+    resposta = usuario.pedir('GET', '/login/', 'GET /login/')
+    if resposta is None:
+        return
+    m = _CSRF_FORM.search(resposta.text)
+    dados = {'username': nome, 'password': _SENHA, 'csrfmiddlewaretoken': m.group(1) if m else ''}
+    if usuario.pedir('POST', '/login/', 'POST /login/', esperado=302, data=dados) is None:
+        return
+    if usuario.pedir('POST', '/jobs/start/', 'POST /jobs/start/', files={'csv_file': ('carga.csv', arquivo, 'text/csv')}) is None:
+        return
+    lotes = 0
+    while time.monotonic() < fim and (not max_plano or lotes < max_plano):
+        resposta = usuario.pedir('POST', '/jobs/plan/', 'POST /jobs/plan/')
+        if resposta is None:
+            break
+        status = resposta.json().get('status')
+        if status == 'planned':
+            break
+        if status == 'busy':
+            time.sleep(0.5)
+            continue
+        lotes += 1
+    while time.monotonic() < fim:
+        resposta = usuario.pedir('POST', '/jobs/step/', 'POST /jobs/step/')
+        if resposta is None:
+            break
+        passo = resposta.json()
+        if passo.get('status') == 'busy':
+            time.sleep(0.5)
+            continue
+        if passo.get('status') in ('done', 'cancelled', 'paused'):
+            break
+        cnpj = ''.join(ch for ch in str((passo.get('item') or {}).get('cnpj') or '') if ch.isdigit())
+        for endpoint, rota, probabilidade in _MIX:
+            if rnd.random() < probabilidade and (cnpj or '{cnpj}' not in rota):
+                usuario.pedir('GET', rota.format(cnpj=cnpj), endpoint)
+    usuario.pedir('POST', '/jobs/cancel/', 'POST /jobs/cancel/')
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _env_banco():
+    """Variáveis que apontam o servidor para o banco de teste deste processo."""
+    dados = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        return {'DATABASE_URL': f"sqlite:///{dados['NAME']}"}
+    # PG* em vez de DATABASE_URL: fora do RUN_LOCAL, DATABASE_URL exige SSL
+    return {
+        'DATABASE_URL': '', 'PGDATABASE': dados['NAME'], 'PGUSER': dados['USER'] or '',
+        'PGPASSWORD': dados['PASSWORD'] or '', 'PGHOST': dados['HOST'] or 'localhost', 'PGPORT': str(dados['PORT'] or 5432),
+    }
+
+
+def _semear_historico(total, por_execucao=1000):
+    """Execuções concluídas com `total` resultados sintéticos (raízes abaixo das do teste)."""
+    for inicio in range(0, total, por_execucao):
+        itens = []
+        for i in range(inicio + 1, min(total, inicio + por_execucao) + 1):
+            documento = _documento_sintetico(i)
+            itens.append(_montar_resultado(documento['taxId'], documento))
+        with transaction.atomic():
+            historico = ConsultaHistorico.objects.create(
+                tipo='upload', arquivo_nome=f'carga-{inicio // por_execucao + 1}.csv',
+                cnpjs=','.join(r['cnpj'] for r in itens),
+            )
+            ConsultaResultado.objects.bulk_create(
+                [ConsultaResultado.de_dict(historico.pk, ordem, r) for ordem, r in enumerate(itens)], batch_size=500,
+            )
+
+
+class Command(BaseCommand):
+    help = 'Teste de carga do servidor do Procfile: login, jobs, detalhes e exportações, com um CNPJÁ falso.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', default='5,20', help='Degraus de usuários simultâneos (padrão: 5,20)')
+        parser.add_argument('--duracao', type=float, default=60, help='Segundos por degrau (padrão: 60)')
+        parser.add_argument('--workers', default='1', help='Configurações de --workers do gunicorn (padrão: 1)')
+        parser.add_argument('--views', default='async,sync', help='ASYNC_VIEWS ligado (async) e/ou desligado (sync)')
+        parser.add_argument('--linhas', type=int, default=5000, help='CNPJs no CSV de cada usuário (padrão: 5000)')
+        parser.add_argument('--max-plano', type=int, default=2, help='Lotes de /jobs/plan/ por usuário; 0 = até terminar')
+        parser.add_argument('--historico', type=int, default=10000, help='Resultados no histórico para as exportações')
+        parser.add_argument('--latencia', type=float, default=0.2, help='Latência (s) de uma consulta online ao CNPJÁ falso')
+        parser.add_argument('--latencia-cache', type=float, default=0.05, help='Latência (s) de uma consulta strategy=CACHE')
+        parser.add_argument('--fracao-cache', type=float, default=0.3, help='Fração dos CNPJs no cache do CNPJÁ falso')
+        parser.add_argument('--chaves', type=int, default=0, help='Chaves falsas do CNPJÁ; 0 = uma por usuário do maior degrau')
+        parser.add_argument('--semente', type=int, default=1, help='Semente do sorteio das chamadas extras')
+        parser.add_argument('--saida', help='Grava os resultados neste arquivo JSON')
+        parser.add_argument('--comparar', help='Compara com os resultados de um arquivo JSON gravado antes')
+
+    def handle(self, *args, **opts):
+        try:
+            degraus = [max(1, int(u)) for u in opts['usuarios'].split(',') if u.strip()]
+            workers = [max(1, int(w)) for w in opts['workers'].split(',') if w.strip()]
+        except ValueError:
+            raise CommandError('--usuarios e --workers devem ser listas de inteiros separados por vírgula')
+        modos = [v.strip() for v in opts['views'].split(',') if v.strip()]
+        if not degraus or not workers or not modos or set(modos) - {'async', 'sync'}:
+            raise CommandError("Informe --usuarios, --workers e --views (async e/ou sync)")
+        base = None
+        if opts['comparar']:
+            try:
+                with open(opts['comparar'], encoding='utf-8') as f:
+                    base = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Não foi possível ler {opts["comparar"]}: {e}')
+        if estaticos_desatualizados():
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        _CnpjaCarga.latencia = opts['latencia']
+        _CnpjaCarga.latencia_cache = opts['latencia_cache']
+        _CnpjaCarga.fracao_cache = opts['fracao_cache']
+        stub = ThreadingHTTPServer(('127.0.0.1', 0), _CnpjaCarga)
+        stub.daemon_threads = True
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        banco = settings.DATABASES['default']
+        arquivo = None
+        if banco['ENGINE'].endswith('sqlite3'):
+            fd, arquivo = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            banco.setdefault('TEST', {})['NAME'] = arquivo
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        bancos = runner.setup_databases()
+        try:
+            resultados = self._executar(opts, degraus, workers, modos, stub.server_port)
+        finally:
+            runner.teardown_databases(bancos)
+            stub.shutdown()
+            if arquivo and os.path.exists(arquivo):
+                os.remove(arquivo)
+
+        if opts['saida']:
+            with open(opts['saida'], 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, ensure_ascii=False, indent=1)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['saida']}"))
+        if base is not None:
+            self._comparar(base, resultados)
+
+    def _executar(self, opts, degraus, workers, modos, porta_stub):
+        User = get_user_model()
+        senha = make_password(_SENHA)  # um hash só: o custo do PBKDF2 fica no login, não na preparação
+        User.objects.bulk_create([User(username=f'carga-{i}', password=senha) for i in range(max(degraus))])
+        inicio = time.perf_counter()
+        _semear_historico(opts['historico'])
+        self.stdout.write(f"Histórico: {opts['historico']} resultados em {time.perf_counter() - inicio:.1f}s")
+        chaves = opts['chaves'] or max(degraus)
+        env = dict(
+            os.environ, **_env_banco(),
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'consulta_cnpj_cpf.settings'),
+            RUN_LOCAL='False', DEBUG='False',
+            CNPJA_BASE_URL=f'http://127.0.0.1:{porta_stub}',
+            CNPJA_API_KEYS=','.join(f'carga-{i}' for i in range(chaves)),
+        )
+        resultados = {
+            'gerado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'ambiente': {
+                'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count(),
+                'banco': connection.vendor, 'redis': bool(os.environ.get('REDIS_URL')),
+            },
+            'parametros': {k: opts[k] for k in (
+                'duracao', 'linhas', 'max_plano', 'historico', 'latencia', 'latencia_cache', 'fracao_cache', 'semente',
+            )} | {'chaves': chaves, 'mix': {endpoint: p for endpoint, _, p in _MIX}},
+            'resultados': [],
+        }
+        proximo_cnpj = 0
+        for n_workers in workers:
+            if n_workers > 1 and (not os.environ.get('REDIS_URL') or connection.vendor != 'postgresql'):
+                self.stdout.write(self.style.WARNING(
+                    f'workers={n_workers}: pulado (mais de um worker exige REDIS_URL e PostgreSQL)'))
+                continue
+            for modo in modos:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\nworkers={n_workers} views={modo}'))
+                env_servidor = dict(env, WEB_CONCURRENCY=str(n_workers), ASYNC_VIEWS=str(modo == 'async'))
+                with self._servidor(n_workers, env_servidor) as url:
+                    for usuarios in degraus:
+                        arquivos = [_csv_carga(proximo_cnpj + i * opts['linhas'], opts['linhas']) for i in range(usuarios)]
+                        proximo_cnpj += usuarios * opts['linhas']
+                        linhas = self._degrau(url, usuarios, arquivos, opts)
+                        self._mostrar(usuarios, linhas)
+                        resultados['resultados'].extend(
+                            {'workers': n_workers, 'views': modo, 'usuarios': usuarios, **linha} for linha in linhas)
+        return resultados
+
+    def _degrau(self, url, usuarios, arquivos, opts):
+        medidas = _Medidas()
+        inicio = time.monotonic()
+        fim = inicio + opts['duracao']
+        threads = [
+            threading.Thread(target=_percorrer, args=(
+                _Usuario(url, medidas), f'carga-{i}', arquivos[i], fim,
+                random.Random(opts['semente'] * 1000 + i), opts['max_plano'],
+            ))
+            for i in range(usuarios)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return medidas.resumo(time.monotonic() - inicio)
+
+    @contextmanager
+    def _servidor(self, n_workers, env):
+        """O processo web do Procfile, sem o `preparar_boot` (o banco de teste já está pronto); produz a URL."""
+        import requests
+
+        porta = _porta_livre()
+        url = f'http://127.0.0.1:{porta}'
+        with tempfile.TemporaryFile() as log:
+            proc = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', 'consulta_cnpj_cpf.asgi:application',
+                 '-k', 'uvicorn_worker.UvicornWorker', '--bind', f'127.0.0.1:{porta}',
+                 '--workers', str(n_workers), '--timeout', '120', '--log-level', 'warning'],
+                cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+
+            def _saida():
+                log.seek(0)
+                return log.read().decode(errors='replace')
+
+            try:
+                fim = time.monotonic() + 60
+                while True:
+                    try:
+                        if requests.get(f'{url}/saude/', timeout=2).status_code == 200:
+                            break
+                    except requests.RequestException:
+                        pass
+                    if proc.poll() is not None or time.monotonic() > fim:
+                        raise CommandError(f'O servidor não respondeu em /saude/:\n{_saida()[-4000:]}')
+                    time.sleep(0.2)
+                yield url
+            finally:
+                if proc.poll() is None:
+                    proc.send_signal(signal.SIGTERM)
+                    try:
+                        proc.wait(30)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+            saida = _saida()
+            if 'Traceback' in saida:
+                self.stderr.write(f'Erros no log do servidor; último trecho:\n{saida[-3000:]}')
+
+    def _mostrar(self, usuarios, linhas):
+        self.stdout.write(
+            f"\n  {usuarios} usuário(s)\n  {'endpoint':<30} {'req':>6} {'req/s':>7} {'p50':>9} {'p95':>9}"
+            f" {'p99':>9} {'máx':>9} {'erros':>6}"
+        )
+        for l in linhas:
+            self.stdout.write(
+                f"  {l['endpoint']:<30} {l['requisicoes']:>6} {l['req_s']:>7.2f} {l['p50_ms']:>7.1f}ms"
+                f" {l['p95_ms']:>7.1f}ms {l['p99_ms']:>7.1f}ms {l['max_ms']:>7.1f}ms {l['erros']:>6}"
+            )
+
+    def _comparar(self, base, atual):
+        """Vazão e p95 atuais contra `base`, por configuração, degrau e endpoint."""
+        def _chave(l):
+            return l['workers'], l['views'], l['usuarios'], l['endpoint']
+
+        anteriores = {_chave(l): l for l in base.get('resultados', [])}
+        self.stdout.write(f"\nComparação com {base.get('gerado_em', '?')} (positivo = maior agora)")
+        antes, agora = base.get('parametros') or {}, atual['parametros']
+        diferentes = sorted(k for k in agora if antes.get(k) != agora[k])
+        if diferentes or base.get('ambiente') != atual['ambiente']:
+            self.stdout.write(self.style.WARNING(
+                f"Parâmetros ou ambiente diferentes ({', '.join(diferentes) or 'ambiente'}): compare com cautela"))
+        self.stdout.write(f"  {'configuração':<22} {'endpoint':<30} {'req/s':>9} {'p95':>9} {'erros':>12}")
+        for l in atual['resultados']:
+            antes = anteriores.get(_chave(l))
+            if antes is None:
+                continue
+
+            def _delta(campo):
+                return f'{(l[campo] / antes[campo] - 1) * 100:+.0f}%' if antes[campo] else '-'
+
+            self.stdout.write(
+                f"  {'w=%d %s %du' % (l['workers'], l['views'], l['usuarios']):<22} {l['endpoint']:<30}"
+                f" {_delta('req_s'):>9} {_delta('p95_ms'):>9} {antes['erros']:>5} -> {l['erros']:<5}"
+            )
@@ -0,0 +1,153 @@
+"""Benchmark do armazenamento de `detalhes`: JSON puro x JSON comprimido.
+
+Compara, sobre os mesmos documentos, o tamanho gravado e o tempo de leitura
+(bytes do banco -> objeto Python) de:
+
+- json: texto JSON, como um `JSONField` (no PostgreSQL o jsonb ainda pode ser
+  comprimido pelo TOAST quando passa de ~2 KB, o que raramente acontece com `detalhes`);
+- zlib: `comprimir` sem dicionário (versão 0);
+- zlib+dict v<N>: o formato atual do `JSONComprimidoField`;
+- zlib+treinado: dicionário montado por `treinar_dicionario` com metade das amostras
+  e medido na outra metade (estimativa do ganho de um dicionário novo).
+
+As amostras vêm do banco (`ConsultaResultado.detalhes` ou, com `--fonte documentos`,
+os documentos completos de `ConsultaDocumento`); sem dados, use `--sinteticos N`.
+
+Uso:
+    python manage.py bench_json
+    python manage.py bench_json --fonte documentos --limite 5000
+    python manage.py bench_json --sinteticos 2000 --salvar /tmp/dicionario.bin
+"""
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from consulta.compressao import VERSAO_ATUAL, comprimir, descomprimir, treinar_dicionario
+from consulta.models import ConsultaDocumento, ConsultaResultado
+
+_ATIVIDADES = (
+    (4781400, 'Comércio varejista de artigos do vestuário e acessórios'),
+    (5611201, 'Restaurantes e similares'),
+    (4930202, 'Transporte rodoviário de carga, exceto produtos perigosos e mudanças, intermunicipal, interestadual e internacional'),
+    (6201501, 'Desenvolvimento de programas de computador sob encomenda'),
+    (4744099, 'Comércio varejista de materiais de construção em geral'),
+    (8211300, 'Serviços combinados de escritório e apoio administrativo'),
+    (4399103, 'Obras de alvenaria'),
+    (7319002, 'Promoção de vendas'),
+)
+_CIDADES = ((3550308, 'São Paulo', 'SP'), (3304557, 'Rio de Janeiro', 'RJ'), (3106200, 'Belo Horizonte', 'MG'), (4106902, 'Curitiba', 'PR'))
+
+
+def _documento_sintetico(i):
+    """Documento no formato do /office do CNPJÁ, com valores variados."""
+    rnd = random.Random(i)
+    principal = rnd.choice(_ATIVIDADES)
+    municipio, cidade, uf = rnd.choice(_CIDADES)
+    cnpj = f'{i:08d}0001{rnd.randint(10, 99)}'
+    return {
+        'updated': f'2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T00:00:00.000Z',
+        'taxId': cnpj,
+        'alias': None if rnd.random() < 0.6 else f'Fantasia {i}',
+        'founded': f'{rnd.randint(1980, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+        'head': True,
+        'company': {
+            'members': [
+                {
+                    'since': f'{rnd.randint(1990, 2024)}-01-01',
+                    'person': {'id': f'{rnd.getrandbits(64):x}', 'type': 'NATURAL', 'name': f'Pessoa {i}-{m}',
+                               'taxId': f'***{rnd.randint(100000, 999999)}**', 'age': rnd.choice(('31-40', '41-50', '51-60'))},
+                    'role': {'id': 49, 'text': 'Sócio-Administrador'},
+                }
+                for m in range(rnd.randint(1, 3))
+            ],
+            'id': int(cnpj[:8]),
+            'name': f'Empresa {i} LTDA',
+            'equity': rnd.choice((1000, 10000, 50000, 100000)),
+            'nature': {'id': 2062, 'text': 'Sociedade Empresária Limitada'},
+            'size': {'id': 1, 'acronym': 'ME', 'text': 'Microempresa'},
+            'simples': {'optant': True, 'since': '2019-01-01'},
+            'simei': {'optant': False, 'since': None},
+        },
+        'statusDate': '2005-11-03',
+        'status': {'id': 2, 'text': 'Ativa'},
+        'address': {
+            'municipality': municipio, 'street': f'Rua {rnd.randint(1, 500)}', 'number': str(rnd.randint(1, 3000)),
+            'district': 'Centro', 'city': cidade, 'state': uf, 'details': None,
+            'zip': f'{rnd.randint(10000000, 99999999)}', 'country': {'id': 76, 'name': 'Brasil'},
+        },
+        'mainActivity': {'id': principal[0], 'text': principal[1]},
+        'phones': [{'type': 'LANDLINE', 'area': '11', 'number': f'{rnd.randint(30000000, 39999999)}'}],
+        'emails': [{'ownership': 'CORPORATE', 'address': f'contato{i}@empresa{i}.com.br', 'domain': f'empresa{i}.com.br'}],
+        'sideActivities': [{'id': a, 'text': t} for a, t in rnd.sample(_ATIVIDADES, rnd.randint(0, 4))],
+        'registrations': [],
+        'suframa': [],
+    }
+
+
+def _amostras(opts):
+    if opts['sinteticos']:
+        return [_documento_sintetico(i) for i in range(opts['sinteticos'])]
+    if opts['fonte'] == 'documentos':
+        qs = ConsultaDocumento.objects.order_by('-pk').values_list('dados', flat=True)
+    else:
+        qs = ConsultaResultado.objects.filter(detalhes__isnull=False).order_by('-pk').values_list('detalhes', flat=True)
+    return [d for d in qs[:opts['limite']] if isinstance(d, dict)]
+
+
+def _medir(nome, docs, gravar, ler, repeticoes):
+    """(nome, bytes totais, mediana de µs por leitura)."""
+    gravados = [gravar(d) for d in docs]
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for g in gravados:
+            ler(g)
+        tempos.append((time.perf_counter() - inicio) / len(gravados))
+    return nome, sum(len(g) for g in gravados), statistics.median(tempos) * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Compara tamanho e tempo de leitura de detalhes em JSON puro e comprimido.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fonte', choices=('detalhes', 'documentos'), default='detalhes',
+                            help='ConsultaResultado.detalhes (padrão) ou ConsultaDocumento')
+        parser.add_argument('--limite', type=int, default=2000, help='Amostras lidas do banco (padrão: 2000)')
+        parser.add_argument('--sinteticos', type=int, default=0, help='Usa N documentos sintéticos em vez do banco')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Rodadas de leitura (padrão: 5)')
+        parser.add_argument('--salvar', help='Grava o dicionário treinado neste arquivo')
+
+    def handle(self, *args, **opts):
+        docs = _amostras(opts)
+        if len(docs) < 2:
+            raise CommandError('Poucas amostras no banco; use --sinteticos N.')
+        random.Random(0).shuffle(docs)
+        treino, teste = docs[:len(docs) // 2], docs[len(docs) // 2:]
+        dicionario = treinar_dicionario(treino)
+        repeticoes = max(1, opts['repeticoes'])
+
+        def _json(d):
+            return json.dumps(d, ensure_ascii=False).encode('utf-8')
+
+        medidas = [
+            _medir('json (JSONField)', teste, _json, lambda b: json.loads(b.decode('utf-8')), repeticoes),
+            _medir('zlib', teste, lambda d: comprimir(d, versao=0), descomprimir, repeticoes),
+            _medir(f'zlib+dict v{VERSAO_ATUAL}', teste, comprimir, descomprimir, repeticoes),
+            _medir('zlib+treinado', teste, lambda d: comprimir(d, versao=0xFF, dicionario=dicionario),
+                   lambda b: descomprimir(b, dicionario=dicionario), repeticoes),
+        ]
+
+        base = medidas[0][1]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'\n{len(teste)} documentos medidos ({len(treino)} no treino; dicionário treinado: {len(dicionario)} bytes)'))
+        self.stdout.write(f"  {'formato':<20} {'total':>12} {'média/doc':>10} {'razão':>7} {'leitura/doc':>12}")
+        for nome, total, leitura in medidas:
+            self.stdout.write(f'  {nome:<20} {total:>12,} {total / len(teste):>9.0f}B {total / base:>6.1%} {leitura:>10.1f}µs')
+
+        if opts['salvar']:
+            with open(opts['salvar'], 'wb') as f:
+                f.write(dicionario)
+            self.stdout.write(f"\nDicionário treinado gravado em {opts['salvar']}")
@@ -0,0 +1,167 @@
+"""Benchmark da extração de itens de XLSX (`jobs_start`).
+
+Compara três caminhos sobre o mesmo arquivo:
+- legado: implementação anterior (openpyxl com objetos de célula);
+- openpyxl: fallback de `ler_xlsx` (`values_only`, dimensões ignoradas);
+- ler_xlsx: leitor enxuto de `consulta.xlsx`.
+
+Uso:
+    python manage.py bench_xlsx --linhas 200000
+    python manage.py bench_xlsx --arquivo planilha.xlsx --sheet Dados
+    python manage.py bench_xlsx --sem-cabecalho --formatado --memoria
+
+Sem `--arquivo`, gera uma planilha sintética temporária (strings compartilhadas,
+como o Excel grava). `--formatado` acrescenta linhas/colunas vazias porém
+formatadas após os dados (caso típico de planilhas exportadas por ERPs).
+"""
+import contextlib
+import io
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+import xlsxwriter
+from django.core.management.base import BaseCommand
+
+from consulta import xlsx
+from consulta.services import clean_cnpj, extrair_itens_xlsx
+
+
+def _extrair_legado(path, sheet=None):
+    """Réplica da extração de `jobs_start` antes do `ler_xlsx` (sem os prints por item)."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb[sheet] if sheet else wb.active
+    items = []
+    header_row = next(ws.iter_rows(min_row=1, max_row=1))
+    headers = [str(c.value).strip().lower() if c.value else '' for c in header_row]
+    cnpj_idx = next((i for i, h in enumerate(headers) if any(k in h for k in ['cnpj', 'cnpj/cpf', 'cnpj_cpf'])), None)
+    proc_idx = next((i for i, h in enumerate(headers) if any(k in h for k in ['processo', 'número do processo'])), None)
+    if cnpj_idx is not None:
+        for row in ws.iter_rows(min_row=2):
+            val = row[cnpj_idx].value if cnpj_idx < len(row) else ''
+            cnpj_val = clean_cnpj(str(val) if val is not None else '')
+            proc_val = (str(row[proc_idx].value).strip() if (proc_idx is not None and row[proc_idx].value) else None)
+            if len(cnpj_val) == 14:
+                items.append({'cnpj': cnpj_val, 'processo': proc_val})
+    else:
+        pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
+        for row in ws.iter_rows(min_row=1):
+            for cell in row:
+                if cell.value is None:
+                    continue
+                for m in pattern.findall(str(cell.value)):
+                    digits = clean_cnpj(m)
+                    if len(digits) == 14:
+                        items.append({'cnpj': digits, 'processo': None})
+    wb.close()
+    return items
+
+
+def _gerar_planilha(path, linhas, cabecalho=True, formatado=False, inline=False):
+    # constant_memory grava strings inline; o padrão (compartilhadas) é o do Excel
+    wb = xlsxwriter.Workbook(path, {'constant_memory': inline})
+    ws = wb.add_worksheet('Dados')
+    fmt = wb.add_format({'bg_color': '#FFF2CC'})
+    r = 0
+    if cabecalho:
+        ws.write_row(r, 0, ['CNPJ', 'Processo', 'DSEvento', 'Oportunidade', 'Substâncias', 'Observação'])
+        r += 1
+    for i in range(linhas):
+        base = 11222333 + (i % 50000)
+        cnpj = f"{base:08d}0001{i % 100:02d}"
+        proc = f"{870000 + i % 1000}/20{17 + i % 8}"
+        ws.write_row(r, 0, [cnpj, proc, 'Requerimento de pesquisa', 'Sim' if i % 3 else 'Não', 'Ouro, Cobre', f'linha {i}'])
+        if formatado:
+            # células vazias formatadas até a coluna Z
+            for c in range(6, 26):
+                ws.write_blank(r, c, None, fmt)
+        r += 1
+    if formatado:
+        for extra in range(r, r + linhas // 2):
+            ws.write_blank(extra, 0, None, fmt)
+            ws.write_blank(extra, 25, None, fmt)
+    wb.close()
+
+
+def _extrair_openpyxl(path, sheet=None):
+    """`extrair_itens_xlsx` forçando o fallback via openpyxl."""
+    original = xlsx.LeitorXlsx
+
+    def _indisponivel(file):
+        raise xlsx.XlsxNaoSuportado('forçado pelo benchmark')
+
+    # `ler_xlsx` importa o leitor de `consulta.xlsx` a cada chamada
+    xlsx.LeitorXlsx = _indisponivel
+    try:
+        return extrair_itens_xlsx(path, sheet=sheet)
+    finally:
+        xlsx.LeitorXlsx = original
+
+
+class Command(BaseCommand):
+    help = 'Compara o tempo (e opcionalmente a memória) da extração de itens de XLSX.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', help='XLSX existente (padrão: gera um sintético)')
+        parser.add_argument('--sheet', help='Planilha a ler (nome ou número); padrão: a ativa')
+        parser.add_argument('--linhas', type=int, default=100000, help='Linhas do XLSX sintético')
+        parser.add_argument('--sem-cabecalho', action='store_true', help='Gera sem cabeçalho (força a varredura por regex)')
+        parser.add_argument('--formatado', action='store_true', help='Gera linhas/colunas vazias formatadas após os dados')
+        parser.add_argument('--inline', action='store_true', help='Gera com strings inline em vez de compartilhadas')
+        parser.add_argument('--repeticoes', type=int, default=1, help='Execuções por implementação (vale a melhor)')
+        parser.add_argument('--memoria', action='store_true', help='Mede o pico de memória (execução extra com tracemalloc)')
+
+    def handle(self, *args, **opts):
+        path = opts['arquivo']
+        temporario = None
+        if not path:
+            fd, temporario = tempfile.mkstemp(suffix='.xlsx')
+            os.close(fd)
+            path = temporario
+            t0 = time.perf_counter()
+            _gerar_planilha(path, opts['linhas'], cabecalho=not opts['sem_cabecalho'],
+                            formatado=opts['formatado'], inline=opts['inline'])
+            self.stdout.write(f"Planilha sintética: {opts['linhas']} linhas, {os.path.getsize(path) / 1e6:.1f} MB "
+                              f"(gerada em {time.perf_counter() - t0:.1f}s)")
+        sheet = opts['sheet']
+        legado_sheet = sheet
+        if legado_sheet and legado_sheet.isdigit():
+            legado_sheet = openpyxl.load_workbook(path, read_only=True).sheetnames[int(legado_sheet) - 1]
+        implementacoes = (
+            ('legado', lambda: _extrair_legado(path, legado_sheet)),
+            ('openpyxl', lambda: _extrair_openpyxl(path, sheet)),
+            ('ler_xlsx', lambda: extrair_itens_xlsx(path, sheet=sheet)),
+        )
+        saida = self.stdout
+        try:
+            medidas = {}
+            for nome, fn in implementacoes:
+                melhor = None
+                for _ in range(max(1, opts['repeticoes'])):
+                    t0 = time.perf_counter()
+                    # silencia os prints de diagnóstico do upload
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        n = len(fn())
+                    dt = time.perf_counter() - t0
+                    melhor = dt if melhor is None or dt < melhor else melhor
+                pico = ''
+                if opts['memoria']:
+                    tracemalloc.start()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        fn()
+                    pico = f"  pico {tracemalloc.get_traced_memory()[1] / 1e6:6.1f} MB"
+                    tracemalloc.stop()
+                medidas[nome] = (melhor, n)
+                saida.write(f"{nome:>9}: {melhor:7.2f}s  {n} itens  ({n / melhor if melhor else 0:,.0f} itens/s){pico}")
+            if len({n for _, n in medidas.values()}) > 1:
+                saida.write(self.style.WARNING('Atenção: as implementações extraíram quantidades diferentes de itens.'))
+            base = medidas['legado'][0]
+            for nome in ('openpyxl', 'ler_xlsx'):
+                dt = medidas[nome][0]
+                saida.write(self.style.SUCCESS(f"{nome}: {base / dt if dt else 0:.1f}x em relação ao legado"))
+        finally:
+            if temporario:
+                os.remove(temporario)
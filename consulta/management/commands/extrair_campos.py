@@ -0,0 +1,48 @@
+"""Preenche as colunas extraídas de `ConsultaResultado` a partir do JSON `detalhes`.
+
+Resultados gravados antes do pipeline de extração (ou depois de mudar `CNPJ_EXTRATORES`)
+não têm as colunas; este comando roda o pipeline sobre o JSON já gravado, sem consultar
+a API, em lotes de `--lote` linhas (uma transação curta por lote).
+
+Uso:
+    python manage.py extrair_campos           # só linhas ainda sem colunas extraídas
+    python manage.py extrair_campos --todos   # recalcula tudo (pipeline alterado)
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from consulta.extracao import extrair_campos
+from consulta.models import ConsultaResultado
+
+
+class Command(BaseCommand):
+    help = 'Preenche as colunas extraídas dos resultados gravados a partir do JSON do CNPJÁ.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help='Recalcula também as linhas já preenchidas')
+        parser.add_argument('--lote', type=int, default=1000, help='Linhas por transação (padrão: 1000)')
+
+    def handle(self, *args, **opts):
+        lote = max(1, opts['lote'])
+        campos = list(ConsultaResultado.CAMPOS_EXTRAIDOS)
+        qs = ConsultaResultado.objects.filter(detalhes__isnull=False)
+        if not opts['todos']:
+            qs = qs.filter(situacao='', uf='', cnae_principal__isnull=True, atualizado__isnull=True)
+        ultimo = 0
+        total = 0
+        while True:
+            # Faixa por pk: cada lote é uma varredura do índice a partir do último id
+            linhas = list(qs.filter(pk__gt=ultimo).order_by('pk').only('pk', 'detalhes')[:lote])
+            if not linhas:
+                break
+            for linha in linhas:
+                valores = extrair_campos(linha.detalhes)
+                for campo in campos:
+                    padrao = ConsultaResultado._meta.get_field(campo).get_default()
+                    setattr(linha, campo, valores.get(campo, padrao))
+            with transaction.atomic():
+                ConsultaResultado.objects.bulk_update(linhas, campos)
+            ultimo = linhas[-1].pk
+            total += len(linhas)
+            self.stdout.write(f'{total} linhas processadas')
+        self.stdout.write(self.style.SUCCESS(f'Extração concluída: {total} linhas'))
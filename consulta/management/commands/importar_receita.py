@@ -0,0 +1,72 @@
+"""Importa os dados abertos do CNPJ (Receita Federal) para a base local.
+
+Baixe os ZIPs do mês em https://dadosabertos.rfb.gov.br/CNPJ/ (Empresas0..9,
+Estabelecimentos0..9, Socios0..9, Cnaes, Municipios, Naturezas, Qualificacoes) e
+aponte o diretório ou os arquivos. Cada tabela encontrada é substituída por inteiro,
+em streaming e em lotes (`COPY` no PostgreSQL; ver `consulta.receita_carga`). Depois,
+com `CNPJ_BASE_LOCAL=True`, as consultas respondem pela base local quando ela tem o
+CNPJ com os campos necessários (`consulta.receita`).
+
+Uso:
+    python manage.py importar_receita /dados/cnpj/2025-09
+    python manage.py importar_receita Empresas*.zip Estabelecimentos*.zip --referencia 2025-09
+    python manage.py importar_receita /dados/cnpj/2025-09 --tabelas tabelas,empresas --limite 1000
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from consulta.receita_carga import LOTE, ORDEM, carregar_tabela, listar_arquivos, referencia_do_caminho
+
+
+def _referencia(valor):
+    try:
+        partes = [int(p) for p in valor.split('-')]
+        return date(partes[0], partes[1], partes[2] if len(partes) > 2 else 1)
+    except (ValueError, IndexError):
+        raise CommandError(f'--referencia inválida: {valor!r} (use AAAA-MM ou AAAA-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'Importa os arquivos de dados abertos do CNPJ da Receita Federal para a base local.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('caminhos', nargs='+', help='Diretório(s) ou arquivos ZIP/CSV da Receita')
+        parser.add_argument('--referencia', help='Mês dos arquivos (AAAA-MM); padrão: tirado do caminho')
+        parser.add_argument('--tabelas', help=f"Só estas tabelas, separadas por vírgula ({', '.join(ORDEM)})")
+        parser.add_argument('--lote', type=int, default=LOTE, help=f'Linhas por lote gravado (padrão: {LOTE})')
+        parser.add_argument('--sem-copy', action='store_true', help='Grava com bulk_create mesmo no PostgreSQL')
+        parser.add_argument('--limite', type=int, default=None, help='Lê no máximo N linhas por arquivo (testes)')
+
+    def handle(self, *args, **opts):
+        arquivos, ignorados = listar_arquivos(opts['caminhos'])
+        for nome in ignorados:
+            self.stdout.write(f'Ignorado: {nome}')
+        if opts['tabelas']:
+            escolhidas = {t.strip() for t in opts['tabelas'].split(',') if t.strip()}
+            desconhecidas = escolhidas - set(ORDEM)
+            if desconhecidas:
+                raise CommandError(f"Tabelas desconhecidas: {', '.join(sorted(desconhecidas))}")
+            arquivos = {t: a for t, a in arquivos.items() if t in escolhidas}
+        if not arquivos:
+            raise CommandError('Nenhum arquivo da Receita reconhecido.')
+        if opts['referencia']:
+            referencia = _referencia(opts['referencia'])
+        else:
+            referencia = next(filter(None, (referencia_do_caminho(c) for c in opts['caminhos'])), None)
+            if referencia is None:
+                raise CommandError('Informe --referencia (AAAA-MM): não foi possível tirá-la do caminho.')
+        lote = max(1000, opts['lote'])
+
+        for tabela in ORDEM:
+            if tabela not in arquivos:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{tabela} ({len(arquivos[tabela])} arquivo(s), referência {referencia:%Y-%m})"))
+
+            def _progresso(linhas, segundos):
+                self.stdout.write(f'  {linhas:,} linhas ({linhas / max(segundos, 0.001):,.0f}/s)')
+
+            total = carregar_tabela(tabela, arquivos[tabela], referencia, lote=lote, usar_copy=not opts['sem_copy'],
+                                    limite=opts['limite'], progresso=_progresso)
+            self.stdout.write(self.style.SUCCESS(f'  {tabela}: {total:,} linhas carregadas'))
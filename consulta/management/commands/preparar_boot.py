@@ -0,0 +1,110 @@
+"""Preparação do boot do processo web: migrate e collectstatic só quando necessário.
+
+Substitui, no `Procfile`, o laço de `migrate` seguido de `collectstatic` (três
+interpretadores e dois `django.setup()` a cada restart/scale de dyno) por um único
+processo que:
+
+- espera o banco responder (até `--tentativas`, com `--espera` segundos entre elas);
+- roda `migrate` só se houver migrações não aplicadas (o plano vazio é só uma leitura
+  de `django_migrations`);
+- roda `collectstatic` só se algum arquivo estático de origem não estiver em
+  `STATIC_ROOT` com o mesmo tamanho e data igual ou mais nova, ou se o manifesto do
+  storage (`staticfiles.json`) estiver faltando. O slug do Heroku já vem com o
+  `collectstatic` do build, então no boot normal nada é copiado nem comprimido.
+
+Uso:
+    python manage.py preparar_boot
+    python manage.py preparar_boot --forcar     # roda migrate e collectstatic sempre
+"""
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import OperationalError
+
+
+def migracoes_pendentes(alias=DEFAULT_DB_ALIAS):
+    """Migrações ainda não aplicadas no banco (lista de (app, nome))."""
+    executor = MigrationExecutor(connections[alias])
+    plano = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [(m.app_label, m.name) for m, _ in plano]
+
+
+def estaticos_desatualizados():
+    """Caminhos de estáticos cuja cópia em `STATIC_ROOT` falta ou está velha.
+
+    Retorna ['<manifesto>'] quando o storage usa manifesto e ele não existe.
+    """
+    raiz = settings.STATIC_ROOT
+    if not raiz:
+        return []
+    manifesto = getattr(staticfiles_storage, 'manifest_name', None)
+    if manifesto and not os.path.exists(os.path.join(raiz, manifesto)):
+        return [manifesto]
+    faltando = []
+    vistos = set()
+    for finder in get_finders():
+        for caminho, storage in finder.list(['CVS', '.*', '*~']):
+            if caminho in vistos:
+                continue  # o primeiro finder vence, como no collectstatic
+            vistos.add(caminho)
+            origem = storage.path(caminho)
+            destino = os.path.join(raiz, caminho)
+            try:
+                o, d = os.stat(origem), os.stat(destino)
+            except FileNotFoundError:
+                faltando.append(caminho)
+                continue
+            if o.st_size != d.st_size or o.st_mtime > d.st_mtime:
+                faltando.append(caminho)
+    return faltando
+
+
+class Command(BaseCommand):
+    help = 'Roda migrate/collectstatic no boot só quando há algo a aplicar.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tentativas', type=int, default=10,
+                            help='Tentativas de conexão ao banco (padrão: 10)')
+        parser.add_argument('--espera', type=float, default=3,
+                            help='Segundos entre as tentativas (padrão: 3)')
+        parser.add_argument('--forcar', action='store_true',
+                            help='Roda migrate e collectstatic mesmo sem mudanças')
+
+    def _aguardar_banco(self, tentativas, espera):
+        for tentativa in range(1, max(1, tentativas) + 1):
+            try:
+                connections[DEFAULT_DB_ALIAS].ensure_connection()
+                return
+            except OperationalError as e:
+                if tentativa >= tentativas:
+                    raise CommandError(f'Banco indisponível após {tentativas} tentativas: {e}')
+                self.stdout.write('DB não pronto, tentando novamente...')
+                time.sleep(espera)
+
+    def handle(self, *args, **opts):
+        inicio = time.perf_counter()
+        self._aguardar_banco(opts['tentativas'], opts['espera'])
+
+        pendentes = migracoes_pendentes()
+        if pendentes or opts['forcar']:
+            self.stdout.write(f'[BOOT] {len(pendentes)} migrações pendentes; aplicando...')
+            call_command('migrate', interactive=False, verbosity=1)
+        else:
+            self.stdout.write('[BOOT] Migrações em dia')
+
+        desatualizados = estaticos_desatualizados()
+        if desatualizados or opts['forcar']:
+            exemplo = f' (ex.: {desatualizados[0]})' if desatualizados else ''
+            self.stdout.write(f'[BOOT] {len(desatualizados)} estáticos desatualizados{exemplo}; coletando...')
+            call_command('collectstatic', interactive=False, verbosity=0)
+        else:
+            self.stdout.write('[BOOT] Estáticos em dia')
+
+        self.stdout.write(f'[BOOT] Pronto em {time.perf_counter() - inicio:.2f}s')
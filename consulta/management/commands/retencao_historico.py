@@ -0,0 +1,53 @@
+"""Retenção do histórico: arquiva e apaga execuções antigas e compacta `detalhes`.
+
+Passos (ver `consulta.retencao`):
+1. converte registros antigos com o JSON `resultado` em linhas de `ConsultaResultado`;
+2. grava as execuções com mais de `--dias` dias num NDJSON gzip em `--destino` e as
+   apaga em lotes curtos (com `--dias 0`, nada é arquivado nem apagado);
+3. apaga checkpoints de jobs concluídos/cancelados mais antigos que `--dias`;
+4. troca cópias antigas de `detalhes` idênticas à mais recente do mesmo CNPJ por uma
+   referência a ela (`detalhes_de`).
+
+Uso (ex.: diário pelo Heroku Scheduler ou cron):
+    python manage.py retencao_historico
+    python manage.py retencao_historico --dias 180 --destino /mnt/arquivo
+    python manage.py retencao_historico --simular
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from consulta import retencao
+
+
+class Command(BaseCommand):
+    help = 'Arquiva e apaga execuções antigas do histórico e compacta snapshots de detalhes repetidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Idade mínima (dias) das execuções arquivadas (padrão: HISTORY_RETENTION_DAYS)')
+        parser.add_argument('--destino', default=None,
+                            help='Diretório dos arquivos NDJSON gzip (padrão: HISTORY_ARCHIVE_DIR)')
+        parser.add_argument('--simular', action='store_true',
+                            help='Só mostra o que seria arquivado, sem gravar nem apagar')
+
+    def handle(self, *args, **opts):
+        dias = settings.HISTORY_RETENTION_DAYS if opts['dias'] is None else opts['dias']
+        if dias < 0:
+            raise CommandError('--dias deve ser >= 0')
+        if opts['simular']:
+            expiradas = retencao.historico_expirado(dias)
+            self.stdout.write(f"{expiradas.count()} execuções com mais de {dias} dias "
+                              f"({retencao.ConsultaResultado.objects.filter(historico__in=expiradas).count()} itens)"
+                              if dias else 'Retenção desligada (0 dias): nada seria arquivado.')
+            return
+        resumo = retencao.executar_retencao(destino=opts['destino'], dias=dias)
+        if resumo['convertidas']:
+            self.stdout.write(f"{resumo['convertidas']} execuções antigas convertidas em itens")
+        if resumo['arquivo']:
+            self.stdout.write(f"{resumo['execucoes']} execuções ({resumo['itens']} itens) arquivadas em {resumo['arquivo']}; "
+                              f"{resumo['apagadas']} apagadas")
+        else:
+            self.stdout.write('Nenhuma execução a arquivar')
+        self.stdout.write(f"{resumo['checkpoints']} checkpoints apagados; "
+                          f"{resumo['detalhes_compactados']} snapshots de detalhes repetidos removidos")
+        self.stdout.write(self.style.SUCCESS('Retenção concluída'))
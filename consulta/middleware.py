@@ -0,0 +1,150 @@
+"""Middlewares da app 'consulta'."""
+
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .profiling import PROFILERS, salvar_perfil
+
+
+class WhiteNoiseAsyncMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise com caminho assíncrono.
+
+    O `WhiteNoiseMiddleware` é só síncrono: sob ASGI o Django passaria a rodar toda a
+    cadeia abaixo dele (inclusive as views assíncronas) na thread única de código
+    síncrono, anulando a concorrência. Aqui arquivos estáticos são servidos numa thread
+    e o restante segue assíncrono.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+def _opcao_profiling(request, nome, cabecalho):
+    return (request.GET.get(nome) or request.headers.get(cabecalho) or '').strip().lower()
+
+
+class ProfilingMiddleware:
+    """Profiling de uma requisição, pedido por staff com `?_profile=` ou `X-Profile:`.
+
+    Só entra na cadeia com `PROFILING_ENABLED`; desligado, o Django descarta o middleware
+    (`MiddlewareNotUsed`) e não há custo algum. Parâmetros (query ou cabeçalho):
+    - `_profile` / `X-Profile`: `1` ou `cprofile` (cProfile), `amostra` (amostragem);
+    - `_profile_out` / `X-Profile-Out`: `texto` (padrão; a resposta vira o relatório
+      ordenado) ou `arquivo` (grava `.prof`/`.collapsed` em `PROFILING_DIR` e devolve a
+      resposta normal com `X-Profile-File`);
+    - `_profile_sort` (`cumulative`, `tottime`, `calls`...) e `_profile_limit` (linhas).
+    Respostas em streaming são consumidas dentro do perfil. Um perfil por processo por vez.
+    """
+
+    sync_capable = True
+    async_capable = True
+    _trava = threading.Lock()
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _pedido(request):
+        modo = _opcao_profiling(request, '_profile', 'X-Profile')
+        if modo in ('1', 'true', 'cprofile'):
+            return 'cprofile'
+        return modo if modo in PROFILERS else None
+
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+        modo = self._pedido(request)
+        if modo is None or not request.user.is_staff:
+            return self.get_response(request)
+        if not self._trava.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile'] = 'ocupado'
+            return response
+        try:
+            perfil = PROFILERS[modo]()
+            inicio = time.perf_counter()
+            perfil.iniciar()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    response = self._materializar(response, b''.join(response.streaming_content))
+            finally:
+                perfil.parar()
+            return self._resultado(request, response, perfil, time.perf_counter() - inicio)
+        finally:
+            self._trava.release()
+
+    async def __acall__(self, request):
+        modo = self._pedido(request)
+        if modo is None or not await sync_to_async(lambda: request.user.is_staff)():
+            return await self.get_response(request)
+        if not self._trava.acquire(blocking=False):
+            response = await self.get_response(request)
+            response['X-Profile'] = 'ocupado'
+            return response
+        try:
+            perfil = PROFILERS[modo]()
+            inicio = time.perf_counter()
+            perfil.iniciar()
+            try:
+                response = await self.get_response(request)
+                if response.streaming:
+                    partes = [p async for p in response.streaming_content]
+                    response = self._materializar(response, b''.join(partes))
+            finally:
+                perfil.parar()
+            return await sync_to_async(self._resultado)(request, response, perfil, time.perf_counter() - inicio)
+        finally:
+            self._trava.release()
+
+    @staticmethod
+    def _materializar(response, conteudo):
+        nova = HttpResponse(conteudo, status=response.status_code)
+        for cabecalho, valor in response.items():
+            nova[cabecalho] = valor
+        return nova
+
+    def _resultado(self, request, response, perfil, duracao):
+        if _opcao_profiling(request, '_profile_out', 'X-Profile-Out') == 'arquivo':
+            response['X-Profile-File'] = salvar_perfil(perfil, request.path, duracao)
+            return response
+        try:
+            limite = int(request.GET.get('_profile_limit') or 60)
+        except ValueError:
+            limite = 60
+        ordem = request.GET.get('_profile_sort') or 'cumulative'
+        cabecalho = f"{request.method} {request.get_full_path()} -> {response.status_code} em {duracao * 1000:.1f}ms\n\n"
+        relatorio = HttpResponse(cabecalho + perfil.texto(ordem, limite), content_type='text/plain; charset=utf-8')
+        relatorio['X-Profile-Status'] = str(response.status_code)
+        return relatorio
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('consulta', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('running', 'Em andamento'), ('paused', 'Pausado'), ('cancelled', 'Cancelado'), ('done', 'Concluído')], db_index=True, default='running', max_length=10)),
+                ('tipo', models.CharField(choices=[('manual', 'Manual'), ('upload', 'Upload')], default='manual', max_length=10)),
+                ('arquivo_nome', models.CharField(blank=True, max_length=255, null=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processados', models.PositiveIntegerField(default=0)),
+                ('estado', models.JSONField(default=dict, help_text='Estado do job na sessão (fila, plano etc.), sem os resultados')),
+                ('resultados', models.JSONField(default=list)),
+                ('historico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='consulta.consultahistorico')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs_consulta', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'status', '-atualizado_em'], name='consulta_co_usuario_3e76e7_idx')],
+            },
+        ),
+    ]
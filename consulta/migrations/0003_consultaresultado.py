@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0002_consultajob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultahistorico',
+            name='status',
+            field=models.CharField(choices=[('andamento', 'Em andamento'), ('concluido', 'Concluído')], db_index=True, default='concluido', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='consultahistorico',
+            name='resultado',
+            field=models.JSONField(blank=True, default=list, help_text='Resultados serializados (registros antigos)'),
+        ),
+        migrations.CreateModel(
+            name='ConsultaResultado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveIntegerField()),
+                ('cnpj', models.CharField(db_index=True, help_text='Somente dígitos', max_length=14)),
+                ('nome', models.CharField(blank=True, default='', max_length=255)),
+                ('email', models.TextField(blank=True, default='', help_text="E-mail, 'Sem e-mail' ou a mensagem de erro da consulta")),
+                ('processo', models.CharField(blank=True, max_length=100, null=True)),
+                ('dsevento', models.TextField(blank=True, null=True)),
+                ('oportunidade', models.TextField(blank=True, null=True)),
+                ('substancias', models.TextField(blank=True, null=True)),
+                ('detalhes', models.JSONField(blank=True, help_text='JSON completo do CNPJÁ (ausente em erros)', null=True)),
+                ('historico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='consulta.consultahistorico')),
+            ],
+            options={
+                'ordering': ['ordem'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='consultaresultado',
+            constraint=models.UniqueConstraint(fields=('historico', 'ordem'), name='consulta_resultado_ordem_unica'),
+        ),
+    ]
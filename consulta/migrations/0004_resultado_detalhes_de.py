@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0003_consultaresultado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='detalhes_de',
+            field=models.ForeignKey(blank=True, help_text='Item mais recente com o mesmo `detalhes` (cópia compactada pela retenção)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='consulta.consultaresultado'),
+        ),
+    ]
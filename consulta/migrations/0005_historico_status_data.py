@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0004_resultado_detalhes_de'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultahistorico',
+            index=models.Index(fields=['status', 'data'], name='consulta_historico_status_data'),
+        ),
+    ]
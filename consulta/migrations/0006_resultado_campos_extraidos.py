@@ -0,0 +1,63 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0005_historico_status_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='atividade_principal',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='atualizado',
+            field=models.DateTimeField(blank=True, help_text='Campo `updated` do documento (data do dado no CNPJÁ)', null=True),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='cnae_principal',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='emails',
+            field=models.TextField(blank=True, default='', help_text="Todos os e-mails, separados por ' | '"),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='municipio',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='municipio_ibge',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='situacao',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='situacao_data',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='telefones',
+            field=models.TextField(blank=True, default='', help_text="Todos os telefones, separados por ' | '"),
+        ),
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='uf',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=2),
+        ),
+    ]
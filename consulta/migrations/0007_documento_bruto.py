@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0006_resultado_campos_extraidos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnpj', models.CharField(db_index=True, help_text='Somente dígitos', max_length=14)),
+                ('assinatura', models.CharField(max_length=40, unique=True)),
+                ('atualizado', models.CharField(blank=True, default='', help_text='Campo `updated` do documento', max_length=40)),
+                ('dados', models.BinaryField(help_text='JSON comprimido (zlib)')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='consultaresultado',
+            name='detalhes',
+            field=models.JSONField(blank=True, help_text='JSON do CNPJÁ, projetado por CNPJ_CAMPOS_ARMAZENADOS (ausente em erros)', null=True),
+        ),
+    ]
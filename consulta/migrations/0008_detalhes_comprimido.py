@@ -0,0 +1,70 @@
+"""`ConsultaResultado.detalhes` passa de JSON para JSON comprimido (`JSONComprimidoField`).
+
+jsonb -> bytea não tem conversão direta no PostgreSQL: cria a coluna nova, copia em
+lotes (comprimindo), remove a antiga e renomeia. `ConsultaDocumento.dados` já era
+binário; muda só o campo Python (os fluxos zlib antigos continuam legíveis).
+"""
+from django.db import migrations, models
+
+import consulta.compressao
+
+LOTE = 1000
+
+
+def _copiar(apps, origem, destino):
+    ConsultaResultado = apps.get_model('consulta', 'ConsultaResultado')
+    ultimo = 0
+    while True:
+        linhas = list(
+            ConsultaResultado.objects.filter(pk__gt=ultimo, **{f'{origem}__isnull': False})
+            .order_by('pk').only('pk', origem)[:LOTE]
+        )
+        if not linhas:
+            return
+        for linha in linhas:
+            setattr(linha, destino, getattr(linha, origem))
+        ConsultaResultado.objects.bulk_update(linhas, [destino])
+        ultimo = linhas[-1].pk
+
+
+def comprimir_detalhes(apps, schema_editor):
+    _copiar(apps, 'detalhes', 'detalhes_comprimido')
+
+
+def descomprimir_detalhes(apps, schema_editor):
+    _copiar(apps, 'detalhes_comprimido', 'detalhes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0007_documento_bruto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultaresultado',
+            name='detalhes_comprimido',
+            field=consulta.compressao.JSONComprimidoField(blank=True, null=True),
+        ),
+        migrations.RunPython(comprimir_detalhes, descomprimir_detalhes),
+        migrations.RemoveField(
+            model_name='consultaresultado',
+            name='detalhes',
+        ),
+        migrations.RenameField(
+            model_name='consultaresultado',
+            old_name='detalhes_comprimido',
+            new_name='detalhes',
+        ),
+        migrations.AlterField(
+            model_name='consultaresultado',
+            name='detalhes',
+            field=consulta.compressao.JSONComprimidoField(blank=True, help_text='JSON do CNPJÁ, projetado por CNPJ_CAMPOS_ARMAZENADOS e comprimido (ausente em erros)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='consultadocumento',
+            name='dados',
+            field=consulta.compressao.JSONComprimidoField(help_text='Documento completo (JSON comprimido)'),
+        ),
+    ]
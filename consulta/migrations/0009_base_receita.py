@@ -0,0 +1,87 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consulta', '0008_detalhes_comprimido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceitaEmpresa',
+            fields=[
+                ('cnpj_basico', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('razao_social', models.CharField(max_length=255)),
+                ('natureza', models.PositiveSmallIntegerField(help_text='Código da natureza jurídica', null=True)),
+                ('porte', models.PositiveSmallIntegerField(help_text='1 = ME, 3 = EPP, 5 = demais', null=True)),
+                ('capital_social', models.DecimalField(decimal_places=2, max_digits=18, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceitaEstabelecimento',
+            fields=[
+                ('cnpj', models.CharField(max_length=14, primary_key=True, serialize=False)),
+                ('matriz', models.BooleanField(default=False)),
+                ('nome_fantasia', models.CharField(blank=True, default='', max_length=255)),
+                ('situacao', models.PositiveSmallIntegerField(help_text='1 = nula, 2 = ativa, 3 = suspensa, 4 = inapta, 8 = baixada', null=True)),
+                ('situacao_data', models.DateField(null=True)),
+                ('inicio_atividade', models.DateField(null=True)),
+                ('cnae_principal', models.PositiveIntegerField(null=True)),
+                ('cnaes_secundarios', models.TextField(blank=True, default='', help_text='Códigos separados por vírgula')),
+                ('logradouro', models.CharField(blank=True, default='', help_text='Tipo e nome do logradouro', max_length=255)),
+                ('numero', models.CharField(blank=True, default='', max_length=20)),
+                ('complemento', models.CharField(blank=True, default='', max_length=255)),
+                ('bairro', models.CharField(blank=True, default='', max_length=100)),
+                ('cep', models.CharField(blank=True, default='', max_length=8)),
+                ('uf', models.CharField(blank=True, default='', max_length=2)),
+                ('municipio', models.PositiveSmallIntegerField(help_text='Código do município na Receita (não é o IBGE)', null=True)),
+                ('telefones', models.CharField(blank=True, default='', help_text="'DDD número' separados por ' | '", max_length=60)),
+                ('email', models.CharField(blank=True, default='', max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceitaImportacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=20)),
+                ('referencia', models.DateField(help_text='Data de referência dos arquivos da Receita')),
+                ('arquivos', models.TextField(blank=True, default='')),
+                ('linhas', models.PositiveBigIntegerField(default=0)),
+                ('iniciada_em', models.DateTimeField(auto_now_add=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceitaSocio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnpj_basico', models.CharField(db_index=True, max_length=8)),
+                ('tipo', models.PositiveSmallIntegerField(help_text='1 = pessoa jurídica, 2 = pessoa física, 3 = estrangeiro')),
+                ('nome', models.CharField(max_length=255)),
+                ('documento', models.CharField(blank=True, default='', help_text='CPF mascarado ou CNPJ', max_length=14)),
+                ('qualificacao', models.PositiveSmallIntegerField(null=True)),
+                ('entrada', models.DateField(null=True)),
+                ('faixa_etaria', models.PositiveSmallIntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceitaTabela',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=12)),
+                ('codigo', models.PositiveIntegerField()),
+                ('descricao', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='receitatabela',
+            constraint=models.UniqueConstraint(fields=('tabela', 'codigo'), name='consulta_receita_tabela_codigo'),
+        ),
+        migrations.AddIndex(
+            model_name='receitaimportacao',
+            index=models.Index(fields=['tabela', '-iniciada_em'], name='consulta_re_tabela_a7db4a_idx'),
+        ),
+    ]
@@ -1,26 +1,297 @@
 """Modelos de persistência da app 'consulta'.
 
-- ConsultaHistorico: snapshot dos resultados e metadados de cada execução.
+- ConsultaHistorico: metadados de cada execução (e o snapshot JSON dos registros antigos).
+- ConsultaResultado: uma linha por item de resultado de uma execução, gravada em lotes.
+- ConsultaJob: checkpoint de um job em lote (fila, progresso e resultados parciais).
+- Receita*: base local dos dados abertos do CNPJ (Receita Federal), importada por
+  `importar_receita` e lida por `consulta.receita`.
 - ProcessEntry/ProcessResult: modelos auxiliares (não usados diretamente na UI principal).
 """
 
+from django.conf import settings
 from django.db import models
 
+from .compressao import JSONComprimidoField
+
 class ConsultaHistorico(models.Model):
-    """Registro de uma execução (manual/upload) com resultados serializados."""
+    """Registro de uma execução (manual/upload).
+
+    Os resultados ficam em `ConsultaResultado` (gravados durante o job); `resultado`
+    guarda o JSON completo apenas nos registros anteriores a essa tabela.
+    """
     TIPO_CHOICES = (
         ('manual', 'Manual'),
         ('upload', 'Upload'),
     )
+    STATUS_CHOICES = (
+        ('andamento', 'Em andamento'),
+        ('concluido', 'Concluído'),
+    )
     data = models.DateTimeField(auto_now_add=True)
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='concluido', db_index=True)
     cnpjs = models.TextField(blank=True, null=True, help_text="CNPJs consultados (manual ou lista do arquivo)")
     arquivo_nome = models.CharField(max_length=255, blank=True, null=True)
-    resultado = models.JSONField()
+    resultado = models.JSONField(default=list, blank=True, help_text="Resultados serializados (registros antigos)")
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'data'], name='consulta_historico_status_data')]
 
     def __str__(self):
         return f"{self.data:%d/%m/%Y %H:%M} - {self.tipo}"
 
+    def resultados(self):
+        """Resultados da execução como lista de dicts, no formato do job."""
+        if self.resultado:
+            return self.resultado
+        return [r.como_dict() for r in self.itens.select_related('detalhes_de')]
+
+    def iter_resultados(self, chunk_size=1000, filtros=None):
+        """Como `resultados()`, sem carregar tudo: gera `(ordem, item)` lendo os itens em lotes.
+
+        `filtros`: igualdades sobre colunas de `ConsultaResultado` (ex.: {'uf': 'SP'}),
+        aplicadas no banco; nos registros antigos em JSON, sobre as colunas extraídas.
+        """
+        if self.resultado:
+            from .extracao import extrair_campos
+
+            for ordem, r in enumerate(self.resultado):
+                if not isinstance(r, dict):
+                    continue
+                r = {**extrair_campos(r.get('detalhes')), **r}
+                if not filtros or all(str(r.get(k) or '') == str(v) for k, v in filtros.items()):
+                    yield ordem, r
+            return
+        itens = self.itens.filter(**filtros) if filtros else self.itens.all()
+        itens = itens.select_related('detalhes_de')
+        for item in itens.iterator(chunk_size=chunk_size):
+            yield item.ordem, item.como_dict()
+
+
+class ConsultaResultado(models.Model):
+    """Resultado de um CNPJ em uma execução; `ordem` é a posição do item no job."""
+    historico = models.ForeignKey(ConsultaHistorico, on_delete=models.CASCADE, related_name='itens')
+    ordem = models.PositiveIntegerField()
+    cnpj = models.CharField(max_length=14, db_index=True, help_text="Somente dígitos")
+    nome = models.CharField(max_length=255, blank=True, default='')
+    email = models.TextField(blank=True, default='', help_text="E-mail, 'Sem e-mail' ou a mensagem de erro da consulta")
+    processo = models.CharField(max_length=100, blank=True, null=True)
+    dsevento = models.TextField(blank=True, null=True)
+    oportunidade = models.TextField(blank=True, null=True)
+    substancias = models.TextField(blank=True, null=True)
+    detalhes = JSONComprimidoField(blank=True, null=True, help_text="JSON do CNPJÁ, projetado por CNPJ_CAMPOS_ARMAZENADOS e comprimido (ausente em erros)")
+    detalhes_de = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Item mais recente com o mesmo `detalhes` (cópia compactada pela retenção)",
+    )
+    # Colunas extraídas de `detalhes` pelo pipeline de `consulta.extracao`
+    situacao = models.CharField(max_length=50, blank=True, default='', db_index=True)
+    situacao_data = models.DateField(blank=True, null=True)
+    cnae_principal = models.PositiveIntegerField(blank=True, null=True, db_index=True)
+    atividade_principal = models.CharField(max_length=255, blank=True, default='')
+    municipio = models.CharField(max_length=100, blank=True, default='')
+    municipio_ibge = models.PositiveIntegerField(blank=True, null=True)
+    uf = models.CharField(max_length=2, blank=True, default='', db_index=True)
+    emails = models.TextField(blank=True, default='', help_text="Todos os e-mails, separados por ' | '")
+    telefones = models.TextField(blank=True, default='', help_text="Todos os telefones, separados por ' | '")
+    atualizado = models.DateTimeField(blank=True, null=True, help_text="Campo `updated` do documento (data do dado no CNPJÁ)")
+
+    CAMPOS_EXTRAS = ('processo', 'dsevento', 'oportunidade', 'substancias')
+    CAMPOS_EXTRAIDOS = (
+        'situacao', 'situacao_data', 'cnae_principal', 'atividade_principal',
+        'municipio', 'municipio_ibge', 'uf', 'emails', 'telefones', 'atualizado',
+    )
+
+    class Meta:
+        ordering = ['ordem']
+        constraints = [
+            models.UniqueConstraint(fields=['historico', 'ordem'], name='consulta_resultado_ordem_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.cnpj} - {self.nome}"
+
+    @staticmethod
+    def com_detalhes():
+        """Filtro dos itens consultados com sucesso: com `detalhes` ou compactados (`detalhes_de`)."""
+        return models.Q(detalhes__isnull=False) | models.Q(detalhes_de__isnull=False)
+
+    @classmethod
+    def de_dict(cls, historico_id, ordem, r):
+        """Instância (não salva) a partir de um item de resultado do job.
+
+        As colunas extraídas vêm do item (calculadas na consulta) ou, em itens antigos,
+        do pipeline de extração sobre `detalhes`. Textos maiores que a coluna são cortados
+        no `max_length` (o PostgreSQL recusaria o lote inteiro).
+        """
+        from .extracao import extrair_campos
+
+        extraidos = {k: r[k] for k in cls.CAMPOS_EXTRAIDOS if r.get(k) is not None}
+        if not extraidos and r.get('detalhes'):
+            extraidos = {k: v for k, v in extrair_campos(r['detalhes']).items() if v is not None}
+        digitos = ''.join(ch for ch in str(r.get('cnpj') or '') if ch.isdigit())[:14]
+        return cls(
+            historico_id=historico_id,
+            ordem=ordem,
+            cnpj=digitos,
+            nome=cls._no_limite('nome', r.get('nome') or ''),
+            email=r.get('email') or '',
+            detalhes=r.get('detalhes'),
+            **{k: cls._no_limite(k, r[k]) for k in cls.CAMPOS_EXTRAS if r.get(k) is not None},
+            **{k: cls._no_limite(k, v) for k, v in extraidos.items()},
+        )
+
+    @classmethod
+    def _no_limite(cls, campo, valor):
+        """`valor` cortado no `max_length` da coluna de texto `campo` (demais valores intactos)."""
+        limite = cls._meta.get_field(campo).max_length
+        if limite is None:
+            return valor
+        return str(valor)[:limite]
+
+    def como_dict(self):
+        """Item de resultado no formato do job (o mesmo gravado na sessão)."""
+        cnpj = self.cnpj
+        if len(cnpj) == 14:
+            cnpj = f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+        detalhes = self.detalhes
+        if detalhes is None and self.detalhes_de_id:
+            detalhes = self.detalhes_de.detalhes
+        r = {'cnpj': cnpj, 'nome': self.nome, 'email': self.email, 'detalhes': detalhes}
+        for k in self.CAMPOS_EXTRAS:
+            if getattr(self, k) is not None:
+                r[k] = getattr(self, k)
+        # Presentes mesmo quando `detalhes` foi compactado (cópia idêntica mais recente)
+        if any(getattr(self, k) not in (None, '') for k in self.CAMPOS_EXTRAIDOS):
+            for k in self.CAMPOS_EXTRAIDOS:
+                valor = getattr(self, k)
+                r[k] = valor.isoformat() if hasattr(valor, 'isoformat') else valor
+        return r
+
+
+class ConsultaJob(models.Model):
+    """Checkpoint de um job em lote, gravado a cada N itens para retomada após crash/deploy."""
+    STATUS_CHOICES = (
+        ('running', 'Em andamento'),
+        ('paused', 'Pausado'),
+        ('cancelled', 'Cancelado'),
+        ('done', 'Concluído'),
+    )
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs_consulta')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running', db_index=True)
+    tipo = models.CharField(max_length=10, choices=ConsultaHistorico.TIPO_CHOICES, default='manual')
+    arquivo_nome = models.CharField(max_length=255, blank=True, null=True)
+    total = models.PositiveIntegerField(default=0)
+    processados = models.PositiveIntegerField(default=0)
+    estado = models.JSONField(default=dict, help_text="Estado do job na sessão (fila, plano etc.), sem os resultados")
+    resultados = models.JSONField(default=list)
+    historico = models.ForeignKey(ConsultaHistorico, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+
+    class Meta:
+        indexes = [models.Index(fields=['usuario', 'status', '-atualizado_em'])]
+
+    def __str__(self):
+        return f"Job {self.pk} - {self.processados}/{self.total} ({self.status})"
+
+class ConsultaDocumento(models.Model):
+    """Documento completo do CNPJÁ, comprimido (armazenamento frio; ver `consulta.projecao`).
+
+    Gravado só com `CNPJ_DOCUMENTO_BRUTO`, uma vez por conteúdo (`assinatura` = sha1 do JSON).
+    """
+    cnpj = models.CharField(max_length=14, db_index=True, help_text="Somente dígitos")
+    assinatura = models.CharField(max_length=40, unique=True)
+    atualizado = models.CharField(max_length=40, blank=True, default='', help_text="Campo `updated` do documento")
+    dados = JSONComprimidoField(help_text="Documento completo (JSON comprimido)")
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.cnpj} ({self.atualizado or self.criado_em})"
+
+    def documento(self):
+        return self.dados
+
+
+class ReceitaEmpresa(models.Model):
+    """Empresa (arquivos `Empresas*` da Receita): dados comuns à matriz e às filiais."""
+    cnpj_basico = models.CharField(max_length=8, primary_key=True)
+    razao_social = models.CharField(max_length=255)
+    natureza = models.PositiveSmallIntegerField(null=True, help_text="Código da natureza jurídica")
+    porte = models.PositiveSmallIntegerField(null=True, help_text="1 = ME, 3 = EPP, 5 = demais")
+    capital_social = models.DecimalField(max_digits=18, decimal_places=2, null=True)
+
+    def __str__(self):
+        return f"{self.cnpj_basico} - {self.razao_social}"
+
+
+class ReceitaEstabelecimento(models.Model):
+    """Estabelecimento (arquivos `Estabelecimentos*`); a empresa é `cnpj[:8]` em `ReceitaEmpresa`."""
+    cnpj = models.CharField(max_length=14, primary_key=True)
+    matriz = models.BooleanField(default=False)
+    nome_fantasia = models.CharField(max_length=255, blank=True, default='')
+    situacao = models.PositiveSmallIntegerField(null=True, help_text="1 = nula, 2 = ativa, 3 = suspensa, 4 = inapta, 8 = baixada")
+    situacao_data = models.DateField(null=True)
+    inicio_atividade = models.DateField(null=True)
+    cnae_principal = models.PositiveIntegerField(null=True)
+    cnaes_secundarios = models.TextField(blank=True, default='', help_text="Códigos separados por vírgula")
+    logradouro = models.CharField(max_length=255, blank=True, default='', help_text="Tipo e nome do logradouro")
+    numero = models.CharField(max_length=20, blank=True, default='')
+    complemento = models.CharField(max_length=255, blank=True, default='')
+    bairro = models.CharField(max_length=100, blank=True, default='')
+    cep = models.CharField(max_length=8, blank=True, default='')
+    uf = models.CharField(max_length=2, blank=True, default='')
+    municipio = models.PositiveSmallIntegerField(null=True, help_text="Código do município na Receita (não é o IBGE)")
+    telefones = models.CharField(max_length=60, blank=True, default='', help_text="'DDD número' separados por ' | '")
+    email = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        return self.cnpj
+
+
+class ReceitaSocio(models.Model):
+    """Sócio (arquivos `Socios*`)."""
+    cnpj_basico = models.CharField(max_length=8, db_index=True)
+    tipo = models.PositiveSmallIntegerField(help_text="1 = pessoa jurídica, 2 = pessoa física, 3 = estrangeiro")
+    nome = models.CharField(max_length=255)
+    documento = models.CharField(max_length=14, blank=True, default='', help_text="CPF mascarado ou CNPJ")
+    qualificacao = models.PositiveSmallIntegerField(null=True)
+    entrada = models.DateField(null=True)
+    faixa_etaria = models.PositiveSmallIntegerField(null=True)
+
+    def __str__(self):
+        return f"{self.cnpj_basico} - {self.nome}"
+
+
+class ReceitaTabela(models.Model):
+    """Tabelas de códigos da Receita (CNAE, municípios, naturezas jurídicas, qualificações)."""
+    tabela = models.CharField(max_length=12)
+    codigo = models.PositiveIntegerField()
+    descricao = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['tabela', 'codigo'], name='consulta_receita_tabela_codigo')]
+
+    def __str__(self):
+        return f"{self.tabela} {self.codigo} - {self.descricao}"
+
+
+class ReceitaImportacao(models.Model):
+    """Uma carga de uma tabela da base local; `concluida_em` vazio = em andamento (ou interrompida)."""
+    tabela = models.CharField(max_length=20)
+    referencia = models.DateField(help_text="Data de referência dos arquivos da Receita")
+    arquivos = models.TextField(blank=True, default='')
+    linhas = models.PositiveBigIntegerField(default=0)
+    iniciada_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['tabela', '-iniciada_em'])]
+
+    def __str__(self):
+        return f"{self.tabela} {self.referencia:%Y-%m} ({self.linhas} linhas)"
+
+
 class ProcessEntry(models.Model):
     """Linha de entrada de processamento (ex.: processo associado a um CNPJ)."""
     processo = models.CharField(max_length=50)
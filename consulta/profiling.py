@@ -0,0 +1,118 @@
+"""Profilers por requisição usados por `ProfilingMiddleware` (só staff, `PROFILING_ENABLED`).
+
+- `cprofile`: `cProfile` na thread que executa a requisição. Em views síncronas cobre a
+  view inteira; em views assíncronas, só o que roda no event loop (trechos em
+  `sync_to_async` e no pool de rede aparecem como espera);
+- `amostra`: uma thread lê as pilhas de todas as threads a cada `PROFILING_INTERVALO_MS`
+  e conta funções (inclusive/própria). Cobre o event loop, a thread do ORM e o pool do
+  CNPJÁ; pilhas ociosas (threads paradas em fila/selector) são descartadas. Com outras
+  requisições em paralelo, o trabalho delas também entra nas amostras.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Funções-folha de threads ociosas (esperando trabalho ou eventos), fora das amostras
+_ARQUIVOS_OCIOSOS = ('threading.py', 'selectors.py', 'queue.py', 'thread.py')  # thread.py: concurrent.futures
+
+
+class PerfilCProfile:
+    extensao = 'prof'
+
+    def __init__(self):
+        self._perfil = cProfile.Profile()
+
+    def iniciar(self):
+        self._perfil.enable()
+
+    def parar(self):
+        self._perfil.disable()
+
+    def texto(self, ordem='cumulative', limite=60):
+        saida = io.StringIO()
+        try:
+            stats = pstats.Stats(self._perfil, stream=saida).strip_dirs().sort_stats(ordem)
+        except KeyError:
+            stats = pstats.Stats(self._perfil, stream=saida).strip_dirs().sort_stats('cumulative')
+        stats.print_stats(limite)
+        return saida.getvalue()
+
+    def salvar(self, caminho):
+        self._perfil.dump_stats(caminho)
+
+
+class PerfilAmostragem:
+    extensao = 'collapsed'
+
+    def __init__(self, intervalo=None):
+        ms = intervalo if intervalo is not None else getattr(settings, 'PROFILING_INTERVALO_MS', 5)
+        self._intervalo = max(1, ms) / 1000
+        self._pilhas = Counter()
+        self._amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='profiling-amostra', daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _amostrar(self):
+        propria = threading.get_ident()
+        while not self._parar.wait(self._intervalo):
+            self._amostras += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == propria:
+                    continue
+                pilha = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                if pilha and not any(pilha[0].split(' (', 1)[1].startswith(a) for a in _ARQUIVOS_OCIOSOS):
+                    self._pilhas[tuple(reversed(pilha))] += 1
+
+    def texto(self, ordem='cumulative', limite=60):
+        inclusivo, proprio = Counter(), Counter()
+        for pilha, n in self._pilhas.items():
+            for funcao in set(pilha):
+                inclusivo[funcao] += n
+            proprio[pilha[-1]] += n
+        contagem = proprio if ordem in ('tottime', 'time', 'self') else inclusivo
+        ativas = sum(self._pilhas.values())
+        total = ativas or 1
+        linhas = [
+            f"{self._amostras} amostras a cada {self._intervalo * 1000:.0f}ms; {ativas} pilhas ativas",
+            f"{'inclusivo':>10} {'próprio':>10}  função",
+        ]
+        for funcao, _ in contagem.most_common(limite):
+            linhas.append(f"{inclusivo[funcao] / total:>9.1%} {proprio[funcao] / total:>10.1%}  {funcao}")
+        return '\n'.join(linhas) + '\n'
+
+    def salvar(self, caminho):
+        # Formato "collapsed" (flamegraph.pl, speedscope): pilha;separada;por;ponto-e-vírgula contagem
+        with open(caminho, 'w', encoding='utf-8') as arq:
+            for pilha, n in self._pilhas.most_common():
+                arq.write(';'.join(pilha) + f' {n}\n')
+
+
+PROFILERS = {'cprofile': PerfilCProfile, 'amostra': PerfilAmostragem}
+
+
+def salvar_perfil(perfil, caminho_requisicao, duracao):
+    """Grava o perfil em `PROFILING_DIR`; retorna o nome do arquivo."""
+    destino = getattr(settings, 'PROFILING_DIR', 'profiles')
+    os.makedirs(destino, exist_ok=True)
+    rota = caminho_requisicao.strip('/').replace('/', '_') or 'raiz'
+    nome = f"{time.strftime('%Y%m%d-%H%M%S')}-{rota[:60]}-{duracao * 1000:.0f}ms.{perfil.extensao}"
+    perfil.salvar(os.path.join(destino, nome))
+    return nome
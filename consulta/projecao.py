@@ -0,0 +1,130 @@
+"""Projeção do JSON do CNPJÁ (`detalhes`) e documento bruto em armazenamento frio.
+
+O documento do CNPJÁ traz bem mais do que a app usa (inscrições estaduais, Simples,
+SUFRAMA...). Na ingestão (`services._montar_resultado`), depois da extração das colunas,
+`detalhes` é podado para os caminhos de `CNPJ_CAMPOS_ARMAZENADOS`; é essa versão que vai
+para a sessão do job, para `ConsultaResultado.detalhes` e para `/api/detalhes/`.
+
+Caminhos são pontuados (`company.name`); listas no caminho valem para cada elemento
+(`phones.number`). Um caminho sem filhos mantém a subárvore inteira. `*` desliga a
+projeção. Nas respostas, `?fields=a,b.c` projeta de novo (`/api/detalhes/`, `/cnpj/<cnpj>/`).
+
+Com `CNPJ_DOCUMENTO_BRUTO` ligado, o documento completo (ainda no cache compartilhado
+por CNPJ) é gravado comprimido em `ConsultaDocumento` quando os resultados do job são
+persistidos, uma vez por conteúdo. `?fields=*` em `/api/detalhes/` devolve o completo
+(cache compartilhado, depois `ConsultaDocumento`).
+"""
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+# O que o modal de detalhes, a extração de colunas e a renovação em background leem
+CAMPOS_PADRAO = (
+    'taxId', 'updated', 'alias', 'founded', 'head', 'status', 'statusDate',
+    'mainActivity', 'sideActivities', 'address', 'emails', 'phones',
+    'company.name', 'company.equity', 'company.nature', 'company.size', 'company.members',
+)
+
+
+@lru_cache(maxsize=64)
+def _arvore(caminhos):
+    """('a.b', 'a.c', 'd') -> {'a': {'b': True, 'c': True}, 'd': True}."""
+    arvore = {}
+    for caminho in caminhos:
+        partes = [p for p in caminho.strip().split('.') if p]
+        if not partes:
+            continue
+        no = arvore
+        for parte in partes[:-1]:
+            filho = no.get(parte)
+            if filho is True:
+                break  # um prefixo já mantém a subárvore inteira
+            no = no.setdefault(parte, {})
+        else:
+            no[partes[-1]] = True
+    return arvore
+
+
+def _aplicar(valor, arvore):
+    if arvore is True:
+        return valor
+    if isinstance(valor, list):
+        return [_aplicar(v, arvore) for v in valor]
+    if isinstance(valor, dict):
+        return {k: _aplicar(valor[k], sub) for k, sub in arvore.items() if k in valor}
+    return valor
+
+
+def campos_armazenados():
+    """Caminhos de `CNPJ_CAMPOS_ARMAZENADOS` (padrão: `CAMPOS_PADRAO`); `()` com '*' (documento inteiro)."""
+    campos = tuple(getattr(settings, 'CNPJ_CAMPOS_ARMAZENADOS', None) or CAMPOS_PADRAO)
+    return () if '*' in campos else campos
+
+
+def projetar(data, campos=None):
+    """Poda `data` para `campos` (padrão: `CNPJ_CAMPOS_ARMAZENADOS`)."""
+    campos = campos_armazenados() if campos is None else tuple(campos)
+    if not campos or '*' in campos or not isinstance(data, dict):
+        return data
+    return _aplicar(data, _arvore(campos))
+
+
+def campos_da_requisicao(request):
+    """`?fields=a,b.c` -> tupla de caminhos; None sem o parâmetro; ('*',) = completo."""
+    valor = (request.GET.get('fields') or '').strip()
+    if not valor:
+        return None
+    return tuple(sorted({c.strip() for c in valor.split(',') if c.strip()}))
+
+
+# ---------------------------- Armazenamento frio ----------------------------
+
+def _assinatura(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def arquivar_documentos(cnpjs):
+    """Grava em `ConsultaDocumento` o documento completo (do cache compartilhado) dos `cnpjs`.
+
+    Só com `CNPJ_DOCUMENTO_BRUTO`; conteúdos já gravados são ignorados (assinatura única).
+    Retorna quantos documentos novos foram gravados. Usa o banco: chame na thread do Django.
+    """
+    if not getattr(settings, 'CNPJ_DOCUMENTO_BRUTO', False):
+        return 0
+    from .models import ConsultaDocumento
+    from .services import _office_cache_key, clean_cnpj
+
+    chaves = {_office_cache_key(c): c for c in {clean_cnpj(c) for c in cnpjs} if len(c) == 14}
+    if not chaves:
+        return 0
+    try:
+        encontrados = cache.get_many(list(chaves))
+    except Exception:
+        return 0
+    docs = {}
+    for chave, data in encontrados.items():
+        if isinstance(data, dict):
+            docs[_assinatura(data)] = (chaves[chave], data)
+    existentes = set(ConsultaDocumento.objects.filter(assinatura__in=list(docs)).values_list('assinatura', flat=True))
+    novos = [
+        ConsultaDocumento(cnpj=cnpj, assinatura=assinatura, atualizado=str(data.get('updated') or '')[:40], dados=data)
+        for assinatura, (cnpj, data) in docs.items() if assinatura not in existentes
+    ]
+    ConsultaDocumento.objects.bulk_create(novos, ignore_conflicts=True)
+    return len(novos)
+
+
+def documento_completo(cnpj):
+    """Documento completo mais recente: cache compartilhado ou `ConsultaDocumento` (ou None)."""
+    from .models import ConsultaDocumento
+    from .services import clean_cnpj, obter_office_cache
+
+    cnpj = clean_cnpj(cnpj)
+    data = obter_office_cache(cnpj)
+    if data is not None:
+        return data
+    doc = ConsultaDocumento.objects.filter(cnpj=cnpj).order_by('-criado_em', '-pk').only('dados').first()
+    return doc.documento() if doc else None
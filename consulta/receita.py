@@ -0,0 +1,215 @@
+"""Base local do CNPJ a partir dos dados abertos da Receita Federal.
+
+`python manage.py importar_receita` carrega os arquivos mensais (Empresas, Estabelecimentos,
+Sócios e tabelas de códigos) em `ReceitaEmpresa`, `ReceitaEstabelecimento`, `ReceitaSocio`
+e `ReceitaTabela`. Com `CNPJ_BASE_LOCAL` ligado, `documento_local` monta a partir dessas
+tabelas um documento no formato do /office do CNPJÁ, e as consultas respondem com ele sem
+chamada paga (`services.resultado_base_local`).
+
+A base não tem tudo o que o CNPJÁ devolve: não há código IBGE do município
+(`address.municipality`), inscrições estaduais, Simples nem SUFRAMA, e os sócios só
+existem se `Socios*` foi importado. O documento local só é usado quando traz todos os
+caminhos de `CNPJ_BASE_LOCAL_CAMPOS` (padrão: os de `CNPJ_CAMPOS_ARMAZENADOS`); senão, a
+consulta segue para o CNPJÁ. Também fica de fora enquanto uma carga está em andamento ou
+quando a referência dos arquivos passou de `CNPJ_BASE_LOCAL_MAX_DIAS`.
+"""
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+
+# Códigos da Receita -> formato do CNPJÁ (os ids são os mesmos)
+SITUACOES = {1: 'Nula', 2: 'Ativa', 3: 'Suspensa', 4: 'Inapta', 8: 'Baixada'}
+PORTES = {1: ('ME', 'Microempresa'), 3: ('EPP', 'Empresa de Pequeno Porte'), 5: ('DEMAIS', 'Demais')}
+FAIXAS_ETARIAS = {1: '0-12', 2: '13-20', 3: '21-30', 4: '31-40', 5: '41-50', 6: '51-60', 7: '61-70', 8: '71-80', 9: '81+'}
+TIPOS_SOCIO = {1: 'LEGAL', 2: 'NATURAL', 3: 'FOREIGN'}
+
+# Tabelas da base; as duas primeiras são obrigatórias para responder
+TABELAS = ('empresas', 'estabelecimentos', 'socios', 'tabelas')
+ESTADO_TTL = 60  # segundos de cache, por processo, do estado das cargas e das tabelas de códigos
+
+_trava = threading.Lock()
+_estado = {'em': 0.0, 'valor': None}
+_codigos = {'referencia': None, 'valor': {}}
+
+
+def estado_base():
+    """{tabela: data de referência} das tabelas com carga concluída; {} durante uma carga.
+
+    Lido do banco no máximo a cada `ESTADO_TTL` segundos por processo.
+    """
+    with _trava:
+        if _estado['valor'] is not None and time.monotonic() - _estado['em'] < ESTADO_TTL:
+            return _estado['valor']
+    from .models import ReceitaImportacao
+
+    valor = {}
+    for tabela in TABELAS:
+        ultima = ReceitaImportacao.objects.filter(tabela=tabela).order_by('-iniciada_em').first()
+        if ultima is None:
+            continue
+        if ultima.concluida_em is None:
+            valor = {}  # carga em andamento (ou interrompida): a base está incompleta
+            break
+        valor[tabela] = ultima.referencia
+    with _trava:
+        _estado.update(em=time.monotonic(), valor=valor)
+    return valor
+
+
+def limpar_estado():
+    """Descarta o estado em cache (após uma carga, neste processo)."""
+    with _trava:
+        _estado.update(em=0.0, valor=None)
+        _codigos.update(referencia=None, valor={})
+
+
+def disponivel():
+    """Data de referência da base se ela pode responder agora; None se não."""
+    estado = estado_base()
+    if 'empresas' not in estado or 'estabelecimentos' not in estado:
+        return None
+    referencia = min(estado['empresas'], estado['estabelecimentos'])
+    max_dias = getattr(settings, 'CNPJ_BASE_LOCAL_MAX_DIAS', 60)
+    if max_dias and (date.today() - referencia).days > max_dias:
+        return None
+    return referencia
+
+
+def _descricoes(referencia):
+    """{tabela: {codigo: descricao}} das tabelas de códigos (carregadas uma vez por referência)."""
+    with _trava:
+        if _codigos['referencia'] == referencia:
+            return _codigos['valor']
+    from .models import ReceitaTabela
+
+    valor = {}
+    for tabela, codigo, descricao in ReceitaTabela.objects.values_list('tabela', 'codigo', 'descricao').iterator(chunk_size=5000):
+        valor.setdefault(tabela, {})[codigo] = descricao
+    with _trava:
+        _codigos.update(referencia=referencia, valor=valor)
+    return valor
+
+
+def _iso(dia):
+    return dia.isoformat() if dia else None
+
+
+def _atividade(codigo, cnaes):
+    return {'id': codigo, 'text': cnaes.get(codigo, '')}
+
+
+def _membros(cnpj_basico, qualificacoes):
+    from .models import ReceitaSocio
+
+    membros = []
+    for s in ReceitaSocio.objects.filter(cnpj_basico=cnpj_basico).order_by('pk'):
+        pessoa = {'type': TIPOS_SOCIO.get(s.tipo, 'NATURAL'), 'name': s.nome, 'taxId': s.documento or None}
+        if s.faixa_etaria in FAIXAS_ETARIAS:
+            pessoa['age'] = FAIXAS_ETARIAS[s.faixa_etaria]
+        membros.append({
+            'since': _iso(s.entrada),
+            'person': pessoa,
+            'role': {'id': s.qualificacao, 'text': qualificacoes.get(s.qualificacao, '')},
+        })
+    return membros
+
+
+def montar_documento(estab, empresa, referencia, descricoes, membros=None):
+    """Documento no formato do /office do CNPJÁ a partir das linhas da base local."""
+    cnaes = descricoes.get('cnae', {})
+    natureza = descricoes.get('natureza', {})
+    company = {
+        'id': int(empresa.cnpj_basico),
+        'name': empresa.razao_social,
+        'equity': float(empresa.capital_social) if empresa.capital_social is not None else None,
+        'nature': {'id': empresa.natureza, 'text': natureza.get(empresa.natureza, '')},
+    }
+    if empresa.porte in PORTES:
+        sigla, texto = PORTES[empresa.porte]
+        company['size'] = {'id': empresa.porte, 'acronym': sigla, 'text': texto}
+    else:
+        company['size'] = None  # porte não informado
+    if membros is not None:
+        company['members'] = membros
+    telefones = []
+    for tel in filter(None, estab.telefones.split(' | ')):
+        area, _, numero = tel.partition(' ')
+        telefones.append({'area': area, 'number': numero})
+    emails = []
+    if estab.email:
+        endereco = estab.email.strip().lower()
+        emails.append({'address': endereco, 'domain': endereco.rpartition('@')[2]})
+    return {
+        'taxId': estab.cnpj,
+        'updated': f'{referencia.isoformat()}T00:00:00.000Z',
+        'alias': estab.nome_fantasia or None,
+        'founded': _iso(estab.inicio_atividade),
+        'head': estab.matriz,
+        'company': company,
+        'statusDate': _iso(estab.situacao_data),
+        'status': {'id': estab.situacao, 'text': SITUACOES.get(estab.situacao, '')},
+        'address': {
+            'street': estab.logradouro,
+            'number': estab.numero,
+            'details': estab.complemento or None,
+            'district': estab.bairro,
+            'city': descricoes.get('municipio', {}).get(estab.municipio, ''),
+            'state': estab.uf,
+            'zip': estab.cep,
+            'country': {'id': 76, 'name': 'Brasil'},
+        },
+        'mainActivity': _atividade(estab.cnae_principal, cnaes),
+        'sideActivities': [_atividade(int(c), cnaes) for c in estab.cnaes_secundarios.split(',') if c.strip().isdigit()],
+        'phones': telefones,
+        'emails': emails,
+    }
+
+
+def campos_necessarios():
+    """Caminhos que o documento local precisa trazer (`CNPJ_BASE_LOCAL_CAMPOS`); None = documento completo."""
+    from .projecao import campos_armazenados
+
+    campos = tuple(getattr(settings, 'CNPJ_BASE_LOCAL_CAMPOS', None) or campos_armazenados())
+    return None if not campos or '*' in campos else campos
+
+
+def _tem_caminho(data, caminho):
+    valor = data
+    for parte in caminho.split('.'):
+        if isinstance(valor, list):
+            return True  # listas (possivelmente vazias) contam como presentes
+        if not isinstance(valor, dict) or parte not in valor:
+            return False
+        valor = valor[parte]
+    return True
+
+
+def documento_local(cnpj):
+    """Documento do CNPJ (14 dígitos) montado da base local, ou None.
+
+    None quando a base não pode responder (`disponivel`), o CNPJ não está nela ou o
+    documento não traz algum caminho de `campos_necessarios()`.
+    """
+    referencia = disponivel()
+    if referencia is None:
+        return None
+    campos = campos_necessarios()
+    if campos is None:
+        return None
+    from .models import ReceitaEmpresa, ReceitaEstabelecimento
+
+    estab = ReceitaEstabelecimento.objects.filter(pk=cnpj).first()
+    if estab is None:
+        return None
+    empresa = ReceitaEmpresa.objects.filter(pk=cnpj[:8]).first()
+    if empresa is None:
+        return None
+    descricoes = _descricoes(referencia)
+    precisa_membros = any(c == 'company' or c.startswith('company.members') for c in campos)
+    membros = _membros(empresa.cnpj_basico, descricoes.get('qualificacao', {})) if precisa_membros and 'socios' in estado_base() else None
+    data = montar_documento(estab, empresa, referencia, descricoes, membros)
+    if not all(_tem_caminho(data, c) for c in campos):
+        return None
+    return data
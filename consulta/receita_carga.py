@@ -0,0 +1,296 @@
+"""Carga dos dados abertos do CNPJ (Receita Federal) na base local (`consulta.receita`).
+
+Os arquivos mensais vêm em ZIPs com um CSV cada (`;`, aspas, latin-1, sem cabeçalho):
+`Empresas*`, `Estabelecimentos*`, `Socios*` e as tabelas de códigos `Cnaes`,
+`Municipios`, `Naturezas` e `Qualificacoes` (`Simples`, `Motivos` e `Paises` são
+ignorados). Cada CSV é lido em streaming direto do ZIP, convertido para as colunas
+compactas dos modelos `Receita*` e gravado em lotes:
+
+- no PostgreSQL, com `COPY ... FROM STDIN` (psycopg 3 `copy`, ou `copy_expert` no
+  psycopg2), um COPY por lote;
+- nos demais bancos, com `bulk_create`.
+
+Cada tabela é substituída por inteiro (os arquivos são uma foto completa): informe todas
+as partes dela na mesma carga. Enquanto uma carga está em andamento (ou se ela falhou),
+`ReceitaImportacao.concluida_em` fica vazio e a base local não responde consultas.
+"""
+import csv
+import io
+import logging
+import os
+import re
+import time
+import zipfile
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ReceitaEmpresa, ReceitaEstabelecimento, ReceitaImportacao, ReceitaSocio, ReceitaTabela
+from .receita import limpar_estado
+
+logger = logging.getLogger('consulta.receita')
+
+LOTE = 50_000
+
+# Tipo do arquivo pelo nome (do ZIP ou do CSV dentro dele, ex.: K3241.K03200Y0.D50913.EMPRECSV)
+_TIPOS = (
+    ('empresas', re.compile(r'empre', re.I)),
+    ('estabelecimentos', re.compile(r'estabele', re.I)),
+    ('socios', re.compile(r'socio', re.I)),
+    ('cnae', re.compile(r'cnae', re.I)),
+    ('municipio', re.compile(r'munic', re.I)),
+    ('natureza', re.compile(r'natju|natureza', re.I)),
+    ('qualificacao', re.compile(r'quals|qualifica', re.I)),
+)
+_CODIGOS = ('cnae', 'municipio', 'natureza', 'qualificacao')
+# Ordem da carga: as tabelas de códigos antes dos dados
+ORDEM = ('tabelas', 'empresas', 'estabelecimentos', 'socios')
+
+
+def tipo_arquivo(nome):
+    """Tipo do arquivo da Receita pelo nome, ou None se não é carregado."""
+    base = os.path.basename(nome)
+    for tipo, padrao in _TIPOS:
+        if padrao.search(base):
+            return tipo
+    return None
+
+
+def tabela_do_tipo(tipo):
+    return 'tabelas' if tipo in _CODIGOS else tipo
+
+
+def referencia_do_caminho(caminho):
+    """Data de referência pelo nome do diretório/arquivo ('2025-09'), ou None."""
+    m = re.search(r'(20\d{2})-(0[1-9]|1[0-2])', caminho)
+    return date(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+def listar_arquivos(caminhos):
+    """{tabela: [(tipo, caminho)]} dos arquivos reconhecidos; ignora (e lista) os demais."""
+    arquivos, ignorados = {}, []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            nomes = [os.path.join(caminho, n) for n in sorted(os.listdir(caminho))]
+        else:
+            nomes = [caminho]
+        for nome in nomes:
+            if not os.path.isfile(nome):
+                continue
+            tipo = tipo_arquivo(nome)
+            if tipo is None:
+                ignorados.append(nome)
+            else:
+                arquivos.setdefault(tabela_do_tipo(tipo), []).append((tipo, nome))
+    return arquivos, ignorados
+
+
+def _linhas_texto(arquivo):
+    # Os arquivos da Receita às vezes trazem bytes NUL, que o módulo csv recusa
+    for linha in arquivo:
+        yield linha.replace('\x00', '') if '\x00' in linha else linha
+
+
+def ler_csv(caminho):
+    """Linhas (listas de campos) do CSV da Receita, direto do ZIP quando for um."""
+    if zipfile.is_zipfile(caminho):
+        with zipfile.ZipFile(caminho) as zf:
+            for membro in zf.infolist():
+                if membro.is_dir():
+                    continue
+                with zf.open(membro) as bruto:
+                    texto = io.TextIOWrapper(bruto, encoding='latin-1', newline='')
+                    yield from csv.reader(_linhas_texto(texto), delimiter=';', quotechar='"')
+    else:
+        with open(caminho, encoding='latin-1', newline='') as texto:
+            yield from csv.reader(_linhas_texto(texto), delimiter=';', quotechar='"')
+
+
+# ---------------------------------------------------------------- conversões
+
+def _t(valor, tamanho):
+    return valor.strip()[:tamanho]
+
+
+def _int(valor):
+    valor = valor.strip()
+    return int(valor) if valor.isdigit() else None
+
+
+def _data(valor):
+    valor = valor.strip()
+    if len(valor) != 8 or not valor.isdigit() or valor == '00000000':
+        return None
+    try:
+        return date(int(valor[:4]), int(valor[4:6]), int(valor[6:]))
+    except ValueError:
+        return None
+
+
+def _decimal(valor):
+    try:
+        return Decimal(valor.strip().replace('.', '').replace(',', '.'))
+    except InvalidOperation:
+        return None
+
+
+def _empresa(c):
+    # cnpj_basico; razao_social; natureza; qualificacao_responsavel; capital_social; porte; ente_federativo
+    return (c[0], _t(c[1], 255), _int(c[2]), _int(c[5]), _decimal(c[4]))
+
+
+def _estabelecimento(c):
+    # cnpj_basico; ordem; dv; matriz/filial; fantasia; situação; data situação; motivo; cidade exterior;
+    # país; início; cnae; cnaes secundários; tipo logradouro; logradouro; número; complemento; bairro;
+    # cep; uf; município; ddd1; tel1; ddd2; tel2; ddd fax; fax; e-mail; situação especial; data
+    telefones = ' | '.join(f'{d.strip()} {t.strip()}' for d, t in ((c[21], c[22]), (c[23], c[24])) if t.strip())
+    return (
+        c[0] + c[1] + c[2], c[3] == '1', _t(c[4], 255), _int(c[5]), _data(c[6]), _data(c[10]), _int(c[11]),
+        c[12].strip(), _t(f'{c[13].strip()} {c[14].strip()}', 255), _t(c[15], 20), _t(c[16], 255), _t(c[17], 100),
+        _t(c[18], 8), _t(c[19], 2), _int(c[20]), telefones[:60], _t(c[27], 255),
+    )
+
+
+def _socio(c):
+    # cnpj_basico; tipo; nome; cpf/cnpj; qualificação; entrada; país; representante (3 campos); faixa etária
+    return (c[0], _int(c[1]) or 2, _t(c[2], 255), _t(c[3], 14), _int(c[4]), _data(c[5]), _int(c[10]))
+
+
+CARGAS = {
+    'empresas': (ReceitaEmpresa, ('cnpj_basico', 'razao_social', 'natureza', 'porte', 'capital_social'), _empresa, 7),
+    'estabelecimentos': (ReceitaEstabelecimento, (
+        'cnpj', 'matriz', 'nome_fantasia', 'situacao', 'situacao_data', 'inicio_atividade', 'cnae_principal',
+        'cnaes_secundarios', 'logradouro', 'numero', 'complemento', 'bairro', 'cep', 'uf', 'municipio',
+        'telefones', 'email',
+    ), _estabelecimento, 28),
+    'socios': (ReceitaSocio, ('cnpj_basico', 'tipo', 'nome', 'documento', 'qualificacao', 'entrada', 'faixa_etaria'), _socio, 11),
+}
+
+
+def _linhas_convertidas(arquivos, conversor, colunas_minimas, limite=None):
+    for _, caminho in arquivos:
+        lidas = 0
+        for campos in ler_csv(caminho):
+            if len(campos) < colunas_minimas:
+                continue
+            yield conversor(campos)
+            lidas += 1
+            if limite and lidas >= limite:
+                break
+
+
+def _linhas_codigos(arquivos, limite=None):
+    for tipo, caminho in arquivos:
+        lidas = 0
+        for campos in ler_csv(caminho):
+            if len(campos) < 2 or _int(campos[0]) is None:
+                continue
+            yield (tipo, _int(campos[0]), _t(campos[1], 255))
+            lidas += 1
+            if limite and lidas >= limite:
+                break
+
+
+# ------------------------------------------------------------------ gravação
+
+def _valor_copy(valor):
+    """Valor no formato texto do COPY (psycopg2)."""
+    if valor is None:
+        return r'\N'
+    if valor is True or valor is False:
+        return 't' if valor else 'f'
+    texto = valor.isoformat() if isinstance(valor, date) else str(valor)
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Gravador:
+    """Grava lotes de tuplas em um modelo: COPY no PostgreSQL, `bulk_create` nos demais."""
+
+    def __init__(self, modelo, colunas, usar_copy=True):
+        self.modelo = modelo
+        self.colunas = colunas
+        self.copy = usar_copy and connection.vendor == 'postgresql'
+
+    def esvaziar(self, filtro=None):
+        tabela = connection.ops.quote_name(self.modelo._meta.db_table)
+        if filtro:
+            self.modelo.objects.filter(**filtro).delete()
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE TABLE {tabela}')
+        else:
+            self.modelo.objects.all().delete()
+
+    def gravar(self, lote):
+        if not lote:
+            return
+        if self.copy:
+            self._copy(lote)
+        else:
+            campos = self.colunas
+            self.modelo.objects.bulk_create([self.modelo(**dict(zip(campos, linha))) for linha in lote], batch_size=2000)
+
+    def _copy(self, lote):
+        tabela = connection.ops.quote_name(self.modelo._meta.db_table)
+        colunas = ', '.join(connection.ops.quote_name(self.modelo._meta.get_field(c).column) for c in self.colunas)
+        sql = f'COPY {tabela} ({colunas}) FROM STDIN'
+        with transaction.atomic(), connection.cursor() as cursor:
+            bruto = cursor.cursor
+            if hasattr(bruto, 'copy'):  # psycopg 3
+                with bruto.copy(sql) as copy:
+                    for linha in lote:
+                        copy.write_row(linha)
+            else:  # psycopg2
+                buffer = io.StringIO()
+                for linha in lote:
+                    buffer.write('\t'.join(_valor_copy(v) for v in linha))
+                    buffer.write('\n')
+                buffer.seek(0)
+                bruto.copy_expert(sql, buffer)
+
+    def analisar(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(self.modelo._meta.db_table)}')
+
+
+def carregar_tabela(tabela, arquivos, referencia, lote=LOTE, usar_copy=True, limite=None, progresso=None):
+    """Substitui `tabela` ('tabelas', 'empresas', 'estabelecimentos' ou 'socios') pelos `arquivos`.
+
+    `progresso(linhas, segundos)` é chamado a cada lote. Retorna o total de linhas.
+    """
+    importacao = ReceitaImportacao.objects.create(
+        tabela=tabela, referencia=referencia, arquivos='\n'.join(os.path.basename(c) for _, c in arquivos),
+    )
+    limpar_estado()
+    if tabela == 'tabelas':
+        gravador = Gravador(ReceitaTabela, ('tabela', 'codigo', 'descricao'), usar_copy)
+        gravador.esvaziar({'tabela__in': sorted({tipo for tipo, _ in arquivos})})
+        linhas = _linhas_codigos(arquivos, limite)
+    else:
+        modelo, colunas, conversor, minimo = CARGAS[tabela]
+        gravador = Gravador(modelo, colunas, usar_copy)
+        gravador.esvaziar()
+        linhas = _linhas_convertidas(arquivos, conversor, minimo, limite)
+    inicio = time.monotonic()
+    total = 0
+    pendente = []
+    for linha in linhas:
+        pendente.append(linha)
+        if len(pendente) >= lote:
+            gravador.gravar(pendente)
+            total += len(pendente)
+            pendente = []
+            if progresso:
+                progresso(total, time.monotonic() - inicio)
+    gravador.gravar(pendente)
+    total += len(pendente)
+    gravador.analisar()
+    importacao.linhas = total
+    importacao.concluida_em = timezone.now()
+    importacao.save(update_fields=['linhas', 'concluida_em'])
+    limpar_estado()
+    logger.info('Base local: %s carregada (%s linhas em %.0fs)', tabela, total, time.monotonic() - inicio)
+    return total
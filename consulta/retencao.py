@@ -0,0 +1,252 @@
+"""Retenção do histórico: arquivamento, exclusão em lotes e compactação.
+
+- `converter_legado`: move o JSON `resultado` de registros antigos para `ConsultaResultado`;
+- `arquivar_historico`: grava as execuções com mais de `HISTORY_RETENTION_DAYS` dias em
+  NDJSON gzip (uma linha por item, com os metadados da execução) e só depois as apaga;
+- `apagar_em_lotes`: exclusão em transações curtas de até `HISTORY_DELETE_BATCH_SIZE`
+  linhas, para não travar as tabelas por muito tempo;
+- `compactar_detalhes`: de snapshots idênticos de `detalhes` de um mesmo CNPJ, mantém só
+  o mais recente; as cópias antigas apontam para ele (`detalhes_de`);
+- `executar_retencao`: tudo acima, na ordem; usado pelo comando `retencao_historico`.
+  `agendar_retencao` (disparada ao fim de cada job com `HISTORY_RETENTION_DAYS` > 0, no
+  máximo uma vez por `HISTORY_RETENTION_INTERVAL`) só arquiva e apaga: a conversão e a
+  compactação varrem a tabela inteira e ficam para o comando.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import ConsultaHistorico, ConsultaJob, ConsultaResultado
+
+logger = logging.getLogger('consulta.retencao')
+
+RETENCAO_LOCK_KEY = 'historico:retencao:lock'
+RETENCAO_EXECUTADA_KEY = 'historico:retencao:executada'
+
+# Execuções lidas/apagadas por vez (cada uma pode ter milhares de itens)
+EXECUCOES_POR_BLOCO = 50
+
+
+def _tamanho_lote():
+    return max(1, getattr(settings, 'HISTORY_DELETE_BATCH_SIZE', 1000))
+
+
+def _blocos(ids, tamanho):
+    for i in range(0, len(ids), tamanho):
+        yield ids[i:i + tamanho]
+
+
+def historico_expirado(dias=None):
+    """Execuções com mais de `dias` dias (padrão `HISTORY_RETENTION_DAYS`; 0 = nenhuma).
+
+    Execuções ligadas a um job em andamento/pausado ficam de fora, mesmo se antigas.
+    """
+    dias = getattr(settings, 'HISTORY_RETENTION_DAYS', 0) if dias is None else dias
+    if not dias or dias <= 0:
+        return ConsultaHistorico.objects.none()
+    limite = timezone.now() - timedelta(days=dias)
+    ativos = ConsultaJob.objects.filter(status__in=('running', 'paused'), historico__isnull=False).values('historico_id')
+    return ConsultaHistorico.objects.filter(data__lt=limite).exclude(pk__in=ativos)
+
+
+def _devolver_detalhes(itens, historicos):
+    """Antes de apagar `itens`, copia o `detalhes` deles para as cópias compactadas de
+    outras execuções (fora de `historicos`) que apontam para eles."""
+    copias = (
+        ConsultaResultado.objects.filter(detalhes_de_id__in=itens).exclude(historico_id__in=historicos)
+        .values_list('detalhes_de_id', flat=True).distinct()
+    )
+    for pk in list(copias):
+        detalhes = ConsultaResultado.objects.filter(pk=pk).values_list('detalhes', flat=True).first()
+        ConsultaResultado.objects.filter(detalhes_de_id=pk).exclude(historico_id__in=historicos).update(
+            detalhes=detalhes, detalhes_de=None)
+
+
+def apagar_em_lotes(ids):
+    """Apaga as execuções `ids` e seus itens em transações curtas. Retorna as execuções apagadas."""
+    ids = list(ids)
+    lote = _tamanho_lote()
+    apagadas = 0
+    for bloco in _blocos(ids, EXECUCOES_POR_BLOCO):
+        while True:
+            itens = list(ConsultaResultado.objects.filter(historico_id__in=bloco).values_list('pk', flat=True)[:lote])
+            if not itens:
+                break
+            with transaction.atomic():
+                _devolver_detalhes(itens, bloco)
+                ConsultaResultado.objects.filter(pk__in=itens).delete()
+        with transaction.atomic():
+            # Sem itens, a cascata só desvincula os checkpoints (SET_NULL)
+            apagadas += ConsultaHistorico.objects.filter(pk__in=bloco).delete()[1].get(ConsultaHistorico._meta.label, 0)
+    return apagadas
+
+
+def _linhas_execucao(h):
+    """Linhas NDJSON (dicts) de uma execução: metadados + um item de resultado."""
+    meta = {
+        'historico_id': h.pk,
+        'data': h.data.isoformat(),
+        'tipo': h.tipo,
+        'status': h.status,
+        'arquivo_nome': h.arquivo_nome,
+    }
+    for ordem, r in h.iter_resultados(chunk_size=_tamanho_lote()):
+        yield {**meta, 'ordem': ordem, **r}
+
+
+def arquivar_historico(destino=None, dias=None, apagar=True):
+    """Grava as execuções expiradas em `<destino>/historico-<data>.ndjson.gz` e as apaga.
+
+    O arquivo é escrito com nome temporário e renomeado ao final; a exclusão só começa
+    depois disso, então uma falha no meio não perde dados. Retorna um resumo.
+    """
+    ids = list(historico_expirado(dias).order_by('data', 'pk').values_list('pk', flat=True))
+    resumo = {'execucoes': len(ids), 'itens': 0, 'arquivo': None, 'apagadas': 0}
+    if not ids:
+        return resumo
+    destino = destino or getattr(settings, 'HISTORY_ARCHIVE_DIR', 'arquivo_historico')
+    os.makedirs(destino, exist_ok=True)
+    caminho = os.path.join(destino, f'historico-{timezone.now():%Y%m%d-%H%M%S}.ndjson.gz')
+    parcial = caminho + '.parcial'
+    try:
+        with gzip.open(parcial, 'wt', encoding='utf-8') as arq:
+            for bloco in _blocos(ids, EXECUCOES_POR_BLOCO):
+                for h in ConsultaHistorico.objects.filter(pk__in=bloco).order_by('data', 'pk'):
+                    for linha in _linhas_execucao(h):
+                        arq.write(json.dumps(linha, ensure_ascii=False, default=str))
+                        arq.write('\n')
+                        resumo['itens'] += 1
+        os.replace(parcial, caminho)
+    except Exception:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+    resumo['arquivo'] = caminho
+    if apagar:
+        resumo['apagadas'] = apagar_em_lotes(ids)
+    return resumo
+
+
+def apagar_checkpoints(dias=None):
+    """Apaga checkpoints de jobs concluídos/cancelados sem atualização há mais de `dias` dias."""
+    dias = getattr(settings, 'HISTORY_RETENTION_DAYS', 0) if dias is None else dias
+    if not dias or dias <= 0:
+        return 0
+    limite = timezone.now() - timedelta(days=dias)
+    ids = list(ConsultaJob.objects.filter(status__in=('done', 'cancelled'), atualizado_em__lt=limite).values_list('pk', flat=True))
+    for bloco in _blocos(ids, _tamanho_lote()):
+        with transaction.atomic():
+            ConsultaJob.objects.filter(pk__in=bloco).delete()
+    return len(ids)
+
+
+def converter_legado():
+    """Converte registros com o JSON `resultado` em linhas de `ConsultaResultado`.
+
+    Uma transação por execução. Retorna quantas execuções foram convertidas.
+    """
+    lote = _tamanho_lote()
+    convertidas = 0
+    for pk in list(ConsultaHistorico.objects.exclude(resultado=[]).values_list('pk', flat=True)):
+        with transaction.atomic():
+            h = ConsultaHistorico.objects.select_for_update().filter(pk=pk).first()
+            if h is None or not h.resultado:
+                continue
+            itens = [ConsultaResultado.de_dict(h.pk, i, r) for i, r in enumerate(h.resultado) if isinstance(r, dict)]
+            ConsultaResultado.objects.bulk_create(itens, batch_size=lote, ignore_conflicts=True)
+            h.resultado = []
+            h.save(update_fields=['resultado'])
+        convertidas += 1
+    return convertidas
+
+
+def _assinatura(detalhes):
+    texto = json.dumps(detalhes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def compactar_detalhes():
+    """Troca cópias antigas de `detalhes` idênticas a uma mais recente do mesmo CNPJ por
+    uma referência a ela (`detalhes_de`); `ConsultaResultado.como_dict` resolve a referência.
+
+    Só considera execuções concluídas (jobs em andamento reaproveitam os seus detalhes
+    na retomada). Retorna quantos itens tiveram `detalhes` removido.
+    """
+    lote = _tamanho_lote()
+    base = ConsultaResultado.objects.filter(detalhes__isnull=False, historico__status='concluido')
+    repetidos_cnpj = list(base.values('cnpj').annotate(n=Count('pk')).filter(n__gt=1).values_list('cnpj', flat=True))
+    removidos = 0
+    for cnpj in repetidos_cnpj:
+        mantidos = {}
+        repetidos = {}
+        copias = base.filter(cnpj=cnpj).order_by('-historico__data', '-pk').values_list('pk', 'detalhes')
+        for pk, detalhes in copias.iterator(chunk_size=lote):
+            assinatura = _assinatura(detalhes)
+            if assinatura in mantidos:
+                repetidos.setdefault(mantidos[assinatura], []).append(pk)
+            else:
+                mantidos[assinatura] = pk
+        for mantido, pks in repetidos.items():
+            for bloco in _blocos(pks, lote):
+                with transaction.atomic():
+                    # Quem apontava para uma cópia que deixa de ter o JSON passa a apontar para a mantida
+                    ConsultaResultado.objects.filter(detalhes_de_id__in=bloco).update(detalhes_de_id=mantido)
+                    ConsultaResultado.objects.filter(pk__in=bloco).update(detalhes=None, detalhes_de_id=mantido)
+            removidos += len(pks)
+    return removidos
+
+
+def executar_retencao(destino=None, dias=None, completa=True):
+    """Conversão do legado, arquivamento/exclusão, limpeza de checkpoints e compactação.
+
+    Com `completa=False` (execução automática), só arquivamento/exclusão e checkpoints.
+    """
+    resumo = {'convertidas': converter_legado() if completa else 0}
+    resumo.update(arquivar_historico(destino=destino, dias=dias))
+    resumo['checkpoints'] = apagar_checkpoints(dias)
+    resumo['detalhes_compactados'] = compactar_detalhes() if completa else 0
+    return resumo
+
+
+def agendar_retencao(forcar=False):
+    """Dispara o arquivamento/exclusão em thread de background, sem bloquear o chamador.
+
+    Só executa quando `HISTORY_RETENTION_INTERVAL` expirou desde a última execução (ou
+    `forcar`) e nenhuma outra está em andamento em qualquer worker. Retorna True se agendou.
+    """
+    intervalo = getattr(settings, 'HISTORY_RETENTION_INTERVAL', 0)
+    if intervalo <= 0 and not forcar:
+        return False
+    try:
+        ultima = cache.get(RETENCAO_EXECUTADA_KEY)
+        if not forcar and ultima and (time.time() - ultima) < intervalo:
+            return False
+        if not cache.add(RETENCAO_LOCK_KEY, 1, 3600):
+            return False
+    except Exception:
+        return False
+
+    def _executar():
+        try:
+            resumo = executar_retencao(completa=False)
+            cache.set(RETENCAO_EXECUTADA_KEY, time.time(), None)
+            logger.info('Retenção do histórico concluída', extra=resumo)
+        except Exception as e:
+            logger.exception('Falha na retenção do histórico: %s', e)
+        finally:
+            cache.delete(RETENCAO_LOCK_KEY)
+            connection.close()
+
+    threading.Thread(target=_executar, name='historico-retencao', daemon=True).start()
+    return True
@@ -5,73 +5,339 @@ Responsabilidades principais:
 - Integração com CNPJÁ PRO via `clients.cnpja.CNPJAClient` (com retry/backoff).
 - Processamento de entradas CSV/XLSX e agregação dos resultados.
 - Exportação em formatos CSV/XLSX.
+
+Dependências pesadas (`requests`, `openpyxl`, `xlsxwriter`, leitor de `consulta.xlsx`)
+são importadas no primeiro uso, não no import do módulo: o boot do processo web
+(`urls` -> `views` -> `services`) não paga por elas. Ver `manage.py bench_boot`.
 """
 
 import re
+import math
 import unicodedata
 import csv
 import io
 import time
-import requests
-import openpyxl
-import xlsxwriter
+import itertools
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
 from clients.cnpja import CNPJAClient, CNPJAClientError
+from .chaves import (
+    chaves as chaves_configuradas, cliente, disponiveis, em_rotacao, fora_de_rotacao, pausar_se_bloqueada,
+)
+from .extracao import extrair_campos
+from .projecao import projetar
 from django.core.cache import cache
+from .logs import AMOSTRAR
+
+logger_api = logging.getLogger('consulta.api')
+logger_ratelimit = logging.getLogger('consulta.ratelimit')
+logger_upload = logging.getLogger('consulta.upload')
+logger_creditos = logging.getLogger('consulta.creditos')
 
 # Delay base entre consultas (segundos). Pode ser configurado via settings.JOB_DELAY_SECONDS
 # Recomendado >= 1.0s para manter ~60/min ou menos.
 DELAY_SECONDS = getattr(settings, 'JOB_DELAY_SECONDS', 1)
 
 
-# Rate limit simples (janela fixa) para no máx. 60 chamadas/minuto à API externa.
+# Rate limit simples (janela fixa) para no máx. 60 chamadas/minuto por chave da API externa
+# (o orçamento total é a soma das chaves em rotação; ver `consulta.chaves`).
 # Usa o cache configurado (idealmente Redis em produção) para coordenar entre processos.
 RATE_LIMIT_PER_MINUTE = 60
 RATE_LIMIT_WINDOW = 60  # segundos
 
-def _rate_limit_acquire(key: str = 'cnpja_api', limit: int = RATE_LIMIT_PER_MINUTE, window_seconds: int = RATE_LIMIT_WINDOW):
+# Custo (créditos) de uma consulta online ao CNPJÁ. A estratégia CACHE não consome créditos.
+CREDITOS_POR_CONSULTA = getattr(settings, 'CNPJA_CREDITOS_POR_CONSULTA', 1)
+# Concorrência da passada de planejamento (CACHE-only), que não usa slots do rate limit.
+PLAN_MAX_WORKERS = getattr(settings, 'JOB_PLAN_MAX_WORKERS', 8)
+# Consultas online simultâneas de um lote da API (`consultar_lote`); o ritmo é do rate limit.
+API_LOTE_WORKERS = getattr(settings, 'API_LOTE_WORKERS', 4)
+# Busca por raiz: filiais da mesma empresa (mesmo CNPJ básico) a partir das quais uma
+# pesquisa de estabelecimentos substitui as consultas individuais; páginas e custo por página.
+RAIZ_MIN_FILIAIS = getattr(settings, 'CNPJ_RAIZ_MIN_FILIAIS', 3)
+RAIZ_MAX_PAGINAS = getattr(settings, 'CNPJ_RAIZ_MAX_PAGINAS', 3)
+RAIZ_POR_PAGINA = 100
+CREDITOS_POR_BUSCA = getattr(settings, 'CNPJA_CREDITOS_POR_BUSCA', 1)
+
+# Escalonamento justo do orçamento compartilhado entre fluxos (jobs, uploads, consultas
+# interativas). Cada fluxo ativo recebe uma cota da janela proporcional ao seu peso; um
+# fluxo que já usou sua cota só avança se sobrar orçamento além das cotas ainda não
+# usadas pelos demais. Fluxos interativos têm peso maior e ignoram as cotas dos lotes.
+RATE_LIMIT_PESO_INTERATIVO = getattr(settings, 'RATE_LIMIT_PESO_INTERATIVO', 4)
+RATE_LIMIT_PESO_LOTE = getattr(settings, 'RATE_LIMIT_PESO_LOTE', 1)
+RATE_LIMIT_FLUXO_TTL = 30  # segundos sem pedir slot até o fluxo deixar de disputar o orçamento
+RATE_LIMIT_ESPERA_COTA = 1.0  # intervalo de reavaliação quando o fluxo excedeu sua cota
+RATE_LIMIT_FALHAS_CACHE = 3  # falhas seguidas do cache até seguir sem chave reservada (com CNPJA_API_KEYS)
+
+
+def _rate_limit_incr(cache_key, ttl):
+    """Incrementa um contador de janela, criando-o com TTL se necessário; retorna o novo valor."""
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        cache.add(cache_key, 0, ttl)
+        return cache.incr(cache_key)
+
+
+def _fluxos_ativos(key, fluxo=None, peso=1, interativo=False):
+    """Registra `fluxo` como ativo e retorna {fluxo: (peso, interativo, visto_em)} dos fluxos ativos."""
+    reg_key = f"rl:{key}:fluxos"
+    now = time.time()
+    fluxos = cache.get(reg_key) or {}
+    fluxos = {f: v for f, v in fluxos.items() if now - v[2] <= RATE_LIMIT_FLUXO_TTL}
+    # Regrava só quando o fluxo é novo ou o registro envelheceu: menos escritas concorrentes
+    # no registro (read-modify-write) e menos registros perdidos entre processos
+    if fluxo and (fluxo not in fluxos or now - fluxos[fluxo][2] > RATE_LIMIT_FLUXO_TTL / 3):
+        fluxos[fluxo] = (peso, interativo, now)
+        cache.set(reg_key, fluxos, RATE_LIMIT_FLUXO_TTL * 2)
+    return fluxos
+
+
+def _cotas_janela(limit, fluxos):
+    """Cota de slots por fluxo na janela, proporcional ao peso (mínimo 1)."""
+    total_peso = sum(v[0] for v in fluxos.values()) or 1
+    return {f: max(1, math.ceil(limit * v[0] / total_peso)) for f, v in fluxos.items()}
+
+
+def _cabe_na_cota(key, window, limit, current, fluxo, fluxos):
+    """Decide se `fluxo` pode usar mais um slot da janela sem tomar a cota de outro fluxo."""
+    cotas = _cotas_janela(limit, fluxos)
+    chaves = {f: f"rl:{key}:{window}:{f}" for f in fluxos}
+    usados = cache.get_many(list(chaves.values()))
+    if (usados.get(chaves[fluxo]) or 0) < cotas[fluxo]:
+        return True
+    interativo = fluxos[fluxo][1]
+    # Interativos só respeitam a cota de outros interativos; lotes respeitam todas
+    reservado = sum(
+        max(0, cotas[f] - (usados.get(chaves[f]) or 0))
+        for f, v in fluxos.items()
+        if f != fluxo and (v[1] or not interativo)
+    )
+    return (limit - current) > reservado
+
+
+def limite_janela(limit=RATE_LIMIT_PER_MINUTE):
+    """Orçamento total da janela da API: `limit` por chave em rotação (ao menos uma)."""
+    return limit * max(1, len(em_rotacao()))
+
+
+def _saldos_por_chave(ids):
+    """{id: saldo conhecido} (None quando ainda não há snapshot de /credit da chave)."""
+    return {c: saldo_creditos(_creditos_chave(c)) for c in ids}
+
+
+def _reservar_chave(window, ttl, limit=RATE_LIMIT_PER_MINUTE):
+    """Reserva um slot da janela na chave em rotação menos usada que ainda tem folga.
+
+    Chaves com saldo de créditos conhecido e esgotado ficam por último. Retorna o id
+    da chave ou None se nenhuma tem folga nesta janela.
+    """
+    ativas = em_rotacao()
+    contadores = {c: f"rl:cnpja_api:chave:{c}:{window}" for c in ativas}
+    usados = cache.get_many(list(contadores.values()))
+    saldos = _saldos_por_chave(ativas)
+    ordem = sorted(ativas, key=lambda c: (saldos[c] is not None and saldos[c] <= 0, usados.get(contadores[c]) or 0))
+    for chave in ordem:
+        if _rate_limit_incr(contadores[chave], ttl) <= limit:
+            return chave
+        cache.decr(contadores[chave])
+    return None
+
+
+def _rate_limit_acquire(key: str = 'cnpja_api', limit: int = RATE_LIMIT_PER_MINUTE, window_seconds: int = RATE_LIMIT_WINDOW,
+                        fluxo: str | None = None, interativo: bool = False, usuario: str | None = None,
+                        peso: int | None = None):
     """Bloqueia a chamada até que haja "slot" disponível dentro do limite.
 
     Implementação com janela fixa por minuto. Em Redis, `incr` é atômico.
     Em LocMemCache, coordena por processo; suficiente em dev.
+    Com `fluxo` informado, aplica a divisão justa da janela entre os fluxos ativos;
+    com `usuario`, registra a vazão para as estatísticas por usuário. `peso` sobrepõe o
+    peso padrão do fluxo (interativo ou lote).
+
+    Para `cnpja_api` com chaves configuradas, `limit` vale por chave: o teto da janela é a
+    soma das chaves em rotação e a chamada também reserva uma chave. Retorna o id da
+    chave reservada (None sem `CNPJA_API_KEYS` ou se o cache falhar `RATE_LIMIT_FALHAS_CACHE`
+    vezes seguidas; o slot da tentativa que falhou é devolvido).
     """
-    now = time.time()
-    window = int(now // window_seconds)
-    cache_key = f"rl:{key}:{window}"
-    # Inicializa contador da janela com TTL restante do minuto
-    ttl = window_seconds - int(now % window_seconds) + 1
-    if cache.get(cache_key) is None:
-        cache.set(cache_key, 0, ttl)
-    # Verifica se já atingiu o teto
-    try:
-        current = cache.get(cache_key) or 0
-        if current >= limit:
-            # Espera até próxima janela
-            wait = window_seconds - (now % window_seconds) + 0.01
-            print(f"[RATE LIMIT] Atingido {limit}/min. Aguardando {wait:.2f}s para liberar próximo slot...")
-            time.sleep(wait)
-            return _rate_limit_acquire(key, limit, window_seconds)
-        # Reserva um slot
+    inicio = time.time()
+    if peso is None:
+        peso = RATE_LIMIT_PESO_INTERATIVO if interativo else RATE_LIMIT_PESO_LOTE
+    por_chave = key == 'cnpja_api' and bool(chaves_configuradas())
+    limite_chave = limit
+    chave = None
+    falhas = 0
+    while True:
+        now = time.time()
+        window = int(now // window_seconds)
+        cache_key = f"rl:{key}:{window}"
+        # TTL restante do minuto e espera até a próxima janela
+        ttl = window_seconds - int(now % window_seconds) + 1
+        wait = window_seconds - (now % window_seconds) + 0.01
+        reservado = False
         try:
-            cache.incr(cache_key)
-        except Exception:
-            cache.set(cache_key, current + 1, ttl)
+            if por_chave:
+                limit = limite_chave * len(em_rotacao())
+            # `add` só cria o contador se ainda não existe (não zera o de outro worker)
+            cache.add(cache_key, 0, ttl)
+            current = cache.get(cache_key) or 0
+            # Verifica se já atingiu o teto global
+            if current >= limit:
+                logger_ratelimit.info('Limite de %s/min atingido; aguardando %.2fs pelo próximo slot', limit, wait, extra={'fluxo': fluxo})
+                time.sleep(wait)
+                continue
+            if fluxo:
+                fluxos = _fluxos_ativos(key, fluxo, peso, interativo)
+                if not _cabe_na_cota(key, window, limit, current, fluxo, fluxos):
+                    logger_ratelimit.debug('Fluxo usou sua cota da janela; aguardando os demais fluxos', extra={'fluxo': fluxo})
+                    time.sleep(min(wait, RATE_LIMIT_ESPERA_COTA))
+                    continue
+            # Reserva um slot: o `incr` atômico decide entre workers que viram o mesmo
+            # `current`; quem passou do teto devolve o slot e tenta de novo
+            if _rate_limit_incr(cache_key, ttl) > limit:
+                cache.decr(cache_key)
+                continue
+            reservado = True
+            if por_chave:
+                chave = _reservar_chave(window, ttl, limite_chave)
+                if chave is None:
+                    # Slots da janela contados em chaves que saíram de rotação: devolve e espera
+                    cache.decr(cache_key)
+                    time.sleep(min(wait, RATE_LIMIT_ESPERA_COTA))
+                    continue
+            if fluxo:
+                _rate_limit_incr(f"{cache_key}:{fluxo}", ttl)
+        except Exception as e:
+            if por_chave and chave is None:
+                # Falha no cache antes de reservar a chave: devolve o slot desta volta e tenta
+                # de novo; sem chave, a chamada sairia fora do orçamento por chave
+                if reservado:
+                    try:
+                        cache.decr(cache_key)
+                    except Exception:
+                        pass
+                falhas += 1
+                if falhas < RATE_LIMIT_FALHAS_CACHE:
+                    logger_ratelimit.warning('Falha no cache ao reservar slot/chave (%s); tentando de novo', e, extra={'fluxo': fluxo})
+                    time.sleep(RATE_LIMIT_ESPERA_COTA)
+                    continue
+                logger_ratelimit.error('Cache indisponível para reservar chave da API (%s); seguindo sem rate limit', e,
+                                       extra={'fluxo': fluxo})
+            else:
+                # Em caso de falha no cache, não bloquear a execução (best effort)
+                logger_ratelimit.warning('Falha no cache do rate limit (%s); seguindo sem slot', e, extra={'fluxo': fluxo})
+        break
+    if usuario:
+        _registrar_throughput(usuario, time.time() - inicio)
+    return chave
+
+
+def reservar_slot_api(fluxo=None, interativo=False, usuario=None, peso=None):
+    """Reserva um slot do orçamento compartilhado da API CNPJÁ (bloqueia até haver slot).
+
+    Retorna o id da chave a usar (`consulta.chaves.cliente`), ou None sem pool de chaves.
+    """
+    return _rate_limit_acquire('cnpja_api', fluxo=fluxo, interativo=interativo, usuario=usuario, peso=peso)
+
+
+def slots_usados_fluxo(fluxo, key='cnpja_api', window_seconds=RATE_LIMIT_WINDOW):
+    """Slots que `fluxo` já reservou na janela atual do rate limit."""
+    window = int(time.time() // window_seconds)
+    try:
+        return cache.get(f"rl:{key}:{window}:{fluxo}") or 0
+    except Exception:
+        return 0
+
+
+def _registrar_throughput(usuario, espera):
+    """Acumula consultas e tempo de espera por usuário (últimas 24h, série por minuto da última hora)."""
+    try:
+        stats_key = f"rl:stats:{usuario}"
+        minuto = int(time.time() // 60)
+        st = cache.get(stats_key) or {'consultas': 0, 'espera_total': 0.0, 'por_minuto': {}}
+        st['consultas'] += 1
+        st['espera_total'] += espera
+        por_minuto = st['por_minuto']
+        por_minuto[minuto] = por_minuto.get(minuto, 0) + 1
+        st['por_minuto'] = {m: n for m, n in por_minuto.items() if m > minuto - 60}
+        st['ultima'] = time.time()
+        cache.set(stats_key, st, 86400)
+        usuarios = cache.get('rl:stats:usuarios') or set()
+        if usuario not in usuarios:
+            usuarios.add(usuario)
+            cache.set('rl:stats:usuarios', usuarios, 86400)
     except Exception:
-        # Em caso de falha no cache, não bloquear a execução (best effort)
         pass
 
 
-def processar_cnpjs_manualmente(cnpjs: str, on_retry=None):
+def estatisticas_throughput(usuarios=None):
+    """Vazão por usuário: consultas (24h), na última hora e no último minuto, e espera média por slot."""
+    if usuarios is None:
+        usuarios = sorted(cache.get('rl:stats:usuarios') or [])
+    minuto = int(time.time() // 60)
+    saida = []
+    for usuario in usuarios:
+        st = cache.get(f"rl:stats:{usuario}")
+        if not st:
+            continue
+        por_minuto = st.get('por_minuto') or {}
+        saida.append({
+            'usuario': usuario,
+            'consultas': st.get('consultas', 0),
+            'ultima_hora': sum(n for m, n in por_minuto.items() if m > minuto - 60),
+            'ultimo_minuto': por_minuto.get(minuto, 0),
+            'espera_media_s': round(st.get('espera_total', 0.0) / max(1, st.get('consultas', 0)), 2),
+        })
+    return saida
+
+
+def fluxos_em_andamento(key='cnpja_api', limit=None):
+    """Fluxos que disputam o orçamento agora, com peso, prioridade e cota da janela atual."""
+    fluxos = _fluxos_ativos(key)
+    cotas = _cotas_janela(limite_janela() if limit is None else limit, fluxos)
+    return [
+        {'fluxo': f, 'peso': v[0], 'interativo': v[1], 'cota_janela': cotas[f]}
+        for f, v in sorted(fluxos.items())
+    ]
+
+
+def uso_chaves(window_seconds=RATE_LIMIT_WINDOW):
+    """Por chave da API (id): slots usados na janela atual, saldo conhecido e pausa, se houver."""
+    ids = list(chaves_configuradas())
+    window = int(time.time() // window_seconds)
+    try:
+        usados = cache.get_many([f"rl:cnpja_api:chave:{c}:{window}" for c in ids])
+    except Exception:
+        usados = {}
+    fora = fora_de_rotacao()
+    saldos = _saldos_por_chave(ids)
+    return [
+        {
+            'id': c,
+            'usados_janela': usados.get(f"rl:cnpja_api:chave:{c}:{window}") or 0,
+            'limite_janela': RATE_LIMIT_PER_MINUTE,
+            'saldo': saldos[c],
+            'em_rotacao': c not in fora,
+            **({'pausa': fora[c]} if c in fora else {}),
+        }
+        for c in ids
+    ]
+
+
+def processar_cnpjs_manualmente(cnpjs: str, on_retry=None, usuario=None):
     """Processa uma string de CNPJs separados por vírgula sequencialmente.
 
     Retorna (lista_cnpjs_limpos, lista_resultados). Aplica DELAY_SECONDS entre chamadas.
+    A entrada manual é tratada como fluxo interativo pelo rate limit.
     """
     cnpj_list = [clean_cnpj(c) for c in cnpjs.split(',') if clean_cnpj(c)]
     resultados = []
     for cnpj in cnpj_list:
-        resultado = consultar_cnpj_api(cnpj, on_retry=on_retry)
+        resultado = consultar_cnpj_api(cnpj, on_retry=on_retry, fluxo=f"manual:{usuario or '-'}", interativo=True, usuario=usuario)
         resultados.append(resultado)
-        print(f"[DELAY] Aguardando {DELAY_SECONDS}s para próxima requisição...")
+        logger_api.debug('Aguardando %ss para a próxima requisição', DELAY_SECONDS, extra=AMOSTRAR)
         time.sleep(DELAY_SECONDS)
     return cnpj_list, resultados
 
@@ -105,17 +371,757 @@ def format_cnpj(cnpj):
     return cnpj
 
 
-def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
+# Cache compartilhado (Django cache/Redis) do JSON do CNPJÁ por CNPJ, alimentado por todas
+# as consultas bem-sucedidas e lido antes de qualquer chamada à API.
+CNPJ_CACHE_TTL = getattr(settings, 'CNPJ_CACHE_TTL', 86400)
+# Espera máxima por uma consulta idêntica em andamento (acima do timeout da chamada, 30s)
+CNPJ_SINGLEFLIGHT_TIMEOUT = 35
+
+
+def _office_cache_key(cnpj):
+    return f"cnpj:office:v1:{cnpj}"
+
+
+def obter_office_cache(cnpj):
+    """Retorna o JSON do CNPJ no cache compartilhado, ou None."""
+    try:
+        return cache.get(_office_cache_key(clean_cnpj(cnpj)))
+    except Exception:
+        return None
+
+
+def salvar_office_cache(cnpj, data):
+    """Grava o JSON do CNPJ no cache compartilhado (best effort)."""
+    if not isinstance(data, dict):
+        return
+    try:
+        cache.set(_office_cache_key(clean_cnpj(cnpj)), data, CNPJ_CACHE_TTL)
+    except Exception:
+        pass
+
+
+def obter_office(cnpj, usuario=None, _tentativas=2):
+    """Read-through do cache compartilhado com coalescência (single-flight) por CNPJ.
+
+    Em miss, apenas uma requisição (entre threads e processos, via `cache.add`) consulta o
+    CNPJÁ com a estratégia configurada; as demais aguardam o resultado no cache. Levanta
+    CNPJAClientError em erro da API (propagado também para quem aguardava).
+    """
+    clean = clean_cnpj(cnpj)
+    data = obter_office_cache(clean)
+    if data is not None:
+        return data
+    lock_key = f"cnpj:office:sf:{clean}"
+    erro_key = f"cnpj:office:erro:{clean}"
+    if cache.add(lock_key, 1, CNPJ_SINGLEFLIGHT_TIMEOUT):
+        cache.delete(erro_key)
+        try:
+            data = obter_office_cache(clean)
+            if data is None:
+                chave = reservar_slot_api(fluxo=f"cnpj:{usuario or '-'}", interativo=True, usuario=usuario)
+                client = cliente(chave)
+                try:
+                    data = client.get_office(
+                        clean,
+                        timeout=30,
+                        strategy=getattr(settings, 'CNPJA_STRATEGY', 'CACHE_IF_FRESH'),
+                        max_age_days=getattr(settings, 'CNPJA_MAX_AGE_DAYS', 40),
+                        max_stale_days=getattr(settings, 'CNPJA_MAX_STALE_DAYS', 30),
+                    )
+                except CNPJAClientError as e:
+                    pausar_se_bloqueada(chave, e)
+                    raise
+                registrar_consumo_creditos(custo_consulta(getattr(settings, 'CNPJA_STRATEGY', 'CACHE_IF_FRESH'), client.last_headers), chave)
+                salvar_office_cache(clean, data)
+            return data
+        except Exception as e:
+            # Publica o erro por alguns segundos para quem aguardava não repetir a chamada
+            cache.set(erro_key, str(e), 5)
+            raise
+        finally:
+            cache.delete(lock_key)
+    # Outra requisição já está consultando este CNPJ: aguarda o resultado dela
+    deadline = time.time() + CNPJ_SINGLEFLIGHT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.1)
+        data = obter_office_cache(clean)
+        if data is not None:
+            return data
+        erro = cache.get(erro_key)
+        if erro:
+            raise CNPJAClientError(erro)
+        if cache.get(lock_key) is None:
+            break
+    if _tentativas <= 1:
+        raise CNPJAClientError(f"Tempo esgotado aguardando consulta do CNPJ {clean}.")
+    return obter_office(clean, usuario=usuario, _tentativas=_tentativas - 1)
+
+
+def _montar_resultado(clean, data):
+    """Extrai nome/e-mail e as colunas do pipeline de extração e monta o item de resultado padrão."""
+    nome = (
+        (data.get('company') or {}).get('name')
+        or data.get('name')
+        or '-'
+    )
+    email = 'Sem e-mail'
+    emails = data.get('emails')
+    if isinstance(emails, list) and emails:
+        first = emails[0]
+        if isinstance(first, dict):
+            email = first.get('address') or first.get('email') or 'Sem e-mail'
+        elif isinstance(first, str):
+            email = first
+    return {
+        'cnpj': format_cnpj(clean),
+        'nome': nome,
+        'email': email,
+        # Só os caminhos de CNPJ_CAMPOS_ARMAZENADOS seguem para sessão e banco
+        'detalhes': projetar(data),
+        # Colunas tipadas (situação, CNAE, município/UF, contatos), extraídas uma vez aqui
+        # do documento completo
+        **extrair_campos(data),
+    }
+
+
+def resultado_base_local(cnpj, ligada=None):
+    """Item de resultado montado da base local da Receita (`consulta.receita`), ou None.
+
+    `ligada` None segue `CNPJ_BASE_LOCAL`. None também quando a base não pode responder
+    pelo CNPJ (ausente, desatualizada, sem algum campo necessário) ou falha.
+    """
+    if not (getattr(settings, 'CNPJ_BASE_LOCAL', False) if ligada is None else ligada):
+        return None
+    from .receita import documento_local
+
+    clean = clean_cnpj(cnpj)
+    try:
+        data = documento_local(clean)
+    except Exception as e:
+        logger_api.warning('Base local indisponível para o CNPJ %s: %s', clean, e)
+        return None
+    if data is None:
+        return None
+    logger_api.debug('Consulta CNPJ %s via base local', clean, extra=AMOSTRAR)
+    return _montar_resultado(clean, data)
+
+
+def resolver_base_local(cnpjs):
+    """{cnpj: resultado} dos CNPJs válidos que a base local resolve (vazio sem `CNPJ_BASE_LOCAL`).
+
+    CNPJs já no cache compartilhado ficam de fora (respondem por ele). Usa o ORM: chame
+    na thread da requisição, antes de mandar o restante aos pools de threads de rede, e
+    passe o resultado adiante (`locais`) com a base desligada nas threads.
+    """
+    if not getattr(settings, 'CNPJ_BASE_LOCAL', False):
+        return {}
+    encontrados = {}
+    for cnpj in dict.fromkeys(clean_cnpj(c) for c in cnpjs):
+        if not cnpj_valido(cnpj) or obter_office_cache(cnpj) is not None:
+            continue
+        resultado = resultado_base_local(cnpj, ligada=True)
+        if resultado is not None:
+            encontrados[cnpj] = resultado
+    return encontrados
+
+
+def _sem_conexao_presa(fn, *args, **kwargs):
+    """Executa `fn` numa thread de pool e fecha as conexões com o banco que ela abriu.
+
+    As tarefas dos pools de rede não usam o ORM; se alguma abrir conexão mesmo assim,
+    ela não fica presa à thread (nem ao pool de conexões) enquanto a thread viver.
+    """
+    from django.db import connections
+
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def consultar_cnpj_cache(cnpj, client=None, base_local=None):
+    """Consulta apenas o cache do CNPJÁ (strategy=CACHE).
+
+    Não consome créditos nem slots do rate limit. Retorna o item de resultado
+    (mesmo formato de `consultar_cnpj_api`) ou None quando não há dados em cache
+    ou a chamada falha; nesses casos a consulta online decide o resultado final.
+    Com a base local ligada (`base_local`; None segue `CNPJ_BASE_LOCAL`), ela responde
+    antes da chamada. Nos pools de threads a base vai desligada (ver `resolver_base_local`).
+    """
+    clean = clean_cnpj(cnpj)
+    data = obter_office_cache(clean)
+    if data is not None:
+        return _montar_resultado(clean, data)
+    resultado = resultado_base_local(clean, ligada=base_local)
+    if resultado is not None:
+        return resultado
+    try:
+        data = (client or cliente()).get_office(clean, timeout=30, strategy='CACHE')
+    except Exception:
+        return None
+    salvar_office_cache(clean, data)
+    return _montar_resultado(clean, data)
+
+
+def planejar_consultas(cnpjs, max_workers=PLAN_MAX_WORKERS, locais=None):
+    """Passada de planejamento: consulta CACHE-only concorrente para CNPJs distintos.
+
+    Retorna (hits, misses): `hits` é um dict {cnpj: resultado} do que já está no
+    cache do CNPJÁ (ou na base local); `misses` é a lista (na ordem recebida) do que
+    exigirá consulta online. `locais` traz o que a base local já resolveu
+    (`resolver_base_local`) na thread chamadora; None consulta a base aqui, antes do pool.
+    """
+    distintos = list(dict.fromkeys(clean_cnpj(c) for c in cnpjs if clean_cnpj(c)))
+    if not distintos:
+        return {}, []
+    if locais is None:
+        locais = resolver_base_local(distintos)
+    hits = {c: locais[c] for c in distintos if c in locais}
+    pendentes = [c for c in distintos if c not in hits]
+    client = cliente()
+    encontrados = []
+    if pendentes:
+        consultar = functools.partial(_sem_conexao_presa, consultar_cnpj_cache, client=client, base_local=False)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pendentes)))) as pool:
+            encontrados = list(pool.map(consultar, pendentes))
+    misses = []
+    for cnpj, resultado in zip(pendentes, encontrados):
+        if resultado is None:
+            misses.append(cnpj)
+        else:
+            hits[cnpj] = resultado
+    logger_api.info('Plano: %s CNPJs verificados no cache', len(distintos), extra={'hits': len(hits), 'misses': len(misses)})
+    return hits, misses
+
+
+def raiz_cnpj(cnpj):
+    """CNPJ básico (8 primeiros dígitos), comum à matriz e às filiais da empresa."""
+    return clean_cnpj(cnpj)[:8]
+
+
+def agrupar_por_raiz(cnpjs, minimo=None):
+    """{raiz: [cnpjs]} das raízes com ao menos `minimo` CNPJs distintos (padrão `CNPJ_RAIZ_MIN_FILIAIS`).
+
+    Vazio quando a busca por raiz está desligada (`minimo` <= 0).
+    """
+    minimo = RAIZ_MIN_FILIAIS if minimo is None else minimo
+    if minimo <= 0:
+        return {}
+    grupos = {}
+    for c in dict.fromkeys(clean_cnpj(c) for c in cnpjs):
+        if len(c) == 14:
+            grupos.setdefault(c[:8], []).append(c)
+    return {r: g for r, g in grupos.items() if len(g) >= max(2, minimo)}
+
+
+def _documento_da_busca_utilizavel(data):
+    """Documento da pesquisa que substitui o /office da filial sem mudar o resultado.
+
+    Precisa trazer os blocos de que `_montar_resultado` tira nome e e-mail e estar dentro
+    de `CNPJA_MAX_AGE_DAYS` (o mesmo dado que `CACHE_IF_FRESH` devolveria).
+    """
+    if not isinstance(data, dict) or 'company' not in data or 'emails' not in data:
+        return False
+    from datetime import timezone as dt_timezone
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+
+    try:
+        quando = parse_datetime(data.get('updated') or '')
+    except ValueError:
+        quando = None
+    if quando is None:
+        return False
+    if timezone.is_naive(quando):
+        quando = timezone.make_aware(quando, dt_timezone.utc)
+    idade = timezone.now() - quando
+    return idade.total_seconds() <= getattr(settings, 'CNPJA_MAX_AGE_DAYS', 40) * 86400
+
+
+def buscar_por_raiz(raiz, cnpjs, fluxo=None, interativo=False, usuario=None):
+    """Resolve as filiais `cnpjs` da empresa `raiz` com a pesquisa de estabelecimentos do CNPJÁ.
+
+    Cada página (até `CNPJ_RAIZ_MAX_PAGINAS`) custa um slot do rate limit e
+    `CNPJA_CREDITOS_POR_BUSCA` créditos, em vez de um /office por filial. Os documentos
+    utilizáveis vão para o cache compartilhado; retorna {cnpj: resultado} (mesmo formato de
+    `consultar_cnpj_api`). O que faltar (não encontrado, desatualizado ou erro da API)
+    segue pela consulta individual.
+    """
+    faltam = set(clean_cnpj(c) for c in cnpjs)
+    resultados = {}
+    token = None
+    paginas = 0
+    while faltam and paginas < max(1, RAIZ_MAX_PAGINAS):
+        client = cliente(reservar_slot_api(fluxo=fluxo, interativo=interativo, usuario=usuario))
+        try:
+            pagina = client.search_offices(raiz, limit=RAIZ_POR_PAGINA, token=token, timeout=30)
+        except CNPJAClientError as e:
+            pausar_se_bloqueada(client.chave_id, e)
+            logger_api.warning('Busca pela raiz %s falhou: %s', raiz, e)
+            break
+        except Exception as e:
+            logger_api.warning('Busca pela raiz %s falhou: %s', raiz, e)
+            break
+        paginas += 1
+        registrar_consumo_creditos(_custo_cabecalho(client.last_headers, CREDITOS_POR_BUSCA), client.chave_id)
+        for data in pagina.get('records') or []:
+            c = clean_cnpj((data or {}).get('taxId') or '')
+            if c in faltam and _documento_da_busca_utilizavel(data):
+                faltam.discard(c)
+                salvar_office_cache(c, data)
+                resultados[c] = _montar_resultado(c, data)
+        token = pagina.get('next')
+        if not token:
+            break
+    logger_api.info('Raiz %s: %s de %s filiais resolvidas em %s página(s)', raiz, len(resultados),
+                    len(resultados) + len(faltam), paginas)
+    return resultados
+
+
+def consultar_lote(itens, usuario=None, interativo=False, max_workers=API_LOTE_WORKERS, locais=None):
+    """Consulta um lote de itens `{cnpj, processo, ...}` e produz os resultados à medida que ficam prontos.
+
+    Mesmo pipeline dos jobs: cada CNPJ distinto é consultado uma vez (o resultado vale
+    para todos os itens dele), primeiro no cache compartilhado (sem rede), depois na
+    passada CACHE-only do CNPJÁ (sem créditos nem rate limit) e, para o que faltar,
+    online com o rate limit do fluxo `api:<usuario>`. Com `CNPJ_BASE_LOCAL`, a base local
+    da Receita responde entre o cache compartilhado e o do CNPJÁ.
+
+    Produz `(indice, item, resultado, via)`, com `via` em `invalido` (DV incorreto,
+    `resultado` None), `cache_local`, `base_local`, `cache`, `raiz`, `online` ou `erro` (sem chave
+    da API configurada). A ordem é a de conclusão; use
+    `indice` para casar com a entrada. Fechar o gerador cancela as consultas pendentes.
+
+    Antes das consultas online, filiais da mesma empresa (ao menos `CNPJ_RAIZ_MIN_FILIAIS`
+    com a mesma raiz) são buscadas juntas (`buscar_por_raiz`, `via` = `raiz`).
+
+    A base local (ORM) é consultada uma vez, na thread que inicia o gerador, ou vem pronta
+    em `locais` (`resolver_base_local`) quando o gerador é consumido por um pool de rede.
+    """
+    por_cnpj = {}
+    for indice, item in enumerate(itens):
+        if not cnpj_valido(item['cnpj']):
+            yield indice, item, None, 'invalido'
+            continue
+        por_cnpj.setdefault(item['cnpj'], []).append(indice)
+
+    def _entregar(cnpj, resultado, via):
+        for indice in por_cnpj[cnpj]:
+            yield indice, itens[indice], resultado, via
+
+    pendentes = []
+    for cnpj in por_cnpj:
+        data = obter_office_cache(cnpj)
+        if data is None:
+            pendentes.append(cnpj)
+        else:
+            yield from _entregar(cnpj, _montar_resultado(cnpj, data), 'cache_local')
+    if locais is None:
+        locais = resolver_base_local(pendentes)
+    restantes = []
+    for cnpj in pendentes:
+        if cnpj in locais:
+            yield from _entregar(cnpj, locais[cnpj], 'base_local')
+        else:
+            restantes.append(cnpj)
+    pendentes = restantes
+    if not pendentes:
+        return
+
+    try:
+        client = cliente()
+    except CNPJAClientError as e:
+        # Sem chave configurada: os pendentes saem como erro, e o chamador ainda fecha o lote
+        logger_api.error('Lote sem cliente do CNPJÁ (%s itens pendentes): %s', len(pendentes), e)
+        for cnpj in pendentes:
+            yield from _entregar(cnpj, {'cnpj': format_cnpj(cnpj), 'nome': '-', 'email': f'Erro: {e}', 'detalhes': None}, 'erro')
+        return
+    online = []
+    pool = ThreadPoolExecutor(max_workers=max(1, min(PLAN_MAX_WORKERS, len(pendentes))))
+    try:
+        futuros = {pool.submit(_sem_conexao_presa, consultar_cnpj_cache, cnpj, client, base_local=False): cnpj for cnpj in pendentes}
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            if resultado is None:
+                online.append(futuros[futuro])
+            else:
+                yield from _entregar(futuros[futuro], resultado, 'cache')
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if not online:
+        return
+
+    fluxo = f"api:{usuario or '-'}"
+    for raiz, filiais in agrupar_por_raiz(online).items():
+        for cnpj, resultado in buscar_por_raiz(raiz, filiais, fluxo=fluxo, interativo=interativo, usuario=usuario).items():
+            online.remove(cnpj)
+            yield from _entregar(cnpj, resultado, 'raiz')
+    if not online:
+        return
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(online))))
+    try:
+        futuros = {
+            pool.submit(_sem_conexao_presa, consultar_cnpj_api, cnpj, cache_first=False, fluxo=fluxo,
+                        interativo=interativo, usuario=usuario, base_local=False): cnpj
+            for cnpj in online
+        }
+        for futuro in as_completed(futuros):
+            yield from _entregar(futuros[futuro], futuro.result(), 'online')
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def saldo_creditos(data):
+    """Calcula o saldo total de créditos (transient + perpetual) a partir do JSON de /credit.
+
+    Retorna None quando o formato não é reconhecido.
+    """
+    if not isinstance(data, dict):
+        return None
+    transient = data.get('transient', data.get('monthlyCredits'))
+    perpetual = data.get('perpetual', data.get('permanentCredits'))
+    try:
+        if transient is not None and perpetual is not None:
+            return float(transient) + float(perpetual)
+        for key in ('total', 'totalCredits'):
+            if data.get(key) is not None:
+                return float(data[key])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def estimar_creditos(consultas_online):
+    """Estimativa de créditos para um número de consultas online."""
+    return consultas_online * CREDITOS_POR_CONSULTA
+
+
+# Saldo de créditos rastreado localmente: snapshot de /credit + consumo acumulado
+# desde a última reconciliação (contador atômico no cache compartilhado), por chave.
+CREDITOS_CACHE_KEY = 'cnpja_creditos_v1'
+CREDITOS_CONSUMO_KEY = 'cnpja_creditos_consumo_v1'
+CREDITOS_RECONCILIADO_KEY = 'cnpja_creditos_reconciliado_v1'
+CREDITOS_LOCK_KEY = 'cnpja_creditos_reconciliando_v1'
+CREDITOS_CACHE_TTL = 86400  # 24h
+CREDITOS_RECONCILIAR_SEGUNDOS = getattr(settings, 'CNPJA_CREDITOS_RECONCILIAR_SEGUNDOS', 900)
+
+
+def custo_consulta(strategy, headers=None):
+    """Créditos consumidos por uma chamada a get_office.
+
+    Usa o cabeçalho configurado em `CNPJA_CREDIT_COST_HEADER` quando a API o informa;
+    caso contrário, o custo conhecido por estratégia (CACHE é gratuito).
+    """
+    return _custo_cabecalho(headers, 0 if strategy == 'CACHE' else CREDITOS_POR_CONSULTA)
+
+
+def _custo_cabecalho(headers, padrao):
+    """Custo informado no cabeçalho `CNPJA_CREDIT_COST_HEADER` da resposta, ou `padrao`."""
+    header = getattr(settings, 'CNPJA_CREDIT_COST_HEADER', '')
+    if header and headers:
+        valor = {k.lower(): v for k, v in headers.items()}.get(header.lower())
+        if valor is not None:
+            try:
+                return int(float(valor))
+            except (TypeError, ValueError):
+                pass
+    return padrao
+
+
+def _chave_creditos(base, chave=None):
+    """Chave de cache `base` da conta `chave` (id); sem id, a primeira chave configurada."""
+    chave = chave or next(iter(chaves_configuradas()), None)
+    return f"{base}:{chave}" if chave else base
+
+
+def registrar_consumo_creditos(custo, chave=None):
+    """Acumula o consumo de créditos da chave no cache e agenda reconciliação se estiver vencida."""
+    if not custo or custo <= 0:
+        return
+    consumo_key = _chave_creditos(CREDITOS_CONSUMO_KEY, chave)
+    try:
+        try:
+            cache.incr(consumo_key, custo)
+        except ValueError:
+            # Contador ainda não existe (ou expirou)
+            cache.add(consumo_key, 0, None)
+            cache.incr(consumo_key, custo)
+    except Exception:
+        # Best effort: a reconciliação periódica corrige eventuais perdas
+        pass
+    agendar_reconciliacao_creditos()
+
+
+def _creditos_chave(chave=None):
+    """JSON de /credit da chave ajustado pelo consumo registrado desde a última reconciliação.
+
+    O consumo é abatido primeiro dos créditos `transient` e depois dos `perpetual`.
+    Retorna None quando ainda não há snapshot em cache.
+    """
+    data = cache.get(_chave_creditos(CREDITOS_CACHE_KEY, chave))
+    if not isinstance(data, dict):
+        return data
+    consumo = cache.get(_chave_creditos(CREDITOS_CONSUMO_KEY, chave)) or 0
+    if consumo <= 0:
+        return data
+    ajustado = dict(data)
+    restante = consumo
+    for campo in ('transient', 'perpetual'):
+        try:
+            atual = float(ajustado.get(campo))
+        except (TypeError, ValueError):
+            continue
+        abatido = min(max(atual, 0), restante)
+        novo = atual - abatido
+        ajustado[campo] = int(novo) if novo == int(novo) else novo
+        restante -= abatido
+        if restante <= 0:
+            break
+    if restante > 0:
+        for campo in ('total', 'totalCredits'):
+            if isinstance(ajustado.get(campo), (int, float)):
+                ajustado[campo] = ajustado[campo] - restante
+    ajustado['consumedSinceSync'] = consumo
+    return ajustado
+
+
+def creditos_atuais():
+    """Saldo de créditos rastreado localmente (formato de /credit).
+
+    Com uma chave, o JSON ajustado dela. Com várias, a soma de `transient`, `perpetual` e
+    `consumedSinceSync` das chaves, mais `chaves`: o saldo de cada uma (por id; None se
+    ainda sem snapshot) e se está em rotação. Retorna None quando nenhuma chave tem snapshot.
+    """
+    ids = list(chaves_configuradas())
+    if len(ids) <= 1:
+        return _creditos_chave()
+    por_chave = {c: _creditos_chave(c) for c in ids}
+    if not any(isinstance(d, dict) for d in por_chave.values()):
+        return None
+    ativas = set(disponiveis())
+    total = {'chaves': []}
+    for c, d in por_chave.items():
+        if not isinstance(d, dict):
+            total['chaves'].append({'id': c, 'saldo': None, 'em_rotacao': c in ativas})
+            continue
+        for campo in ('transient', 'perpetual', 'consumedSinceSync'):
+            if isinstance(d.get(campo), (int, float)):
+                total[campo] = total.get(campo, 0) + d[campo]
+        total['chaves'].append({
+            'id': c,
+            'saldo': saldo_creditos(d),
+            **{k: d[k] for k in ('transient', 'perpetual', 'consumedSinceSync') if k in d},
+            'em_rotacao': c in ativas,
+        })
+    return total
+
+
+def _reconciliar_chave(client, chave=None):
+    consumo_key = _chave_creditos(CREDITOS_CONSUMO_KEY, chave)
+    consumo_antes = cache.get(consumo_key) or 0
+    data = client.get_credits(timeout=15)
+    cache.set(_chave_creditos(CREDITOS_CACHE_KEY, chave), data, timeout=CREDITOS_CACHE_TTL)
+    if consumo_antes:
+        # Preserva o consumo registrado durante a chamada (ainda não refletido no /credit)
+        try:
+            cache.decr(consumo_key, consumo_antes)
+        except ValueError:
+            pass
+
+
+def reconciliar_creditos(client=None):
+    """Consulta /credit (bloqueante) de cada chave e substitui os snapshots, zerando o consumo já refletido.
+
+    Uma chave recusada (401/403) sai de rotação e fica de fora; se todas falharem, levanta
+    o erro. Retorna `creditos_atuais()`.
+    """
+    if client is not None:
+        _reconciliar_chave(client, client.chave_id)
+    else:
+        ids = list(chaves_configuradas()) or [None]
+        falhas = []
+        for chave in ids:
+            try:
+                _reconciliar_chave(cliente(chave), chave)
+            except CNPJAClientError as e:
+                pausar_se_bloqueada(chave, e)
+                logger_creditos.warning('Falha ao obter /credit da chave %s: %s', chave, e)
+                falhas.append(e)
+        if len(falhas) == len(ids):
+            raise falhas[-1]
+    cache.set(CREDITOS_RECONCILIADO_KEY, time.time(), None)
+    return creditos_atuais()
+
+
+def agendar_reconciliacao_creditos(forcar=False):
+    """Dispara a reconciliação com /credit em thread de background, sem bloquear o chamador.
+
+    Só executa quando o intervalo `CNPJA_CREDITOS_RECONCILIAR_SEGUNDOS` expirou (ou `forcar`)
+    e nenhuma outra reconciliação está em andamento. Retorna True se agendou.
+    """
+    try:
+        ultimo = cache.get(CREDITOS_RECONCILIADO_KEY)
+        if not forcar and ultimo and (time.time() - ultimo) < CREDITOS_RECONCILIAR_SEGUNDOS:
+            return False
+        if not cache.add(CREDITOS_LOCK_KEY, 1, 60):
+            return False
+    except Exception:
+        return False
+
+    def _executar():
+        try:
+            reconciliar_creditos()
+        except Exception as e:
+            logger_creditos.warning('Falha ao reconciliar saldo com /credit: %s', e)
+        finally:
+            cache.delete(CREDITOS_LOCK_KEY)
+
+    threading.Thread(target=_executar, name='cnpja-creditos', daemon=True).start()
+    return True
+
+
+_PESOS_DV_CNPJ = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+def cnpj_valido(cnpj):
+    """Confere os dígitos verificadores de um CNPJ (14 dígitos, não repetidos)."""
+    d = clean_cnpj(cnpj)
+    if len(d) != 14 or d == d[0] * 14:
+        return False
+    for n in (12, 13):
+        soma = sum(int(a) * b for a, b in zip(d[:n], _PESOS_DV_CNPJ[13 - n:]))
+        dv = 11 - soma % 11
+        if (0 if dv >= 10 else dv) != int(d[n]):
+            return False
+    return True
+
+
+def _cnpjs_no_cache_local(cnpjs, lote=1000):
+    """Subconjunto de `cnpjs` com office no cache compartilhado (sem rede)."""
+    cnpjs = list(cnpjs)
+    encontrados = set()
+    for i in range(0, len(cnpjs), lote):
+        chaves = {_office_cache_key(c): c for c in cnpjs[i:i + lote]}
+        encontrados.update(chaves[k] for k in cache.get_many(list(chaves)))
+    return encontrados
+
+
+def _cnpjs_no_historico_recente(segundos=None):
+    """CNPJs consultados com sucesso no histórico dentro de `segundos` (padrão: CNPJ_CACHE_TTL)."""
+    from django.utils import timezone
+    from .models import ConsultaHistorico, ConsultaResultado
+    desde = timezone.now() - timezone.timedelta(seconds=segundos or CNPJ_CACHE_TTL)
+    encontrados = set(
+        ConsultaResultado.objects.filter(ConsultaResultado.com_detalhes(), historico__data__gte=desde)
+        .values_list('cnpj', flat=True).distinct()
+    )
+    # Registros antigos, com os resultados em JSON
+    qs = ConsultaHistorico.objects.filter(data__gte=desde).exclude(resultado=[]).values_list('resultado', flat=True)
+    for resultado in qs.iterator(chunk_size=200):
+        for r in resultado if isinstance(resultado, list) else []:
+            if isinstance(r, dict) and r.get('detalhes'):
+                encontrados.add(clean_cnpj(r.get('cnpj')))
+    return encontrados
+
+
+def estimar_duracao(consultas_online, interativo=False):
+    """ETA (segundos) das consultas online de um job.
+
+    Cada consulta online custa ao menos `DELAY_SECONDS` (passo do job) e o intervalo
+    do rate limit (`RATE_LIMIT_WINDOW / limite_janela()`, somando as chaves em rotação).
+    `agora` considera a fatia do orçamento que o job teria entre os fluxos ativos neste
+    momento. Não inclui a latência da API.
+    """
+    limite = limite_janela()
+    intervalo = max(DELAY_SECONDS, RATE_LIMIT_WINDOW / limite)
+    peso = RATE_LIMIT_PESO_INTERATIVO if interativo else RATE_LIMIT_PESO_LOTE
+    fluxos = _fluxos_ativos('cnpja_api')
+    total_peso = sum(v[0] for v in fluxos.values()) + peso
+    fatia = limite * peso / total_peso
+    intervalo_agora = max(intervalo, RATE_LIMIT_WINDOW / fatia)
+    return {
+        'isolado': math.ceil(consultas_online * intervalo),
+        'agora': math.ceil(consultas_online * intervalo_agora),
+        'fluxos_ativos': len(fluxos),
+    }
+
+
+def analisar_itens(items, interativo=False, estatisticas=None):
+    """Pré-análise (dry run, sem rede) dos itens extraídos de um upload/entrada manual.
+
+    Conta CNPJs distintos válidos, duplicados, inválidos (formato ou dígito
+    verificador), quantos já estão no cache compartilhado ou no histórico recente,
+    e estima duração e créditos das consultas online restantes.
+    """
+    ocorrencias = 0
+    formato_invalido = 0
+    dv_invalido = set()
+    validos = {}
+    for item in items:
+        raw = item.get('cnpj') if isinstance(item, dict) else item
+        ocorrencias += 1
+        clean = clean_cnpj(raw)
+        if len(clean) != 14:
+            formato_invalido += 1
+        elif clean in validos:
+            validos[clean] += 1
+        elif clean in dv_invalido or not cnpj_valido(clean):
+            dv_invalido.add(clean)
+        else:
+            validos[clean] = 1
+    em_cache = _cnpjs_no_cache_local(validos)
+    no_historico = _cnpjs_no_historico_recente() & (set(validos) - em_cache)
+    # O job consulta online também os CNPJs com DV inválido (a API responde o erro)
+    online = len(validos) - len(em_cache) + len(dv_invalido)
+    eta = estimar_duracao(online, interativo=interativo)
+    estimativa = estimar_creditos(online)
+    saldo = saldo_creditos(creditos_atuais())
+    linhas = (estatisticas or {}).get('linhas', ocorrencias)
+    return {
+        'rows': linhas,
+        'items': ocorrencias,
+        'distinct': len(validos),
+        'duplicates': sum(validos.values()) - len(validos),
+        'invalid_format': formato_invalido,
+        'invalid_check_digit': len(dv_invalido),
+        'cached': len(em_cache),
+        'history': len(no_historico),
+        'online': online,
+        'eta_seconds': eta['isolado'],
+        'eta_seconds_now': eta['agora'],
+        'active_flows': eta['fluxos_ativos'],
+        'credits_estimate': estimativa,
+        'credits_balance': saldo,
+        'insufficient': saldo is not None and estimativa > saldo,
+    }
+
+
+def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None, cache_first=None,
+                       fluxo=None, interativo=False, usuario=None, base_local=None):
     """Consulta a API PRO do CNPJÁ com retry/backoff e extração resiliente de campos.
 
     - retry_count: tentativas para erros transitórios (429/timeout/connerror).
     - retry_wait: segundos de espera entre tentativas (backoff constante).
     - on_retry: callback opcional (attempt:int, wait:int) para feedback de UI.
+    - cache_first: força (True/False) a tentativa CACHE antes da online; None usa
+      `CNPJA_FORCE_CACHE_FIRST`. O planejador passa False para CNPJs já sabidamente fora do cache.
+    - fluxo/interativo/usuario: identificação para a divisão justa do rate limit e estatísticas.
+    - base_local: responde pela base local da Receita antes de qualquer chamada ao CNPJÁ
+      quando ela tem o CNPJ com os campos necessários; None usa `CNPJ_BASE_LOCAL`.
     """
-    client = CNPJAClient()
     clean = clean_cnpj(cnpj)
+    # Cache compartilhado local: evita qualquer chamada quando outro fluxo já consultou o CNPJ
+    data = obter_office_cache(clean)
+    if data is not None:
+        logger_api.debug('Consulta CNPJ %s via cache local', clean, extra=AMOSTRAR)
+        return _montar_resultado(clean, data)
+    resultado = resultado_base_local(clean, ligada=base_local)
+    if resultado is not None:
+        return resultado
+    import requests
+    client_cache = cliente()  # CACHE não usa slot: qualquer chave em rotação
     last_error = None
-    prefer_cache_first = getattr(settings, 'CNPJA_FORCE_CACHE_FIRST', True)
+    prefer_cache_first = getattr(settings, 'CNPJA_FORCE_CACHE_FIRST', True) if cache_first is None else cache_first
     # Monta a sequência de estratégias: tenta CACHE puro antes de consultar online
     base_strategy = getattr(settings, 'CNPJA_STRATEGY', 'CACHE_IF_FRESH')
     max_age = getattr(settings, 'CNPJA_MAX_AGE_DAYS', 40)
@@ -129,9 +1135,11 @@ def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
         # Dentro de cada tentativa, percorre a sequência de estratégias
         for strat, s_max_age, s_max_stale in strategies:
             try:
-                # Aplica rate limit apenas quando a estratégia não é puramente de CACHE
+                # Aplica rate limit apenas quando a estratégia não é puramente de CACHE; o slot
+                # vem com a chave que tem folga na janela
+                client = client_cache
                 if strat != 'CACHE':
-                    _rate_limit_acquire('cnpja_api')
+                    client = cliente(_rate_limit_acquire('cnpja_api', fluxo=fluxo, interativo=interativo, usuario=usuario))
                 start_time = time.time()
                 data = client.get_office(
                     clean,
@@ -141,36 +1149,24 @@ def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
                     max_stale_days=s_max_stale,
                 )
                 elapsed = time.time() - start_time
-                nome = (
-                    (data.get('company') or {}).get('name')
-                    or data.get('name')
-                    or '-'
-                )
-                email = 'Sem e-mail'
-                emails = data.get('emails')
-                if isinstance(emails, list) and emails:
-                    first = emails[0]
-                    if isinstance(first, dict):
-                        email = first.get('address') or first.get('email') or 'Sem e-mail'
-                    elif isinstance(first, str):
-                        email = first
+                registrar_consumo_creditos(custo_consulta(strat, client.last_headers), client.chave_id)
                 stale_flag = data.get('stale')
                 via = strat + (' (stale)' if stale_flag else '')
-                print(f"[CONSULTA] CNPJ {format_cnpj(clean)} | via={via} | resposta={elapsed:.2f}s")
-                return {
-                    'cnpj': format_cnpj(clean),
-                    'nome': nome,
-                    'email': email,
-                    'detalhes': data
-                }
+                logger_api.debug('Consulta CNPJ %s via %s em %.2fs', clean, via, elapsed, extra=AMOSTRAR)
+                salvar_office_cache(clean, data)
+                return _montar_resultado(clean, data)
             except CNPJAClientError as e:
                 msg = str(e)
                 last_error = msg
                 # Se estratégia CACHE não encontrou dados (404), tenta próxima sem contar como retry
                 if strat == 'CACHE' and '404' in msg:
-                    print(f"[CACHE MISS] CNPJ {format_cnpj(clean)}: sem dados em cache. Tentando estratégia {base_strategy}...")
+                    logger_api.debug('CNPJ %s sem dados em cache; tentando estratégia %s', clean, base_strategy, extra=AMOSTRAR)
                     continue
-                print(f"[ERRO API PRO] via={strat} CNPJ {format_cnpj(clean)}: {msg}")
+                logger_api.warning('Erro da API via %s no CNPJ %s: %s', strat, clean, msg)
+                # Chave bloqueada (401/403/429): sai de rotação e, havendo outra, tenta já com ela
+                if pausar_se_bloqueada(client.chave_id, e) and disponiveis():
+                    client_cache = cliente()
+                    break
                 if '429' in msg:
                     # Aguarda antes de nova tentativa. Tenta usar ttl do corpo se presente (ex: {"ttl":4})
                     wait_secs = retry_wait
@@ -185,7 +1181,7 @@ def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
                         pass
                     if on_retry:
                         on_retry(attempt + 1, wait_secs)
-                    print(f"[BACKOFF 429] Aguardando {wait_secs}s antes do retry...")
+                    logger_ratelimit.warning('429 da API; aguardando %ss antes do retry', wait_secs, extra={'fluxo': fluxo})
                     time.sleep(wait_secs)
                     # passa para próxima tentativa (retry)
                     break
@@ -198,7 +1194,7 @@ def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
                 }
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
                 last_error = 'Timeout/ConnectionError'
-                print(f"[TIMEOUT/CONNECTION ERROR] via={strat} CNPJ {format_cnpj(clean)}: Tentativa {attempt+1}")
+                logger_api.warning('Timeout/conexão via %s no CNPJ %s (tentativa %s)', strat, clean, attempt + 1)
                 # aguarda antes da próxima tentativa
                 wait_secs = max(5, retry_wait // 2)
                 if on_retry:
@@ -208,7 +1204,7 @@ def consultar_cnpj_api(cnpj, retry_count=3, retry_wait=20, on_retry=None):
                 break
             except Exception as e:
                 last_error = str(e)
-                print(f"[ERRO INESPERADO] CNPJ {format_cnpj(clean)}: {str(e)}")
+                logger_api.exception('Erro inesperado no CNPJ %s: %s', clean, e)
                 return {
                     'cnpj': format_cnpj(clean),
                     'nome': '-',
@@ -285,7 +1281,7 @@ def format_processo(proc: str | None) -> str | None:
     return proc
 
 
-def processar_csv(file, logger=None, on_retry=None):
+def processar_csv(file, logger=None, on_retry=None, usuario=None):
     """Lê um CSV, detecta colunas e consulta a API por linha.
 
     - Detecta por nomes de cabeçalho comuns (inclui NRCPFCNPJ/DSProcesso);
@@ -299,7 +1295,7 @@ def processar_csv(file, logger=None, on_retry=None):
     op_keys = ['oportunidade']
     sub_keys = ['substancias', 'substancias', 'substancia', 'substâncias', 'substância']
     resultados = []
-    print(f"[SERVICES-CSV] Headers: {reader.fieldnames}")
+    logger_upload.debug('CSV: cabeçalhos %s', reader.fieldnames)
     for row in reader:
         cnpj_val = None
         proc_val = None
@@ -313,7 +1309,7 @@ def processar_csv(file, logger=None, on_retry=None):
                 original = row[key]
                 cnpj_val = clean_cnpj(original or '').strip()
                 if logger and original:
-                    logger.info(f"Linha CSV: '{original}' -> CNPJ limpo: '{cnpj_val}'")
+                    logger.debug('Linha CSV: %r -> CNPJ limpo: %r', original, cnpj_val, extra=AMOSTRAR)
             if not proc_val and any(k.lower() in key.lower() for k in proc_keys):
                 proc_val = (row[key] or '').strip()
             kn = _norm(key)
@@ -337,8 +1333,8 @@ def processar_csv(file, logger=None, on_retry=None):
         if cnpj_val:
             try:
                 if logger:
-                    logger.info(f'Consultando CNPJ (CSV): {cnpj_val}')
-                resultado = consultar_cnpj_api(cnpj_val, on_retry=on_retry)
+                    logger.debug('Consultando CNPJ (CSV): %s', cnpj_val, extra=AMOSTRAR)
+                resultado = consultar_cnpj_api(cnpj_val, on_retry=on_retry, fluxo=f"upload:{usuario or '-'}", usuario=usuario)
                 resultado['processo'] = proc_val
                 if dsevento_val is not None:
                     resultado['dsevento'] = dsevento_val
@@ -346,69 +1342,341 @@ def processar_csv(file, logger=None, on_retry=None):
                     resultado['oportunidade'] = oportunidade_val
                 if substancias_val is not None:
                     resultado['substancias'] = substancias_val
-                print(f"[SERVICES-CSV] row -> proc:{proc_val} dsev:{dsevento_val} op:{oportunidade_val} sub:{substancias_val}")
+                logger_upload.debug('CSV: linha -> proc:%s dsev:%s op:%s sub:%s', proc_val, dsevento_val, oportunidade_val, substancias_val, extra=AMOSTRAR)
                 resultados.append(resultado)
             except Exception as e:
                 if logger:
-                    logger.error(f'Erro ao consultar CNPJ {cnpj_val}: {e}')
+                    logger.error('Erro ao consultar CNPJ %s: %s', cnpj_val, e)
                 resultados.append({'processo': proc_val, 'cnpj': format_cnpj(cnpj_val), 'nome': '-', 'email': f'Erro: {str(e)}', 'detalhes': None, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val})
             time.sleep(DELAY_SECONDS)
     return resultados
 
 
-def processar_xlsx(file, logger=None, on_retry=None):
-    """Lê um XLSX (primeira planilha), detecta colunas e consulta API por linha.
+def extrair_itens_csv(file, estatisticas=None):
+    """Extrai os itens de um job (`{'cnpj', 'processo', extras...}`) de um CSV.
+
+    Procura as colunas por cabeçalho; linhas sem CNPJ na coluna são vasculhadas por
+    regex. CSV caótico (DictReader falha) cai no `csv.reader` campo a campo.
+    Se `estatisticas` (dict) for passado, recebe `linhas` (linhas de dados lidas).
+    """
+    # Fallback de encoding
+    raw = file.read()
+    try:
+        decoded = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        decoded = raw.decode('latin-1')
+    sio = io.StringIO(decoded)
+    items = []
+    linhas = 0
+    # Tenta DictReader primeiro
+    try:
+        reader = csv.DictReader(sio)
+        keys = ['cnpj', 'CNPJ', 'CNPJ/CPF', 'cnpj_cpf', 'NRCPFCNPJ', 'nrcpfcnpj', 'CNPJCPF']
+        pkeys = ['processo', 'Processo', 'número do processo', 'numero do processo', 'dsprocesso', 'DSProcesso']
+        ds_keys = ['dsevento', 'ds evento', 'ds_evento']
+        op_keys = ['oportunidade']
+        sub_keys = ['substancias', 'substâncias', 'substancia']
+        found_by_header = False
+        logger_upload.debug('Upload CSV: cabeçalhos %s', reader.fieldnames)
+        for row in reader:
+            linhas += 1
+            matched_this_row = False
+            proc_val = None
+            dsevento_val = None
+            oportunidade_val = None
+            substancias_val = None
+            for key in row:
+                if key is None:
+                    continue
+                if any(k.lower() in key.lower() for k in keys):
+                    cnpj_val = clean_cnpj(row[key])
+                    if len(cnpj_val) == 14:
+                        # captura processo se existir
+                        for k2 in row:
+                            if any(pk.lower() in k2.lower() for pk in pkeys):
+                                proc_val = (row[k2] or '').strip()
+                                break
+                        # extras por cabeçalho
+                        for k3 in row:
+                            kn = (k3 or '').lower()
+                            if dsevento_val is None and any(ds in kn for ds in ds_keys):
+                                dsevento_val = (row[k3] or '').strip()
+                            if oportunidade_val is None and any(op in kn for op in op_keys):
+                                oportunidade_val = (row[k3] or '').strip()
+                            if substancias_val is None and any(sb in kn for sb in sub_keys):
+                                substancias_val = (row[k3] or '').strip()
+                        payload = {'cnpj': cnpj_val, 'processo': proc_val, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val}
+                        logger_upload.debug('Upload CSV: linha -> %s', payload, extra=AMOSTRAR)
+                        items.append(payload)
+                        matched_this_row = True
+                        found_by_header = True
+            if not matched_this_row:
+                # Fallback por linha: vasculha todos os valores
+                pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
+                cnpj_candidates = []
+                for v in row.values():
+                    if not v:
+                        continue
+                    for m in pattern.findall(str(v)):
+                        digits = clean_cnpj(m)
+                        if len(digits) == 14:
+                            cnpj_candidates.append(digits)
+                # tenta obter processo e extras por cabeçalho mesmo no fallback
+                for digits in cnpj_candidates:
+                    proc_val = None
+                    dsevento_val = None
+                    oportunidade_val = None
+                    substancias_val = None
+                    for k2 in row:
+                        if any(pk.lower() in k2.lower() for pk in pkeys):
+                            proc_val = (row[k2] or '').strip()
+                        kn = (k2 or '').lower()
+                        if dsevento_val is None and any(ds in kn for ds in ds_keys):
+                            dsevento_val = (row[k2] or '').strip()
+                        if oportunidade_val is None and any(op in kn for op in op_keys):
+                            oportunidade_val = (row[k2] or '').strip()
+                        if substancias_val is None and any(sb in kn for sb in sub_keys):
+                            substancias_val = (row[k2] or '').strip()
+                    payload = {'cnpj': digits, 'processo': proc_val, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val}
+                    logger_upload.debug('Upload CSV (regex): linha -> %s', payload, extra=AMOSTRAR)
+                    items.append(payload)
+    except Exception:
+        # Se DictReader não funcionar bem (csv caótico), usa csv.reader
+        sio.seek(0)
+        reader2 = csv.reader(sio)
+        linhas = 0
+        pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
+        for row in reader2:
+            linhas += 1
+            for field in row:
+                for m in pattern.findall(str(field)):
+                    digits = clean_cnpj(m)
+                    if len(digits) == 14:
+                        items.append({'cnpj': digits, 'processo': None})
+    if estatisticas is not None:
+        estatisticas['linhas'] = linhas
+    return items
+
+
+def _aparar_linha(row):
+    """Remove células vazias do fim da tupla (a última coluna usada varia por linha)."""
+    fim = len(row)
+    while fim and (row[fim - 1] is None or row[fim - 1] == ''):
+        fim -= 1
+    return row[:fim] if fim != len(row) else row
+
+
+def _texto_celula(row, idx):
+    """Valor da coluna `idx` como texto aparado; None se ausente/vazio.
+
+    Floats inteiros (ex.: 11222333000181.0) viram '11222333000181' para não
+    sujar CNPJs/processos numéricos com o sufixo '.0'.
+    """
+    if idx is None or idx >= len(row):
+        return None
+    val = row[idx]
+    if val is None:
+        return None
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    val = str(val).strip()
+    return val or None
+
+
+def _selecionar_planilha(nomes, ativa, sheet=None):
+    """Nome da planilha pedida: nome exato, nome sem acento/caixa ou índice 1-based; padrão: a ativa."""
+    if sheet is None or str(sheet).strip() == '':
+        return ativa
+    sheet = str(sheet).strip()
+    if sheet in nomes:
+        return sheet
+    alvo = _norm(sheet)
+    for nome in nomes:
+        if _norm(nome) == alvo:
+            return nome
+    if sheet.isdigit() and 1 <= int(sheet) <= len(nomes):
+        return nomes[int(sheet) - 1]
+    raise ValueError(f"Planilha '{sheet}' não encontrada. Disponíveis: {', '.join(nomes)}")
+
+
+def _ler_xlsx_openpyxl(file, sheet=None):
+    """Fallback de `ler_xlsx` via openpyxl (`read_only` + `values_only`)."""
+    import openpyxl
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb[_selecionar_planilha(wb.sheetnames, wb.active.title, sheet)]
+    except ValueError:
+        wb.close()
+        raise
+    # Ignora as dimensões declaradas: planilhas formatadas costumam declarar
+    # A1:XFD1048576 e o openpyxl completaria cada linha (e as vazias) até lá.
+    ws.reset_dimensions()
+    rows = ws.iter_rows(min_row=1, values_only=True)
+    cabecalho = _aparar_linha(next(rows, ()) or ())
+
+    def _linhas():
+        try:
+            for row in rows:
+                row = _aparar_linha(row)
+                if row:
+                    yield row
+        finally:
+            wb.close()
+
+    return cabecalho, _linhas()
+
+
+def ler_xlsx(file, sheet=None):
+    """Abre um XLSX em modo streaming e devolve (cabecalho, linhas).
+
+    Usa o leitor enxuto de `consulta.xlsx` (tuplas de valores direto do XML, sem
+    objetos de célula nem estilos); se o arquivo fugir do formato esperado, cai no
+    openpyxl em `read_only`/`values_only`. Em ambos os casos cada linha termina na
+    última célula com valor e linhas vazias são descartadas.
+
+    `cabecalho` é a 1ª linha da planilha (tupla, vazia se a linha 1 estiver em branco)
+    e `linhas` um gerador com as demais. O arquivo é fechado ao esgotar o gerador.
+    `sheet` aceita nome ou índice 1-based; levanta ValueError se não existir.
+    """
+    from .xlsx import LeitorXlsx, XlsxNaoSuportado
+
+    try:
+        leitor = LeitorXlsx(file)
+    except XlsxNaoSuportado as e:
+        logger_upload.info('Leitor XLSX enxuto indisponível (%s); usando openpyxl', e)
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        return _ler_xlsx_openpyxl(file, sheet)
+    try:
+        nome = _selecionar_planilha(leitor.sheetnames, leitor.ativa, sheet)
+    except ValueError:
+        leitor.close()
+        raise
+    rows = leitor.linhas(nome)
+    primeira = next(rows, None)
+    cabecalho = ()
+    if primeira is not None and primeira[0] == 1:
+        cabecalho, primeira = primeira[1], None
+
+    def _linhas():
+        try:
+            if primeira is not None:
+                yield primeira[1]
+            for _, row in rows:
+                yield row
+        finally:
+            leitor.close()
+
+    return cabecalho, _linhas()
+
+
+def _indices_colunas_xlsx(headers, cnpj_keys, proc_keys):
+    """Localiza as colunas de CNPJ, Processo e extras (DSEvento/Oportunidade/Substâncias)."""
+    idx = {'cnpj': None, 'processo': None, 'dsevento': None, 'oportunidade': None, 'substancias': None}
+    for i, h in enumerate(headers):
+        hl = h.lower()
+        hn = _norm(h)
+        if idx['cnpj'] is None and any(k.lower() in hl for k in cnpj_keys):
+            idx['cnpj'] = i
+        if idx['processo'] is None and any(k.lower() in hl for k in proc_keys):
+            idx['processo'] = i
+        if idx['dsevento'] is None and any(k in hn for k in ['dsevento', 'ds evento', 'ds_evento']):
+            idx['dsevento'] = i
+        if idx['oportunidade'] is None and 'oportunidade' in hn:
+            idx['oportunidade'] = i
+        if idx['substancias'] is None and 'substancia' in hn:
+            idx['substancias'] = i
+    return idx
+
+
+XLSX_CNPJ_PATTERN = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
+
+
+def extrair_itens_xlsx(file, sheet=None, estatisticas=None):
+    """Extrai os itens de um job (`{'cnpj', 'processo', extras...}`) de um XLSX.
+
+    Com coluna de CNPJ no cabeçalho, lê uma linha por item (apenas CNPJs com 14
+    dígitos). Sem ela, varre as células (inclusive a 1ª linha) atrás de CNPJs.
+    Se `estatisticas` (dict) for passado, recebe `linhas` (linhas não vazias lidas).
+    """
+    cabecalho, linhas = ler_xlsx(file, sheet)
+    headers = [str(h).strip().lower() if h is not None else '' for h in cabecalho]
+    idx = _indices_colunas_xlsx(headers, ['cnpj', 'cnpj/cpf', 'cnpj_cpf'],
+                                ['processo', 'número do processo', 'numero do processo'])
+    logger_upload.debug('Upload XLSX: cabeçalhos %s; colunas %s', headers, idx)
+    items = []
+    lidas = 0
+    cnpj_idx = idx['cnpj']
+    if cnpj_idx is not None:
+        extras = [(k, idx[k]) for k in ('dsevento', 'oportunidade', 'substancias') if idx[k] is not None]
+        for row in linhas:
+            lidas += 1
+            cnpj_val = clean_cnpj(_texto_celula(row, cnpj_idx) or '')
+            if len(cnpj_val) != 14:
+                continue
+            item = {'cnpj': cnpj_val, 'processo': _texto_celula(row, idx['processo'])}
+            for k, i in extras:
+                item[k] = _texto_celula(row, i)
+            items.append(item)
+        logger_upload.info('Upload XLSX: %s itens por cabeçalho', len(items))
+    else:
+        for row in itertools.chain((cabecalho,), linhas):
+            lidas += 1 if row else 0
+            for val in row:
+                if val is None:
+                    continue
+                if isinstance(val, int):
+                    # Número puro: só serve se já tiver 14 dígitos (sem zeros perdidos)
+                    if 10_000_000_000_000 <= val <= 99_999_999_999_999:
+                        items.append({'cnpj': str(val), 'processo': None})
+                    continue
+                for m in XLSX_CNPJ_PATTERN.findall(str(val)):
+                    digits = clean_cnpj(m)
+                    if len(digits) == 14:
+                        items.append({'cnpj': digits, 'processo': None})
+    if estatisticas is not None:
+        estatisticas['linhas'] = lidas
+    return items
+
+
+def processar_xlsx(file, logger=None, on_retry=None, usuario=None, sheet=None):
+    """Lê um XLSX (planilha ativa ou `sheet`), detecta colunas e consulta API por linha.
 
     Idêntico ao CSV: tenta cabeçalhos, com fallback por regex linha a linha.
+    A leitura usa `ler_xlsx` (tuplas de valores, sem objetos de célula).
     """
-    wb = openpyxl.load_workbook(file, read_only=True)
-    ws = wb.active
-    headers = [str(cell.value).strip() if cell.value else '' for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-    print(f"[SERVICES-XLSX] Headers: {headers}")
+    cabecalho, linhas = ler_xlsx(file, sheet)
+    headers = [str(h).strip() if h else '' for h in cabecalho]
+    logger_upload.debug('XLSX: cabeçalhos %s', headers)
     cnpj_keys = ['cnpj', 'CNPJ', 'CNPJ/CPF', 'cnpj_cpf', 'nrcpfcnpj', 'NRCPFCNPJ', 'cpf/cnpj', 'CNPJCPF']
     proc_keys = ['processo', 'Processo', 'número do processo', 'numero do processo', 'dsprocesso', 'DSProcesso']
-    cnpj_idx = None
-    proc_idx = None
-    ds_idx = None
-    op_idx = None
-    sub_idx = None
-    for idx, h in enumerate(headers):
-        hn = _norm(h)
-        if cnpj_idx is None and any(k.lower() in h.lower() for k in cnpj_keys):
-            cnpj_idx = idx
-        if proc_idx is None and any(k.lower() in h.lower() for k in proc_keys):
-            proc_idx = idx
-        if ds_idx is None and any(k in hn for k in ['dsevento','ds evento','ds_evento']):
-            ds_idx = idx
-        if op_idx is None and 'oportunidade' in hn:
-            op_idx = idx
-        if sub_idx is None and any(k in hn for k in ['substancias','substancia','substancias','substancias']):
-            sub_idx = idx
+    idx = _indices_colunas_xlsx(headers, cnpj_keys, proc_keys)
+    cnpj_idx = idx['cnpj']
 
     resultados = []
-    for row in ws.iter_rows(min_row=2):
+    for row in linhas:
         # 1) Por cabeçalho
         cnpj_val = None
-        if cnpj_idx is not None and row[cnpj_idx].value:
-            cnpj_val = clean_cnpj(str(row[cnpj_idx].value))
-        proc_val = (str(row[proc_idx].value).strip() if (proc_idx is not None and row[proc_idx].value) else None)
-        dsevento_val = (str(row[ds_idx].value).strip() if (ds_idx is not None and row[ds_idx].value) else None)
-        oportunidade_val = (str(row[op_idx].value).strip() if (op_idx is not None and row[op_idx].value) else None)
-        substancias_val = (str(row[sub_idx].value).strip() if (sub_idx is not None and row[sub_idx].value) else None)
+        if cnpj_idx is not None:
+            cnpj_val = clean_cnpj(_texto_celula(row, cnpj_idx) or '') or None
+        proc_val = _texto_celula(row, idx['processo'])
+        dsevento_val = _texto_celula(row, idx['dsevento'])
+        oportunidade_val = _texto_celula(row, idx['oportunidade'])
+        substancias_val = _texto_celula(row, idx['substancias'])
 
-        # 2) Fallback por regex
-        if not cnpj_val:
-            joined = ' '.join([str(c.value) for c in row if c.value is not None])
-            cnpj_val = _extract_first_cnpj_from_text(joined)
-        if not proc_val:
-            joined = ' '.join([str(c.value) for c in row if c.value is not None])
-            proc_val = _extract_first_processo_from_text(joined)
+        # 2) Fallback por regex (a linha só é convertida em texto se necessário)
+        if not cnpj_val or not proc_val:
+            joined = ' '.join([str(v) for v in row if v is not None])
+            if not cnpj_val:
+                cnpj_val = _extract_first_cnpj_from_text(joined)
+            if not proc_val:
+                proc_val = _extract_first_processo_from_text(joined)
         # Padroniza processo
         proc_val = format_processo(proc_val)
 
         if cnpj_val:
             try:
-                resultado = consultar_cnpj_api(cnpj_val, on_retry=on_retry)
+                resultado = consultar_cnpj_api(cnpj_val, on_retry=on_retry, fluxo=f"upload:{usuario or '-'}", usuario=usuario)
                 resultado['processo'] = proc_val
                 if dsevento_val is not None:
                     resultado['dsevento'] = dsevento_val
@@ -416,7 +1684,7 @@ def processar_xlsx(file, logger=None, on_retry=None):
                     resultado['oportunidade'] = oportunidade_val
                 if substancias_val is not None:
                     resultado['substancias'] = substancias_val
-                print(f"[SERVICES-XLSX] row -> proc:{proc_val} dsev:{dsevento_val} op:{oportunidade_val} sub:{substancias_val}")
+                logger_upload.debug('XLSX: linha -> proc:%s dsev:%s op:%s sub:%s', proc_val, dsevento_val, oportunidade_val, substancias_val, extra=AMOSTRAR)
                 resultados.append(resultado)
             except Exception as e:
                 resultados.append({'processo': proc_val, 'cnpj': format_cnpj(cnpj_val), 'nome': '-', 'email': f'Erro: {str(e)}', 'detalhes': None, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val})
@@ -459,6 +1727,8 @@ def exportar_xlsx(resultados, include_data=False):
 
     Quando include_data=True, inclui a coluna Data (para histórico).
     """
+    import xlsxwriter
+
     output = io.BytesIO()
     wb = xlsxwriter.Workbook(output, {'in_memory': True})
     ws = wb.add_worksheet('Export')
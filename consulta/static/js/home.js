@@ -66,6 +66,63 @@ if (toggleCardBtn && formContainer) {
     });
 }
 let loopActive = false, paused = false, cancelled = false;
+// Corpo de /jobs/start/ e /jobs/analyze/: arquivo (multipart) ou lista manual (JSON)
+function jobRequestOptions(cnpjs, csv, csrfToken) {
+    if (csv > 0) {
+        const formData = new FormData();
+        formData.append('csv_file', document.getElementById('csv_file').files[0]);
+        const sheetEl = document.getElementById('sheet');
+        if (sheetEl && sheetEl.value.trim()) formData.append('sheet', sheetEl.value.trim());
+        return { method: 'POST', body: formData, credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } };
+    }
+    return {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+        body: JSON.stringify({ cnpjs })
+    };
+}
+function formatDuration(seconds) {
+    const h = Math.floor(seconds / 3600), m = Math.floor((seconds % 3600) / 60), s = seconds % 60;
+    if (h) return `${h}h${String(m).padStart(2, '0')}min`;
+    if (m) return `${m}min${String(s).padStart(2, '0')}s`;
+    return `${s}s`;
+}
+// Pré-análise (dry run): nada é consultado nem gravado
+const btnAnalisar = document.getElementById('btn-analisar');
+if (btnAnalisar) {
+    btnAnalisar.addEventListener('click', async () => {
+        const cnpjs = cnpjInput.value.trim();
+        const csv = document.getElementById('csv_file').files.length;
+        const errorMsg = document.getElementById('error-msg');
+        const out = document.getElementById('analysis-result');
+        errorMsg.style.display = 'none';
+        if (!cnpjs && !csv) {
+            errorMsg.textContent = 'Preencha o campo de CNPJ(s) ou envie um arquivo CSV.';
+            errorMsg.style.display = 'block';
+            return;
+        }
+        btnAnalisar.disabled = true;
+        out.style.display = 'block';
+        out.textContent = 'Analisando...';
+        try {
+            const resp = await fetch('/jobs/analyze/', jobRequestOptions(cnpjs, csv, getCSRFToken()));
+            const a = await resp.json().catch(() => ({}));
+            if (!resp.ok) { out.textContent = a.detail || 'Falha na análise.'; return; }
+            const saldo = (a.credits_balance === null || a.credits_balance === undefined) ? '?' : a.credits_balance;
+            out.textContent = `${a.rows} linha(s), ${a.distinct} CNPJ(s) distintos válidos` +
+                ` (${a.duplicates} duplicado(s), ${a.invalid_format + a.invalid_check_digit} inválido(s)).` +
+                ` Em cache: ${a.cached}; no histórico recente: ${a.history}; online: ${a.online}.` +
+                ` Tempo estimado: ${formatDuration(a.eta_seconds)}` +
+                (a.eta_seconds_now > a.eta_seconds ? ` (${formatDuration(a.eta_seconds_now)} com ${a.active_flows} fluxo(s) ativo(s))` : '') +
+                `. Créditos: ~${a.credits_estimate} de ${saldo}` + (a.insufficient ? ' — saldo insuficiente!' : '.');
+        } catch (err) {
+            out.textContent = 'Falha na análise.';
+        } finally {
+            btnAnalisar.disabled = false;
+        }
+    });
+}
 document.getElementById('consultaForm').addEventListener('submit', async function(e) {
     const cnpjs = cnpjInput.value.trim();
     const csv = document.getElementById('csv_file').files.length;
@@ -110,18 +167,7 @@ document.getElementById('consultaForm').addEventListener('submit', async functio
     // 1) Start job
     let startResp;
     const csrfToken = getCSRFToken();
-    if (csv > 0) {
-        const formData = new FormData();
-        formData.append('csv_file', document.getElementById('csv_file').files[0]);
-        startResp = await fetch('/jobs/start/', { method: 'POST', body: formData, credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
-    } else {
-        startResp = await fetch('/jobs/start/', {
-            method: 'POST',
-            credentials: 'same-origin',
-            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
-            body: JSON.stringify({ cnpjs })
-        });
-    }
+    startResp = await fetch('/jobs/start/', jobRequestOptions(cnpjs, csv, csrfToken));
     if (!startResp.ok) {
         const err = await startResp.json().catch(() => ({}));
         errorMsg.textContent = err.detail || 'Falha ao iniciar o processamento.';
@@ -130,10 +176,63 @@ document.getElementById('consultaForm').addEventListener('submit', async functio
     }
     const startData = await startResp.json();
     const total = startData.total || 0;
+
+    // 1b) Planejamento: verifica o cache do CNPJÁ (sem custo) e estima os créditos
+    let plan = null;
+    while (!cancelled) {
+        const planResp = await fetch('/jobs/plan/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+        if (!planResp.ok) { plan = null; break; }
+        plan = await planResp.json();
+        // Outra requisição (aba/worker) está com o job: aguarda e tenta de novo
+        if (plan.status === 'busy') { await new Promise(r => setTimeout(r, 500)); continue; }
+        progressEl.textContent = `Verificando cache: ${plan.checked}/${plan.distinct}`;
+        if (plan.status === 'planned') break;
+    }
+    if (plan && plan.status === 'planned') {
+        const saldo = (plan.credits_balance != null) ? String(plan.credits_balance) : '—';
+        showRetryStatus(`Em cache: ${plan.cached} | Consultas online: ${plan.online} | Créditos estimados: ${plan.credits_estimate} (saldo: ${saldo})`);
+        if (plan.insufficient && !confirm(`Este lote deve consumir ${plan.credits_estimate} créditos, acima do saldo atual (${saldo}). Deseja continuar?`)) {
+            btnCancelar.click();
+            return;
+        }
+    }
     progressEl.textContent = `Progresso: 0/${total}`;
 
+    await runJobLoop(total, 0, progressEl, csrfToken);
+});
+// Renderiza uma linha de resultado do job na tabela
+function appendResultRow(tbody, r) {
+    const tr = document.createElement('tr');
+    const email = (!r.email || r.email === '-') ? 'Sem e-mail' : r.email;
+    const cnpjVal = r.cnpj || '-';
+    tr.innerHTML = `
+        <td style="padding:8px;">${r.processo || ''}</td>
+        <td style="padding:8px;">${cnpjVal}</td>
+        <td style=\"padding:8px;\">${r.dsevento || ''}</td>
+        <td style=\"padding:8px;\">${r.oportunidade || ''}</td>
+        <td style=\"padding:8px;\">${r.substancias || ''}</td>
+        <td style="padding:8px;">${r.nome || '-'}</td>
+        <td style="padding:8px;">${email}</td>
+        <td style="padding:8px; text-align:center;">
+            <button class=\"btn-icon btn-details\" data-cnpj=\"${cnpjVal}\" title=\"Ver detalhes\" style=\"background:transparent; border:1px solid var(--ignea-brown); border-radius:6px; width:28px; height:28px; display:inline-grid; place-items:center; color:inherit;\"> 
+                <svg xmlns=\"http://www.w3.org/2000/svg\" width=\"14\" height=\"14\" viewBox=\"0 0 24 24\" fill=\"none\" stroke=\"currentColor\" stroke-width=\"2\" stroke-linecap=\"round\" stroke-linejoin=\"round\">\n                            <rect x=\"3\" y=\"3\" width=\"18\" height=\"18\" rx=\"3\" ry=\"3\"></rect>\n                            <line x1=\"12\" y1=\"10\" x2=\"12\" y2=\"16\"></line>\n                            <line x1=\"12\" y1=\"7\" x2=\"12.01\" y2=\"7\"></line>\n                        </svg>
+            </button>
+        </td>
+    `;
+    tbody.appendChild(tr);
+    // Garante CSS da animação (definido uma única vez)
+    ensureRowAnimStyle();
+    // Dispara animação de entrada
+    tr.classList.add('ignea-row-fade-right');
+    // Limpa a classe ao término da animação sem "piscadas"
+    tr.addEventListener('animationend', () => {
+        tr.classList.remove('ignea-row-fade-right');
+    }, { once: true });
+}
+// Loop de passos do job (usado na submissão e na retomada a partir de checkpoint)
+async function runJobLoop(total, processed, progressEl, csrfToken) {
+    const tbody = document.querySelector('#tab-resultado tbody');
     // 2) Loop de passos
-    let processed = 0;
     while (loopActive && !cancelled && processed < total) {
         if (paused) { await new Promise(r => setTimeout(r, 800)); continue; }
     const stepResp = await fetch('/jobs/step/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
@@ -141,36 +240,12 @@ document.getElementById('consultaForm').addEventListener('submit', async functio
         const stepData = await stepResp.json();
     if (stepData.status === 'paused') { paused = true; btnPausar.style.display = 'none'; btnRetomar.style.display = ''; expandFormCard(); continue; }
         if (stepData.status === 'cancelled') { cancelled = true; loopActive = false; break; }
+        if (stepData.status === 'busy') { await new Promise(r => setTimeout(r, 500)); continue; }
         if (stepData.status === 'done') { processed = stepData.processed; progressEl.textContent = `Progresso: ${processed}/${total}`; break; }
         if (stepData.item) {
             processed = stepData.processed;
             const r = stepData.item;
-            const tr = document.createElement('tr');
-            const email = (!r.email || r.email === '-') ? 'Sem e-mail' : r.email;
-            const cnpjVal = r.cnpj || '-';
-            tr.innerHTML = `
-                <td style="padding:8px;">${r.processo || ''}</td>
-                <td style="padding:8px;">${cnpjVal}</td>
-                <td style=\"padding:8px;\">${r.dsevento || ''}</td>
-                <td style=\"padding:8px;\">${r.oportunidade || ''}</td>
-                <td style=\"padding:8px;\">${r.substancias || ''}</td>
-                <td style="padding:8px;">${r.nome || '-'}</td>
-                <td style="padding:8px;">${email}</td>
-                <td style="padding:8px; text-align:center;">
-                    <button class=\"btn-icon btn-details\" data-cnpj=\"${cnpjVal}\" title=\"Ver detalhes\" style=\"background:transparent; border:1px solid var(--ignea-brown); border-radius:6px; width:28px; height:28px; display:inline-grid; place-items:center; color:inherit;\"> 
-                        <svg xmlns=\"http://www.w3.org/2000/svg\" width=\"14\" height=\"14\" viewBox=\"0 0 24 24\" fill=\"none\" stroke=\"currentColor\" stroke-width=\"2\" stroke-linecap=\"round\" stroke-linejoin=\"round\">\n                            <rect x=\"3\" y=\"3\" width=\"18\" height=\"18\" rx=\"3\" ry=\"3\"></rect>\n                            <line x1=\"12\" y1=\"10\" x2=\"12\" y2=\"16\"></line>\n                            <line x1=\"12\" y1=\"7\" x2=\"12.01\" y2=\"7\"></line>\n                        </svg>
-                    </button>
-                </td>
-            `;
-            tbody.appendChild(tr);
-            // Garante CSS da animação (definido uma única vez)
-            ensureRowAnimStyle();
-            // Dispara animação de entrada
-            tr.classList.add('ignea-row-fade-right');
-            // Limpa a classe ao término da animação sem "piscadas"
-            tr.addEventListener('animationend', () => {
-                tr.classList.remove('ignea-row-fade-right');
-            }, { once: true });
+            appendResultRow(tbody, r);
             progressEl.textContent = `Progresso: ${processed}/${total}`;
 // CSS da animação já é injetado por ensureRowAnimStyle()
         }
@@ -183,7 +258,7 @@ document.getElementById('consultaForm').addEventListener('submit', async functio
     // Finaliza job: persiste no histórico (sem recarregar a página)
     try {
         if (!cancelled) {
-            const resp = await fetch('/jobs/finalize/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+            const resp = await postJob('/jobs/finalize/', csrfToken);
             if (resp.ok) {
             // Mostra mensagem sutil de sucesso sem apagar a tabela
             let doneEl = document.getElementById('done-indicator');
@@ -205,22 +280,30 @@ document.getElementById('consultaForm').addEventListener('submit', async functio
     } catch (e) {
         console.error('Falha ao salvar histórico:', e);
     }
-});
+}
+// POST de controle do job; 409 = um passo ainda está com o job, repete em seguida
+async function postJob(url, csrfToken) {
+    for (let tentativa = 0; ; tentativa++) {
+        const resp = await fetch(url, { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+        if (resp.status !== 409 || tentativa >= 120) return resp;
+        await new Promise(r => setTimeout(r, 500));
+    }
+}
 // Controles: Pausar/Retomar/Cancelar
 btnPausar.addEventListener('click', async () => {
     const csrfToken = getCSRFToken();
-    await fetch('/jobs/pause/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+    await postJob('/jobs/pause/', csrfToken);
     paused = true; btnPausar.style.display = 'none'; btnRetomar.style.display = ''; expandFormCard();
 });
 btnRetomar.addEventListener('click', async () => {
     const csrfToken = getCSRFToken();
-    await fetch('/jobs/resume/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+    await postJob('/jobs/resume/', csrfToken);
     paused = false; btnRetomar.style.display = 'none'; btnPausar.style.display = ''; collapseFormCard();
 });
 btnCancelar.addEventListener('click', async () => {
     cancelled = true; loopActive = false;
     const csrfToken = getCSRFToken();
-    await fetch('/jobs/cancel/', { method: 'POST', credentials: 'same-origin', headers: { 'X-CSRFToken': csrfToken } });
+    await postJob('/jobs/cancel/', csrfToken);
     // sem indicador de loading textual
     btnBuscar.disabled = false;
     btnPausar.style.display = 'none'; btnRetomar.style.display = 'none'; btnCancelar.style.display = 'none';
@@ -288,6 +371,48 @@ if (document.readyState === 'loading') {
 } else {
     try { loadCredits(false); } catch (e) {}
 }
+// Retomada de jobs a partir do checkpoint no banco (após crash/deploy ou aba fechada)
+async function checkPendingJobs() {
+    try {
+        const resp = await fetch('/jobs/pending/', { credentials: 'same-origin' });
+        if (!resp.ok) return;
+        const data = await resp.json();
+        const job = (data.jobs || [])[0];
+        if (!job || document.getElementById('btn-restaurar')) return;
+        const btn = document.createElement('button');
+        btn.type = 'button';
+        btn.id = 'btn-restaurar';
+        btn.className = 'ignea-button';
+        btn.textContent = `Retomar job #${job.id} (${job.processed}/${job.total})`;
+        btn.title = `${job.arquivo_nome || 'Entrada manual'} — ${job.updated}`;
+        btn.addEventListener('click', () => restoreJob(job.id, btn));
+        document.getElementById('actions-bar').insertBefore(btn, document.getElementById('progress-indicator'));
+    } catch (e) {}
+}
+async function restoreJob(jobId, btn) {
+    const csrfToken = getCSRFToken();
+    const resp = await postJob(`/jobs/restore/${jobId}/`, csrfToken);
+    btn.remove();
+    if (!resp.ok) return;
+    const data = await resp.json();
+    btnBuscar.disabled = true;
+    btnPausar.style.display = '';
+    btnRetomar.style.display = 'none';
+    btnCancelar.style.display = '';
+    paused = false; cancelled = false; loopActive = true;
+    collapseFormCard();
+    const tbody = document.querySelector('#tab-resultado tbody');
+    tbody.innerHTML = '';
+    for (const r of (data.results || [])) appendResultRow(tbody, r);
+    const progressEl = document.getElementById('progress-indicator');
+    progressEl.textContent = `Progresso: ${data.processed}/${data.total}`;
+    await runJobLoop(data.total || 0, data.processed || 0, progressEl, csrfToken);
+}
+if (document.readyState === 'loading') {
+    window.addEventListener('DOMContentLoaded', checkPendingJobs);
+} else {
+    checkPendingJobs();
+}
 // Alternância de abas Resultado/Histórico
 const btnResultado = document.getElementById('btn-resultado');
 const btnHistorico = document.getElementById('btn-historico');
@@ -1,6 +0,0 @@
-"""Testes unitários/integração da app 'consulta'.
-
-Adicionar casos para serviços (parsing CSV/XLSX), views de job e API CNPJA.
-"""
-
-from django.test import TestCase
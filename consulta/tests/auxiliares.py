@@ -0,0 +1,78 @@
+"""Dados e dublês compartilhados pelos testes da app 'consulta'."""
+
+import time
+
+from django.core.cache import cache
+
+from .. import services
+
+
+def cnpj_de(raiz, filial=1):
+    """CNPJ com dígitos verificadores válidos a partir da raiz (int) e do número da filial."""
+    base = [int(d) for d in f'{raiz:08d}{filial:04d}']
+    for pesos in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        resto = sum(d * p for d, p in zip(base, pesos)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+    return ''.join(map(str, base))
+
+
+def documento_cnpja(cnpj, nome='Empresa', email='contato@empresa.com.br'):
+    return {'taxId': cnpj, 'company': {'name': nome}, 'emails': [{'address': email}], 'updated': '2026-01-01T00:00:00Z'}
+
+
+def limpar_cache():
+    """Cache vazio, com a reconciliação de créditos marcada como recente (sem thread de /credit)."""
+    cache.clear()
+    cache.set(services.CREDITOS_RECONCILIADO_KEY, time.time(), None)
+
+
+class RespostaFalsa:
+    def __init__(self, status_code, dados=None, headers=None):
+        self.status_code = status_code
+        self.dados = dados
+        self.headers = headers or {}
+        self.text = '' if dados is None else str(dados)
+
+    def json(self):
+        return self.dados
+
+
+def corpo_streaming(resposta):
+    """Conteúdo de uma StreamingHttpResponse, com iterador síncrono ou assíncrono (views_async)."""
+    from asgiref.sync import async_to_sync
+
+    async def _ler():
+        return b''.join([parte async for parte in resposta.streaming_content])
+
+    return async_to_sync(_ler)() if resposta.is_async else b''.join(resposta.streaming_content)
+
+
+def cnpja_falso(documentos, em_cache=(), chamadas=None):
+    """`requests.get` falso do CNPJÁ: /office responde `documentos`; com strategy=CACHE só `em_cache`."""
+    def get(url, headers=None, params=None, timeout=None):
+        cnpj = url.rstrip('/').rsplit('/', 1)[-1]
+        if cnpj == 'credit':
+            return RespostaFalsa(200, {'transient': 1000, 'perpetual': 0})
+        if chamadas is not None:
+            chamadas.append((cnpj, (params or {}).get('strategy')))
+        if (params or {}).get('strategy') == 'CACHE' and cnpj not in em_cache:
+            return RespostaFalsa(404, {'message': 'not found'})
+        if cnpj not in documentos:
+            return RespostaFalsa(404, {'message': 'not found'})
+        return RespostaFalsa(200, documentos[cnpj])
+    return get
+
+
+def iniciar_job(client, cnpjs):
+    """Cria o job da sessão por `/jobs/start/` (entrada manual); retorna a resposta JSON."""
+    import json
+    resposta = client.post('/jobs/start/', data=json.dumps({'cnpjs': ','.join(cnpjs)}),
+                           content_type='application/json', secure=True)
+    return resposta.json()
+
+
+def planejar_job(client):
+    while True:
+        plano = client.post('/jobs/plan/', secure=True).json()
+        if plano['status'] == 'planned':
+            return plano
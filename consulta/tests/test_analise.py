@@ -0,0 +1,58 @@
+"""Pré-análise do upload (/jobs/analyze/)."""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class AnaliseUploadTests(TestCase):
+    """`/jobs/analyze/`: pré-análise sem rede e sem criar job."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+
+    def test_cnpj_valido(self):
+        self.assertTrue(services.cnpj_valido('11.222.333/0001-81'))
+        self.assertFalse(services.cnpj_valido('11.222.333/0001-80'))
+        self.assertFalse(services.cnpj_valido('11111111111111'))
+        self.assertFalse(services.cnpj_valido('1122233300018'))
+
+    def test_analise_manual(self):
+        import json
+        from ..models import ConsultaHistorico, ConsultaJob, ConsultaResultado
+        em_cache, novo, no_historico = cnpj_de(81818181), cnpj_de(82828282), cnpj_de(83838383)
+        services.salvar_office_cache(em_cache, documento_cnpja(em_cache))
+        historico = ConsultaHistorico.objects.create(tipo='manual')
+        ConsultaResultado.objects.create(historico=historico, ordem=0, cnpj=no_historico, detalhes={'taxId': no_historico})
+        cnpjs = [em_cache, novo, services.format_cnpj(novo), no_historico, '11222333000180', '123']
+        with mock.patch('requests.get', side_effect=AssertionError('chamou a API')):
+            resposta = self.client.post('/jobs/analyze/', data=json.dumps({'cnpjs': ','.join(cnpjs)}),
+                                        content_type='application/json', secure=True)
+        dados = resposta.json()
+        esperado = {
+            'rows': 6, 'items': 6, 'distinct': 3, 'duplicates': 1, 'invalid_format': 1, 'invalid_check_digit': 1,
+            'cached': 1, 'history': 1, 'online': 3, 'credits_estimate': 3, 'source': 'manual', 'total': 5,
+        }
+        self.assertEqual({k: dados[k] for k in esperado}, esperado)
+        self.assertGreaterEqual(dados['eta_seconds'], 3)
+        self.assertNotIn('job', self.client.session)
+        self.assertFalse(ConsultaJob.objects.exists())
+
+    def test_analise_de_upload_csv(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        csv = f'CNPJ;Processo\n{cnpj_de(84848484)};1\n{cnpj_de(84848484)};2\n\n'.encode()
+        arquivo = SimpleUploadedFile('lista.csv', csv, content_type='text/csv')
+        dados = self.client.post('/jobs/analyze/', {'csv_file': arquivo}, secure=True).json()
+        self.assertEqual((dados['source'], dados['file_name'], dados['distinct'], dados['duplicates'], dados['total']),
+                         ('upload', 'lista.csv', 1, 1, 2))
+
+    def test_sem_itens(self):
+        import json
+        resposta = self.client.post('/jobs/analyze/', data=json.dumps({'cnpjs': ''}), content_type='application/json', secure=True)
+        self.assertEqual(resposta.status_code, 400)
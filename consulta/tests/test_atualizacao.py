@@ -0,0 +1,95 @@
+"""Renovação em background dos CNPJs perto de vencer."""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], CNPJA_MAX_AGE_DAYS=40, CNPJ_REFRESH_ANTECEDENCIA_DIAS=5,
+                   CNPJ_REFRESH_JANELA_DIAS=90, CNPJ_REFRESH_HORARIO='')
+class AtualizacaoTests(TestCase):
+    """Renovação em background dos CNPJs perto de vencer o `maxAge`."""
+
+    def setUp(self):
+        limpar_cache()
+
+    def _consultado(self, cnpj, atualizado):
+        from ..models import ConsultaHistorico, ConsultaResultado
+        h = ConsultaHistorico.objects.create(tipo='manual', status='concluido')
+        detalhes = {'taxId': cnpj, 'updated': atualizado.isoformat()}
+        ConsultaResultado.de_dict(h.pk, 0, {'cnpj': services.format_cnpj(cnpj), 'detalhes': detalhes}).save()
+
+    @override_settings(CNPJ_REFRESH_HORARIO='22-6')
+    def test_horario_atravessa_a_meia_noite(self):
+        from datetime import datetime
+        from django.utils import timezone
+        from ..atualizacao import em_horario
+        fuso = timezone.get_current_timezone()
+        self.assertTrue(em_horario(datetime(2026, 1, 1, 23, tzinfo=fuso)))
+        self.assertTrue(em_horario(datetime(2026, 1, 1, 3, tzinfo=fuso)))
+        self.assertFalse(em_horario(datetime(2026, 1, 1, 6, tzinfo=fuso)))
+        self.assertFalse(em_horario(datetime(2026, 1, 1, 12, tzinfo=fuso)))
+
+    def test_candidatos_so_os_perto_de_vencer(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from ..atualizacao import _marca_key, cnpjs_vencendo
+        agora = timezone.now()
+        velho, novo, renovado, marcado = (cnpj_de(14000000 + i) for i in range(4))
+        self._consultado(velho, agora - timedelta(days=37))
+        self._consultado(novo, agora - timedelta(days=10))
+        self._consultado(renovado, agora - timedelta(days=38))
+        self._consultado(marcado, agora - timedelta(days=39))
+        services.salvar_office_cache(renovado, {'taxId': renovado, 'updated': agora.isoformat()})
+        cache.set(_marca_key(marcado), agora.isoformat(), 60)
+        self.assertEqual([c for c, _ in cnpjs_vencendo(agora)], [velho])
+
+    def test_candidatos_pela_coluna_extraida(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from ..atualizacao import cnpjs_vencendo
+        from ..models import ConsultaHistorico, ConsultaResultado
+        agora = timezone.now()
+        cnpj = cnpj_de(14000020)
+        h = ConsultaHistorico.objects.create(tipo='manual', status='concluido')
+        # `detalhes` sem `updated`: a data vem só da coluna `atualizado`
+        ConsultaResultado.de_dict(h.pk, 0, {'cnpj': services.format_cnpj(cnpj), 'detalhes': {'taxId': cnpj},
+                                            'atualizado': (agora - timedelta(days=37)).isoformat()}).save()
+        with mock.patch.object(ConsultaResultado, 'como_dict', side_effect=AssertionError):
+            self.assertEqual([c for c, _ in cnpjs_vencendo(agora)], [cnpj])
+
+    def test_renova_com_max_age_reduzido_e_marca(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from ..atualizacao import _marca_key, executar_atualizacao
+        cnpj = cnpj_de(14000010)
+        self._consultado(cnpj, timezone.now() - timedelta(days=36))
+        parametros = []
+        documento = {**documento_cnpja(cnpj), 'updated': timezone.now().isoformat()}
+
+        def get(url, headers=None, params=None, timeout=None):
+            parametros.append(params)
+            return RespostaFalsa(200, documento)
+
+        with mock.patch('requests.get', side_effect=get), mock.patch.object(services, 'agendar_reconciliacao_creditos'):
+            resumo = executar_atualizacao()
+            self.assertEqual((resumo['status'], resumo['candidatos'], resumo['atualizados']), ('ok', 1, 1))
+            self.assertEqual(parametros, [{'strategy': 'CACHE_IF_FRESH', 'maxAge': 35, 'maxStale': mock.ANY}])
+            self.assertEqual(services.obter_office_cache(cnpj), documento)
+            self.assertIsNotNone(cache.get(_marca_key(cnpj)))
+            # Já renovado: a próxima passada não chama a API
+            self.assertEqual(executar_atualizacao()['candidatos'], 0)
+        self.assertEqual(len(parametros), 1)
+
+    def test_nao_roda_fora_do_horario_nem_em_paralelo(self):
+        from ..atualizacao import REFRESH_LOCK_KEY, executar_atualizacao
+        with override_settings(CNPJ_REFRESH_HORARIO='0-0'):
+            self.assertEqual(executar_atualizacao()['status'], 'fora_do_horario')
+        cache.add(REFRESH_LOCK_KEY, 1, 60)
+        self.assertEqual(executar_atualizacao()['status'], 'ocupado')
+        with override_settings(CNPJ_REFRESH_FRACAO=0):
+            self.assertEqual(executar_atualizacao()['status'], 'desligado')
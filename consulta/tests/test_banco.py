@@ -0,0 +1,147 @@
+"""Pool de conexões do PostgreSQL."""
+
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from ..banco.pool import PoolConexoes, PoolEsgotado
+from .auxiliares import limpar_cache
+
+
+class _ConexaoFalsa:
+    def __init__(self, n):
+        self.n = n
+        self.fechada = False
+        self.valida = True
+
+
+class PoolConexoesTests(SimpleTestCase):
+    def _pool(self, **opcoes):
+        self.criadas = []
+
+        def criar():
+            conexao = _ConexaoFalsa(len(self.criadas))
+            self.criadas.append(conexao)
+            return conexao
+
+        def fechar(conexao):
+            conexao.fechada = True
+
+        self.criar = criar
+        opcoes.setdefault('espera', 0.05)
+        return PoolConexoes(validar=lambda c: c.valida, reiniciar=lambda c: True, fechar=fechar, **opcoes)
+
+    def test_obter_e_devolver_reaproveita_a_conexao(self):
+        pool = self._pool(maximo=2)
+        conexao = pool.obter(self.criar)
+        self.assertEqual(pool.metricas()['em_uso'], 1)
+        pool.devolver(conexao)
+        self.assertIs(pool.obter(self.criar), conexao)
+        metricas = pool.metricas()
+        self.assertEqual((metricas['criadas'], metricas['checkouts'], metricas['abertas']), (1, 2, 1))
+
+    def test_devolver_com_descartar_fecha_a_conexao(self):
+        pool = self._pool()
+        conexao = pool.obter(self.criar)
+        pool.devolver(conexao, descartar=True)
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(pool.metricas()['abertas'], 0)
+        self.assertEqual(pool.metricas()['descartadas'], 1)
+
+    def test_reiniciar_falho_descarta_na_devolucao(self):
+        pool = self._pool()
+        pool.reiniciar = lambda c: False
+        conexao = pool.obter(self.criar)
+        pool.devolver(conexao)
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(pool.metricas()['ociosas'], 0)
+
+    def test_health_check_troca_conexao_quebrada(self):
+        pool = self._pool(checar_apos=0)
+        quebrada = pool.obter(self.criar)
+        pool.devolver(quebrada)
+        quebrada.valida = False
+        nova = pool.obter(self.criar)
+        self.assertIsNot(nova, quebrada)
+        self.assertTrue(quebrada.fechada)
+        self.assertEqual(pool.metricas()['falhas_checagem'], 1)
+        self.assertEqual(pool.metricas()['abertas'], 1)
+
+    def test_conexao_ociosa_valida_passa_no_health_check(self):
+        pool = self._pool(checar_apos=0)
+        conexao = pool.obter(self.criar)
+        pool.devolver(conexao)
+        self.assertIs(pool.obter(self.criar), conexao)
+        self.assertEqual(pool.metricas()['falhas_checagem'], 0)
+
+    def test_reciclagem_por_vida_maxima(self):
+        pool = self._pool(vida_maxima=1e-9)
+        velha = pool.obter(self.criar)
+        pool.devolver(velha)
+        self.assertTrue(velha.fechada)
+        self.assertEqual(pool.metricas()['recicladas'], 1)
+
+    def test_esgotado_levanta_pool_esgotado(self):
+        pool = self._pool(maximo=1)
+        pool.obter(self.criar)
+        with self.assertRaises(PoolEsgotado):
+            pool.obter(self.criar)
+        metricas = pool.metricas()
+        self.assertEqual((metricas['esperas'], metricas['esgotamentos']), (1, 1))
+
+    def test_espera_recebe_conexao_devolvida_por_outra_thread(self):
+        pool = self._pool(maximo=1, espera=2)
+        conexao = pool.obter(self.criar)
+        threading.Timer(0.05, pool.devolver, args=(conexao,)).start()
+        self.assertIs(pool.obter(self.criar), conexao)
+        self.assertEqual(pool.metricas()['esperas'], 1)
+
+    def test_recupera_conexao_de_thread_encerrada(self):
+        pool = self._pool(maximo=1)
+        orfas = []
+        thread = threading.Thread(target=lambda: orfas.append(pool.obter(self.criar)))
+        thread.start()
+        thread.join()
+        nova = pool.obter(self.criar)
+        self.assertIsNot(nova, orfas[0])
+        self.assertTrue(orfas[0].fechada)
+        self.assertEqual(pool.metricas()['recuperadas'], 1)
+
+
+class PoolRegistroTests(TestCase):
+    """Pools por processo (`pool_para`) e as métricas em `/api/banco/` (staff)."""
+
+    def setUp(self):
+        from ..banco import pool
+        limpar_cache()
+        registro = mock.patch.dict(pool._pools, clear=True)
+        registro.start()
+        self.addCleanup(registro.stop)
+
+    def _opcoes(self, nome='default'):
+        return {'nome': nome, 'validar': lambda c: True, 'reiniciar': lambda c: True, 'fechar': lambda c: None}
+
+    def test_um_pool_por_chave_e_recriado_apos_fork(self):
+        from ..banco.pool import pool_para, pools
+        chave = ('default', 'app', 'db', 5432, 'app')
+        pool = pool_para(chave, **self._opcoes())
+        self.assertIs(pool_para(chave, **self._opcoes()), pool)
+        self.assertIsNot(pool_para(('replica',), **self._opcoes('replica')), pool)
+        self.assertEqual(set(pools()), {'default', 'replica'})
+        # Herdado de outro processo (fork): não vale para este
+        pool.pid -= 1
+        self.assertEqual(set(pools()), {'replica'})
+        self.assertIsNot(pool_para(chave, **self._opcoes()), pool)
+
+    def test_api_banco_so_staff(self):
+        from django.contrib.auth.models import User
+        from ..banco.pool import pool_para
+        pool = pool_para(('default',), maximo=3, **self._opcoes())
+        pool.devolver(pool.obter(object))
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+        self.assertEqual(self.client.get('/api/banco/', secure=True).status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', password='segredo-123', is_staff=True))
+        dados = self.client.get('/api/banco/', secure=True).json()
+        self.assertEqual(dados['engine'], 'django.db.backends.sqlite3')
+        self.assertEqual((dados['pools']['default']['criadas'], dados['pools']['default']['abertas']), (1, 1))
@@ -0,0 +1,52 @@
+"""Teste de carga (bench_carga)."""
+
+from django.test import SimpleTestCase
+
+from .. import services
+
+
+class BenchCargaTests(SimpleTestCase):
+    """Partes puras do teste de carga (`bench_carga`): CSV, relatório e comparação."""
+
+    def test_csv_de_carga_com_cnpjs_distintos_e_validos(self):
+        import csv
+        import io
+        from ..management.commands.bench_carga import _csv_carga
+        linhas = list(csv.DictReader(io.StringIO(_csv_carga(999_998, 4).decode())))
+        self.assertEqual([l['processo'] for l in linhas], ['999998', '999999', '1000000', '1000001'])
+        cnpjs = [services.clean_cnpj(l['cnpj']) for l in linhas]
+        self.assertEqual(len(set(cnpjs)), 4)
+        self.assertTrue(all(services.cnpj_valido(c) for c in cnpjs))
+        # Usuários seguidos (índices contíguos) não repetem CNPJs
+        primeiro = {l['cnpj'] for l in csv.DictReader(io.StringIO(_csv_carga(0, 4).decode()))}
+        segundo = {l['cnpj'] for l in csv.DictReader(io.StringIO(_csv_carga(4, 4).decode()))}
+        self.assertFalse(primeiro & segundo)
+
+    def test_resumo_por_endpoint_na_ordem_e_total(self):
+        from ..management.commands.bench_carga import _Medidas
+        medidas = _Medidas()
+        for i in range(1, 101):
+            medidas.registrar('POST /jobs/step/', i / 1000, ok=i != 100)
+        medidas.registrar('GET /login/', 0.5, ok=True)
+        linhas = medidas.resumo(duracao=10)
+        self.assertEqual([l['endpoint'] for l in linhas], ['GET /login/', 'POST /jobs/step/', 'total'])
+        passo = linhas[1]
+        self.assertEqual((passo['requisicoes'], passo['req_s'], passo['erros'], passo['taxa_erros']), (100, 10.0, 1, 0.01))
+        self.assertEqual(passo['max_ms'], 100.0)
+        self.assertLessEqual(passo['p50_ms'], passo['p95_ms'])
+        self.assertLessEqual(passo['p95_ms'], passo['p99_ms'])
+        self.assertEqual((linhas[2]['requisicoes'], linhas[2]['erros'], linhas[2]['max_ms']), (101, 1, 500.0))
+        self.assertEqual(_Medidas().resumo(10), [])
+
+    def test_comparacao_com_linha_de_base(self):
+        from io import StringIO
+        from ..management.commands.bench_carga import Command
+        linha = {'workers': 1, 'views': 'async', 'usuarios': 5, 'endpoint': 'total', 'req_s': 10.0, 'p95_ms': 200.0, 'erros': 0}
+        base = {'gerado_em': 'ontem', 'parametros': {'duracao': 60}, 'ambiente': {'python': '3.11'}, 'resultados': [linha]}
+        atual = {'parametros': {'duracao': 30}, 'ambiente': {'python': '3.11'},
+                 'resultados': [{**linha, 'req_s': 12.0, 'p95_ms': 150.0, 'erros': 2}]}
+        saida = StringIO()
+        Command(stdout=saida)._comparar(base, atual)
+        saida = saida.getvalue()
+        self.assertIn('Parâmetros ou ambiente diferentes (duracao)', saida)
+        self.assertRegex(saida, r'w=1 async 5u\s+total\s+\+20%\s+-25%\s+0 -> 2')
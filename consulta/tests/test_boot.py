@@ -0,0 +1,65 @@
+"""Preparação do boot."""
+
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+
+class PreparoBootTests(TestCase):
+    """`preparar_boot`: migrate/collectstatic só quando há algo a aplicar."""
+
+    def setUp(self):
+        import os
+        import tempfile
+        from django.core.files.storage import FileSystemStorage
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.origem = os.path.join(self._tmp.name, 'origem')
+        self.raiz = os.path.join(self._tmp.name, 'staticfiles')
+        for base in (self.origem, self.raiz):
+            os.makedirs(os.path.join(base, 'js'))
+        for nome, conteudo in (('app.css', 'body{}'), ('js/home.js', 'var a;')):
+            for base in (self.origem, self.raiz):
+                with open(os.path.join(base, nome), 'w') as arq:
+                    arq.write(conteudo)
+        agora = time.time()
+        for nome in ('app.css', 'js/home.js'):
+            os.utime(os.path.join(self.origem, nome), (agora - 60, agora - 60))
+        storage = FileSystemStorage(location=self.origem)
+        finder = mock.Mock(list=lambda ignorar: [('app.css', storage), ('js/home.js', storage), ('app.css', storage)])
+        for alvo, valor in (('get_finders', lambda: [finder]), ('staticfiles_storage', mock.Mock(manifest_name=None))):
+            patcher = mock.patch(f'consulta.management.commands.preparar_boot.{alvo}', valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _desatualizados(self):
+        from ..management.commands.preparar_boot import estaticos_desatualizados
+        with override_settings(STATIC_ROOT=self.raiz):
+            return estaticos_desatualizados()
+
+    def test_estaticos_em_dia_novos_ou_faltando(self):
+        import os
+        self.assertEqual(self._desatualizados(), [])
+        os.utime(os.path.join(self.origem, 'app.css'))
+        self.assertEqual(self._desatualizados(), ['app.css'])
+        os.remove(os.path.join(self.raiz, 'js/home.js'))
+        self.assertEqual(self._desatualizados(), ['app.css', 'js/home.js'])
+
+    def test_manifesto_faltando(self):
+        from ..management.commands import preparar_boot
+        preparar_boot.staticfiles_storage.manifest_name = 'staticfiles.json'
+        self.assertEqual(self._desatualizados(), ['staticfiles.json'])
+
+    def test_boot_sem_mudancas_nao_roda_comandos(self):
+        from io import StringIO
+        from django.core.management import call_command
+        saida = StringIO()
+        with override_settings(STATIC_ROOT=self.raiz), \
+                mock.patch('consulta.management.commands.preparar_boot.call_command') as comando:
+            call_command('preparar_boot', stdout=saida)
+            comando.assert_not_called()
+            self.assertIn('[BOOT] Migrações em dia', saida.getvalue())
+            self.assertIn('[BOOT] Estáticos em dia', saida.getvalue())
+            call_command('preparar_boot', forcar=True, stdout=StringIO())
+        self.assertEqual([c.args[0] for c in comando.call_args_list], ['migrate', 'collectstatic'])
@@ -0,0 +1,96 @@
+"""Pool de chaves da API do CNPJÁ."""
+
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from clients.cnpja import id_chave
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa
+
+
+@override_settings(CNPJA_API_KEYS=['chave-a', 'chave-b'], CNPJA_CHAVE_PAUSA_401=900, CNPJA_CHAVE_PAUSA_429=60)
+class ChavesTests(TestCase):
+    """Pool de chaves: pausa por 401/429, orçamento por chave e reserva da menos usada."""
+
+    def setUp(self):
+        limpar_cache()
+        self.a, self.b = id_chave('chave-a'), id_chave('chave-b')
+
+    def test_cliente_por_id(self):
+        from ..chaves import chaves, cliente
+        self.assertEqual(list(chaves()), [self.a, self.b])
+        self.assertEqual(cliente(self.b).chave_id, self.b)
+        self.assertIn(cliente().chave_id, (self.a, self.b))
+        self.assertNotIn('chave-a', self.a)
+
+    def test_pausa_por_401_e_429(self):
+        from clients.cnpja import CNPJAClientError
+        from ..chaves import disponiveis, em_rotacao, fora_de_rotacao, pausar_se_bloqueada
+        self.assertFalse(pausar_se_bloqueada(self.a, CNPJAClientError('Erro 500', status=500)))
+        self.assertEqual(services.limite_janela(10), 20)
+        agora = time.time()
+        with self.assertLogs('consulta.ratelimit', 'WARNING'):
+            self.assertTrue(pausar_se_bloqueada(self.a, CNPJAClientError('Erro 401', status=401)))
+        self.assertEqual(disponiveis(), [self.b])
+        self.assertEqual(services.limite_janela(10), 10)
+        self.assertAlmostEqual(fora_de_rotacao()[self.a]['ate'], agora + 900, delta=5)
+        # O `ttl` do 429 manda quando é maior que a pausa padrão
+        with self.assertLogs('consulta.ratelimit', 'WARNING'):
+            self.assertTrue(pausar_se_bloqueada(self.b, CNPJAClientError('Erro 429: {"ttl": 120}', status=429)))
+        self.assertEqual(fora_de_rotacao()[self.b]['motivo'], 'HTTP 429')
+        self.assertAlmostEqual(fora_de_rotacao()[self.b]['ate'], agora + 121, delta=5)
+        # Todas pausadas: segue com todas (o erro volta ao chamador)
+        self.assertEqual(disponiveis(), [])
+        self.assertEqual(em_rotacao(), [self.a, self.b])
+
+    def test_reserva_distribui_e_respeita_o_limite_por_chave(self):
+        janela = int(time.time() // 3600)
+        reservas = [services._reservar_chave(janela, 60, limit=2) for _ in range(5)]
+        self.assertEqual(sorted(reservas[:4]), sorted([self.a, self.a, self.b, self.b]))
+        self.assertNotEqual(reservas[0], reservas[1])
+        self.assertIsNone(reservas[4])
+        uso = {u['id']: (u['usados_janela'], u['em_rotacao']) for u in services.uso_chaves(window_seconds=3600)}
+        self.assertEqual(uso, {self.a: (2, True), self.b: (2, True)})
+
+    def test_chave_sem_saldo_fica_por_ultimo(self):
+        cache.set(services._chave_creditos(services.CREDITOS_CACHE_KEY, self.a), {'transient': 0, 'perpetual': 0}, None)
+        cache.set(services._chave_creditos(services.CREDITOS_CACHE_KEY, self.b), {'transient': 5, 'perpetual': 0}, None)
+        self.assertEqual([services._reservar_chave(1, 60, limit=2) for _ in range(3)], [self.b, self.b, self.a])
+
+    def test_consulta_com_401_tira_a_chave_e_tenta_com_outra(self):
+        from ..chaves import fora_de_rotacao
+        cnpj = cnpj_de(18000001)
+        usadas = []
+
+        def get(url, headers=None, params=None, timeout=None):
+            usadas.append(headers['Authorization'])
+            if headers['Authorization'] == 'chave-a':
+                return RespostaFalsa(401, {'message': 'unauthorized'})
+            return RespostaFalsa(200, documento_cnpja(cnpj))
+
+        primeira = mock.patch.object(services, '_reservar_chave', side_effect=lambda *a, **k: services.em_rotacao()[0])
+        with primeira, mock.patch('requests.get', side_effect=get), self.assertLogs('consulta', 'WARNING'):
+            resultado = services.consultar_cnpj_api(cnpj, cache_first=False, base_local=False, retry_wait=0)
+        self.assertIsNotNone(resultado['detalhes'])
+        self.assertEqual(usadas, ['chave-a', 'chave-b'])
+        self.assertEqual(list(fora_de_rotacao()), [self.a])
+
+    def test_falha_do_cache_devolve_o_slot_e_nao_segue_calada(self):
+        janela = int(time.time() // services.RATE_LIMIT_WINDOW)
+        reservas = [RuntimeError('cache fora'), self.b]
+        with mock.patch.object(services, '_reservar_chave', side_effect=reservas), \
+                mock.patch.object(services, 'RATE_LIMIT_ESPERA_COTA', 0), self.assertLogs('consulta.ratelimit', 'WARNING'):
+            self.assertEqual(services.reservar_slot_api(), self.b)
+        # Um slot só: o da tentativa que falhou foi devolvido
+        self.assertEqual(cache.get(f'rl:cnpja_api:{janela}'), 1)
+
+        limpar_cache()
+        with mock.patch.object(services, '_reservar_chave', side_effect=RuntimeError('cache fora')), \
+                mock.patch.object(services, 'RATE_LIMIT_ESPERA_COTA', 0), self.assertLogs('consulta.ratelimit', 'WARNING') as logs:
+            self.assertIsNone(services.reservar_slot_api())
+        self.assertEqual([r.levelname for r in logs.records], ['WARNING'] * (services.RATE_LIMIT_FALHAS_CACHE - 1) + ['ERROR'])
+        self.assertEqual(cache.get(f'rl:cnpja_api:{janela}'), 0)
@@ -0,0 +1,64 @@
+"""Checkpoints de jobs e retomada por id."""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, cnpja_falso, iniciar_job
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], JOB_CHECKPOINT_EVERY=2, CNPJA_FORCE_CACHE_FIRST=False)
+class JobCheckpointTests(TestCase):
+    """Jobs gravam checkpoint a cada N itens e são retomados por id depois de perder a sessão."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.user = User.objects.create_user('op', password='segredo-123')
+        self.client.force_login(self.user)
+        self.cnpjs = [cnpj_de(40404040), cnpj_de(50505050), cnpj_de(60606060)]
+        self.get = cnpja_falso({c: documento_cnpja(c, nome=f'Empresa {c[:2]}') for c in self.cnpjs})
+
+    def _passo(self, client=None):
+        with mock.patch('requests.get', side_effect=self.get), mock.patch('consulta.views_async.DELAY_SECONDS', 0):
+            return (client or self.client).post('/jobs/step/', secure=True).json()
+
+    def test_retomar_depois_de_perder_a_sessao(self):
+        from django.test import Client
+        from ..models import ConsultaHistorico, ConsultaJob, ConsultaResultado
+        job_id = iniciar_job(self.client, self.cnpjs)['job_id']
+        registro = ConsultaJob.objects.get(pk=job_id)
+        self.assertEqual((registro.status, registro.total, registro.historico.status), ('running', 3, 'andamento'))
+        self._passo()
+        self.assertEqual(ConsultaJob.objects.get(pk=job_id).processados, 0)
+        self._passo()
+        self.assertEqual(ConsultaJob.objects.get(pk=job_id).processados, 2)
+        self.assertEqual(ConsultaResultado.objects.filter(historico=registro.historico).count(), 2)
+
+        # Outro navegador (sessão nova) do mesmo usuário
+        outro = Client()
+        outro.force_login(self.user)
+        pendentes = outro.get('/jobs/pending/', secure=True).json()['jobs']
+        self.assertEqual([(j['id'], j['processed'], j['total'], j['current']) for j in pendentes], [(job_id, 2, 3, False)])
+        restaurado = outro.post(f'/jobs/restore/{job_id}/', secure=True).json()
+        self.assertEqual((restaurado['processed'], restaurado['total']), (2, 3))
+        self.assertEqual([r['nome'] for r in restaurado['results']], ['Empresa 40', 'Empresa 50'])
+        passo = self._passo(outro)
+        self.assertEqual((passo['processed'], passo['item']['nome']), (3, 'Empresa 60'))
+        self.assertEqual(self._passo(outro)['status'], 'done')
+        self.assertEqual(outro.post('/jobs/finalize/', secure=True).json(), {'status': 'ok'})
+
+        registro.refresh_from_db()
+        self.assertEqual((registro.status, registro.processados, registro.estado), ('done', 3, {}))
+        historico = ConsultaHistorico.objects.get(pk=registro.historico_id)
+        self.assertEqual(historico.status, 'concluido')
+        self.assertEqual([r['nome'] for r in historico.resultados()], ['Empresa 40', 'Empresa 50', 'Empresa 60'])
+        self.assertEqual(outro.get('/jobs/pending/', secure=True).json(), {'jobs': []})
+
+    def test_restaurar_job_de_outro_usuario(self):
+        from django.contrib.auth.models import User
+        from django.test import Client
+        job_id = iniciar_job(self.client, self.cnpjs)['job_id']
+        intruso = Client()
+        intruso.force_login(User.objects.create_user('outro', password='segredo-123'))
+        self.assertEqual(intruso.post(f'/jobs/restore/{job_id}/', secure=True).status_code, 404)
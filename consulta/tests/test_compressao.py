@@ -0,0 +1,58 @@
+"""JSON comprimido."""
+
+from django.test import TestCase
+
+
+class CompressaoTests(TestCase):
+    """`JSONComprimidoField`: zlib com dicionário versionado, leitura do formato antigo."""
+
+    DOC = {
+        'taxId': '12345678000195', 'updated': '2026-01-01T00:00:00.000Z', 'head': True,
+        'status': {'id': 2, 'text': 'Ativa'}, 'mainActivity': {'id': 4711302, 'text': 'Comércio varejista de mercadorias'},
+        'company': {'name': 'Mercado São João LTDA', 'nature': {'id': 2062, 'text': 'Sociedade Empresária Limitada'}},
+        'emails': [{'ownership': 'CORPORATE', 'address': 'contato@mercado.com.br', 'domain': 'mercado.com.br'}],
+    }
+
+    def test_ida_e_volta_e_versoes(self):
+        import zlib
+        from ..compressao import VERSAO_ATUAL, comprimir, descomprimir
+        com_dicionario = comprimir(self.DOC)
+        sem_dicionario = comprimir(self.DOC, versao=0)
+        self.assertEqual((com_dicionario[0], sem_dicionario[0]), (VERSAO_ATUAL, 0))
+        self.assertEqual(descomprimir(com_dicionario), self.DOC)
+        self.assertEqual(descomprimir(sem_dicionario), self.DOC)
+        self.assertLess(len(com_dicionario), len(sem_dicionario))
+        # Formato anterior: zlib puro, sem byte de versão
+        self.assertEqual(descomprimir(zlib.compress(b'{"a":[1,2]}')), {'a': [1, 2]})
+        self.assertIsNone(descomprimir(b''))
+        with self.assertRaises(ValueError):
+            descomprimir(bytes([99]) + com_dicionario[1:])
+
+    def test_campo_no_modelo(self):
+        from django.core.exceptions import ValidationError
+        from django.db import connection
+        from ..models import ConsultaHistorico, ConsultaResultado
+        h = ConsultaHistorico.objects.create(tipo='manual')
+        item = ConsultaResultado.objects.create(historico=h, ordem=0, cnpj=self.DOC['taxId'], detalhes=self.DOC)
+        vazio = ConsultaResultado.objects.create(historico=h, ordem=1, cnpj=self.DOC['taxId'])
+        self.assertEqual(ConsultaResultado.objects.get(pk=item.pk).detalhes, self.DOC)
+        self.assertEqual(list(h.itens.order_by('ordem').values_list('detalhes', flat=True)), [self.DOC, None])
+        ConsultaResultado.objects.filter(pk=vazio.pk).update(detalhes={'taxId': 'x'})
+        self.assertEqual(ConsultaResultado.objects.get(pk=vazio.pk).detalhes, {'taxId': 'x'})
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT detalhes FROM {ConsultaResultado._meta.db_table} WHERE id = %s', [item.pk])
+            bruto = bytes(cursor.fetchone()[0])
+        self.assertEqual(bruto[0], 1)
+        self.assertNotIn(b'Ativa', bruto)
+        campo = ConsultaResultado._meta.get_field('detalhes')
+        with self.assertRaises(ValidationError):
+            campo.to_python(b'\x01lixo')
+
+    def test_treinar_dicionario(self):
+        from ..compressao import comprimir, treinar_dicionario
+        amostras = [{**self.DOC, 'taxId': f'{i:014d}'} for i in range(5)]
+        dicionario = treinar_dicionario(amostras, tamanho=512)
+        self.assertLessEqual(len(dicionario), 512)
+        self.assertIn('"nature":{'.encode(), dicionario)
+        self.assertNotIn(b'00000000000003', dicionario)
+        self.assertLess(len(comprimir(amostras[0], versao=9, dicionario=dicionario)), len(comprimir(amostras[0], versao=0)))
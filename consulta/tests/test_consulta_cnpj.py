@@ -0,0 +1,69 @@
+"""/cnpj/<cnpj>/: cache compartilhado, single-flight e ETag."""
+
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa, cnpja_falso
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class ConsultaCNPJCacheTests(TestCase):
+    """`/cnpj/<cnpj>/`: cache compartilhado, single-flight e ETag."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.cnpj = cnpj_de(70707070)
+        self.chamadas = []
+        self.get = cnpja_falso({self.cnpj: documento_cnpja(self.cnpj, nome='ACME')}, chamadas=self.chamadas)
+        self.user = User.objects.create_user('api', password='segredo-123')
+
+    def test_single_flight_entre_threads(self):
+        import time
+        liberar = threading.Event()
+
+        def get_lento(*args, **kwargs):
+            liberar.wait(5)
+            return self.get(*args, **kwargs)
+
+        resultados = []
+        with mock.patch('requests.get', side_effect=get_lento):
+            threads = [threading.Thread(target=lambda: resultados.append(services.obter_office(self.cnpj))) for _ in range(4)]
+            for t in threads:
+                t.start()
+            time.sleep(0.2)
+            liberar.set()
+            for t in threads:
+                t.join(10)
+        self.assertEqual([r['company']['name'] for r in resultados], ['ACME'] * 4)
+        self.assertEqual(len(self.chamadas), 1)
+        # Depois, o cache compartilhado responde sem rede
+        with mock.patch('requests.get', side_effect=AssertionError('chamou a API')):
+            self.assertEqual(services.obter_office(self.cnpj)['company']['name'], 'ACME')
+
+    def test_erro_da_api_e_propagado_e_nao_fica_em_cache(self):
+        from clients.cnpja import CNPJAClientError
+        with mock.patch('requests.get', return_value=RespostaFalsa(400, {'message': 'inválido'})):
+            with self.assertRaises(CNPJAClientError):
+                services.obter_office(self.cnpj)
+        self.assertIsNone(services.obter_office_cache(self.cnpj))
+
+    def test_etag_e_304(self):
+        self.client.force_login(self.user)
+        with mock.patch('requests.get', side_effect=self.get):
+            resposta = self.client.get(f'/cnpj/{self.cnpj}/', secure=True)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertTrue(resposta['Cache-Control'].startswith('private, max-age='))
+            etag = resposta['ETag']
+            repetida = self.client.get(f'/cnpj/{self.cnpj}/', secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida['ETag'], etag)
+        self.assertEqual(len(self.chamadas), 1)
+
+    def test_cnpj_invalido(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/cnpj/123/', secure=True).status_code, 400)
@@ -0,0 +1,63 @@
+"""Rastreamento de créditos por consulta e reconciliação com /credit."""
+
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from clients.cnpja import id_chave
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa, cnpja_falso
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class CreditosTests(SimpleTestCase):
+    """Saldo rastreado por consulta: snapshot de /credit menos o consumo desde a reconciliação."""
+
+    def setUp(self):
+        limpar_cache()
+        self.chave = id_chave('chave-teste')
+        cache.set(f'{services.CREDITOS_CACHE_KEY}:{self.chave}', {'transient': 5, 'perpetual': 10}, None)
+
+    def test_custo_por_estrategia(self):
+        self.assertEqual(services.custo_consulta('CACHE'), 0)
+        self.assertEqual(services.custo_consulta('CACHE_IF_FRESH'), services.CREDITOS_POR_CONSULTA)
+
+    @override_settings(CNPJA_CREDIT_COST_HEADER='X-Credit-Cost')
+    def test_custo_informado_no_cabecalho(self):
+        self.assertEqual(services.custo_consulta('ONLINE', {'x-credit-cost': '3'}), 3)
+        self.assertEqual(services.custo_consulta('CACHE', {'X-Credit-Cost': '0'}), 0)
+        self.assertEqual(services.custo_consulta('ONLINE', {'X-Credit-Cost': 'n/a'}), services.CREDITOS_POR_CONSULTA)
+
+    def test_consumo_abate_transient_e_depois_perpetual(self):
+        services.registrar_consumo_creditos(7, self.chave)
+        self.assertEqual(services.creditos_atuais(), {'transient': 0, 'perpetual': 8, 'consumedSinceSync': 7})
+        self.assertEqual(services.saldo_creditos(services.creditos_atuais()), 8.0)
+
+    def test_consulta_online_registra_o_consumo(self):
+        cnpj = cnpj_de(30303030)
+        with mock.patch('requests.get', side_effect=cnpja_falso({cnpj: documento_cnpja(cnpj)})):
+            services.consultar_cnpj_api(cnpj, cache_first=True)
+        self.assertEqual(services.creditos_atuais()['consumedSinceSync'], services.CREDITOS_POR_CONSULTA)
+
+    def test_reconciliar_substitui_o_snapshot_e_zera_o_consumo(self):
+        services.registrar_consumo_creditos(4, self.chave)
+        resposta = RespostaFalsa(200, {'transient': 100, 'perpetual': 1})
+        with mock.patch('requests.get', return_value=resposta):
+            self.assertEqual(services.reconciliar_creditos(), {'transient': 100, 'perpetual': 1})
+        self.assertFalse(cache.get(f'{services.CREDITOS_CONSUMO_KEY}:{self.chave}'))
+
+    def test_agendamento_respeita_intervalo_e_trava(self):
+        with mock.patch('consulta.services.reconciliar_creditos') as reconciliar:
+            self.assertFalse(services.agendar_reconciliacao_creditos())
+            cache.add(services.CREDITOS_LOCK_KEY, 1, 60)
+            self.assertFalse(services.agendar_reconciliacao_creditos(forcar=True))
+            cache.delete(services.CREDITOS_LOCK_KEY)
+            self.assertTrue(services.agendar_reconciliacao_creditos(forcar=True))
+            for thread in threading.enumerate():
+                if thread.name == 'cnpja-creditos':
+                    thread.join(5)
+        reconciliar.assert_called_once_with()
+        self.assertIsNone(cache.get(services.CREDITOS_LOCK_KEY))
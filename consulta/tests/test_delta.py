@@ -0,0 +1,88 @@
+"""Exportação incremental do histórico."""
+
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import services
+from .auxiliares import cnpj_de, limpar_cache, corpo_streaming
+
+
+class ExportacaoDeltaTests(TestCase):
+    """`/export/historico/delta/`: cursor (micros_pk), atraso de confirmação e filtros."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+
+    def _execucao(self, segundos, itens, status='concluido'):
+        from datetime import timedelta
+        from django.utils import timezone
+        from ..models import ConsultaHistorico, ConsultaResultado
+        h = ConsultaHistorico.objects.create(tipo='manual', status=status)
+        ConsultaHistorico.objects.filter(pk=h.pk).update(data=timezone.now() - timedelta(seconds=segundos))
+        for ordem, (raiz, uf) in enumerate(itens):
+            cnpj = cnpj_de(raiz)
+            ConsultaResultado.de_dict(h.pk, ordem, {'cnpj': services.format_cnpj(cnpj), 'nome': f'Empresa {raiz}',
+                                                   'detalhes': {'taxId': cnpj, 'address': {'state': uf}}}).save()
+        return h
+
+    def _delta(self, **params):
+        import json
+        resposta = self.client.get('/export/historico/delta/', params, secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        corpo = corpo_streaming(resposta)
+        if params.get('format') == 'csv':
+            return resposta, corpo.decode('utf-8').splitlines()
+        return resposta, [json.loads(linha) for linha in corpo.decode('utf-8').splitlines()]
+
+    def test_pagina_pelo_cursor_e_segura_as_recentes(self):
+        from datetime import timedelta
+        primeira = self._execucao(300, [(15000001, 'SP'), (15000002, 'MG')])
+        segunda = self._execucao(200, [(15000003, 'SP')])
+        self._execucao(250, [(15000004, 'SP')], status='andamento')
+        recente = self._execucao(5, [(15000005, 'SP')])
+
+        resposta, itens = self._delta(limit=1)
+        self.assertEqual([(i['historico_id'], i['ordem']) for i in itens], [(primeira.pk, 0), (primeira.pk, 1)])
+        self.assertEqual(resposta['X-Has-More'], '1')
+        micros, _, pk = resposta['X-Next-Cursor'].partition('_')
+        self.assertTrue(micros.isdigit())
+        self.assertEqual(int(pk), primeira.pk)
+
+        resposta, itens = self._delta(since=resposta['X-Next-Cursor'], limit=1)
+        self.assertEqual([i['historico_id'] for i in itens], [segunda.pk])
+        cursor = resposta['X-Next-Cursor']
+        # A execução concluída há 5 s ainda está dentro do atraso de confirmação
+        resposta, itens = self._delta(since=cursor)
+        self.assertEqual((itens, resposta['X-Has-More'], resposta['X-Next-Cursor']), ([], '0', cursor))
+
+        with mock.patch('consulta.views._DELTA_ATRASO', timedelta(0)):
+            _, itens = self._delta(since=cursor)
+        self.assertEqual([i['historico_id'] for i in itens], [recente.pk])
+
+    def test_filtros_e_csv(self):
+        self._execucao(300, [(15000011, 'SP'), (15000012, 'MG')])
+        _, itens = self._delta(uf='mg')
+        self.assertEqual([i['cnpj'] for i in itens], [services.format_cnpj(cnpj_de(15000012))])
+        self.assertNotIn('detalhes', itens[0])
+        _, itens = self._delta(uf='mg', detalhes='1')
+        self.assertEqual(itens[0]['detalhes']['address']['state'], 'MG')
+        _, linhas = self._delta(format='csv')
+        self.assertTrue(linhas[0].startswith('historico_id,data,tipo,arquivo_nome,ordem,processo,cnpj'))
+        self.assertEqual(len(linhas), 3)
+
+    def test_historico_compactado_sai_com_detalhes(self):
+        from ..retencao import compactar_detalhes
+        antiga = self._execucao(300, [(15000021, 'SP')])
+        self._execucao(200, [(15000021, 'SP')])
+        self.assertEqual(compactar_detalhes(), 1)
+        _, itens = self._delta(detalhes='1')
+        self.assertEqual([(i['historico_id'], i['detalhes']['taxId']) for i in itens][0], (antiga.pk, cnpj_de(15000021)))
+        self.assertEqual(len(itens), 2)
+
+    def test_parametros_invalidos(self):
+        for params in ({'format': 'xml'}, {'since': 'ontem'}, {'limit': 'x'}, {'cnae': 'abc'}):
+            resposta = self.client.get('/export/historico/delta/', params, secure=True)
+            self.assertEqual(resposta.status_code, 400, params)
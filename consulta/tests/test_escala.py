@@ -0,0 +1,113 @@
+"""Vários workers: checagens de configuração e trava do job."""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .auxiliares import cnpj_de, limpar_cache
+
+
+class EscalaTests(SimpleTestCase):
+    """Vários workers: configuração compartilhada obrigatória e trava do job no cache."""
+
+    @override_settings(SCALE_OUT=True, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                       SESSION_ENGINE='django.contrib.sessions.backends.file')
+    def test_recusa_estado_local_com_scale_out(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from ..checks import problemas_escala, recusar_configuracao_insegura
+        problemas = problemas_escala()
+        self.assertEqual(len(problemas), 3)
+        self.assertIn('REDIS_URL', problemas[0])
+        with self.assertRaises(ImproperlyConfigured):
+            recusar_configuracao_insegura()
+
+    @override_settings(SCALE_OUT=True, CACHES={'default': {'BACKEND': 'django_redis.cache.RedisCache'}},
+                       SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_aceita_estado_compartilhado(self):
+        from django.conf import settings
+        from ..checks import problemas_escala
+        with mock.patch.dict(settings.DATABASES['default'], ENGINE='django.db.backends.postgresql'):
+            self.assertEqual(problemas_escala(), [])
+
+    @override_settings(SCALE_OUT=False)
+    def test_um_worker_nao_exige_nada(self):
+        from ..checks import problemas_escala
+        self.assertEqual(problemas_escala(), [])
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+class TravaJobTests(SimpleTestCase):
+    def setUp(self):
+        from importlib import import_module
+        from django.conf import settings
+        from django.test import RequestFactory
+        limpar_cache()
+        self.engine = import_module(settings.SESSION_ENGINE)
+        sessao = self.engine.SessionStore()
+        sessao['job'] = {'processed': 1, 'total': 2}
+        sessao.save()
+        self.chave_sessao = sessao.session_key
+        self.request = RequestFactory().post('/jobs/step/')
+        self.request.session = self.engine.SessionStore(self.chave_sessao)
+
+    def test_trava_exclusiva_e_sessao_relida(self):
+        from ..views import _liberar_job, _travar_job
+        # Outro worker gravou a sessão depois que esta requisição a leu
+        self.request.session['job']
+        outra = self.engine.SessionStore(self.chave_sessao)
+        outra['job'] = {'processed': 2, 'total': 2}
+        outra.save()
+        trava = _travar_job(self.request)
+        self.assertIsNotNone(trava)
+        self.assertEqual(self.request.session['job']['processed'], 2)
+        self.assertIsNone(_travar_job(self.request))
+        self.request.session['job'] = {'processed': 3, 'total': 3}
+        _liberar_job(self.request, trava)
+        # Gravada antes de liberar a trava
+        self.assertEqual(self.engine.SessionStore(self.chave_sessao)['job']['processed'], 3)
+        self.assertIsNotNone(_travar_job(self.request))
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class JobTravaTests(TestCase):
+    """Controles do job (pausar, retomar, cancelar, concluir, restaurar) respeitam a trava do passo."""
+
+    def setUp(self):
+        import json
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.user = User.objects.create_user('op', password='segredo-123')
+        self.client.force_login(self.user)
+        resposta = self.client.post('/jobs/start/', data=json.dumps({'cnpjs': f'{cnpj_de(44444444)},{cnpj_de(55555555)}'}),
+                                    content_type='application/json', secure=True)
+        self.job_id = resposta.json()['job_id']
+        self.trava = f'job:trava:{self.client.session.session_key}'
+
+    def _post(self, url):
+        return self.client.post(url, secure=True)
+
+    def test_ocupado_responde_409_sem_mudar_o_job(self):
+        cache.add(self.trava, 1)
+        for url in ('/jobs/pause/', '/jobs/resume/', '/jobs/cancel/', '/jobs/finalize/', f'/jobs/restore/{self.job_id}/'):
+            with self.subTest(url=url):
+                resposta = self._post(url)
+                self.assertEqual(resposta.status_code, 409)
+                self.assertEqual(resposta.json()['status'], 'busy')
+        self.assertEqual(self.client.session['job']['status'], 'running')
+        self.assertEqual(self.client.session['job']['total'], 2)
+
+    def test_controles_liberam_a_trava(self):
+        self.assertEqual(self._post('/jobs/pause/').json(), {'status': 'paused'})
+        self.assertEqual(self.client.session['job']['status'], 'paused')
+        self.assertIsNone(cache.get(self.trava))
+        self.assertEqual(self._post('/jobs/resume/').json(), {'status': 'running'})
+        self.assertEqual(self._post(f'/jobs/restore/{self.job_id}/').status_code, 200)
+        self.assertEqual(self._post('/jobs/cancel/').json(), {'status': 'cancelled'})
+        self.assertIsNone(cache.get(self.trava))
+
+    def test_passo_ocupado_responde_busy(self):
+        cache.add(self.trava, 1)
+        resposta = self._post('/jobs/step/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['status'], 'busy')
@@ -0,0 +1,88 @@
+"""Colunas extraídas do JSON do CNPJÁ."""
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+
+class ConsultaResultadoDeDictTests(SimpleTestCase):
+    def test_corta_textos_no_max_length_da_coluna(self):
+        from ..models import ConsultaResultado
+        r = {
+            'cnpj': '12.345.678/0001-95', 'nome': 'N' * 300, 'email': 'E' * 400, 'processo': 12345 * 10 ** 100,
+            'dsevento': 'D' * 500, 'situacao': 'S' * 80, 'municipio': 'M' * 150, 'atividade_principal': 'A' * 400,
+            'uf': 'SPX', 'cnae_principal': 4711302, 'situacao_data': '2020-01-01', 'telefones': 'T' * 300,
+        }
+        item = ConsultaResultado.de_dict(1, 0, r)
+        for campo, tamanho in (('nome', 255), ('processo', 100), ('situacao', 50), ('municipio', 100),
+                               ('atividade_principal', 255), ('uf', 2)):
+            with self.subTest(campo=campo):
+                self.assertEqual(len(getattr(item, campo)), tamanho)
+        # Colunas sem limite (TextField) e não textuais ficam como vieram
+        self.assertEqual((len(item.email), len(item.dsevento), len(item.telefones)), (400, 500, 300))
+        self.assertEqual((item.cnae_principal, item.situacao_data, item.cnpj), (4711302, '2020-01-01', '12345678000195'))
+        item.full_clean(exclude=['historico'])
+
+
+def _extrator_quebrado(data):
+    raise KeyError('campo')
+
+
+def _extrator_extra(data):
+    return {'uf': 'XX', 'coluna_desconhecida': 1}
+
+
+class ExtracaoTests(TestCase):
+    """Pipeline `CNPJ_EXTRATORES` e o comando `extrair_campos`."""
+
+    DETALHES = {
+        'taxId': '12345678000195',
+        'status': {'id': 2, 'text': 'Ativa'},
+        'statusDate': '2005-11-03',
+        'mainActivity': {'id': 4711302, 'text': 'Comércio varejista'},
+        'address': {'city': 'São Paulo', 'municipality': 3550308, 'state': 'sp'},
+        'emails': [{'address': 'a@x.com'}, {'address': 'b@x.com'}, {}],
+        'phones': [{'area': '11', 'number': '5555-0000'}, {'area': '', 'number': ''}],
+        'updated': '2026-03-01T12:00:00Z',
+    }
+
+    def tearDown(self):
+        from ..extracao import _extratores
+        _extratores.cache_clear()
+
+    def test_pipeline_padrao(self):
+        from ..extracao import extrair_campos
+        self.assertEqual(extrair_campos(self.DETALHES), {
+            'situacao': 'Ativa', 'situacao_data': '2005-11-03', 'cnae_principal': 4711302,
+            'atividade_principal': 'Comércio varejista', 'municipio': 'São Paulo', 'municipio_ibge': 3550308,
+            'uf': 'SP', 'emails': 'a@x.com | b@x.com', 'telefones': '11 5555-0000',
+            'atualizado': '2026-03-01T12:00:00+00:00',
+        })
+        self.assertEqual(extrair_campos(None), {})
+        # `updated` sem fuso é UTC; inválido fica vazio
+        self.assertEqual(extrair_campos({'updated': '2026-03-01T12:00:00'})['atualizado'], '2026-03-01T12:00:00+00:00')
+        self.assertIsNone(extrair_campos({'updated': '2026-13-01T12:00:00'})['atualizado'])
+
+    @override_settings(CNPJ_EXTRATORES=['consulta.tests.test_extracao._extrator_quebrado', 'consulta.extracao.extrair_situacao',
+                                        'consulta.tests.test_extracao._extrator_extra'])
+    def test_extrator_com_erro_nao_para_o_pipeline(self):
+        from ..extracao import _extratores, extrair_campos
+        _extratores.cache_clear()
+        with self.assertLogs('consulta.extracao', 'WARNING'):
+            campos = extrair_campos(self.DETALHES)
+        self.assertEqual(campos, {'situacao': 'Ativa', 'situacao_data': '2005-11-03', 'uf': 'XX'})
+
+    def test_comando_preenche_so_o_que_falta(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from ..models import ConsultaHistorico, ConsultaResultado
+        h = ConsultaHistorico.objects.create(tipo='manual')
+        ConsultaResultado.objects.bulk_create([
+            ConsultaResultado(historico=h, ordem=0, cnpj='12345678000195', detalhes=self.DETALHES),
+            ConsultaResultado(historico=h, ordem=1, cnpj='12345678000195', detalhes=self.DETALHES, uf='RJ'),
+            ConsultaResultado(historico=h, ordem=2, cnpj='12345678000195'),
+        ])
+        call_command('extrair_campos', lote=1, stdout=StringIO())
+        self.assertEqual(list(h.itens.order_by('ordem').values_list('uf', 'cnae_principal')),
+                         [('SP', 4711302), ('RJ', None), ('', None)])
+        self.assertEqual(h.itens.get(ordem=0).atualizado.isoformat(), '2026-03-01T12:00:00+00:00')
+        call_command('extrair_campos', todos=True, stdout=StringIO())
+        self.assertEqual(h.itens.get(ordem=1).cnae_principal, 4711302)
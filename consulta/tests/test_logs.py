@@ -0,0 +1,53 @@
+"""Logging estruturado e não bloqueante."""
+
+import logging
+
+from django.test import SimpleTestCase
+
+
+class LogsTests(SimpleTestCase):
+    """Fila não bloqueante, amostragem por mensagem e formato estruturado."""
+
+    def _registro(self, msg='item %s', args=(1,), nome='consulta.jobs', **extra):
+        return logging.makeLogRecord({'name': nome, 'levelno': logging.INFO, 'levelname': 'INFO',
+                                      'msg': msg, 'args': args, **extra})
+
+    def test_amostragem_por_mensagem(self):
+        from ..logs import AMOSTRAR, FiltroAmostragem
+        filtro = FiltroAmostragem(taxa=3)
+        registros = [self._registro(args=(i,), **AMOSTRAR) for i in range(7)]
+        self.assertEqual([filtro.filter(r) for r in registros], [True, False, False, True, False, False, True])
+        # A primeira sai inteira; as seguintes indicam a taxa
+        self.assertEqual([getattr(registros[i], 'amostra', None) for i in (0, 3)], [None, '1/3'])
+        # Outra mensagem tem contador próprio; sem a marca, tudo passa
+        self.assertTrue(filtro.filter(self._registro(msg='outro %s', **AMOSTRAR)))
+        self.assertTrue(all(filtro.filter(self._registro()) for _ in range(5)))
+
+    def test_formatador_chave_valor_e_json(self):
+        import json
+        from ..logs import FormatadorEstruturado
+        registro = self._registro(cnpj='12345678000195', ms=12)
+        linha = FormatadorEstruturado().format(registro)
+        self.assertRegex(linha, r'^\S+ INFO consulta\.jobs item 1 cnpj=12345678000195 ms=12$')
+        dados = json.loads(FormatadorEstruturado(como_json=True).format(registro))
+        self.assertEqual({k: dados[k] for k in ('nivel', 'categoria', 'msg', 'cnpj', 'ms')},
+                         {'nivel': 'INFO', 'categoria': 'consulta.jobs', 'msg': 'item 1', 'cnpj': '12345678000195', 'ms': 12})
+
+    def test_fila_cheia_descarta_sem_bloquear_e_avisa(self):
+        import io
+        from ..logs import FilaHandler
+        saida = io.StringIO()
+        handler = FilaHandler(tamanho=2, stream=saida)
+        handler.setFormatter(logging.Formatter('%(name)s %(message)s'))
+        handler._listener.stop()  # ninguém consome: a fila enche
+        for i in range(5):
+            handler.emit(self._registro(args=(i,)))
+        self.assertEqual(handler._descartadas, 3)
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        handler.emit(self._registro(args=(9,)))
+        self.assertEqual(handler._descartadas, 0)
+        handler._listener.start()
+        handler.parar()
+        self.assertEqual(saida.getvalue().splitlines(),
+                         ['consulta.logs 3 registros de log descartados (fila cheia)', 'consulta.jobs item 9'])
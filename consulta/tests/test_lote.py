@@ -0,0 +1,71 @@
+"""POST /api/lote/."""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, corpo_streaming, cnpja_falso
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], API_LOTE_MAX_ITENS=6)
+class ConsultaLoteTests(TestCase):
+    """`POST /api/lote/`: NDJSON por item (índice, via), resumo no fim e validação."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.client.force_login(User.objects.create_user('api', password='segredo-123'))
+        self.local, self.em_cache, self.online = cnpj_de(16000001), cnpj_de(16000002), cnpj_de(16000003)
+        services.salvar_office_cache(self.local, documento_cnpja(self.local, 'Local'))
+        self.chamadas = []
+        self.get = cnpja_falso({c: documento_cnpja(c, 'Empresa') for c in (self.em_cache, self.online)},
+                                em_cache={self.em_cache}, chamadas=self.chamadas)
+
+    def _lote(self, corpo):
+        import json
+        with mock.patch('requests.get', side_effect=self.get):
+            resposta = self.client.post('/api/lote/', data=json.dumps(corpo), content_type='application/json', secure=True)
+            if resposta.status_code != 200:
+                return resposta, None
+            self.assertEqual(resposta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+            return resposta, [json.loads(l) for l in corpo_streaming(resposta).decode('utf-8').splitlines()]
+
+    def test_uma_linha_por_item_e_resumo(self):
+        invalido = self.online[:-1] + str((int(self.online[-1]) + 1) % 10)
+        _, linhas = self._lote({'itens': [
+            self.local, {'cnpj': services.format_cnpj(self.online), 'processo': 'P1'}, self.em_cache,
+            {'cnpj': self.online, 'processo': 'P2', 'dsevento': 'Leilão'}, invalido,
+        ], 'detalhes': False})
+        self.assertEqual(linhas[-1], {'resumo': {'total': 5, 'ok': 4, 'erros': 0, 'invalidos': 1}})
+        por_indice = {l['indice']: l for l in linhas[:-1]}
+        self.assertEqual(sorted(por_indice), [0, 1, 2, 3, 4])
+        self.assertEqual({i: l['via'] for i, l in por_indice.items()},
+                         {0: 'cache_local', 1: 'online', 2: 'cache', 3: 'online', 4: 'invalido'})
+        self.assertEqual((por_indice[0]['nome'], por_indice[0]['status']), ('Local', 'ok'))
+        self.assertEqual((por_indice[3]['processo'], por_indice[3]['dsevento']), ('P2', 'Leilão'))
+        self.assertEqual(por_indice[4]['status'], 'erro')
+        self.assertNotIn('detalhes', por_indice[1])
+        # Itens repetidos: o CNPJ é consultado online uma vez só
+        self.assertEqual(self.chamadas.count((self.online, 'CACHE_IF_FRESH')), 1)
+
+    def test_detalhes_por_padrao_e_lista_direta(self):
+        _, linhas = self._lote([self.local])
+        self.assertEqual(linhas[0]['detalhes']['taxId'], self.local)
+
+    def test_sem_chave_da_api_fecha_com_resumo(self):
+        import os
+        with override_settings(CNPJA_API_KEYS=[]), mock.patch.dict(os.environ, {'CNPJA_API_KEY': ''}), \
+                self.assertLogs('consulta.api', 'ERROR'):
+            _, linhas = self._lote([self.local, self.online])
+        self.assertEqual(linhas[-1], {'resumo': {'total': 2, 'ok': 1, 'erros': 1, 'invalidos': 0}})
+        erro = next(l for l in linhas[:-1] if l['indice'] == 1)
+        self.assertEqual((erro['status'], erro['via']), ('erro', 'erro'))
+        self.assertIn('CNPJA_API_KEY', erro['erro'])
+        self.assertEqual(self.chamadas, [])
+
+    def test_corpo_invalido_e_limite(self):
+        for corpo in ({'itens': []}, {'itens': [[1]]}, 'x', {'itens': [self.local] * 7}):
+            resposta, _ = self._lote(corpo)
+            self.assertEqual(resposta.status_code, 400, corpo)
+        self.assertIn('Máximo de 6 itens', resposta.json()['detail'])
@@ -0,0 +1,75 @@
+"""Passada CACHE-only e planejamento de jobs (jobs/plan)."""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from clients.cnpja import id_chave
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, cnpja_falso, iniciar_job, planejar_job
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], CNPJ_RAIZ_MIN_FILIAIS=0, JOB_PLAN_BATCH_SIZE=2)
+class PlanejamentoTests(TestCase):
+    """Passada CACHE-only antes das consultas online (jobs/plan)."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.user = User.objects.create_user('op', password='segredo-123')
+        self.em_cache, self.fora = cnpj_de(10101010), cnpj_de(20202020)
+        self.documentos = {c: documento_cnpja(c) for c in (self.em_cache, self.fora)}
+        self.chamadas = []
+        self.get = cnpja_falso(self.documentos, em_cache={self.em_cache}, chamadas=self.chamadas)
+
+    def test_planejar_consultas_separa_hits_e_misses(self):
+        formatado = services.format_cnpj(self.em_cache)
+        with mock.patch('requests.get', side_effect=self.get):
+            hits, misses = services.planejar_consultas([self.fora, self.em_cache, formatado, ''])
+        self.assertEqual(list(hits), [self.em_cache])
+        self.assertEqual(hits[self.em_cache]['cnpj'], formatado)
+        self.assertEqual(misses, [self.fora])
+        # Um CACHE por CNPJ distinto, sem consulta online; o hit vai para o cache compartilhado
+        self.assertEqual(sorted(self.chamadas), sorted([(self.fora, 'CACHE'), (self.em_cache, 'CACHE')]))
+        self.assertIsNotNone(services.obter_office_cache(self.em_cache))
+
+    def test_falha_no_cache_vira_miss(self):
+        import requests
+        with mock.patch('requests.get', side_effect=requests.exceptions.ConnectionError):
+            self.assertEqual(services.planejar_consultas([self.em_cache]), ({}, [self.em_cache]))
+
+    def test_miss_conhecido_pula_a_tentativa_cache(self):
+        with mock.patch('requests.get', side_effect=self.get):
+            resultado = services.consultar_cnpj_api(self.fora, cache_first=False)
+        self.assertEqual(resultado['nome'], 'Empresa')
+        self.assertEqual(self.chamadas, [(self.fora, 'CACHE_IF_FRESH')])
+
+    def test_ordenar_fila_planejada(self):
+        from ..views import _ordenar_fila_planejada
+        a, b, c = cnpj_de(1), cnpj_de(2), cnpj_de(3)
+        fila = [{'cnpj': a, 'processo': '1'}, {'cnpj': b, 'processo': None}, {'cnpj': c, 'processo': '1'},
+                {'cnpj': c, 'processo': '2'}, {'cnpj': a, 'processo': '2'}, {'cnpj': a, 'processo': '3'}]
+        ordenada = _ordenar_fila_planejada(fila, prefetched={b: {}})
+        # Hits primeiro; misses por itens resolvidos (a: 3, c: 2) e, no empate, ordem do arquivo
+        self.assertEqual([(i['cnpj'], i['processo']) for i in ordenada],
+                         [(b, None), (a, '1'), (a, '2'), (a, '3'), (c, '1'), (c, '2')])
+
+    def test_jobs_plan_estima_creditos_e_serve_hits_sem_chamada(self):
+        self.client.force_login(self.user)
+        cache.set(f"{services.CREDITOS_CACHE_KEY}:{id_chave('chave-teste')}", {'transient': 0, 'perpetual': 0}, None)
+        iniciar_job(self.client, [self.fora, self.em_cache])
+        with mock.patch('requests.get', side_effect=self.get):
+            plano = planejar_job(self.client)
+        self.assertEqual((plano['distinct'], plano['cached'], plano['online']), (2, 1, 1))
+        self.assertEqual((plano['credits_estimate'], plano['credits_balance'], plano['insufficient']), (1, 0.0, True))
+        fila = self.client.session['job']['queue']
+        self.assertEqual([i['cnpj'] for i in fila], [self.em_cache, self.fora])
+        self.chamadas.clear()
+        with mock.patch('requests.get', side_effect=self.get), mock.patch('consulta.views_async.DELAY_SECONDS', 0):
+            passos = [self.client.post('/jobs/step/', secure=True).json() for _ in range(2)]
+        self.assertEqual([p['processed'] for p in passos], [1, 2])
+        self.assertEqual([p['item']['nome'] for p in passos], ['Empresa'] * 2)
+        # Hit servido do plano; o miss vai direto à consulta online, sem nova tentativa CACHE
+        self.assertEqual(self.chamadas, [(self.fora, 'CACHE_IF_FRESH')])
@@ -0,0 +1,61 @@
+"""Profiling por requisição."""
+
+from django.test import TestCase, override_settings
+
+from .auxiliares import limpar_cache
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    """`ProfilingMiddleware`: só staff, relatório em texto ou arquivo, streaming consumido."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.staff = User.objects.create_user('admin', password='segredo-123', is_staff=True)
+        self.comum = User.objects.create_user('op', password='segredo-123')
+
+    def test_desligado_sai_da_cadeia(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from ..middleware import ProfilingMiddleware
+        with override_settings(PROFILING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_so_staff_recebe_o_relatorio(self):
+        self.client.force_login(self.comum)
+        resposta = self.client.get('/api/throughput/', {'_profile': '1'}, secure=True)
+        self.assertEqual(resposta['Content-Type'], 'application/json')
+        self.client.force_login(self.staff)
+        resposta = self.client.get('/api/throughput/', {'_profile': '1', '_profile_sort': 'tottime'}, secure=True)
+        self.assertEqual(resposta['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(resposta['X-Profile-Status'], '200')
+        texto = resposta.content.decode('utf-8')
+        self.assertTrue(texto.startswith('GET /api/throughput/?_profile=1'))
+        self.assertIn('function calls', texto)
+
+    def test_amostragem_em_arquivo_com_streaming_assincrono(self):
+        import os
+        import tempfile
+        from asgiref.sync import async_to_sync
+        self.client.force_login(self.staff)
+        self.async_client.cookies = self.client.cookies
+
+        async def _get():
+            return await self.async_client.get('/export/historico/delta/', {'format': 'csv'}, secure=True,
+                                               headers={'X-Profile': 'amostra', 'X-Profile-Out': 'arquivo'})
+
+        with tempfile.TemporaryDirectory() as destino, override_settings(PROFILING_DIR=destino, PROFILING_INTERVALO_MS=1):
+            resposta = async_to_sync(_get)()
+            self.assertFalse(resposta.streaming)
+            self.assertTrue(resposta.content.startswith(b'historico_id,'))
+            self.assertEqual(resposta['X-Next-Cursor'], '')
+            self.assertTrue(resposta['X-Profile-File'].endswith('.collapsed'))
+            self.assertIn(resposta['X-Profile-File'], os.listdir(destino))
+
+    def test_um_perfil_por_vez(self):
+        from ..middleware import ProfilingMiddleware
+        self.client.force_login(self.staff)
+        with ProfilingMiddleware._trava:
+            resposta = self.client.get('/api/throughput/', {'_profile': '1'}, secure=True)
+        self.assertEqual(resposta['X-Profile'], 'ocupado')
+        self.assertEqual(resposta['Content-Type'], 'application/json')
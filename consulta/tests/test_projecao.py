@@ -0,0 +1,63 @@
+"""Projeção de `detalhes` e documento bruto."""
+
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache
+
+
+class ProjecaoTests(TestCase):
+    """Poda de `detalhes` (`CNPJ_CAMPOS_ARMAZENADOS`), `?fields=` e documento bruto."""
+
+    def setUp(self):
+        limpar_cache()
+        self.cnpj = cnpj_de(17000001)
+        self.completo = {
+            **documento_cnpja(self.cnpj, 'Completa'),
+            'company': {'name': 'Completa', 'members': [{'person': {'name': 'Ana'}, 'since': '2001-01-01'}], 'simples': {'optant': True}},
+            'phones': [{'area': '11', 'number': '5555-0000', 'type': 'LANDLINE'}],
+            'registrations': [{'state': 'SP', 'number': '1'}],
+            'suframa': [],
+        }
+
+    def test_projetar_caminhos_listas_e_prefixos(self):
+        from ..projecao import projetar
+        self.assertEqual(projetar(self.completo, ('phones.number', 'company.members.person', 'company', 'nada.aqui')), {
+            'phones': [{'number': '5555-0000'}],
+            'company': self.completo['company'],
+        })
+        self.assertIs(projetar(self.completo, ('*',)), self.completo)
+        self.assertEqual(projetar(None, ('taxId',)), None)
+
+    def test_ingestao_poda_mas_extrai_do_completo(self):
+        detalhes = services._montar_resultado(self.cnpj, self.completo)['detalhes']
+        self.assertNotIn('registrations', detalhes)
+        self.assertNotIn('simples', detalhes['company'])
+        self.assertEqual(detalhes['company']['members'], self.completo['company']['members'])
+        with override_settings(CNPJ_CAMPOS_ARMAZENADOS=['taxId', 'company.name']):
+            resultado = services._montar_resultado(self.cnpj, self.completo)
+        self.assertEqual(resultado['detalhes'], {'taxId': self.cnpj, 'company': {'name': 'Completa'}})
+        self.assertEqual(resultado['telefones'], '11 5555-0000')
+        with override_settings(CNPJ_CAMPOS_ARMAZENADOS=['*']):
+            self.assertEqual(services._montar_resultado(self.cnpj, self.completo)['detalhes'], self.completo)
+
+    @override_settings(CNPJ_DOCUMENTO_BRUTO=True)
+    def test_documento_bruto_uma_vez_por_conteudo_e_fields(self):
+        from django.contrib.auth.models import User
+        from ..models import ConsultaDocumento, ConsultaHistorico, ConsultaResultado
+        from ..projecao import arquivar_documentos
+        services.salvar_office_cache(self.cnpj, self.completo)
+        self.assertEqual(arquivar_documentos([services.format_cnpj(self.cnpj), self.cnpj, 'x']), 1)
+        self.assertEqual(arquivar_documentos([self.cnpj]), 0)
+        self.assertEqual(ConsultaDocumento.objects.get().documento(), self.completo)
+
+        h = ConsultaHistorico.objects.create(tipo='manual', status='concluido')
+        ConsultaResultado.de_dict(h.pk, 0, services._montar_resultado(self.cnpj, self.completo)).save()
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+        url = f'/api/detalhes/{self.cnpj}/'
+        self.assertEqual(self.client.get(url, {'fields': 'taxId, company.name'}, secure=True).json(),
+                         {'taxId': self.cnpj, 'company': {'name': 'Completa'}})
+        self.assertNotIn('registrations', self.client.get(url, secure=True).json())
+        # `*`: o completo, do cache compartilhado ou (sem ele) do armazenamento frio
+        limpar_cache()
+        self.assertEqual(self.client.get(url, {'fields': '*'}, secure=True).json(), self.completo)
@@ -0,0 +1,76 @@
+"""Consultas agrupadas pela raiz do CNPJ."""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from clients.cnpja import id_chave
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], CNPJA_MAX_AGE_DAYS=40)
+class BuscaPorRaizTests(TestCase):
+    """Filiais da mesma empresa resolvidas pela pesquisa por raiz (`company.id.in`)."""
+
+    def setUp(self):
+        from django.utils import timezone
+        limpar_cache()
+        self.raiz = 19000001
+        self.filiais = [cnpj_de(self.raiz, f) for f in (1, 2, 3)]
+        self.recente = timezone.now().isoformat()
+        self.buscas = []
+        self.paginas = {
+            None: {'records': [self._doc(self.filiais[0]), self._doc(cnpj_de(self.raiz, 9)),
+                               self._doc(self.filiais[1], updated='2020-01-01T00:00:00Z')], 'next': 'p2'},
+            'p2': {'records': [self._doc(self.filiais[2])]},
+        }
+
+    def _doc(self, cnpj, updated=None):
+        return {**documento_cnpja(cnpj, f'Filial {cnpj[8:12]}'), 'updated': updated or self.recente}
+
+    def _get(self, url, headers=None, params=None, timeout=None):
+        params = params or {}
+        if 'company.id.in' in params:
+            self.buscas.append(params)
+            return RespostaFalsa(200, self.paginas[params.get('token')])
+        cnpj = url.rstrip('/').rsplit('/', 1)[-1]
+        if params.get('strategy') == 'CACHE':
+            return RespostaFalsa(404, {'message': 'not found'})
+        return RespostaFalsa(200, self._doc(cnpj))
+
+    def test_agrupar_por_raiz(self):
+        outra = cnpj_de(19000002)
+        cnpjs = [*self.filiais, services.format_cnpj(self.filiais[0]), outra, '123']
+        self.assertEqual(services.agrupar_por_raiz(cnpjs, minimo=3), {f'{self.raiz:08d}': self.filiais})
+        self.assertEqual(services.agrupar_por_raiz(cnpjs, minimo=0), {})
+        # Uma filial sozinha nunca vira busca, mesmo com mínimo 1
+        self.assertEqual(list(services.agrupar_por_raiz(cnpjs, minimo=1)), [f'{self.raiz:08d}'])
+
+    def test_buscar_por_raiz_pagina_e_ignora_desatualizados(self):
+        with mock.patch('requests.get', side_effect=self._get), self.assertLogs('consulta.api', 'INFO'):
+            resultados = services.buscar_por_raiz(f'{self.raiz:08d}', self.filiais)
+        self.assertEqual(sorted(resultados), [self.filiais[0], self.filiais[2]])
+        self.assertEqual(resultados[self.filiais[0]]['nome'], f'Filial {self.filiais[0][8:12]}')
+        self.assertEqual([b.get('token') for b in self.buscas], [None, 'p2'])
+        self.assertEqual(self.buscas[0]['company.id.in'], f'{self.raiz:08d}')
+        self.assertIsNotNone(services.obter_office_cache(self.filiais[2]))
+        self.assertIsNone(services.obter_office_cache(self.filiais[1]))
+
+    def test_erro_da_busca_deixa_tudo_para_a_consulta_individual(self):
+        from ..chaves import fora_de_rotacao
+
+        def get(url, headers=None, params=None, timeout=None):
+            return RespostaFalsa(429, {'message': 'limit', 'ttl': 5})
+
+        with mock.patch('requests.get', side_effect=get), self.assertLogs('consulta', 'WARNING'):
+            self.assertEqual(services.buscar_por_raiz(f'{self.raiz:08d}', self.filiais), {})
+        self.assertIn(id_chave('chave-teste'), fora_de_rotacao())
+
+    def test_lote_usa_a_busca_e_consulta_o_resto(self):
+        itens = [{'cnpj': c, 'processo': None} for c in self.filiais]
+        with mock.patch('requests.get', side_effect=self._get), mock.patch.object(services, 'RAIZ_MIN_FILIAIS', 3), \
+                self.assertLogs('consulta.api', 'INFO'):
+            vias = {i: via for i, _, _, via in services.consultar_lote(itens)}
+        self.assertEqual(vias, {0: 'raiz', 1: 'online', 2: 'raiz'})
@@ -0,0 +1,59 @@
+"""Divisão justa da janela do rate limit entre fluxos."""
+
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import services
+from .auxiliares import limpar_cache
+
+
+class _Bloqueou(BaseException):
+    """Levantada no lugar do `time.sleep` do rate limit (o laço engole `Exception`)."""
+
+
+class RateLimitJustoTests(SimpleTestCase):
+    """Divisão ponderada da janela entre fluxos (`_rate_limit_acquire`)."""
+
+    def setUp(self):
+        limpar_cache()
+
+    def _adquirir(self, fluxo, interativo=False, limit=4):
+        with mock.patch('time.sleep', side_effect=_Bloqueou):
+            try:
+                services._rate_limit_acquire('teste', limit=limit, window_seconds=3600, fluxo=fluxo, interativo=interativo)
+            except _Bloqueou:
+                return False
+        return True
+
+    def test_cotas_proporcionais_ao_peso(self):
+        agora = 0
+        fluxos = {'i': (4, True, agora), 'a': (1, False, agora), 'b': (1, False, agora)}
+        self.assertEqual(services._cotas_janela(60, fluxos), {'i': 40, 'a': 10, 'b': 10})
+        self.assertEqual(services._cotas_janela(2, fluxos), {'i': 2, 'a': 1, 'b': 1})
+
+    def test_lote_nao_toma_a_cota_de_outro_lote(self):
+        self.assertTrue(self._adquirir('lote:b'))
+        self.assertTrue(self._adquirir('lote:a'))
+        self.assertTrue(self._adquirir('lote:a'))
+        # a esgotou a sua metade; o slot que resta é de b
+        self.assertFalse(self._adquirir('lote:a'))
+        self.assertTrue(self._adquirir('lote:b'))
+        # Janela cheia: ninguém passa
+        self.assertFalse(self._adquirir('lote:b'))
+
+    def test_fluxo_sozinho_usa_a_janela_inteira(self):
+        self.assertEqual([self._adquirir('lote:a') for _ in range(5)], [True, True, True, True, False])
+
+    def test_lote_respeita_a_cota_reservada_ao_interativo(self):
+        self.assertTrue(self._adquirir('lote:a', limit=10))
+        self.assertTrue(self._adquirir('ui', interativo=True, limit=10))
+        # Cotas de 10 slots com pesos 1 e 4: lote 2, interativo 8
+        self.assertTrue(self._adquirir('lote:a', limit=10))
+        self.assertFalse(self._adquirir('lote:a', limit=10))
+        self.assertEqual([self._adquirir('ui', interativo=True, limit=10) for _ in range(8)], [True] * 7 + [False])
+
+    def test_interativo_usa_os_slots_que_os_lotes_nao_gastaram(self):
+        self.assertTrue(self._adquirir('lote:a', limit=10))
+        self.assertEqual([self._adquirir('ui', interativo=True, limit=10) for _ in range(10)], [True] * 9 + [False])
@@ -0,0 +1,164 @@
+"""Base local da Receita Federal."""
+
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, cnpja_falso
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], CNPJ_BASE_LOCAL=True, CNPJ_RAIZ_MIN_FILIAIS=0)
+class BaseLocalForaDosPoolsTests(SimpleTestCase):
+    """A base local (ORM) é consultada só na thread chamadora, uma vez por CNPJ."""
+
+    def setUp(self):
+        limpar_cache()
+        self.local, self.online = cnpj_de(11111111), cnpj_de(22222222)
+        self.consultas = []
+
+        def documento_local(cnpj):
+            self.consultas.append((cnpj, threading.current_thread()))
+            return documento_cnpja(cnpj, nome='Da Receita') if cnpj == self.local else None
+
+        patcher = mock.patch('consulta.receita.documento_local', side_effect=documento_local)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_consultar_lote(self):
+        get = cnpja_falso({self.online: documento_cnpja(self.online)})
+        with mock.patch('requests.get', side_effect=get):
+            saida = list(services.consultar_lote([{'cnpj': self.local}, {'cnpj': self.online}, {'cnpj': self.local}]))
+        vias = sorted((indice, via) for indice, _, _, via in saida)
+        self.assertEqual(vias, [(0, 'base_local'), (1, 'online'), (2, 'base_local')])
+        self.assertEqual(sorted(c for c, _ in self.consultas), sorted([self.local, self.online]))
+        self.assertEqual({t for _, t in self.consultas}, {threading.current_thread()})
+
+    def test_consultar_lote_com_locais_prontos_nao_consulta_a_base(self):
+        locais = services.resolver_base_local([self.local, self.online])
+        self.consultas.clear()
+        get = cnpja_falso({self.online: documento_cnpja(self.online)})
+        with mock.patch('requests.get', side_effect=get):
+            saida = list(services.consultar_lote([{'cnpj': self.local}, {'cnpj': self.online}], locais=locais))
+        self.assertEqual(sorted(via for _, _, _, via in saida), ['base_local', 'online'])
+        self.assertEqual(self.consultas, [])
+
+    def test_planejar_consultas(self):
+        with mock.patch('requests.get', side_effect=cnpja_falso({})):
+            hits, misses = services.planejar_consultas([self.local, self.online])
+        self.assertEqual(list(hits), [self.local])
+        self.assertEqual(hits[self.local]['nome'], 'Da Receita')
+        self.assertEqual(misses, [self.online])
+        self.assertEqual({t for _, t in self.consultas}, {threading.current_thread()})
+
+    def test_resolver_base_local_ignora_cache_e_invalidos(self):
+        services.salvar_office_cache(self.online, documento_cnpja(self.online))
+        self.assertEqual(list(services.resolver_base_local([self.local, self.online, '11111111000100'])), [self.local])
+        self.assertEqual([c for c, _ in self.consultas], [self.local])
+
+    @override_settings(CNPJ_BASE_LOCAL=False)
+    def test_desligada(self):
+        self.assertEqual(services.resolver_base_local([self.local]), {})
+        self.assertEqual(self.consultas, [])
+
+
+@override_settings(CNPJ_BASE_LOCAL=True, CNPJ_BASE_LOCAL_CAMPOS=None, CNPJ_CAMPOS_ARMAZENADOS=None, CNPJ_BASE_LOCAL_MAX_DIAS=60)
+class BaseLocalReceitaTests(TestCase):
+    """Carga dos arquivos da Receita e o documento local no formato do /office."""
+
+    def setUp(self):
+        import os
+        import tempfile
+        import zipfile
+        from ..receita import limpar_estado
+        limpar_estado()
+        self.addCleanup(limpar_estado)
+        self.cnpj = cnpj_de(20000001)
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+        estab = [
+            '20000001', self.cnpj[8:12], self.cnpj[12:], '1', 'LOJA', '02', '20050103', '00', '', '', '20000101',
+            '4711302', '4712100,4729699', 'RUA', 'DAS FLORES', '10', 'SALA 2', 'CENTRO', '01001000', 'SP', '7107',
+            '11', '55550000', '', '', '', '', 'CONTATO@LOJA.COM.BR', '', '',
+        ]
+        arquivos = {
+            'Estabelecimentos0.csv': [estab, ['curta']],
+            'Socios0.csv': [['20000001', '2', 'ANA SOUZA', '***123456**', '49', '20000101', '', '', '', '', '5']],
+            'Cnaes.csv': [['4711302', 'Comércio varejista de mercadorias'], ['4712100', 'Minimercados'], ['x', 'cabeçalho']],
+            'Municipios.csv': [['7107', 'SAO PAULO']],
+            'Naturezas.csv': [['2062', 'Sociedade Empresária Limitada']],
+            'Qualificacoes.csv': [['49', 'Sócio-Administrador']],
+            'Simples.csv': [['20000001', 'S']],
+        }
+        for nome, linhas in arquivos.items():
+            with open(os.path.join(self.pasta, nome), 'w', encoding='latin-1', newline='') as arq:
+                arq.writelines(';'.join(f'"{c}"' for c in linha) + '\n' for linha in linhas)
+        # Empresas vem zipada, com um byte NUL perdido no meio (acontece nos arquivos da Receita)
+        with zipfile.ZipFile(os.path.join(self.pasta, 'Empresas0.zip'), 'w') as zf:
+            zf.writestr('K3241.K03200Y0.D50913.EMPRECSV',
+                        '"20000001";"LOJA SÃO JOÃO\x00 LTDA";"2062";"49";"1000,00";"01";""\n'.encode('latin-1'))
+
+    def _carregar(self, referencia=None):
+        import os
+        from datetime import date
+        from ..receita_carga import ORDEM, carregar_tabela, listar_arquivos
+        arquivos, ignorados = listar_arquivos([self.pasta])
+        self.assertEqual([os.path.basename(c) for c in ignorados], ['Simples.csv'])
+        with self.assertLogs('consulta.receita', 'INFO'):
+            for tabela in ORDEM:
+                carregar_tabela(tabela, arquivos[tabela], referencia or date.today().replace(day=1))
+
+    def test_carga_e_documento_local(self):
+        from ..receita import documento_local
+        self._carregar()
+        doc = documento_local(self.cnpj)
+        self.assertEqual(doc['taxId'], self.cnpj)
+        self.assertEqual(doc['company']['name'], 'LOJA SÃO JOÃO LTDA')
+        self.assertEqual(doc['company']['equity'], 1000.0)
+        self.assertEqual(doc['company']['nature'], {'id': 2062, 'text': 'Sociedade Empresária Limitada'})
+        self.assertEqual(doc['company']['size']['acronym'], 'ME')
+        self.assertEqual(doc['company']['members'], [{
+            'since': '2000-01-01', 'role': {'id': 49, 'text': 'Sócio-Administrador'},
+            'person': {'type': 'NATURAL', 'name': 'ANA SOUZA', 'taxId': '***123456**', 'age': '41-50'},
+        }])
+        self.assertEqual((doc['status'], doc['statusDate'], doc['founded'], doc['head']),
+                         ({'id': 2, 'text': 'Ativa'}, '2005-01-03', '2000-01-01', True))
+        self.assertEqual((doc['address']['street'], doc['address']['city'], doc['address']['state']),
+                         ('RUA DAS FLORES', 'SAO PAULO', 'SP'))
+        self.assertEqual(doc['mainActivity'], {'id': 4711302, 'text': 'Comércio varejista de mercadorias'})
+        self.assertEqual([a['id'] for a in doc['sideActivities']], [4712100, 4729699])
+        self.assertEqual(doc['phones'], [{'area': '11', 'number': '55550000'}])
+        self.assertEqual(doc['emails'], [{'address': 'contato@loja.com.br', 'domain': 'loja.com.br'}])
+        resultado = services.resultado_base_local(self.cnpj)
+        self.assertEqual((resultado['nome'], resultado['email'], resultado['uf']), ('LOJA SÃO JOÃO LTDA', 'contato@loja.com.br', 'SP'))
+        self.assertIsNone(documento_local(cnpj_de(20000002)))
+
+    def test_base_nao_responde_incompleta_velha_ou_sem_campos(self):
+        from datetime import date, timedelta
+        from ..models import ReceitaImportacao
+        from ..receita import documento_local, limpar_estado
+        self._carregar()
+        with override_settings(CNPJ_BASE_LOCAL_CAMPOS=['taxId', 'registrations']):
+            self.assertIsNone(documento_local(self.cnpj))
+        with override_settings(CNPJ_BASE_LOCAL_CAMPOS=['*']):
+            self.assertIsNone(documento_local(self.cnpj))
+        self.assertIsNone(services.resultado_base_local(self.cnpj, ligada=False))
+        # Carga em andamento: nada responde até ela terminar
+        ReceitaImportacao.objects.create(tabela='socios', referencia=date.today())
+        limpar_estado()
+        self.assertIsNone(documento_local(self.cnpj))
+        ReceitaImportacao.objects.all().delete()
+        self._carregar(referencia=date.today() - timedelta(days=90))
+        self.assertIsNone(documento_local(self.cnpj))
+
+    def test_estado_da_base_em_cache_por_processo(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ..receita import estado_base
+        self._carregar()
+        estado_base()
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(set(estado_base()), {'tabelas', 'empresas', 'estabelecimentos', 'socios'})
+        self.assertEqual(len(consultas.captured_queries), 0)
@@ -0,0 +1,84 @@
+"""Resultados do job gravados em lotes."""
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, cnpja_falso
+
+
+class PersistenciaResultadosTests(TestCase):
+    """Resultados do job gravados em lotes em `ConsultaResultado`."""
+
+    def _resultado(self, i, uf='SP'):
+        cnpj = cnpj_de(12000000 + i)
+        return {'cnpj': services.format_cnpj(cnpj), 'nome': f'Empresa {i}', 'email': 'Sem e-mail',
+                'detalhes': {'taxId': cnpj, 'address': {'state': uf}}, 'processo': f'P{i}', 'uf': uf}
+
+    @override_settings(JOB_RESULTS_BATCH_SIZE=2)
+    def test_grava_em_lotes_so_o_que_falta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ..models import ConsultaHistorico, ConsultaResultado
+        from ..views import _gravar_resultados
+        historico = ConsultaHistorico.objects.create(tipo='upload', status='andamento')
+        job = {'historico_id': historico.pk, 'persistidos': 0, 'results': [self._resultado(i) for i in range(3)]}
+        with mock.patch('consulta.views.arquivar_documentos'), CaptureQueriesContext(connection) as consultas:
+            _gravar_resultados(job)
+        inserts = [q for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(job['persistidos'], 3)
+        job['results'].append(self._resultado(3, uf='MG'))
+        with mock.patch('consulta.views.arquivar_documentos'):
+            _gravar_resultados(job)
+            # Regravar um lote já gravado (sessão não salva a tempo) não duplica linhas
+            job['persistidos'] = 2
+            _gravar_resultados(job)
+        self.assertEqual(list(historico.itens.values_list('ordem', flat=True)), [0, 1, 2, 3])
+        self.assertEqual(job['persistidos'], 4)
+        self.assertEqual(ConsultaResultado.objects.count(), 4)
+
+    def test_como_dict_e_iter_resultados(self):
+        from ..models import ConsultaHistorico, ConsultaResultado
+        historico = ConsultaHistorico.objects.create(tipo='manual')
+        resultados = [self._resultado(0), self._resultado(1, uf='MG')]
+        ConsultaResultado.objects.bulk_create([ConsultaResultado.de_dict(historico.pk, i, r) for i, r in enumerate(resultados)])
+        lidos = historico.resultados()
+        self.assertEqual([(r['cnpj'], r['nome'], r['processo'], r['uf']) for r in lidos],
+                         [(r['cnpj'], r['nome'], r['processo'], r['uf']) for r in resultados])
+        self.assertEqual(lidos[1]['detalhes'], resultados[1]['detalhes'])
+        self.assertEqual([o for o, _ in historico.iter_resultados(filtros={'uf': 'MG'})], [1])
+        # Registros antigos (JSON no histórico) passam pelos mesmos filtros
+        antigo = ConsultaHistorico.objects.create(tipo='manual', resultado=resultados)
+        self.assertEqual([r['nome'] for _, r in antigo.iter_resultados(filtros={'uf': 'SP'})], ['Empresa 0'])
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'], JOB_CHECKPOINT_EVERY=100)
+class JobCancelarTests(TestCase):
+    def setUp(self):
+        import json
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+        self.cnpjs = [cnpj_de(66666666), cnpj_de(77777777), cnpj_de(88888888)]
+        resposta = self.client.post('/jobs/start/', data=json.dumps({'cnpjs': ','.join(self.cnpjs)}),
+                                    content_type='application/json', secure=True)
+        self.job_id = resposta.json()['job_id']
+
+    def test_cancelar_nao_grava_resultados_e_descarta_o_historico(self):
+        from ..models import ConsultaHistorico, ConsultaJob, ConsultaResultado
+        get = cnpja_falso({c: documento_cnpja(c) for c in self.cnpjs})
+        with mock.patch('requests.get', side_effect=get), mock.patch('consulta.views_async.DELAY_SECONDS', 0):
+            self.assertEqual(self.client.post('/jobs/step/', secure=True).json()['status'], 'running')
+        # O passo não atingiu o checkpoint: o resultado ainda está só na sessão
+        self.assertEqual(ConsultaResultado.objects.count(), 0)
+        with mock.patch('consulta.views._gravar_resultados') as gravar:
+            self.assertEqual(self.client.post('/jobs/cancel/', secure=True).json(), {'status': 'cancelled'})
+        gravar.assert_not_called()
+        self.assertFalse(ConsultaHistorico.objects.exists())
+        self.assertEqual(ConsultaResultado.objects.count(), 0)
+        registro = ConsultaJob.objects.get(pk=self.job_id)
+        self.assertEqual((registro.status, registro.processados, registro.estado), ('cancelled', 1, {}))
+        self.assertIsNone(registro.historico_id)
+        self.assertEqual(self.client.get('/jobs/pending/', secure=True).json(), {'jobs': []})
@@ -0,0 +1,166 @@
+"""Retenção do histórico."""
+
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .. import services
+from .auxiliares import cnpj_de, limpar_cache
+
+
+class RetencaoTests(TestCase):
+    """Arquivamento NDJSON gzip, exclusão em lotes e compactação de `detalhes`."""
+
+    def _execucao(self, dias, status='concluido', detalhes=None, n=2):
+        from datetime import timedelta
+        from django.utils import timezone
+        from ..models import ConsultaHistorico, ConsultaResultado
+        h = ConsultaHistorico.objects.create(tipo='upload', status=status, arquivo_nome='lista.xlsx')
+        ConsultaHistorico.objects.filter(pk=h.pk).update(data=timezone.now() - timedelta(days=dias))
+        ConsultaResultado.objects.bulk_create([
+            ConsultaResultado.de_dict(h.pk, i, {'cnpj': services.format_cnpj(cnpj_de(13000000 + i)), 'nome': f'Empresa {i}',
+                                                'detalhes': detalhes or {'taxId': cnpj_de(13000000 + i)}})
+            for i in range(n)
+        ])
+        return h
+
+    @override_settings(HISTORY_DELETE_BATCH_SIZE=1)
+    def test_arquiva_e_apaga_so_o_expirado(self):
+        import gzip
+        import json
+        import tempfile
+        from ..models import ConsultaHistorico, ConsultaJob, ConsultaResultado
+        from ..retencao import arquivar_historico
+        antiga = self._execucao(40)
+        em_job = self._execucao(40, status='andamento')
+        ConsultaJob.objects.create(status='paused', historico=em_job)
+        recente = self._execucao(1)
+        with tempfile.TemporaryDirectory() as destino:
+            resumo = arquivar_historico(destino=destino, dias=30)
+            with gzip.open(resumo['arquivo'], 'rt', encoding='utf-8') as arq:
+                linhas = [json.loads(l) for l in arq]
+        self.assertEqual((resumo['execucoes'], resumo['itens'], resumo['apagadas']), (1, 2, 1))
+        self.assertEqual({(l['historico_id'], l['ordem'], l['arquivo_nome']) for l in linhas},
+                         {(antiga.pk, 0, 'lista.xlsx'), (antiga.pk, 1, 'lista.xlsx')})
+        self.assertEqual(set(ConsultaHistorico.objects.values_list('pk', flat=True)), {em_job.pk, recente.pk})
+        self.assertFalse(ConsultaResultado.objects.filter(historico_id=antiga.pk).exists())
+
+    def test_sem_retencao_nada_expira(self):
+        from ..retencao import arquivar_historico
+        self._execucao(400)
+        self.assertEqual(arquivar_historico(dias=0)['execucoes'], 0)
+
+    def test_compacta_detalhes_repetidos(self):
+        from ..models import ConsultaResultado
+        from ..retencao import compactar_detalhes
+        iguais = {'taxId': cnpj_de(13000000), 'status': {'text': 'Ativa'}}
+        velha = self._execucao(10, detalhes=iguais, n=1)
+        nova = self._execucao(5, detalhes=iguais, n=1)
+        andamento = self._execucao(15, status='andamento', detalhes=iguais, n=1)
+        self.assertEqual(compactar_detalhes(), 1)
+        itens = {r.historico_id: r for r in ConsultaResultado.objects.all()}
+        self.assertIsNone(itens[velha.pk].detalhes)
+        self.assertEqual(itens[velha.pk].detalhes_de_id, itens[nova.pk].pk)
+        self.assertEqual(itens[nova.pk].detalhes, iguais)
+        self.assertEqual(itens[andamento.pk].detalhes, iguais)
+        self.assertEqual(velha.resultados()[0]['detalhes'], iguais)
+
+        # Uma cópia ainda mais nova: as antigas passam a apontar para ela
+        novissima = self._execucao(1, detalhes=iguais, n=1)
+        self.assertEqual(compactar_detalhes(), 1)
+        mantido = ConsultaResultado.objects.get(historico=novissima).pk
+        self.assertEqual(set(ConsultaResultado.objects.filter(historico__in=(velha, nova)).values_list('detalhes_de_id', flat=True)),
+                         {mantido})
+        self.assertEqual([r['detalhes'] for h in (velha, nova) for r in h.resultados()], [iguais, iguais])
+
+    def test_historico_compactado_no_arquivo_e_na_exclusao(self):
+        import gzip
+        import json
+        import tempfile
+        from ..models import ConsultaResultado
+        from ..retencao import apagar_em_lotes, arquivar_historico, compactar_detalhes
+        iguais = {'taxId': cnpj_de(13000000), 'status': {'text': 'Ativa'}}
+        antiga = self._execucao(40, detalhes=iguais, n=1)
+        media = self._execucao(20, detalhes=iguais, n=1)
+        recente = self._execucao(1, detalhes=iguais, n=1)
+        self.assertEqual(compactar_detalhes(), 2)
+        with tempfile.TemporaryDirectory() as destino:
+            resumo = arquivar_historico(destino=destino, dias=30)
+            with gzip.open(resumo['arquivo'], 'rt', encoding='utf-8') as arq:
+                linhas = [json.loads(l) for l in arq]
+        self.assertEqual([(l['historico_id'], l['detalhes']) for l in linhas], [(antiga.pk, iguais)])
+        # Apagar a execução com a cópia mantida devolve o JSON às que apontavam para ela
+        apagar_em_lotes([recente.pk])
+        item = ConsultaResultado.objects.get(historico=media)
+        self.assertEqual((item.detalhes, item.detalhes_de_id), (iguais, None))
+
+    def test_restaurar_job_com_itens_compactados(self):
+        from django.contrib.auth.models import User
+        from ..models import ConsultaJob, ConsultaResultado
+        from ..retencao import compactar_detalhes
+        cnpj = cnpj_de(13000000)
+        iguais = {'taxId': cnpj, 'status': {'text': 'Ativa'}}
+        user = User.objects.create_user('op', password='segredo-123')
+        self.client.force_login(user)
+        velha = self._execucao(10, detalhes=iguais, n=1)
+        self._execucao(5, detalhes=iguais, n=1)
+        self.assertEqual(compactar_detalhes(), 1)
+        registro = ConsultaJob.objects.create(
+            usuario=user, status='paused', total=2, processados=1, historico=velha,
+            estado={'queue': [{'cnpj': cnpj, 'processo': None}, {'cnpj': cnpj_de(13000001), 'processo': None}]},
+        )
+        self.assertIsNone(ConsultaResultado.objects.get(historico=velha).detalhes)
+        restaurado = self.client.post(f'/jobs/restore/{registro.pk}/', secure=True).json()
+        self.assertEqual([r['detalhes'] for r in restaurado['results']], [iguais])
+        # O item compactado é reaproveitado na retomada, não consultado de novo
+        self.assertEqual(self.client.session['job']['prefetched'][cnpj]['detalhes'], iguais)
+        self.assertEqual(self.client.get(f'/api/detalhes/{cnpj}/', secure=True).json(), iguais)
+
+    def test_fim_do_job_so_agenda_com_retencao_ligada(self):
+        from django.contrib.auth.models import User
+        from .auxiliares import cnpja_falso, documento_cnpja, iniciar_job
+        limpar_cache()
+        self.client.force_login(User.objects.create_user('op', password='segredo-123'))
+        cnpj = cnpj_de(13000000)
+        get = cnpja_falso({cnpj: documento_cnpja(cnpj)})
+        for dias, chamadas in ((0, 0), (30, 1)):
+            with self.settings(HISTORY_RETENTION_DAYS=dias, CNPJA_API_KEYS=['chave-teste'], CNPJA_FORCE_CACHE_FIRST=False), \
+                    mock.patch('requests.get', side_effect=get), mock.patch('consulta.views_async.DELAY_SECONDS', 0), \
+                    mock.patch('consulta.views.agendar_retencao') as agendar:
+                iniciar_job(self.client, [cnpj])
+                while self.client.post('/jobs/step/', secure=True).json()['status'] != 'done':
+                    pass
+                self.assertEqual(self.client.post('/jobs/finalize/', secure=True).json(), {'status': 'ok'})
+            self.assertEqual(agendar.call_count, chamadas)
+        limpar_cache()
+
+    @override_settings(HISTORY_RETENTION_DAYS=30, HISTORY_RETENTION_INTERVAL=3600)
+    def test_execucao_automatica_so_arquiva(self):
+        from ..retencao import agendar_retencao
+        limpar_cache()
+        with mock.patch('consulta.retencao.threading.Thread', side_effect=lambda target, **kw: mock.Mock(start=target)), \
+                mock.patch('consulta.retencao.connection'), \
+                mock.patch('consulta.retencao.converter_legado') as converter, \
+                mock.patch('consulta.retencao.compactar_detalhes') as compactar, \
+                mock.patch('consulta.retencao.arquivar_historico', return_value={'execucoes': 1}) as arquivar:
+            self.assertTrue(agendar_retencao())
+        arquivar.assert_called_once_with(destino=None, dias=None)
+        converter.assert_not_called()
+        compactar.assert_not_called()
+        limpar_cache()
+
+    @override_settings(HISTORY_RETENTION_INTERVAL=3600)
+    def test_agendamento_respeita_intervalo_e_trava(self):
+        from ..retencao import RETENCAO_EXECUTADA_KEY, RETENCAO_LOCK_KEY, agendar_retencao
+        limpar_cache()
+        with mock.patch('consulta.retencao.threading.Thread') as thread:
+            self.assertTrue(agendar_retencao())
+            self.assertFalse(agendar_retencao())
+            cache.delete(RETENCAO_LOCK_KEY)
+            cache.set(RETENCAO_EXECUTADA_KEY, time.time(), None)
+            self.assertFalse(agendar_retencao())
+            self.assertTrue(agendar_retencao(forcar=True))
+        self.assertEqual(thread.return_value.start.call_count, 2)
+        limpar_cache()
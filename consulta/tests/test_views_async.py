@@ -0,0 +1,99 @@
+"""Views assíncronas (ASGI)."""
+
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from clients.cnpja import id_chave
+
+from .. import services
+from .auxiliares import cnpj_de, documento_cnpja, limpar_cache, RespostaFalsa, cnpja_falso, iniciar_job
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class ViewsAssincronasTests(TestCase):
+    """Rotas de jobs, créditos, detalhes e consulta servidas por `views_async`."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.user = User.objects.create_user('op', password='segredo-123')
+
+    def test_rotas_assincronas(self):
+        import asyncio
+        from django.urls import resolve
+        for url in ('/jobs/step/', '/jobs/plan/', '/jobs/pause/', '/api/creditos/', f'/api/detalhes/{cnpj_de(1)}/', '/api/lote/'):
+            with self.subTest(url=url):
+                self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+
+    def test_metodo_e_login(self):
+        self.assertEqual(self.client.post('/jobs/step/', secure=True).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/jobs/step/', secure=True).status_code, 405)
+
+    def test_passo_espera_sem_bloquear_a_thread(self):
+        cnpj = cnpj_de(90909090)
+        self.client.force_login(self.user)
+        iniciar_job(self.client, [cnpj])
+        espera = mock.AsyncMock()
+        with mock.patch('requests.get', side_effect=cnpja_falso({cnpj: documento_cnpja(cnpj)})), \
+                mock.patch('consulta.views_async.asyncio.sleep', espera), \
+                mock.patch('time.sleep', side_effect=AssertionError('time.sleep no event loop')):
+            passo = self.client.post('/jobs/step/', secure=True).json()
+        self.assertEqual((passo['status'], passo['processed'], passo['item']['nome']), ('running', 1, 'Empresa'))
+        espera.assert_awaited_once()
+
+    def test_detalhes_gravados(self):
+        from ..models import ConsultaHistorico, ConsultaResultado
+        self.client.force_login(self.user)
+        gravado = cnpj_de(91919191)
+        historico = ConsultaHistorico.objects.create(tipo='manual')
+        ConsultaResultado.objects.create(historico=historico, ordem=0, cnpj=gravado, detalhes={'taxId': gravado, 'alias': 'X'})
+        resposta = self.client.get(f'/api/detalhes/{gravado}/', secure=True)
+        self.assertEqual(resposta.json()['alias'], 'X')
+        self.assertEqual(self.client.get(f'/api/detalhes/{cnpj_de(92929292)}/', secure=True).status_code, 404)
+        self.assertEqual(self.client.get('/api/detalhes/123/', secure=True).status_code, 400)
+
+    def test_creditos(self):
+        self.client.force_login(self.user)
+        with mock.patch('requests.get', return_value=RespostaFalsa(500, {'erro': 1})):
+            self.assertEqual(self.client.get('/api/creditos/', secure=True).status_code, 502)
+        cache.set(f"{services.CREDITOS_CACHE_KEY}:{id_chave('chave-teste')}", {'transient': 3, 'perpetual': 4}, None)
+        self.assertEqual(self.client.get('/api/creditos/', secure=True).json(), {'transient': 3, 'perpetual': 4})
+
+
+@override_settings(CNPJA_API_KEYS=['chave-teste'])
+class ConsultaCNPJAutenticacaoTests(TestCase):
+    """`/cnpj/<cnpj>/` (assíncrona) autentica como a APIView: sessão ou Basic."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        limpar_cache()
+        self.user = User.objects.create_user('api', password='segredo-123')
+        self.cnpj = cnpj_de(33333333)
+
+    def _get(self, **extra):
+        get = cnpja_falso({self.cnpj: documento_cnpja(self.cnpj, nome='ACME')})
+        with mock.patch('requests.get', side_effect=get):
+            return self.client.get(f'/cnpj/{self.cnpj}/', secure=True, **extra)
+
+    def test_basic_auth(self):
+        import base64
+        credenciais = base64.b64encode(b'api:segredo-123').decode()
+        resposta = self._get(HTTP_AUTHORIZATION=f'Basic {credenciais}')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['company']['name'], 'ACME')
+
+    def test_basic_auth_com_senha_errada(self):
+        import base64
+        credenciais = base64.b64encode(b'api:errada').decode()
+        self.assertIn(self._get(HTTP_AUTHORIZATION=f'Basic {credenciais}').status_code, (401, 403))
+
+    def test_sessao(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self._get().status_code, 200)
+
+    def test_sem_autenticacao(self):
+        self.assertEqual(self._get().status_code, 403)
@@ -0,0 +1,153 @@
+"""Leitor XLSX em streaming."""
+
+from django.test import SimpleTestCase
+
+from .. import services
+
+
+def _xlsx(planilhas, ativa=0):
+    """XLSX em memória gerado pelo openpyxl: {nome: [linhas]}."""
+    import io
+    import openpyxl
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in planilhas.items():
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    wb.active = ativa
+    arquivo = io.BytesIO()
+    wb.save(arquivo)
+    arquivo.seek(0)
+    arquivo.name = 'planilha.xlsx'
+    return arquivo
+
+
+def _xlsx_xml(linhas, strings=''):
+    """XLSX mínimo escrito à mão: uma planilha com as `<row>` de `linhas` e as `<si>` de `strings`."""
+    import io
+    import zipfile
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    arquivos = {
+        '[Content_Types].xml': '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>',
+        'xl/workbook.xml': (f'<workbook {ns} xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                            '<sheets><sheet name="P" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        'xl/_rels/workbook.xml.rels': ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                                       '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'),
+        'xl/sharedStrings.xml': f'<sst {ns}>{strings}</sst>',
+        'xl/worksheets/sheet1.xml': f'<worksheet {ns}><sheetData>{linhas}</sheetData></worksheet>',
+    }
+    arquivo = io.BytesIO()
+    with zipfile.ZipFile(arquivo, 'w') as z:
+        for nome, conteudo in arquivos.items():
+            z.writestr(nome, conteudo)
+    arquivo.seek(0)
+    return arquivo
+
+
+class LeitorXlsxTests(SimpleTestCase):
+    """Leitor enxuto (`consulta.xlsx`): mesmos valores do openpyxl `values_only`."""
+
+    def test_valores_iguais_aos_do_openpyxl(self):
+        import datetime
+        import openpyxl
+        from ..xlsx import LeitorXlsx
+        linhas = [
+            ['CNPJ', 'Processo', None, 'Valor'],
+            ['11.222.333/0001-81', '123/2024', None, 1.5],
+            [11222333000181, None, None, None],
+            [None, None, None, None],
+            [None, None, 'só no meio', True],
+            [datetime.datetime(2024, 5, 17, 10, 30), 42, None, -3],
+        ]
+        arquivo = _xlsx({'Dados': linhas})
+        wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        esperado = [tuple(v for v in r) for r in wb['Dados'].iter_rows(values_only=True)]
+        wb.close()
+        esperado = [r[:max(i + 1 for i, v in enumerate(r) if v is not None)] for r in esperado if any(v is not None for v in r)]
+        arquivo.seek(0)
+        leitor = LeitorXlsx(arquivo)
+        try:
+            obtido = list(leitor.linhas())
+        finally:
+            leitor.close()
+        self.assertEqual([valores for _, valores in obtido], esperado)
+        # Número das linhas preservado (a linha vazia 4 não aparece)
+        self.assertEqual([n for n, _ in obtido], [1, 2, 3, 5, 6])
+
+    def test_rich_text_inline_e_celulas_sem_valor(self):
+        from ..xlsx import LeitorXlsx
+        arquivo = _xlsx_xml('<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" s="0"/></row>'
+                            '<row r="2"><c r="A2" t="s"><v>1</v></c><c r="C2" t="inlineStr"><is><t>inline</t></is></c></row>'
+                            '<row r="3"><c r="A3" s="0"/><c r="B3"/></row>',
+                            '<si><t>CNPJ</t></si><si><r><t>11.222.</t></r><r><t>333/0001-81</t></r><rPh><t>x</t></rPh></si>')
+        leitor = LeitorXlsx(arquivo)
+        try:
+            self.assertEqual(list(leitor.linhas()), [(1, ('CNPJ',)), (2, ('11.222.333/0001-81', None, 'inline'))])
+        finally:
+            leitor.close()
+
+    def test_celulas_fora_de_ordem_vao_para_a_coluna_certa(self):
+        from ..xlsx import LeitorXlsx
+        arquivo = _xlsx_xml('<row r="1"><c r="C1"><v>3</v></c><c r="A1"><v>1</v></c><c r="B1" t="inlineStr"><is><t>b</t></is></c></row>')
+        leitor = LeitorXlsx(arquivo)
+        try:
+            self.assertEqual(list(leitor.linhas()), [(1, (1, 'b', 3))])
+        finally:
+            leitor.close()
+
+    def test_linhas_lidas_saem_da_arvore(self):
+        from unittest import mock
+        from xml.etree.ElementTree import iterparse
+        from .. import xlsx
+        elementos = []
+
+        def _iterparse(src, events=None):
+            for evento, el in iterparse(src, events=events):
+                elementos.append(el)
+                yield evento, el
+
+        arquivo = _xlsx_xml(''.join(f'<row r="{i}"><c r="A{i}" t="s"><v>0</v></c></row>' for i in range(1, 201)), '<si><t>x</t></si>')
+        with mock.patch('consulta.xlsx.iterparse', _iterparse):
+            leitor = xlsx.LeitorXlsx(arquivo)
+            try:
+                self.assertEqual(sum(1 for _ in leitor.linhas()), 200)
+            finally:
+                leitor.close()
+        raizes = {el.tag: el for el in elementos if el.tag in (xlsx.NS_MAIN + 'sst', xlsx.NS_MAIN + 'sheetData')}
+        self.assertEqual([len(el) for el in raizes.values()], [0, 0])
+
+    def test_arquivo_invalido_nao_e_suportado(self):
+        import io
+        from ..xlsx import LeitorXlsx, XlsxNaoSuportado
+        with self.assertRaises(XlsxNaoSuportado):
+            LeitorXlsx(io.BytesIO(b'nao sou um zip'))
+
+    def test_selecao_de_planilha(self):
+        arquivo = _xlsx({'Resumo': [['x']], 'Situação': [['CNPJ'], ['11222333000181']]}, ativa=0)
+        for sheet in ('Situação', 'situacao', '2'):
+            with self.subTest(sheet=sheet):
+                arquivo.seek(0)
+                self.assertEqual(services.extrair_itens_xlsx(arquivo, sheet=sheet), [{'cnpj': '11222333000181', 'processo': None}])
+        arquivo.seek(0)
+        self.assertEqual(services.extrair_itens_xlsx(arquivo), [])
+        arquivo.seek(0)
+        with self.assertRaisesMessage(ValueError, "Planilha 'Outra' não encontrada"):
+            services.extrair_itens_xlsx(arquivo, sheet='Outra')
+
+    def test_extrair_itens_por_cabecalho_e_por_varredura(self):
+        arquivo = _xlsx({'P': [
+            ['Número do Processo', 'CNPJ/CPF', 'Oportunidade'],
+            [123.0, 11222333000181, 'sim'],
+            ['456', '11.222.333/0001-81', None],
+            ['789', '123', 'curto'],
+        ]})
+        estatisticas = {}
+        itens = services.extrair_itens_xlsx(arquivo, estatisticas=estatisticas)
+        self.assertEqual(itens, [
+            {'cnpj': '11222333000181', 'processo': '123', 'oportunidade': 'sim'},
+            {'cnpj': '11222333000181', 'processo': '456', 'oportunidade': None},
+        ])
+        self.assertEqual(estatisticas, {'linhas': 3})
+        sem_cabecalho = _xlsx({'P': [['texto 11.222.333/0001-81 e 11222333000181'], [1234], [11222333000181]]})
+        self.assertEqual([i['cnpj'] for i in services.extrair_itens_xlsx(sem_cabecalho)], ['11222333000181'] * 3)
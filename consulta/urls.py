@@ -2,10 +2,18 @@
 
 Inclui rotas para autenticação, home, exportações, APIs auxiliares e
 endpoints de processamento em lote por polling (jobs_*).
+
+Com `ASYNC_VIEWS` ligado (padrão), jobs, créditos, detalhes, /cnpj/<cnpj>/ e /api/lote/ usam as
+versões assíncronas de `views_async` (mesmas respostas, sem prender o processo na espera).
 """
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+v = views_async if getattr(settings, 'ASYNC_VIEWS', True) else views
+consulta_cnpj = views_async.consulta_cnpj if v is views_async else views.ConsultaCNPJView.as_view()
+consulta_lote = views_async.consulta_lote if v is views_async else views.ConsultaLoteView.as_view()
 
 urlpatterns = [
     # Auth
@@ -16,15 +24,25 @@ urlpatterns = [
     path('export/resultado/xlsx/', views.export_resultado_xlsx, name='export_resultado_xlsx'),
     path('export/historico/csv/', views.export_historico_csv, name='export_historico_csv'),
     path('export/historico/xlsx/', views.export_historico_xlsx, name='export_historico_xlsx'),
+    path('export/historico/delta/', v.export_historico_delta, name='export_historico_delta'),
     path('status-retry/', views.status_retry, name='status_retry'),
-    path('api/creditos/', views.api_creditos, name='api_creditos'),
-    path('api/detalhes/<str:cnpj>/', views.api_detalhes, name='api_detalhes'),
-    path('cnpj/<str:cnpj>/', views.ConsultaCNPJView.as_view(), name='consulta_cnpj'),
+    path('api/creditos/', v.api_creditos, name='api_creditos'),
+    path('api/throughput/', views.api_throughput, name='api_throughput'),
+    path('api/banco/', views.api_banco, name='api_banco'),
+    path('saude/', views.saude, name='saude'),
+    path('api/detalhes/<str:cnpj>/', v.api_detalhes, name='api_detalhes'),
+    path('cnpj/<str:cnpj>/', consulta_cnpj, name='consulta_cnpj'),
+    path('api/lote/', consulta_lote, name='consulta_lote'),
     # Streaming simples via polling (controle de job na sessão)
-    path('jobs/start/', views.jobs_start, name='jobs_start'),
-    path('jobs/step/', views.jobs_step, name='jobs_step'),
-    path('jobs/finalize/', views.jobs_finalize, name='jobs_finalize'),
-    path('jobs/pause/', views.jobs_pause, name='jobs_pause'),
-    path('jobs/resume/', views.jobs_resume, name='jobs_resume'),
-    path('jobs/cancel/', views.jobs_cancel, name='jobs_cancel'),
+    path('jobs/start/', v.jobs_start, name='jobs_start'),
+    path('jobs/analyze/', v.jobs_analyze, name='jobs_analyze'),
+    path('jobs/plan/', v.jobs_plan, name='jobs_plan'),
+    path('jobs/step/', v.jobs_step, name='jobs_step'),
+    path('jobs/finalize/', v.jobs_finalize, name='jobs_finalize'),
+    path('jobs/pause/', v.jobs_pause, name='jobs_pause'),
+    path('jobs/resume/', v.jobs_resume, name='jobs_resume'),
+    path('jobs/cancel/', v.jobs_cancel, name='jobs_cancel'),
+    # Checkpoints: retomada de jobs após crash/deploy
+    path('jobs/pending/', v.jobs_pending, name='jobs_pending'),
+    path('jobs/restore/<int:job_id>/', v.jobs_restore, name='jobs_restore'),
 ]
@@ -10,10 +10,17 @@ Este módulo contém:
 
 from django.http import JsonResponse
 from django.shortcuts import render
-from .models import ConsultaHistorico
+from .models import ConsultaHistorico, ConsultaJob, ConsultaResultado
 import logging
-from django.http import HttpResponse
-from .services import clean_cnpj, format_cnpj, consultar_cnpj_api, processar_csv, processar_xlsx, exportar_csv, exportar_xlsx, processar_cnpjs_manualmente
+from django.http import HttpResponse, StreamingHttpResponse
+from .services import clean_cnpj, format_cnpj, consultar_cnpj_api, processar_csv, processar_xlsx, extrair_itens_csv, extrair_itens_xlsx, exportar_csv, exportar_xlsx, processar_cnpjs_manualmente
+from .services import planejar_consultas, saldo_creditos, estimar_creditos, analisar_itens
+from .services import agrupar_por_raiz, buscar_por_raiz, raiz_cnpj, resolver_base_local
+from .services import creditos_atuais, reconciliar_creditos, agendar_reconciliacao_creditos
+from .services import estatisticas_throughput, fluxos_em_andamento, uso_chaves, obter_office, consultar_lote
+from .retencao import agendar_retencao, apagar_em_lotes
+from .logs import AMOSTRAR
+from .projecao import arquivar_documentos, campos_da_requisicao, documento_completo, projetar
 from clients.cnpja import CNPJAClient, CNPJAClientError
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -22,21 +29,34 @@ from .serializers import CNPJQuerySerializer
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+import csv
+import hashlib
 import json
+from datetime import datetime, timedelta, timezone as dt_timezone
 import re
+import time
+from importlib import import_module
 from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
 from django.views.decorators.http import require_GET
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
 from .forms import ConsultaForm  # existing
 from .forms import LoginForm
 from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
 import os
 
+logger_jobs = logging.getLogger('consulta.jobs')
+logger_banco = logging.getLogger('consulta.banco')
+
 @login_required(login_url='login')
 def status_retry(request):
 	"""Retorna o status textual do último retry registrado na sessão.
@@ -59,14 +79,16 @@ def home(request):
 	"""
 	error_msg = None
 	resultados = []
-	historico = ConsultaHistorico.objects.order_by('-data')[:30]
+	historico = _historico_concluido()[:30]
 	if request.method == 'POST':
 		if request.POST.get('limpar_historico') == '1':
-			ConsultaHistorico.objects.all().delete()
+			# Jobs em andamento mantêm seu registro (os resultados são gravados nele);
+			# exclusão em lotes curtos para não travar as tabelas com históricos grandes
+			apagar_em_lotes(ConsultaHistorico.objects.filter(status='concluido').values_list('pk', flat=True))
 			historico = []
 			context = {'resultados': [], 'historico': historico, 'msg': 'Histórico apagado com sucesso!'}
 			return render(request, 'consulta/home.html', context)
-		logger = logging.getLogger('consulta')
+		logger = logging.getLogger('consulta.upload')
 		cnpjs = request.POST.get('cnpjs', '').strip()
 		csv_file = request.FILES.get('csv_file')
 		tipo = None
@@ -77,7 +99,7 @@ def home(request):
 
 		if cnpjs:
 			tipo = 'manual'
-			cnpj_list, resultados = processar_cnpjs_manualmente(cnpjs, on_retry=on_retry)
+			cnpj_list, resultados = processar_cnpjs_manualmente(cnpjs, on_retry=on_retry, usuario=request.user.get_username())
 			cnpjs_registro = ','.join(cnpj_list)
 		elif csv_file:
 			# Validação server-side do tipo de upload
@@ -92,12 +114,12 @@ def home(request):
 				tipo = 'upload'
 				if fname_lower.endswith('.csv'):
 					try:
-						resultados = processar_csv(csv_file, logger=logger, on_retry=on_retry)
+						resultados = processar_csv(csv_file, logger=logger, on_retry=on_retry, usuario=request.user.get_username())
 					except Exception as e:
 						error_msg = f'Erro ao processar o arquivo: {str(e)}'
 				elif fname_lower.endswith('.xlsx'):
 					try:
-						resultados = processar_xlsx(csv_file, logger=logger, on_retry=on_retry)
+						resultados = processar_xlsx(csv_file, logger=logger, on_retry=on_retry, usuario=request.user.get_username(), sheet=request.POST.get('sheet'))
 					except Exception as e:
 						error_msg = f'Erro ao processar o arquivo: {str(e)}'
 				else:
@@ -107,12 +129,7 @@ def home(request):
 		# Salvar histórico se houver resultados (ou erro); sempre como lista
 		if (tipo and (resultados or error_msg)):
 			payload_result = resultados if resultados else [{'cnpj': '-', 'nome': '-', 'email': f'Erro: {error_msg}'}]
-			ConsultaHistorico.objects.create(
-				tipo=tipo,
-				cnpjs=cnpjs_registro,
-				arquivo_nome=csv_file.name if tipo == 'upload' and csv_file else None,
-				resultado=payload_result
-			)
+			_criar_historico(tipo, cnpjs_registro, csv_file.name if tipo == 'upload' and csv_file else None, payload_result)
 		# Salvar resultados atuais na sessão para exportação
 		request.session['ultimos_resultados'] = resultados
 	context = {'resultados': resultados, 'historico': historico}
@@ -121,6 +138,23 @@ def home(request):
 	return render(request, 'consulta/home.html', context)
 
 
+def _historico_concluido():
+	"""Execuções concluídas, mais recentes primeiro, com os itens de resultado pré-carregados."""
+	return ConsultaHistorico.objects.filter(status='concluido').order_by('-data').prefetch_related('itens')
+
+
+def _criar_historico(tipo, cnpjs, arquivo_nome, resultados):
+	"""Cria uma execução concluída com seus resultados em lote (uma linha por item)."""
+	with transaction.atomic():
+		historico = ConsultaHistorico.objects.create(tipo=tipo, cnpjs=cnpjs, arquivo_nome=arquivo_nome)
+		ConsultaResultado.objects.bulk_create(
+			[ConsultaResultado.de_dict(historico.pk, i, r) for i, r in enumerate(resultados)],
+			batch_size=getattr(settings, 'JOB_RESULTS_BATCH_SIZE', 500),
+		)
+		arquivar_documentos(r.get('cnpj') for r in resultados if r.get('detalhes') is not None)
+	return historico
+
+
 @login_required(login_url='login')
 def export_resultado_csv(request):
 	"""Exporta os últimos resultados da sessão como CSV (sem coluna Data)."""
@@ -144,10 +178,9 @@ def export_resultado_xlsx(request):
 @login_required(login_url='login')
 def export_historico_csv(request):
 	"""Exporta todo o histórico do banco como CSV (inclui coluna Data)."""
-	historico = ConsultaHistorico.objects.order_by('-data')
 	resultados = []
-	for h in historico:
-		for r in h.resultado:
+	for h in _historico_concluido().iterator(chunk_size=50):
+		for r in h.resultados():
 			r_cpy = r.copy()
 			r_cpy['data'] = h.data.strftime('%d/%m/%y')
 			resultados.append(r_cpy)
@@ -160,10 +193,9 @@ def export_historico_csv(request):
 @login_required(login_url='login')
 def export_historico_xlsx(request):
 	"""Exporta todo o histórico do banco como XLSX (inclui coluna Data)."""
-	historico = ConsultaHistorico.objects.order_by('-data')
 	resultados = []
-	for h in historico:
-		for r in h.resultado:
+	for h in _historico_concluido().iterator(chunk_size=50):
+		for r in h.resultados():
 			r_cpy = r.copy()
 			r_cpy['data'] = h.data.strftime('%d/%m/%y')
 			resultados.append(r_cpy)
@@ -173,47 +205,221 @@ def export_historico_xlsx(request):
 	return response
 
 
+# Exportação incremental: cursor (data de conclusão, id) sobre o índice (status, data)
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Execuções concluídas há menos que isso ainda não saem no delta: uma transação de
+# finalize que começou antes (data menor) pode não ter sido confirmada
+_DELTA_ATRASO = timedelta(seconds=30)
+_DELTA_CAMPOS = ('historico_id', 'data', 'tipo', 'arquivo_nome', 'ordem', 'processo', 'cnpj',
+	'dsevento', 'oportunidade', 'substancias', 'nome', 'email', *ConsultaResultado.CAMPOS_EXTRAIDOS)
+# Filtros do delta (parâmetro GET -> coluna de ConsultaResultado)
+_DELTA_FILTROS = {'uf': 'uf', 'situacao': 'situacao', 'cnae': 'cnae_principal'}
+
+
+class _Eco:
+	"""Buffer do csv.writer que devolve a linha em vez de acumular (streaming)."""
+	def write(self, valor):
+		return valor
+
+
+def _cursor_delta(data, pk):
+	return f"{(data - _EPOCH) // timedelta(microseconds=1)}_{pk}"
+
+
+def _ler_cursor_delta(valor):
+	"""`since` -> (data, pk). Aceita o cursor devolvido pelo endpoint ou uma data/hora ISO."""
+	valor = (valor or '').strip()
+	if not valor:
+		return None
+	micros, sep, pk = valor.partition('_')
+	if sep and micros.isdigit() and pk.isdigit():
+		return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+	quando = parse_datetime(valor)
+	if quando is None:
+		dia = parse_date(valor)
+		quando = datetime(dia.year, dia.month, dia.day) if dia else None
+	if quando is None:
+		raise ValueError(valor)
+	if timezone.is_naive(quando):
+		quando = timezone.make_aware(quando)
+	return quando, 0
+
+
+def _delta_historico(request):
+	"""Monta a exportação incremental; retorna `(erro, None)` ou `(None, resposta_info)`.
+
+	`resposta_info` = (gerador, content_type, nome_arquivo, proximo_cursor, tem_mais). O
+	gerador lê as execuções em blocos e os itens com `iterator()` (memória constante).
+	"""
+	formato = (request.GET.get('format') or 'ndjson').lower()
+	if formato not in ('ndjson', 'csv'):
+		return JsonResponse({'detail': "format deve ser 'ndjson' ou 'csv'"}, status=400), None
+	try:
+		cursor = _ler_cursor_delta(request.GET.get('since'))
+	except (ValueError, OverflowError):
+		return JsonResponse({'detail': 'since inválido: use o cursor devolvido em X-Next-Cursor ou uma data ISO'}, status=400), None
+	try:
+		limite = min(max(int(request.GET.get('limit') or 100), 1), 1000)
+	except ValueError:
+		return JsonResponse({'detail': 'limit deve ser um inteiro'}, status=400), None
+	com_detalhes = request.GET.get('detalhes') == '1'
+	filtros = {coluna: request.GET[p].strip() for p, coluna in _DELTA_FILTROS.items() if request.GET.get(p, '').strip()}
+	if 'uf' in filtros:
+		filtros['uf'] = filtros['uf'].upper()
+	if 'cnae_principal' in filtros and not filtros['cnae_principal'].isdigit():
+		return JsonResponse({'detail': 'cnae deve ser numérico'}, status=400), None
+
+	qs = ConsultaHistorico.objects.filter(status='concluido', data__lte=timezone.now() - _DELTA_ATRASO)
+	if cursor:
+		qs = qs.filter(Q(data__gt=cursor[0]) | Q(data=cursor[0], pk__gt=cursor[1]))
+	execucoes = list(qs.order_by('data', 'pk').values_list('pk', 'data')[:limite + 1])
+	tem_mais = len(execucoes) > limite
+	execucoes = execucoes[:limite]
+	if execucoes:
+		proximo = _cursor_delta(execucoes[-1][1], execucoes[-1][0])
+	else:
+		proximo = _cursor_delta(*cursor) if cursor else ''
+	ids = [pk for pk, _ in execucoes]
+
+	def _itens():
+		for i in range(0, len(ids), 50):
+			for h in ConsultaHistorico.objects.filter(pk__in=ids[i:i + 50]).order_by('data', 'pk'):
+				meta = {'historico_id': h.pk, 'data': h.data.isoformat(), 'tipo': h.tipo, 'arquivo_nome': h.arquivo_nome}
+				for ordem, r in h.iter_resultados(filtros=filtros):
+					yield {**meta, 'ordem': ordem, **{k: r.get(k) for k in _DELTA_CAMPOS[5:]}}, r.get('detalhes')
+
+	if formato == 'csv':
+		def _gerar():
+			escritor = csv.writer(_Eco())
+			yield escritor.writerow(_DELTA_CAMPOS)
+			for item, _ in _itens():
+				yield escritor.writerow(['' if item[k] is None else item[k] for k in _DELTA_CAMPOS])
+		return None, (_gerar(), 'text/csv; charset=utf-8', 'historico-delta.csv', proximo, tem_mais)
+
+	def _gerar():
+		for item, detalhes in _itens():
+			if com_detalhes:
+				item['detalhes'] = detalhes
+			yield json.dumps(item, ensure_ascii=False, default=str) + '\n'
+	return None, (_gerar(), 'application/x-ndjson; charset=utf-8', 'historico-delta.ndjson', proximo, tem_mais)
+
+
+def _resposta_delta(conteudo, content_type, nome, proximo, tem_mais):
+	response = StreamingHttpResponse(conteudo, content_type=content_type)
+	response['Content-Disposition'] = f'attachment; filename="{nome}"'
+	response['X-Next-Cursor'] = proximo
+	response['X-Has-More'] = '1' if tem_mais else '0'
+	response['Cache-Control'] = 'no-store'
+	return response
+
+
+@require_GET
+@login_required(login_url='login')
+def export_historico_delta(request):
+	"""Exporta só os itens de execuções concluídas depois do cursor `since` (NDJSON ou CSV).
+
+	GET params: `since` (cursor de `X-Next-Cursor` ou data ISO; vazio = desde o início),
+	`format` (`ndjson` | `csv`), `limit` (execuções por resposta, até 1000), `detalhes=1`
+	(inclui o JSON do CNPJÁ no NDJSON) e os filtros `uf`, `situacao` e `cnae` (colunas
+	extraídas, indexadas). Resposta em streaming; o próximo cursor vem no
+	cabeçalho `X-Next-Cursor` e `X-Has-More: 1` indica que há mais execuções a buscar.
+	"""
+	erro, info = _delta_historico(request)
+	if erro is not None:
+		return erro
+	return _resposta_delta(*info)
+
+
 @require_GET
 @login_required(login_url='login')
 def api_creditos(request):
-	"""Retorna créditos CNPJÁ com cache de 24h. Force refresh com ?refresh=1."""
-	cache_key = 'cnpja_creditos_v1'
+	"""Retorna o saldo de créditos CNPJÁ rastreado localmente.
+
+	O saldo é o último snapshot de /credit menos o consumo registrado a cada consulta.
+	A reconciliação com /credit roda em background (periódica ou forçada com ?refresh=1);
+	só há chamada síncrona quando ainda não existe nenhum snapshot em cache.
+	"""
 	refresh = request.GET.get('refresh') == '1'
-	data = cache.get(cache_key)
-	if data is None or refresh:
+	data = creditos_atuais()
+	if data is None:
 		try:
-			client = CNPJAClient()
-			data = client.get_credits(timeout=15)
-			# TTL de 24h = 86400s
-			cache.set(cache_key, data, timeout=86400)
+			data = reconciliar_creditos()
 		except Exception as e:
-			if data is None:
-				return JsonResponse({'detail': f'Não foi possível obter créditos: {str(e)}'}, status=502)
-			# Se já existe cache, retorna cache mesmo em erro
+			return JsonResponse({'detail': f'Não foi possível obter créditos: {str(e)}'}, status=502)
+	else:
+		agendar_reconciliacao_creditos(forcar=refresh)
 	return JsonResponse(data, safe=False)
 
 
-def _refresh_creditos_cache_silently():
-	"""Atualiza o cache de créditos sem falhar a requisição chamadora."""
+
+@require_GET
+@login_required(login_url='login')
+def api_throughput(request):
+	"""Vazão de consultas à API por usuário e fluxos que disputam o orçamento agora.
+
+	Usuários staff veem todos os usuários e o uso de cada chave da API; os demais, apenas
+	a própria vazão.
+	"""
+	if request.user.is_staff:
+		return JsonResponse({'usuarios': estatisticas_throughput(), 'fluxos': fluxos_em_andamento(), 'chaves': uso_chaves()})
+	return JsonResponse({'usuarios': estatisticas_throughput([request.user.get_username()])})
+
+
+@require_http_methods(['GET', 'HEAD'])
+def saude(request):
+	"""Health check para a plataforma/balanceador: 200 se o banco responde, 503 se não.
+
+	Sem login; não expõe detalhes do erro (ficam no log).
+	"""
+	inicio = time.perf_counter()
 	try:
-		client = CNPJAClient()
-		data = client.get_credits(timeout=15)
-		cache.set('cnpja_creditos_v1', data, timeout=86400)
-	except Exception:
-		pass
+		with connection.cursor() as cursor:
+			cursor.execute('SELECT 1')
+	except DatabaseError as e:
+		logger_banco.warning('[SAUDE] Banco indisponível: %s', e)
+		return JsonResponse({'status': 'erro', 'banco': 'indisponível'}, status=503)
+	return JsonResponse({'status': 'ok', 'banco_ms': round((time.perf_counter() - inicio) * 1000, 1)})
+
+
+@require_GET
+@login_required(login_url='login')
+def api_banco(request):
+	"""Métricas do pool de conexões deste processo (staff)."""
+	if not request.user.is_staff:
+		return JsonResponse({'detail': 'Apenas staff.'}, status=403)
+	from .banco.pool import metricas_pools
 
+	banco = settings.DATABASES['default']
+	return JsonResponse({
+		'pid': os.getpid(),
+		'engine': banco.get('ENGINE'),
+		'conn_max_age': banco.get('CONN_MAX_AGE'),
+		'pools': metricas_pools(),
+	})
 
 
 @require_GET
 @login_required(login_url='login')
 def api_detalhes(request, cnpj: str):
-    """Retorna o JSON completo salvo para um CNPJ (prioriza sessão atual, depois histórico do banco)."""
+    """Retorna o JSON salvo para um CNPJ (prioriza sessão atual, depois histórico do banco).
+
+    O JSON guardado já vem projetado (`CNPJ_CAMPOS_ARMAZENADOS`). `?fields=a,b.c` projeta a
+    resposta; `?fields=*` devolve o documento completo (cache compartilhado ou armazenamento
+    frio), caindo no guardado se não houver.
+    """
     def _digits(s: str) -> str:
         return ''.join(ch for ch in (s or '') if ch.isdigit())
 
     target = _digits(cnpj)
     if len(target) != 14:
         return JsonResponse({'detail': 'CNPJ inválido'}, status=400)
+    campos = campos_da_requisicao(request)
+
+    # 0) Documento completo, quando pedido
+    if campos and '*' in campos:
+        det = documento_completo(target)
+        if det is not None:
+            return JsonResponse(det, safe=False)
 
     # 1) Prioriza resultados do job na sessão (ainda não persistidos)
     job = request.session.get('job') or {}
@@ -221,23 +427,51 @@ def api_detalhes(request, cnpj: str):
         if _digits(item.get('cnpj')) == target:
             det = item.get('detalhes')
             if det is not None:
-                return JsonResponse(det, safe=False)
+                return JsonResponse(projetar(det, campos), safe=False)
+
+    # 2) Procura nos resultados gravados (índice por CNPJ), do mais recente ao mais antigo
+    det = _detalhes_gravados().filter(cnpj=target).values_list('json_detalhes', flat=True).first()
+    if det is not None:
+        return JsonResponse(projetar(det, campos), safe=False)
 
-    # 2) Procura no histórico do banco (mais recente primeiro)
-    qs = ConsultaHistorico.objects.order_by('-data')[:200]
+    # 3) Registros antigos com o resultado em JSON (mais recente primeiro)
+    qs = ConsultaHistorico.objects.exclude(resultado=[]).order_by('-data')[:200]
     for h in qs:
         for r in (h.resultado or []):
             try:
                 if _digits(r.get('cnpj')) == target and r.get('detalhes') is not None:
-                    return JsonResponse(r.get('detalhes'), safe=False)
+                    return JsonResponse(projetar(r.get('detalhes'), campos), safe=False)
             except Exception:
                 continue
 
     return JsonResponse({'detail': 'Detalhes não encontrados para este CNPJ.'}, status=404)
 
 
+def _detalhes_gravados():
+	"""Resultados com JSON de detalhes (`json_detalhes`), do histórico mais recente ao mais antigo.
+
+	Itens compactados pela retenção trazem o JSON do item que apontam (`detalhes_de`).
+	"""
+	return (
+		ConsultaResultado.objects.filter(ConsultaResultado.com_detalhes())
+		.annotate(json_detalhes=Coalesce('detalhes', 'detalhes_de__detalhes'))
+		.order_by('-historico__data', '-pk')
+	)
+
+
+def _etag_payload(data):
+	"""ETag forte derivado do conteúdo JSON (independe da ordem das chaves)."""
+	raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+	return '"' + hashlib.md5(raw).hexdigest() + '"'
+
+
 class ConsultaCNPJView(APIView):
-	"""GET /cnpj/<cnpj>/ retorna o JSON completo da API PRO do CNPJÁ."""
+	"""GET /cnpj/<cnpj>/ retorna o JSON completo da API PRO do CNPJÁ (ou só `?fields=a,b.c`).
+
+	Servido do cache compartilhado por CNPJ (read-through); requisições simultâneas do
+	mesmo CNPJ geram uma única chamada à API. Responde com ETag/Cache-Control e 304
+	quando o navegador já tem o mesmo conteúdo.
+	"""
 	permission_classes = [IsAuthenticated]
 	def get(self, request, cnpj: str):
 		s = CNPJQuerySerializer(data={'cnpj': cnpj})
@@ -245,23 +479,105 @@ class ConsultaCNPJView(APIView):
 			return Response(s.errors, status=status.HTTP_400_BAD_REQUEST)
 		cnpj_digits = s.validated_data['cnpj']
 		try:
-			client = CNPJAClient()
-			data = client.get_office(cnpj_digits)
-			return Response(data, status=status.HTTP_200_OK)
+			data = obter_office(cnpj_digits, usuario=request.user.get_username())
 		except CNPJAClientError as e:
 			return Response({ 'detail': str(e) }, status=status.HTTP_400_BAD_REQUEST)
 		except Exception:
 			return Response({ 'detail': 'Erro interno ao consultar CNPJ' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+		data = projetar(data, campos_da_requisicao(request) or ('*',))
+		etag = _etag_payload(data)
+		headers = {
+			'ETag': etag,
+			'Cache-Control': f"private, max-age={getattr(settings, 'CNPJ_HTTP_MAX_AGE', 300)}",
+		}
+		if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+			return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+		return Response(data, status=status.HTTP_200_OK, headers=headers)
 
 
-# --------- Abordagem simples com polling (sem Celery) ---------
+def _itens_lote(dados):
+	"""Valida o corpo de `POST /api/lote/`; retorna `(erro, itens, com_detalhes)`.
 
-def _init_job_session(request, items):
-	"""Inicializa a estrutura de job na sessão.
+	Aceita `{"itens": [...], "detalhes": true}` ou a lista direto. Cada item é um CNPJ
+	(string) ou `{cnpj, processo, dsevento, oportunidade, substancias}`. Itens repetidos
+	não são removidos (cada um tem sua linha), mas o CNPJ é consultado uma vez.
+	"""
+	com_detalhes = True
+	if isinstance(dados, dict):
+		com_detalhes = dados.get('detalhes', True) not in (False, 0, '0', 'false')
+		dados = dados.get('itens', dados.get('cnpjs'))
+	if not isinstance(dados, list) or not dados:
+		return 'Envie {"itens": [...]} com CNPJs (strings) ou objetos {cnpj, processo}.', None, com_detalhes
+	limite = getattr(settings, 'API_LOTE_MAX_ITENS', 1000)
+	if len(dados) > limite:
+		return f'Máximo de {limite} itens por lote (recebidos {len(dados)}).', None, com_detalhes
+	itens = []
+	for it in dados:
+		if isinstance(it, dict):
+			item = {'cnpj': clean_cnpj(str(it.get('cnpj') or '')), 'processo': it.get('processo') or None}
+			for k in ('dsevento', 'oportunidade', 'substancias'):
+				if it.get(k) is not None:
+					item[k] = it[k]
+		elif isinstance(it, (str, int)):
+			item = {'cnpj': clean_cnpj(str(it)), 'processo': None}
+		else:
+			return 'Cada item deve ser um CNPJ (string) ou um objeto {cnpj, processo}.', None, com_detalhes
+		itens.append(item)
+	return None, itens, com_detalhes
 
-	Normaliza `items` (strings ou dicts {cnpj, processo}), aplica deduplicação por par
-	(cnpj, processo), e registra contadores/estado para o loop de processamento.
+
+def _linhas_lote(itens, usuario, com_detalhes, locais=None):
+	"""Gerador NDJSON de `POST /api/lote/`: uma linha por item, na ordem de conclusão,
+	e por fim `{"resumo": ...}` (a ausência dela indica resposta interrompida).
+	`locais`: base local já resolvida na thread da requisição (ver `consultar_lote`)."""
+	interativo = len({i['cnpj'] for i in itens}) <= getattr(settings, 'RATE_LIMIT_INTERATIVO_MAX_ITENS', 50)
+	resumo = {'total': len(itens), 'ok': 0, 'erros': 0, 'invalidos': 0}
+	for indice, item, resultado, via in consultar_lote(itens, usuario=usuario, interativo=interativo, locais=locais):
+		linha = {'indice': indice, **item, 'cnpj': format_cnpj(item['cnpj']) if len(item['cnpj']) == 14 else item['cnpj'], 'via': via}
+		if resultado is None:
+			resumo['invalidos'] += 1
+			linha.update(status='erro', erro='CNPJ inválido (dígitos verificadores)')
+		elif resultado.get('detalhes') is None:
+			resumo['erros'] += 1
+			linha.update(status='erro', erro=resultado.get('email'))
+		else:
+			resumo['ok'] += 1
+			linha.update({k: v for k, v in resultado.items() if k not in ('cnpj', 'detalhes')}, status='ok')
+			if com_detalhes:
+				linha['detalhes'] = resultado['detalhes']
+		yield json.dumps(linha, ensure_ascii=False, default=str) + '\n'
+	yield json.dumps({'resumo': resumo}, ensure_ascii=False) + '\n'
+
+
+def _resposta_lote(conteudo):
+	response = StreamingHttpResponse(conteudo, content_type='application/x-ndjson; charset=utf-8')
+	response['Cache-Control'] = 'no-store'
+	# Proxies (nginx) não devem acumular a resposta: o cliente lê cada linha ao chegar
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+
+class ConsultaLoteView(APIView):
+	"""POST /api/lote/ consulta vários CNPJs e devolve NDJSON à medida que cada um fica pronto.
+
+	Mesmo pipeline dos jobs (`consultar_lote`): CNPJs repetidos consultados uma vez, cache
+	compartilhado e CACHE-only antes, online com rate limit no fluxo `api:<usuario>`.
+	Cada linha traz `indice` (posição na entrada), `status` (`ok` | `erro`), `via` e os
+	campos do resultado (`detalhes` com o JSON do CNPJÁ, salvo `"detalhes": false`).
 	"""
+	permission_classes = [IsAuthenticated]
+
+	def post(self, request):
+		erro, itens, com_detalhes = _itens_lote(request.data)
+		if erro:
+			return Response({'detail': erro}, status=status.HTTP_400_BAD_REQUEST)
+		return _resposta_lote(_linhas_lote(itens, request.user.get_username(), com_detalhes))
+
+
+# --------- Abordagem simples com polling (sem Celery) ---------
+
+def _normalizar_itens(items):
+	"""Normaliza `items` (strings ou dicts {cnpj, processo}) e deduplica pares (cnpj, processo)."""
 	# items pode ser lista de strings (cnpj) ou dicts {cnpj, processo}
 	normalized = []
 	seen = set()  # dedup apenas pares idênticos (cnpj, processo)
@@ -284,6 +600,16 @@ def _init_job_session(request, items):
 			if c and key not in seen:
 				normalized.append({'cnpj': c, 'processo': None})
 				seen.add(key)
+	return normalized
+
+
+def _init_job_session(request, items):
+	"""Inicializa a estrutura de job na sessão.
+
+	Normaliza `items` (ver `_normalizar_itens`) e registra contadores/estado para o
+	loop de processamento.
+	"""
+	normalized = _normalizar_itens(items)
 	job = {
 		'queue': normalized,
 		'processed': 0,
@@ -293,16 +619,107 @@ def _init_job_session(request, items):
 		'tipo': None,
 		'arquivo_nome': None,
 		'cnpjs_str': ','.join([i['cnpj'] for i in normalized]),
+		# Planejamento (jobs_plan): CNPJs distintos pendentes de verificação no cache,
+		# misses que exigirão consulta online e resultados já obtidos por CNPJ (reuso).
+		'plan': {
+			'pending': list(dict.fromkeys(i['cnpj'] for i in normalized)),
+			'misses': [],
+			'cached': 0,
+			'distinct': len(set(i['cnpj'] for i in normalized)),
+			'done': False,
+		},
+		'prefetched': {},
 	}
 	request.session['job'] = job
 	request.session.modified = True
 	return job
 
 
-@require_http_methods(["POST"])
-@login_required(login_url='login')
-def jobs_start(request):
-	"""Inicia um job a partir de CSV/XLSX ou lista manual de CNPJs, salvando na sessão."""
+def _criar_checkpoint_job(request, job):
+	"""Cria o registro de checkpoint (ConsultaJob) do job recém-iniciado e guarda o id na sessão."""
+	try:
+		with transaction.atomic():
+			# Execução em andamento: recebe os resultados em lotes a cada checkpoint
+			historico = ConsultaHistorico.objects.create(
+				tipo=job.get('tipo') or 'manual',
+				status='andamento',
+				cnpjs=job.get('cnpjs_str') or '',
+				arquivo_nome=job.get('arquivo_nome'),
+			)
+			job.update({'historico_id': historico.pk, 'persistidos': 0})
+			registro = ConsultaJob.objects.create(
+				usuario=request.user if request.user.is_authenticated else None,
+				tipo=job.get('tipo') or 'manual',
+				arquivo_nome=job.get('arquivo_nome'),
+				total=job.get('total', 0),
+				estado={k: v for k, v in job.items() if k not in ('results', 'id')},
+				historico=historico,
+			)
+		job['id'] = registro.pk
+	except Exception as e:
+		# Sem checkpoint o job ainda funciona (apenas não será retomável)
+		job.pop('historico_id', None)
+		job.pop('persistidos', None)
+		logger_jobs.warning('Falha ao criar checkpoint: %s', e)
+	return job
+
+
+def _gravar_resultados(job):
+	"""Grava em lote (bulk_create) os resultados do job ainda não persistidos.
+
+	`job['persistidos']` conta os itens já gravados; a restrição única (historico, ordem)
+	torna inofensivo regravar um lote cuja sessão não chegou a ser salva.
+	"""
+	historico_id = job.get('historico_id')
+	if not historico_id:
+		return
+	persistidos = job.get('persistidos', 0)
+	novos = (job.get('results') or [])[persistidos:]
+	if not novos:
+		return
+	ConsultaResultado.objects.bulk_create(
+		[ConsultaResultado.de_dict(historico_id, persistidos + i, r) for i, r in enumerate(novos)],
+		batch_size=getattr(settings, 'JOB_RESULTS_BATCH_SIZE', 500),
+		ignore_conflicts=True,
+	)
+	arquivar_documentos(r.get('cnpj') for r in novos if r.get('detalhes') is not None)
+	job['persistidos'] = persistidos + len(novos)
+
+
+def _checkpoint_job(job, forcar=False):
+	"""Persiste o estado do job da sessão a cada `JOB_CHECKPOINT_EVERY` itens processados.
+
+	Também grava quando a fila esvazia ou quando `forcar` (pausa, cancelamento, fim do plano).
+	Os resultados novos vão para `ConsultaResultado` na mesma transação do estado, então
+	fila e resultados gravados são sempre consistentes entre si na retomada.
+	"""
+	job_id = job.get('id')
+	if not job_id:
+		return
+	every = max(1, getattr(settings, 'JOB_CHECKPOINT_EVERY', 10))
+	processed = job.get('processed', 0)
+	if not forcar and job.get('queue') and processed % every != 0:
+		return
+	try:
+		with transaction.atomic():
+			_gravar_resultados(job)
+			ConsultaJob.objects.filter(pk=job_id).update(
+				status=job.get('status', 'running'),
+				processados=processed,
+				total=job.get('total', 0),
+				estado={k: v for k, v in job.items() if k not in ('results', 'id')},
+				atualizado_em=timezone.now(),
+			)
+	except Exception as e:
+		logger_jobs.warning('Falha ao gravar checkpoint do job %s: %s', job_id, e)
+
+
+def _itens_da_requisicao(request, estatisticas=None):
+	"""Extrai os itens de um job do corpo da requisição (JSON, lista manual ou CSV/XLSX).
+
+	Retorna `(items, origem, erro)`: `origem` é 'manual' ou 'upload' e `erro` uma
+	JsonResponse 400 quando o arquivo não pôde ser lido (nesse caso `items` é vazio).
+	"""
 	# Use o content-type para decidir como ler o corpo, evitando RawPostDataException
 	content_type = (request.META.get('CONTENT_TYPE') or '').lower()
 	items = []
@@ -316,232 +733,380 @@ def jobs_start(request):
 		cnpjs_raw = (payload.get('cnpjs') or '').strip()
 		if cnpjs_raw:
 			items = [c.strip() for c in cnpjs_raw.split(',') if c.strip()]
-		job = _init_job_session(request, items)
-		job['tipo'] = 'manual'
-		request.session['job'] = job
-		request.session.modified = True
-		return JsonResponse({'total': job['total']})
-	else:
-		# multipart/form-data ou x-www-form-urlencoded
-		cnpjs_raw = (request.POST.get('cnpjs') or '').strip()
-		if cnpjs_raw:
-			items = [c.strip() for c in cnpjs_raw.split(',') if c.strip()]
-		if not items:
-			up_file = request.FILES.get('csv_file')
-			if up_file:
-				fname = (up_file.name or '').lower()
-				try:
-					if fname.endswith('.xlsx'):
-						# Extrai CNPJs do XLSX via openpyxl
-						import openpyxl as _openpyxl
-						wb = _openpyxl.load_workbook(up_file, read_only=True, data_only=True)
-						ws = wb.active
-						header_row = next(ws.iter_rows(min_row=1, max_row=1))
-						headers = [str(c.value).strip().lower() if c.value else '' for c in header_row]
-						keys = ['cnpj', 'cnpj/cpf', 'cnpj_cpf']
-						pkeys = ['processo', 'número do processo', 'numero do processo']
-						# extras
-						ds_keys = ['dsevento', 'ds evento', 'ds_evento']
-						op_keys = ['oportunidade']
-						sub_keys = ['substancias', 'substâncias', 'substancia']
-						cnpj_idx = None
-						proc_idx = None
-						ds_idx = None
-						op_idx = None
-						sub_idx = None
-						import unicodedata as _ud
-						def _norm(s):
-							if s is None: return ''
-							s = str(s)
-							s = _ud.normalize('NFKD', s).encode('ASCII', 'ignore').decode('ASCII')
-							return s.lower().strip()
-						for idx, h in enumerate(headers):
-							if any(k in h for k in keys):
-								cnpj_idx = idx
-								break
-						for idx, h in enumerate(headers):
-							if any(k in h for k in pkeys):
-								proc_idx = idx
-								break
-						# extras
-						for idx, h in enumerate(headers):
-							hn = _norm(h)
-							if ds_idx is None and any(k in hn for k in ds_keys):
-								ds_idx = idx
-							if op_idx is None and any(k in hn for k in op_keys):
-								op_idx = idx
-							if sub_idx is None and any(k in hn for k in sub_keys):
-								sub_idx = idx
-						print(f"[UPLOAD-XLSX] Headers: {headers}")
-						print(f"[UPLOAD-XLSX] idx -> cnpj:{cnpj_idx} proc:{proc_idx} ds:{ds_idx} op:{op_idx} sub:{sub_idx}")
-						if cnpj_idx is not None:
-							for row in ws.iter_rows(min_row=2):
-								val = row[cnpj_idx].value if cnpj_idx < len(row) else ''
-								cnpj_val = clean_cnpj(str(val) if val is not None else '')
-								proc_val = (str(row[proc_idx].value).strip() if (proc_idx is not None and row[proc_idx].value) else None)
-								if len(cnpj_val) == 14:
-									item_payload = {'cnpj': cnpj_val, 'processo': proc_val}
-									# extras
-									try:
-										if ds_idx is not None:
-											item_payload['dsevento'] = str(row[ds_idx].value).strip() if row[ds_idx].value else None
-										if op_idx is not None:
-											item_payload['oportunidade'] = str(row[op_idx].value).strip() if row[op_idx].value else None
-										if sub_idx is not None:
-											item_payload['substancias'] = str(row[sub_idx].value).strip() if row[sub_idx].value else None
-									except Exception:
-										pass
-									print(f"[UPLOAD-XLSX] item -> proc:{item_payload.get('processo')} dsev:{item_payload.get('dsevento')} op:{item_payload.get('oportunidade')} sub:{item_payload.get('substancias')}")
-									items.append(item_payload)
-						else:
-							# Fallback: varre todas as células procurando padrões de CNPJ
-							pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
-							for row in ws.iter_rows(min_row=1):
-								for cell in row:
-									if cell.value is None:
-										continue
-									text = str(cell.value)
-									for m in pattern.findall(text):
-										digits = clean_cnpj(m)
-										if len(digits) == 14:
-											items.append({'cnpj': digits, 'processo': None})
-					elif fname.endswith('.csv'):
-						# Extrai CNPJs do CSV com fallback de encoding
-						raw = up_file.read()
-						try:
-							decoded = raw.decode('utf-8-sig')
-						except UnicodeDecodeError:
-							decoded = raw.decode('latin-1')
-						import csv as _csv
-						import io as _io
-						sio = _io.StringIO(decoded)
-						# Tenta DictReader primeiro
-						try:
-							reader = _csv.DictReader(sio)
-							keys = ['cnpj', 'CNPJ', 'CNPJ/CPF', 'cnpj_cpf', 'NRCPFCNPJ', 'nrcpfcnpj', 'CNPJCPF']
-							pkeys = ['processo', 'Processo', 'número do processo', 'numero do processo', 'dsprocesso', 'DSProcesso']
-							ds_keys = ['dsevento', 'ds evento', 'ds_evento']
-							op_keys = ['oportunidade']
-							sub_keys = ['substancias', 'substâncias', 'substancia']
-							found_by_header = False
-							print(f"[UPLOAD-CSV] Headers: {reader.fieldnames}")
-							for row in reader:
-								matched_this_row = False
-								proc_val = None
-								dsevento_val = None
-								oportunidade_val = None
-								substancias_val = None
-								for key in row:
-									if key is None:
-										continue
-									if any(k.lower() in key.lower() for k in keys):
-										cnpj_val = clean_cnpj(row[key])
-										if len(cnpj_val) == 14:
-											# captura processo se existir
-											for k2 in row:
-												if any(pk.lower() in k2.lower() for pk in pkeys):
-													proc_val = (row[k2] or '').strip()
-													break
-											# extras por cabeçalho
-											for k3 in row:
-												kn = (k3 or '').lower()
-												if dsevento_val is None and any(ds in kn for ds in ds_keys):
-													dsevento_val = (row[k3] or '').strip()
-												if oportunidade_val is None and any(op in kn for op in op_keys):
-													oportunidade_val = (row[k3] or '').strip()
-												if substancias_val is None and any(sb in kn for sb in sub_keys):
-													substancias_val = (row[k3] or '').strip()
-											payload = {'cnpj': cnpj_val, 'processo': proc_val, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val}
-											print(f"[UPLOAD-CSV] row -> proc:{payload['processo']} dsev:{payload['dsevento']} op:{payload['oportunidade']} sub:{payload['substancias']}")
-											items.append(payload)
-											matched_this_row = True
-											found_by_header = True
-								if not matched_this_row:
-									# Fallback por linha: vasculha todos os valores
-									pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
-									cnpj_candidates = []
-									for v in row.values():
-										if not v:
-											continue
-										for m in pattern.findall(str(v)):
-											digits = clean_cnpj(m)
-											if len(digits) == 14:
-												cnpj_candidates.append(digits)
-									# tenta obter processo e extras por cabeçalho mesmo no fallback
-									for digits in cnpj_candidates:
-										proc_val = None
-										dsevento_val = None
-										oportunidade_val = None
-										substancias_val = None
-										for k2 in row:
-											if any(pk.lower() in k2.lower() for pk in pkeys):
-												proc_val = (row[k2] or '').strip()
-											kn = (k2 or '').lower()
-											if dsevento_val is None and any(ds in kn for ds in ds_keys):
-												dsevento_val = (row[k2] or '').strip()
-											if oportunidade_val is None and any(op in kn for op in op_keys):
-												oportunidade_val = (row[k2] or '').strip()
-											if substancias_val is None and any(sb in kn for sb in sub_keys):
-												substancias_val = (row[k2] or '').strip()
-										payload = {'cnpj': digits, 'processo': proc_val, 'dsevento': dsevento_val, 'oportunidade': oportunidade_val, 'substancias': substancias_val}
-										print(f"[UPLOAD-CSV:FALLBACK] row -> proc:{payload['processo']} dsev:{payload['dsevento']} op:{payload['oportunidade']} sub:{payload['substancias']}")
-										items.append(payload)
-						except Exception:
-							# Se DictReader não funcionar bem (csv caótico), usa csv.reader
-							sio.seek(0)
-							reader2 = _csv.reader(sio)
-							pattern = re.compile(r"\d{2}\D?\d{3}\D?\d{3}\D?\d{4}\D?\d{2}")
-							for row in reader2:
-								for field in row:
-									for m in pattern.findall(str(field)):
-										digits = clean_cnpj(m)
-										if len(digits) == 14:
-											items.append({'cnpj': digits, 'processo': None})
-					else:
-						return JsonResponse({'detail': 'Tipo de arquivo não suportado. Envie CSV ou XLSX.'}, status=400)
-				except Exception as e:
-					return JsonResponse({'detail': f'Erro ao ler arquivo: {str(e)}'}, status=400)
-		if not items:
-			return JsonResponse({'detail': 'Informe cnpjs (JSON/POST) ou envie csv_file.'}, status=400)
-		job = _init_job_session(request, items)
-		# Define metadados do job conforme origem
-		if request.FILES.get('csv_file'):
-			job['tipo'] = 'upload'
-			job['arquivo_nome'] = request.FILES['csv_file'].name
+		return items, 'manual', None
+	# multipart/form-data ou x-www-form-urlencoded
+	cnpjs_raw = (request.POST.get('cnpjs') or '').strip()
+	if cnpjs_raw:
+		items = [c.strip() for c in cnpjs_raw.split(',') if c.strip()]
+		return items, 'manual', None
+	up_file = request.FILES.get('csv_file')
+	if not up_file:
+		return items, 'manual', None
+	fname = (up_file.name or '').lower()
+	try:
+		if fname.endswith('.xlsx'):
+			# Leitura em streaming (tuplas de valores); `sheet` escolhe outra planilha
+			items = extrair_itens_xlsx(up_file, sheet=request.POST.get('sheet'), estatisticas=estatisticas)
+		elif fname.endswith('.csv'):
+			items = extrair_itens_csv(up_file, estatisticas=estatisticas)
 		else:
-			job['tipo'] = 'manual'
-		request.session['job'] = job
-		request.session.modified = True
-		return JsonResponse({'total': job['total']})
+			return [], 'upload', JsonResponse({'detail': 'Tipo de arquivo não suportado. Envie CSV ou XLSX.'}, status=400)
+	except Exception as e:
+		return [], 'upload', JsonResponse({'detail': f'Erro ao ler arquivo: {str(e)}'}, status=400)
+	return items, 'upload', None
 
 
 @require_http_methods(["POST"])
 @login_required(login_url='login')
-def jobs_step(request):
-	"""Processa um item da fila do job na sessão e retorna o resultado parcial."""
-	import time
-	from .services import DELAY_SECONDS
+def jobs_start(request):
+	"""Inicia um job a partir de CSV/XLSX ou lista manual de CNPJs, salvando na sessão."""
+	items, origem, erro = _itens_da_requisicao(request)
+	if erro is not None:
+		return erro
+	return _iniciar_job(request, items, origem)
+
+
+def _iniciar_job(request, items, origem):
+	"""Cria o job na sessão e o checkpoint no banco a partir dos itens já extraídos."""
+	# Corpo JSON sem CNPJs ainda cria um job vazio (comportamento histórico do endpoint)
+	json_body = (request.META.get('CONTENT_TYPE') or '').lower().startswith('application/json')
+	if not items and not json_body:
+		return JsonResponse({'detail': 'Informe cnpjs (JSON/POST) ou envie csv_file.'}, status=400)
+	job = _init_job_session(request, items)
+	# Define metadados do job conforme origem
+	if origem == 'upload':
+		job['tipo'] = 'upload'
+		job['arquivo_nome'] = request.FILES['csv_file'].name
+	else:
+		job['tipo'] = 'manual'
+	_criar_checkpoint_job(request, job)
+	request.session['job'] = job
+	request.session.modified = True
+	return JsonResponse({'total': job['total'], 'job_id': job.get('id')})
+
+
+@require_http_methods(["POST"])
+@login_required(login_url='login')
+def jobs_analyze(request):
+	"""Pré-análise (dry run) de um upload ou lista manual, sem rede e sem criar job.
+
+	Aceita o mesmo corpo de `/jobs/start/` e responde quantas linhas/CNPJs o arquivo
+	tem, duplicados, inválidos, quantos já estão frescos no cache local ou no
+	histórico, o ETA das consultas online e a estimativa de créditos.
+	"""
+	estatisticas = {}
+	items, origem, erro = _itens_da_requisicao(request, estatisticas=estatisticas)
+	if erro is not None:
+		return erro
+	return _resumo_analise(request, items, origem, estatisticas)
+
+
+def _resumo_analise(request, items, origem, estatisticas):
+	"""Monta a resposta de `jobs_analyze` a partir dos itens já extraídos."""
+	if not items:
+		return JsonResponse({'detail': 'Informe cnpjs (JSON/POST) ou envie csv_file.'}, status=400)
+	limite = getattr(settings, 'RATE_LIMIT_INTERATIVO_MAX_ITENS', 50)
+	resumo = analisar_itens(items, interativo=(origem == 'manual' and len(items) <= limite), estatisticas=estatisticas)
+	# Tamanho da fila que `/jobs/start/` criaria (pares cnpj/processo idênticos contam uma vez)
+	resumo['total'] = len(_normalizar_itens(items))
+	resumo['source'] = origem
+	if origem == 'upload':
+		resumo['file_name'] = request.FILES['csv_file'].name
+	return JsonResponse(resumo)
+
+
+def _ordenar_fila_planejada(queue, prefetched):
+	"""Reordena a fila após o planejamento.
+
+	Itens já resolvidos pelo cache vêm primeiro (sem custo nem delay). Em seguida,
+	os misses, priorizando CNPJs que resolvem mais itens da fila (mesmo CNPJ com
+	processos diferentes) e, no empate, a ordem original do arquivo. Itens do mesmo
+	CNPJ ficam adjacentes para que a consulta online seja reaproveitada.
+	"""
+	ocorrencias = {}
+	primeira_pos = {}
+	for pos, it in enumerate(queue):
+		c = it.get('cnpj')
+		ocorrencias[c] = ocorrencias.get(c, 0) + 1
+		primeira_pos.setdefault(c, pos)
+	def prioridade(it):
+		c = it.get('cnpj')
+		em_cache = c in prefetched
+		return (0 if em_cache else 1, 0 if em_cache else -ocorrencias[c], primeira_pos[c])
+	return sorted(queue, key=prioridade)
+
+
+def _resumo_plano(job):
+	"""Monta a resposta do planejamento com a estimativa de créditos do job."""
+	plan = job.get('plan') or {}
+	cached = plan.get('cached', 0)
+	online = len(plan.get('misses') or [])
+	estimate = estimar_creditos(online)
+	balance = saldo_creditos(creditos_atuais())
+	return {
+		'status': 'planned' if plan.get('done') else 'planning',
+		'distinct': plan.get('distinct', 0),
+		'checked': cached + online,
+		'cached': cached,
+		'online': online,
+		'credits_estimate': estimate,
+		'credits_balance': balance,
+		'insufficient': bool(plan.get('done') and balance is not None and estimate > balance),
+	}
+
+
+def _recarregar_sessao(request):
+	"""Troca a sessão da requisição por uma cópia recém-lida do backend.
+
+	Outra requisição do mesmo usuário (pausar, cancelar ou um passo em outro worker)
+	pode ter gravado a sessão depois que esta foi lida; sem reler, salvar aqui
+	sobrescreveria a alteração.
+	"""
+	engine = import_module(settings.SESSION_ENGINE)
+	request.session = engine.SessionStore(request.session.session_key)
+
+
+def _travar_job(request):
+	"""Trava distribuída (cache compartilhado) do job da sessão.
+
+	Só uma requisição por vez, em qualquer worker, executa um passo ou lote de
+	planejamento do mesmo job. Retorna a chave da trava, ou None se já está ocupada.
+	Com a trava obtida a sessão é relida, já com o que o passo anterior gravou.
+	"""
+	chave = f"job:trava:{request.session.session_key}"
+	if not cache.add(chave, 1, getattr(settings, 'JOB_LOCK_TIMEOUT', 120)):
+		return None
+	_recarregar_sessao(request)
+	return chave
+
+
+def _liberar_job(request, chave):
+	"""Grava a sessão ainda sob a trava (o SessionMiddleware só gravaria depois) e libera."""
+	try:
+		if request.session.modified:
+			request.session.save()
+			request.session.modified = False
+	finally:
+		cache.delete(chave)
+
+
+def _job_ocupado(request, status=200):
+	"""Resposta de passo/lote recusado porque outra requisição está com o job.
+
+	Pausar, retomar, cancelar, concluir e restaurar respondem 409 (o cliente repete).
+	"""
+	job = request.session.get('job') or {}
+	return JsonResponse({'status': 'busy', 'processed': job.get('processed', 0), 'total': job.get('total', 0), 'item': None}, status=status)
+
+
+def _lote_plano(request):
+	"""1ª fase de `jobs_plan` (sessão): `(resposta, None, None)` sem job ou com o job
+	ocupado, ou `(None, lote, trava)` com os próximos CNPJs a verificar (lista vazia
+	quando só falta concluir o plano). Quem recebe a trava deve liberá-la (`_liberar_job`).
+	"""
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request), None, None
+	job = request.session.get('job')
+	if not job:
+		_liberar_job(request, trava)
+		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400), None, None
+	pending = (job.get('plan') or {}).get('pending') or []
+	batch_size = max(1, getattr(settings, 'JOB_PLAN_BATCH_SIZE', 50))
+	return None, pending[:batch_size], trava
+
+
+def _planejar_lote(lote, locais=None):
+	"""2ª fase de `jobs_plan` (rede, sem sessão): `(hits, misses)` do lote no cache do CNPJÁ.
+
+	`locais`: o que a base local já resolveu do lote (`resolver_base_local`, consultada
+	antes na thread da requisição); None a consulta aqui.
+	"""
+	if not lote:
+		return {}, []
+	if getattr(settings, 'CNPJA_FORCE_CACHE_FIRST', True):
+		return planejar_consultas(lote, locais=locais)
+	# Sem cache-first configurado: tudo será consultado online pela estratégia padrão
+	return {}, list(lote)
+
+
+def _aplicar_lote_plano(request, lote, hits, misses):
+	"""3ª fase de `jobs_plan` (sessão): registra o lote e, ao final, reordena a fila."""
+	if lote:
+		_recarregar_sessao(request)
 	job = request.session.get('job')
 	if not job:
 		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
+	plan = job.setdefault('plan', {'pending': [], 'misses': [], 'cached': 0, 'distinct': 0, 'done': False})
+	prefetched = job.setdefault('prefetched', {})
+	pending = plan.get('pending') or []
+	if lote:
+		verificados = set(lote)
+		# Só aplica o que ainda estava pendente (outra chamada pode ter aplicado o mesmo lote)
+		aplicaveis = verificados.intersection(pending)
+		hits = {c: v for c, v in hits.items() if c in aplicaveis}
+		prefetched.update(hits)
+		plan['cached'] = plan.get('cached', 0) + len(hits)
+		plan['misses'] = (plan.get('misses') or []) + [c for c in misses if c in aplicaveis]
+		pending = [c for c in pending if c not in verificados]
+		plan['pending'] = pending
+	if not pending and not plan.get('done'):
+		job['queue'] = _ordenar_fila_planejada(job.get('queue', []), prefetched)
+		plan['done'] = True
+		_checkpoint_job(job, forcar=True)
+	request.session['job'] = job
+	request.session.modified = True
+	return JsonResponse(_resumo_plano(job))
+
+
+@require_http_methods(["POST"])
+@login_required(login_url='login')
+def jobs_plan(request):
+	"""Executa um lote da passada de planejamento (CACHE-only) do job na sessão.
+
+	Cada chamada verifica até `JOB_PLAN_BATCH_SIZE` CNPJs distintos no cache do CNPJÁ,
+	em paralelo e sem consumir créditos/slots do rate limit. Ao final, reordena a fila
+	e devolve quantos créditos serão gastos frente ao saldo em cache de `api_creditos`.
+	"""
+	resposta, lote, trava = _lote_plano(request)
+	if resposta is not None:
+		return resposta
+	try:
+		try:
+			hits, misses = _planejar_lote(lote)
+		except CNPJAClientError as e:
+			return JsonResponse({'detail': str(e)}, status=502)
+		return _aplicar_lote_plano(request, lote, hits, misses)
+	finally:
+		_liberar_job(request, trava)
+
+
+def _job_interativo(job):
+	"""Entradas manuais pequenas são interativas (prioridade no rate limit); uploads são lote."""
+	limite = getattr(settings, 'RATE_LIMIT_INTERATIVO_MAX_ITENS', 50)
+	return job.get('tipo') == 'manual' and job.get('total', 0) <= limite
+
+
+def _preparar_passo(request):
+	"""1ª fase de `jobs_step` (sessão): escolhe o próximo item da fila.
+
+	Retorna `(resposta, None)` quando não há o que consultar (sem job, pausado,
+	cancelado, concluído ou ocupado por outra requisição) ou `(None, ctx)` com o CNPJ,
+	o resultado reaproveitável (planejamento/consulta anterior ou base local, que usa o
+	ORM e por isso é consultada aqui), os parâmetros da consulta à API e a trava do job
+	(`ctx['trava']`, liberada por quem chamou).
+	"""
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request), None
+	try:
+		resposta, ctx = _proximo_item(request)
+	except Exception:
+		_liberar_job(request, trava)
+		raise
+	if ctx is None:
+		_liberar_job(request, trava)
+	else:
+		ctx['trava'] = trava
+	return resposta, ctx
+
+
+def _proximo_item(request):
+	job = request.session.get('job')
+	if not job:
+		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400), None
 	queue = job.get('queue', [])
 	processed = job.get('processed', 0)
 	total = job.get('total', 0)
-	results = job.get('results', [])
 	status_job = job.get('status', 'running')
 	if status_job == 'paused':
-		return JsonResponse({'status': 'paused', 'processed': processed, 'total': total, 'item': None})
+		return JsonResponse({'status': 'paused', 'processed': processed, 'total': total, 'item': None}), None
 	if status_job == 'cancelled':
-		return JsonResponse({'status': 'cancelled', 'processed': processed, 'total': total, 'item': None})
+		return JsonResponse({'status': 'cancelled', 'processed': processed, 'total': total, 'item': None}), None
 	if processed >= total or not queue:
-		return JsonResponse({'status': 'done', 'processed': processed, 'total': total, 'item': None})
-	time.sleep(DELAY_SECONDS)
-	item = queue.pop(0)
+		return JsonResponse({'status': 'done', 'processed': processed, 'total': total, 'item': None}), None
+	plan = job.get('plan') or {}
+	item = queue[0]
 	cnpj = item.get('cnpj') if isinstance(item, dict) else item
+	ctx = {
+		'cnpj': cnpj,
+		'reaproveitado': (job.get('prefetched') or {}).get(cnpj),
+		'consulta': {
+			# Após o planejamento, o CNPJ já é sabidamente um miss do cache
+			'cache_first': False if plan.get('done') else None,
+			'fluxo': f"job:{job.get('id') or request.session.session_key}",
+			'interativo': _job_interativo(job),
+			'usuario': request.user.get_username(),
+			# Já consultada abaixo; `_consultar_item` roda no pool de rede, sem banco
+			'base_local': False,
+		},
+	}
+	if ctx['reaproveitado'] is None:
+		ctx['reaproveitado'] = resolver_base_local([cnpj]).get(cnpj)
+	# Primeira filial de uma empresa com várias filiais ainda a consultar: busca todas pela raiz
+	raiz = raiz_cnpj(cnpj)
+	if plan.get('done') and ctx['reaproveitado'] is None and raiz not in (job.get('raizes') or []):
+		prefetched = job.get('prefetched') or {}
+		filiais = [c for c in ((q.get('cnpj') if isinstance(q, dict) else q) for q in queue) if (c or '')[:8] == raiz and c not in prefetched]
+		filiais = agrupar_por_raiz(filiais).get(raiz)
+		if filiais:
+			ctx['raiz'] = (raiz, filiais)
+	return None, ctx
+
+
+def _consultar_item(ctx):
+	"""2ª fase de `jobs_step` (bloqueante, sem sessão/banco): resultado do item.
+
+	Com `ctx['raiz']`, busca antes as filiais da mesma raiz; as encontradas ficam em
+	`ctx['por_raiz']` para `_concluir_passo` reaproveitar nos próximos itens.
+	"""
+	if ctx['reaproveitado'] is not None:
+		return dict(ctx['reaproveitado'])
+	if ctx.get('raiz'):
+		raiz, filiais = ctx['raiz']
+		consulta = ctx['consulta']
+		ctx['por_raiz'] = buscar_por_raiz(raiz, filiais, fluxo=consulta['fluxo'], interativo=consulta['interativo'], usuario=consulta['usuario'])
+		if ctx['cnpj'] in ctx['por_raiz']:
+			return dict(ctx['por_raiz'][ctx['cnpj']])
 	try:
-		resultado = consultar_cnpj_api(cnpj)
+		return consultar_cnpj_api(ctx['cnpj'], **ctx['consulta'])
 	except Exception as e:
-		resultado = {'cnpj': cnpj, 'nome': '-', 'email': f'Erro: {str(e)}'}
+		return {'cnpj': ctx['cnpj'], 'nome': '-', 'email': f'Erro: {str(e)}'}
+
+
+def _concluir_passo(request, ctx, resultado):
+	"""3ª fase de `jobs_step` (sessão): retira o item da fila e registra o resultado.
+
+	Se o job mudou durante a consulta (cancelado, restaurado ou o item já saiu da
+	fila), o resultado é descartado e a resposta reflete o estado atual do job.
+	"""
+	if ctx['reaproveitado'] is None:
+		_recarregar_sessao(request)
+	job = request.session.get('job')
+	if not job:
+		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
+	queue = job.get('queue', [])
+	processed = job.get('processed', 0)
+	total = job.get('total', 0)
+	results = job.get('results', [])
+	prefetched = job.get('prefetched') or {}
+	cnpj = ctx['cnpj']
+	primeiro = queue[0] if queue else None
+	if job.get('status') == 'cancelled' or primeiro is None or (primeiro.get('cnpj') if isinstance(primeiro, dict) else primeiro) != cnpj:
+		status_job = job.get('status', 'running') if queue else 'done'
+		return JsonResponse({'status': status_job, 'processed': processed, 'total': total, 'item': None})
+	item = queue.pop(0)
+	if ctx.get('raiz'):
+		# Raiz já buscada neste job: as filiais encontradas saem sem nova consulta
+		job.setdefault('raizes', []).append(ctx['raiz'][0])
+		na_fila = {(q.get('cnpj') if isinstance(q, dict) else q) for q in queue}
+		prefetched.update({c: r for c, r in (ctx.get('por_raiz') or {}).items() if c in na_fila})
+	# Mantém o resultado do CNPJ apenas enquanto outros itens da fila ainda o usarem
+	if any((q.get('cnpj') if isinstance(q, dict) else q) == cnpj for q in queue):
+		if resultado.get('detalhes') is not None:
+			prefetched[cnpj] = {k: resultado.get(k) for k in ('cnpj', 'nome', 'email', 'detalhes')}
+	else:
+		prefetched.pop(cnpj, None)
 	# anexa processo se existir
 	if isinstance(item, dict) and item.get('processo'):
 		resultado['processo'] = item['processo']
@@ -550,40 +1115,89 @@ def jobs_step(request):
 		for k in ('dsevento', 'oportunidade', 'substancias'):
 			if k in item and item[k] is not None:
 				resultado[k] = item[k]
-	print(f"[JOB-STEP] cnpj:{cnpj} proc:{resultado.get('processo')} dsev:{resultado.get('dsevento')} op:{resultado.get('oportunidade')} sub:{resultado.get('substancias')}")
+	logger_jobs.debug('Job: CNPJ %s processado', cnpj, extra=AMOSTRAR)
 	results.append(resultado)
 	processed += 1
-	job.update({'queue': queue, 'processed': processed, 'total': total, 'results': results})
+	job.update({'queue': queue, 'processed': processed, 'total': total, 'results': results, 'prefetched': prefetched})
+	_checkpoint_job(job)
 	request.session['job'] = job
 	request.session['ultimos_resultados'] = results  # mantém export funcionando
 	request.session.modified = True
 	return JsonResponse({'status': 'running', 'processed': processed, 'total': total, 'item': resultado})
 
 
+@require_http_methods(["POST"])
+@login_required(login_url='login')
+def jobs_step(request):
+	"""Processa um item da fila do job na sessão e retorna o resultado parcial.
+
+	Quando o job foi planejado (jobs_plan), itens já resolvidos pelo cache ou por uma
+	consulta anterior do mesmo CNPJ são devolvidos sem delay e sem nova chamada à API.
+	Versão assíncrona (sem bloquear o processo durante o delay/consulta): views_async.
+	"""
+	import time
+	from .services import DELAY_SECONDS
+	resposta, ctx = _preparar_passo(request)
+	if resposta is not None:
+		return resposta
+	try:
+		if ctx['reaproveitado'] is None:
+			time.sleep(DELAY_SECONDS)
+		resultado = _consultar_item(ctx)
+		return _concluir_passo(request, ctx, resultado)
+	finally:
+		_liberar_job(request, ctx['trava'])
+
+
 @require_http_methods(["POST"])
 @login_required(login_url='login')
 def jobs_finalize(request):
-	"""Persiste os resultados do job no histórico e finaliza, limpando o job da sessão."""
+	"""Conclui o job: grava os últimos resultados, marca a execução como concluída e limpa a sessão.
+
+	Os resultados já foram gravados em lotes durante o job (`_checkpoint_job`); aqui resta
+	no máximo um lote parcial e a atualização de status.
+	"""
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request, status=409)
+	try:
+		return _finalizar_job(request)
+	finally:
+		_liberar_job(request, trava)
+
+
+def _finalizar_job(request):
 	job = request.session.get('job')
 	if not job:
 		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
 	try:
-		tipo = job.get('tipo') or 'manual'
-		cnpjs_registro = job.get('cnpjs_str') or ''
-		arquivo_nome = job.get('arquivo_nome')
 		resultados = job.get('results') or []
-		if resultados:
-			ConsultaHistorico.objects.create(
-				tipo=tipo,
-				cnpjs=cnpjs_registro,
-				arquivo_nome=arquivo_nome,
-				resultado=resultados,
-			)
+		historico_id = job.get('historico_id')
+		with transaction.atomic():
+			if historico_id:
+				_gravar_resultados(job)
+				if resultados:
+					ConsultaHistorico.objects.filter(pk=historico_id).update(status='concluido', data=timezone.now())
+				else:
+					ConsultaHistorico.objects.filter(pk=historico_id).delete()
+					historico_id = None
+			elif resultados:
+				# Job sem checkpoint (falha ao criá-lo): grava tudo de uma vez
+				historico_id = _criar_historico(job.get('tipo') or 'manual', job.get('cnpjs_str') or '', job.get('arquivo_nome'), resultados).pk
+			if job.get('id'):
+				# Resultados já estão no histórico; o checkpoint guarda apenas o status final
+				ConsultaJob.objects.filter(pk=job['id']).update(
+					status='done', processados=job.get('processed', 0), estado={}, resultados=[],
+					historico_id=historico_id, atualizado_em=timezone.now(),
+				)
 		# limpar job
 		request.session.pop('job', None)
 		request.session.modified = True
-		# tenta atualizar créditos em background (sem bloquear resposta)
-		_refresh_creditos_cache_silently()
+		# saldo já é rastreado por consulta; reconcilia com /credit em background se vencido
+		agendar_reconciliacao_creditos()
+		# retenção do histórico (arquivamento/exclusão), se ligada; no máximo uma vez por intervalo
+		if getattr(settings, 'HISTORY_RETENTION_DAYS', 0) > 0:
+			agendar_retencao()
 		return JsonResponse({'status': 'ok'})
 	except Exception as e:
 		return JsonResponse({'detail': f'Erro ao salvar histórico: {str(e)}'}, status=500)
@@ -593,41 +1207,134 @@ def jobs_finalize(request):
 @login_required(login_url='login')
 def jobs_pause(request):
 	"""Pausa o job em andamento marcando o status como 'paused'."""
-	job = request.session.get('job')
-	if not job:
-		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
-	job['status'] = 'paused'
-	request.session['job'] = job
-	request.session.modified = True
-	return JsonResponse({'status': 'paused'})
+	return _mudar_status_job(request, 'paused')
 
 
 @require_http_methods(["POST"])
 @login_required(login_url='login')
 def jobs_resume(request):
 	"""Retoma o job pausado, marcando o status como 'running'."""
-	job = request.session.get('job')
-	if not job:
-		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
-	job['status'] = 'running'
-	request.session['job'] = job
-	request.session.modified = True
-	return JsonResponse({'status': 'running'})
+	return _mudar_status_job(request, 'running')
+
+
+def _mudar_status_job(request, status_job):
+	"""Pausa/retomada sob a trava do job: um passo em andamento gravaria a sessão por cima."""
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request, status=409)
+	try:
+		job = request.session.get('job')
+		if not job:
+			return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
+		job['status'] = status_job
+		_checkpoint_job(job, forcar=True)
+		request.session['job'] = job
+		request.session.modified = True
+		return JsonResponse({'status': status_job})
+	finally:
+		_liberar_job(request, trava)
 
 
 @require_http_methods(["POST"])
 @login_required(login_url='login')
 def jobs_cancel(request):
 	"""Cancela o job atual e esvazia a fila remanescente para encerrar o loop."""
-	job = request.session.get('job')
-	if not job:
-		return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
-	job['status'] = 'cancelled'
-	# limpa a fila restante para encerrar imediatamente
-	job['queue'] = []
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request, status=409)
+	try:
+		job = request.session.get('job')
+		if not job:
+			return JsonResponse({'detail': 'Nenhum job em andamento.'}, status=400)
+		job['status'] = 'cancelled'
+		# limpa a fila restante para encerrar imediatamente
+		job['queue'] = []
+		with transaction.atomic():
+			# Job cancelado não entra no histórico nem é retomado: o checkpoint guarda só o
+			# status (sem gravar os resultados pendentes) e os já gravados são descartados
+			if job.get('id'):
+				ConsultaJob.objects.filter(pk=job['id']).update(
+					status='cancelled', processados=job.get('processed', 0), estado={}, atualizado_em=timezone.now(),
+				)
+			if job.get('historico_id'):
+				ConsultaHistorico.objects.filter(pk=job['historico_id'], status='andamento').delete()
+				job['historico_id'] = None
+		request.session['job'] = job
+		request.session.modified = True
+		return JsonResponse({'status': 'cancelled'})
+	finally:
+		_liberar_job(request, trava)
+
+
+@require_GET
+@login_required(login_url='login')
+def jobs_pending(request):
+	"""Lista os jobs do usuário com checkpoint retomável (em andamento ou pausados)."""
+	qs = ConsultaJob.objects.filter(usuario=request.user, status__in=('running', 'paused')).order_by('-atualizado_em')[:10]
+	atual = (request.session.get('job') or {}).get('id')
+	jobs = [{
+		'id': j.pk,
+		'tipo': j.tipo,
+		'arquivo_nome': j.arquivo_nome,
+		'processed': j.processados,
+		'total': j.total,
+		'status': j.status,
+		'updated': timezone.localtime(j.atualizado_em).strftime('%d/%m/%y %H:%M'),
+		'current': j.pk == atual,
+	} for j in qs]
+	return JsonResponse({'jobs': jobs})
+
+
+@require_http_methods(["POST"])
+@login_required(login_url='login')
+def jobs_restore(request, job_id: int):
+	"""Retoma um job a partir do último checkpoint gravado no banco.
+
+	Restaura fila e resultados na sessão; itens já concluídos não são consultados
+	novamente, e CNPJs concluídos que ainda aparecem na fila são reaproveitados.
+	"""
+	trava = _travar_job(request)
+	if trava is None:
+		return _job_ocupado(request, status=409)
+	try:
+		return _restaurar_job(request, job_id)
+	finally:
+		_liberar_job(request, trava)
+
+
+def _restaurar_job(request, job_id):
+	registro = ConsultaJob.objects.filter(pk=job_id, usuario=request.user, status__in=('running', 'paused')).first()
+	if registro is None:
+		return JsonResponse({'detail': 'Job não encontrado ou já finalizado.'}, status=404)
+	job = dict(registro.estado or {})
+	# Checkpoints antigos guardavam os resultados em JSON; os novos, em ConsultaResultado
+	results = list(registro.resultados or [])
+	if not results and registro.historico_id:
+		itens = ConsultaResultado.objects.filter(historico_id=registro.historico_id).select_related('detalhes_de')
+		results = [r.como_dict() for r in itens]
+		job['persistidos'] = len(results)
+	queue = job.get('queue') or []
+	# Itens processados após o último checkpoint voltam para a fila; reaproveita CNPJs já resolvidos
+	prefetched = job.get('prefetched') or {}
+	pendentes = set(clean_cnpj((q.get('cnpj') if isinstance(q, dict) else q)) for q in queue)
+	for r in results:
+		c = clean_cnpj(r.get('cnpj'))
+		if c in pendentes and r.get('detalhes') is not None:
+			prefetched.setdefault(c, {k: r.get(k) for k in ('cnpj', 'nome', 'email', 'detalhes')})
+	job.update({
+		'id': registro.pk,
+		'queue': queue,
+		'results': results,
+		'processed': len(results),
+		'total': registro.total,
+		'status': 'running',
+		'prefetched': prefetched,
+	})
 	request.session['job'] = job
+	request.session['ultimos_resultados'] = results
 	request.session.modified = True
-	return JsonResponse({'status': 'cancelled'})
+	ConsultaJob.objects.filter(pk=registro.pk).update(status='running', atualizado_em=timezone.now())
+	return JsonResponse({'total': job['total'], 'processed': job['processed'], 'job_id': registro.pk, 'results': results})
 
 
 # -------------------- Autenticação --------------------
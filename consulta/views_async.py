@@ -0,0 +1,367 @@
+"""Versões assíncronas (ASGI) dos endpoints de job, créditos, detalhes, /cnpj/<cnpj>/ e /api/lote/.
+
+Sob um servidor ASGI, o que espera por rede ou relógio deixa de prender o processo:
+- delays de `jobs_step` usam `asyncio.sleep`;
+- chamadas ao CNPJÁ (e a espera do rate limit/single-flight) rodam num pool de threads
+  dedicado (`ASYNC_UPSTREAM_THREADS`), fora do event loop;
+- sessão e ORM continuam síncronos no Django 4.2 e rodam via `sync_to_async`
+  (thread única do Django), em trechos curtos antes/depois da espera.
+
+A lógica é a mesma de `views.py`, reaproveitada pelas funções de fase (`_preparar_passo`,
+`_consultar_item`, `_concluir_passo` etc.). As rotas usam este módulo quando
+`ASYNC_VIEWS` está ligado (padrão); sob WSGI as views assíncronas também funcionam.
+"""
+
+import asyncio
+import functools
+import inspect
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from django.shortcuts import resolve_url
+from django.utils.http import parse_etags
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from clients.cnpja import CNPJAClientError
+from . import views
+from .models import ConsultaHistorico
+from .projecao import campos_da_requisicao, documento_completo, projetar
+from .serializers import CNPJQuerySerializer
+from .services import DELAY_SECONDS, creditos_atuais, reconciliar_creditos, agendar_reconciliacao_creditos, obter_office
+from .services import _sem_conexao_presa, resolver_base_local
+
+# Pool para chamadas bloqueantes de rede (requests) sem sessão/ORM
+_EXECUTOR_UPSTREAM = ThreadPoolExecutor(
+	max_workers=getattr(settings, 'ASYNC_UPSTREAM_THREADS', 64),
+	thread_name_prefix='cnpja-io',
+)
+
+
+async def _em_thread(fn, *args, **kwargs):
+	"""Executa `fn` no pool de rede. Não use para código que acessa sessão/banco.
+
+	Se mesmo assim `fn` abrir uma conexão, ela é fechada ao fim (as threads do pool
+	vivem enquanto o processo).
+	"""
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(_EXECUTOR_UPSTREAM, functools.partial(_sem_conexao_presa, fn, *args, **kwargs))
+
+
+def _metodos(*metodos):
+	"""Equivalente assíncrono de `require_http_methods` (o do Django 4.2 é só síncrono)."""
+	def decorator(view):
+		@functools.wraps(view)
+		async def _view(request, *args, **kwargs):
+			if request.method not in metodos:
+				return HttpResponseNotAllowed(metodos)
+			return await view(request, *args, **kwargs)
+		return _view
+	return decorator
+
+
+async def _autenticado(request):
+	# request.user é lazy e consulta o banco: avalia fora do event loop
+	return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def _login_obrigatorio(view):
+	"""Equivalente assíncrono de `login_required(login_url='login')`."""
+	@functools.wraps(view)
+	async def _view(request, *args, **kwargs):
+		if not await _autenticado(request):
+			return redirect_to_login(request.get_full_path(), resolve_url('login'))
+		return await view(request, *args, **kwargs)
+	return _view
+
+
+def _em_sessao(view_sync):
+	"""Versão assíncrona de uma view que só usa sessão/banco: roda o corpo (sem os
+	decoradores síncronos) na thread do Django via `sync_to_async`."""
+	corpo = sync_to_async(inspect.unwrap(view_sync))
+
+	@functools.wraps(inspect.unwrap(view_sync))
+	async def _view(request, *args, **kwargs):
+		return await corpo(request, *args, **kwargs)
+	return _view
+
+
+# ---------------------------- Jobs ----------------------------
+
+@_metodos('POST')
+@_login_obrigatorio
+async def jobs_start(request):
+	"""Assíncrona: a leitura do arquivo roda no pool; sessão/checkpoint na thread do Django."""
+	items, origem, erro = await _em_thread(views._itens_da_requisicao, request)
+	if erro is not None:
+		return erro
+	return await sync_to_async(views._iniciar_job)(request, items, origem)
+
+
+@_metodos('POST')
+@_login_obrigatorio
+async def jobs_analyze(request):
+	"""Assíncrona: a leitura do arquivo roda no pool; cache/histórico na thread do Django."""
+	estatisticas = {}
+	items, origem, erro = await _em_thread(views._itens_da_requisicao, request, estatisticas=estatisticas)
+	if erro is not None:
+		return erro
+	return await sync_to_async(views._resumo_analise)(request, items, origem, estatisticas)
+
+
+@_metodos('POST')
+@_login_obrigatorio
+async def jobs_plan(request):
+	"""Assíncrona: a verificação do lote no cache do CNPJÁ roda no pool de rede.
+
+	A base local (ORM) é consultada antes, na thread do Django.
+	"""
+	resposta, lote, trava = await sync_to_async(views._lote_plano)(request)
+	if resposta is not None:
+		return resposta
+	try:
+		try:
+			locais = await sync_to_async(resolver_base_local)(lote)
+			hits, misses = await _em_thread(views._planejar_lote, lote, locais)
+		except CNPJAClientError as e:
+			return JsonResponse({'detail': str(e)}, status=502)
+		return await sync_to_async(views._aplicar_lote_plano)(request, lote, hits, misses)
+	finally:
+		await sync_to_async(views._liberar_job)(request, trava)
+
+
+@_metodos('POST')
+@_login_obrigatorio
+async def jobs_step(request):
+	"""Assíncrona: delay com `asyncio.sleep` e consulta à API no pool de rede."""
+	resposta, ctx = await sync_to_async(views._preparar_passo)(request)
+	if resposta is not None:
+		return resposta
+	try:
+		if ctx['reaproveitado'] is None:
+			await asyncio.sleep(DELAY_SECONDS)
+			resultado = await _em_thread(views._consultar_item, ctx)
+		else:
+			resultado = views._consultar_item(ctx)
+		return await sync_to_async(views._concluir_passo)(request, ctx, resultado)
+	finally:
+		await sync_to_async(views._liberar_job)(request, ctx['trava'])
+
+
+# Só sessão/banco: o corpo é o mesmo das views síncronas
+jobs_finalize = _metodos('POST')(_login_obrigatorio(_em_sessao(views.jobs_finalize)))
+jobs_pause = _metodos('POST')(_login_obrigatorio(_em_sessao(views.jobs_pause)))
+jobs_resume = _metodos('POST')(_login_obrigatorio(_em_sessao(views.jobs_resume)))
+jobs_cancel = _metodos('POST')(_login_obrigatorio(_em_sessao(views.jobs_cancel)))
+jobs_pending = _metodos('GET', 'HEAD')(_login_obrigatorio(_em_sessao(views.jobs_pending)))
+jobs_restore = _metodos('POST')(_login_obrigatorio(_em_sessao(views.jobs_restore)))
+
+
+# ---------------------------- Exportação ----------------------------
+
+async def _em_blocos(gerador, tamanho=500):
+	"""Consome um gerador síncrono (que usa o ORM) em blocos na thread do Django.
+
+	O Django 4.2 sob ASGI carregaria um iterador síncrono inteiro na memória antes de
+	enviar a resposta; assim o streaming continua em partes.
+	"""
+	proximo_bloco = sync_to_async(lambda: list(itertools.islice(gerador, tamanho)))
+	while True:
+		bloco = await proximo_bloco()
+		if not bloco:
+			break
+		for parte in bloco:
+			yield parte
+
+
+@_metodos('GET', 'HEAD')
+@_login_obrigatorio
+async def export_historico_delta(request):
+	"""Assíncrona de `views.export_historico_delta`, com o streaming em blocos."""
+	erro, info = await sync_to_async(views._delta_historico)(request)
+	if erro is not None:
+		return erro
+	conteudo, *resto = info
+	return views._resposta_delta(_em_blocos(conteudo), *resto)
+
+
+# ---------------------------- APIs auxiliares ----------------------------
+
+@_metodos('GET', 'HEAD')
+@_login_obrigatorio
+async def api_creditos(request):
+	"""Assíncrona: o saldo vem do cache; a busca síncrona em /credit (sem snapshot) roda no pool."""
+	refresh = request.GET.get('refresh') == '1'
+	data = await _em_thread(creditos_atuais)
+	if data is None:
+		try:
+			data = await _em_thread(reconciliar_creditos)
+		except Exception as e:
+			return JsonResponse({'detail': f'Não foi possível obter créditos: {str(e)}'}, status=502)
+	else:
+		await _em_thread(agendar_reconciliacao_creditos, forcar=refresh)
+	return JsonResponse(data, safe=False)
+
+
+@_metodos('GET', 'HEAD')
+@_login_obrigatorio
+async def api_detalhes(request, cnpj: str):
+	"""Assíncrona: procura na sessão e depois no histórico com o ORM assíncrono."""
+	def _digits(s: str) -> str:
+		return ''.join(ch for ch in (s or '') if ch.isdigit())
+
+	target = _digits(cnpj)
+	if len(target) != 14:
+		return JsonResponse({'detail': 'CNPJ inválido'}, status=400)
+	campos = campos_da_requisicao(request)
+
+	# 0) Documento completo (`?fields=*`): cache compartilhado ou armazenamento frio
+	if campos and '*' in campos:
+		det = await sync_to_async(documento_completo)(target)
+		if det is not None:
+			return JsonResponse(det, safe=False)
+
+	# 1) Prioriza resultados do job na sessão (ainda não persistidos)
+	job = await sync_to_async(request.session.get)('job') or {}
+	for item in (job.get('results') or []):
+		if _digits(item.get('cnpj')) == target:
+			det = item.get('detalhes')
+			if det is not None:
+				return JsonResponse(projetar(det, campos), safe=False)
+
+	# 2) Procura nos resultados gravados (índice por CNPJ), do mais recente ao mais antigo
+	det = await views._detalhes_gravados().filter(cnpj=target).values_list('json_detalhes', flat=True).afirst()
+	if det is not None:
+		return JsonResponse(projetar(det, campos), safe=False)
+
+	# 3) Registros antigos com o resultado em JSON (mais recente primeiro)
+	async for h in ConsultaHistorico.objects.exclude(resultado=[]).order_by('-data')[:200]:
+		for r in (h.resultado or []):
+			try:
+				if _digits(r.get('cnpj')) == target and r.get('detalhes') is not None:
+					return JsonResponse(projetar(r.get('detalhes'), campos), safe=False)
+			except Exception:
+				continue
+
+	return JsonResponse({'detail': 'Detalhes não encontrados para este CNPJ.'}, status=404)
+
+
+def _checar_throttle(request):
+	"""Aplica as mesmas classes de throttle do DRF usadas por `ConsultaCNPJView`.
+
+	Retorna os segundos de espera (ou 0 quando a requisição pode seguir).
+	"""
+	espera = 0
+	for classe in api_settings.DEFAULT_THROTTLE_CLASSES:
+		throttle = classe()
+		if not throttle.allow_request(request, None):
+			espera = max(espera, throttle.wait() or 1)
+	return espera
+
+
+def _requisicao_drf(request):
+	"""Autentica e lê o corpo como uma APIView do DRF (sessão com CSRF, Basic...).
+
+	Retorna `(erro, requisicao_drf)`. Acessa banco/sessão: chame via `sync_to_async`.
+	"""
+	drf = Request(
+		request,
+		parsers=[p() for p in api_settings.DEFAULT_PARSER_CLASSES],
+		authenticators=[a() for a in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+	)
+	try:
+		if not drf.user.is_authenticated:
+			return JsonResponse({'detail': str(NotAuthenticated.default_detail)}, status=403), None
+		drf.data
+	except APIException as e:
+		return JsonResponse({'detail': str(e.detail)}, status=e.status_code), None
+	return None, drf
+
+
+async def _no_pool(gerador):
+	"""Consome no pool de rede, item a item, um gerador síncrono que espera a rede (sem ORM).
+
+	Cada item sai assim que fica pronto (em `_em_blocos` sairia por bloco).
+	"""
+	fim = object()
+	try:
+		while True:
+			parte = await _em_thread(next, gerador, fim)
+			if parte is fim:
+				break
+			yield parte
+	finally:
+		await _em_thread(gerador.close)
+
+
+@_metodos('POST')
+async def consulta_lote(request):
+	"""Assíncrona de `ConsultaLoteView` (POST /api/lote/): as consultas rodam no pool de rede
+	e cada linha NDJSON é enviada assim que o CNPJ fica pronto."""
+	erro, drf = await sync_to_async(_requisicao_drf)(request)
+	if erro is not None:
+		return erro
+	espera = await sync_to_async(_checar_throttle)(drf)
+	if espera:
+		resposta = JsonResponse({'detail': str(Throttled(espera).detail)}, status=429)
+		resposta['Retry-After'] = str(int(espera))
+		return resposta
+	erro, itens, com_detalhes = views._itens_lote(drf.data)
+	if erro:
+		return JsonResponse({'detail': erro}, status=400)
+	usuario = drf.user.get_username()
+	# A base local (ORM) responde aqui, na thread do Django; o pool de rede fica com o resto
+	locais = await sync_to_async(resolver_base_local)([i['cnpj'] for i in itens])
+	return views._resposta_lote(_no_pool(views._linhas_lote(itens, usuario, com_detalhes, locais)))
+
+
+# Como nas APIViews, o CSRF é conferido pela SessionAuthentication do DRF (clientes com
+# Basic auth não têm token). `csrf_exempt` do Django 4.2 não aceita views assíncronas.
+consulta_lote.csrf_exempt = True
+
+
+@_metodos('GET', 'HEAD')
+async def consulta_cnpj(request, cnpj: str):
+	"""Assíncrona de `ConsultaCNPJView` (GET /cnpj/<cnpj>/), com as mesmas respostas JSON.
+
+	A consulta (cache compartilhado, single-flight e API) roda no pool de rede, então
+	várias consultas lentas ao CNPJÁ não prendem o processo. Autenticação como na APIView
+	(sessão, Basic...).
+	"""
+	erro, drf = await sync_to_async(_requisicao_drf)(request)
+	if erro is not None:
+		return erro
+	espera = await sync_to_async(_checar_throttle)(drf)
+	if espera:
+		resposta = JsonResponse({'detail': str(Throttled(espera).detail)}, status=429)
+		resposta['Retry-After'] = str(int(espera))
+		return resposta
+	s = CNPJQuerySerializer(data={'cnpj': cnpj})
+	if not s.is_valid():
+		return JsonResponse(s.errors, status=400)
+	cnpj_digits = s.validated_data['cnpj']
+	usuario = drf.user.get_username()
+	try:
+		data = await _em_thread(obter_office, cnpj_digits, usuario=usuario)
+	except CNPJAClientError as e:
+		return JsonResponse({'detail': str(e)}, status=400)
+	except Exception:
+		return JsonResponse({'detail': 'Erro interno ao consultar CNPJ'}, status=500)
+	data = projetar(data, campos_da_requisicao(request) or ('*',))
+	etag = views._etag_payload(data)
+	if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+		resposta = HttpResponseNotModified()
+	else:
+		resposta = JsonResponse(data, safe=False)
+	resposta['ETag'] = etag
+	resposta['Cache-Control'] = f"private, max-age={getattr(settings, 'CNPJ_HTTP_MAX_AGE', 300)}"
+	return resposta
+
+
+# Idem `consulta_lote`: clientes com Basic auth não têm token CSRF
+consulta_cnpj.csrf_exempt = True
@@ -0,0 +1,221 @@
+"""Leitor enxuto de XLSX para ingestão de planilhas grandes.
+
+O openpyxl (mesmo em `read_only`) monta um dicionário por célula, passa cada
+string compartilhada pelo modelo de rich text e completa as linhas até as
+dimensões declaradas no arquivo. Para extrair CNPJs só precisamos dos valores,
+então este módulo lê o XML da planilha direto do zip com `iterparse`:
+
+- strings compartilhadas viram uma lista de `str` (sem objetos de rich text);
+- cada linha é uma tupla que termina na última célula com valor;
+- células só com formatação (sem `<v>`) e linhas vazias são ignoradas;
+- números com formato de data viram `datetime`, como no openpyxl.
+
+Arquivos que fogem do formato esperado (ex.: Strict OOXML) levantam
+`XlsxNaoSuportado` na abertura; `services.ler_xlsx` cai então no openpyxl.
+"""
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_SHEET_DATA = NS_MAIN + 'sheetData'
+_ROW = NS_MAIN + 'row'
+_C = NS_MAIN + 'c'
+_V = NS_MAIN + 'v'
+_T = NS_MAIN + 't'
+_R = NS_MAIN + 'r'
+_SI = NS_MAIN + 'si'
+
+_COLUNAS = {}
+
+
+class XlsxNaoSuportado(Exception):
+    """O arquivo não pôde ser aberto pelo leitor enxuto (use o openpyxl)."""
+
+
+def _indice_coluna(ref):
+    """'AB12' -> 27 (0-based). Resultado memorizado por prefixo de letras."""
+    letras = ref.rstrip('0123456789')
+    idx = _COLUNAS.get(letras)
+    if idx is None:
+        idx = 0
+        for ch in letras:
+            idx = idx * 26 + (ord(ch) - 64)
+        idx -= 1
+        _COLUNAS[letras] = idx
+    return idx
+
+
+def _numero(texto):
+    if '.' in texto or 'E' in texto or 'e' in texto:
+        valor = float(texto)
+        return int(valor) if valor.is_integer() and abs(valor) < 1e15 else valor
+    return int(texto)
+
+
+class LeitorXlsx:
+    """Abre o zip, lê os metadados do workbook e itera linhas de uma planilha."""
+
+    def __init__(self, file):
+        try:
+            self._zip = zipfile.ZipFile(file)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise XlsxNaoSuportado(str(e))
+        try:
+            self._ler_workbook()
+            self._datas, self._duracoes = self._ler_estilos()
+            self._strings = None
+        except XlsxNaoSuportado:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise XlsxNaoSuportado(f'Metadados inválidos: {e}')
+
+    def close(self):
+        self._zip.close()
+
+    @property
+    def sheetnames(self):
+        return [nome for nome, _ in self._planilhas]
+
+    @property
+    def ativa(self):
+        """Nome da planilha ativa (a aberta por padrão no Excel)."""
+        return self._planilhas[self._ativa][0]
+
+    def _ler_workbook(self):
+        nomes = set(self._zip.namelist())
+        if 'xl/workbook.xml' not in nomes:
+            raise XlsxNaoSuportado('xl/workbook.xml ausente')
+        alvos = {}
+        if 'xl/_rels/workbook.xml.rels' in nomes:
+            rels = parse(self._zip.open('xl/_rels/workbook.xml.rels')).getroot()
+            for rel in rels.iter(NS_PKG + 'Relationship'):
+                alvo = rel.get('Target') or ''
+                alvo = alvo.lstrip('/') if alvo.startswith('/') else posixpath.normpath(posixpath.join('xl', alvo))
+                alvos[rel.get('Id')] = alvo
+        wb = parse(self._zip.open('xl/workbook.xml')).getroot()
+        if wb.tag != NS_MAIN + 'workbook':
+            raise XlsxNaoSuportado(f'Namespace não suportado: {wb.tag}')
+        self._planilhas = []
+        for sh in wb.iter(NS_MAIN + 'sheet'):
+            caminho = alvos.get(sh.get(NS_REL + 'id'))
+            if caminho in nomes:
+                self._planilhas.append((sh.get('name'), caminho))
+        if not self._planilhas:
+            raise XlsxNaoSuportado('Nenhuma planilha encontrada')
+        view = wb.find(f'{NS_MAIN}bookViews/{NS_MAIN}workbookView')
+        ativa = int(view.get('activeTab', 0)) if view is not None else 0
+        self._ativa = ativa if 0 <= ativa < len(self._planilhas) else 0
+        pr = wb.find(NS_MAIN + 'workbookPr')
+        data1904 = pr is not None and pr.get('date1904') in ('1', 'true')
+        self._epoch = CALENDAR_MAC_1904 if data1904 else CALENDAR_WINDOWS_1900
+        self._caminho_strings = 'xl/sharedStrings.xml' if 'xl/sharedStrings.xml' in nomes else None
+        self._caminho_estilos = 'xl/styles.xml' if 'xl/styles.xml' in nomes else None
+
+    def _ler_estilos(self):
+        """Índices de estilo (`s` da célula) cujo formato numérico é data/duração."""
+        datas, duracoes = set(), set()
+        if not self._caminho_estilos:
+            return datas, duracoes
+        root = parse(self._zip.open(self._caminho_estilos)).getroot()
+        formatos = dict(BUILTIN_FORMATS)
+        for fmt in root.iter(NS_MAIN + 'numFmt'):
+            formatos[int(fmt.get('numFmtId'))] = fmt.get('formatCode') or ''
+        xfs = root.find(NS_MAIN + 'cellXfs')
+        if xfs is None:
+            return datas, duracoes
+        for idx, xf in enumerate(xfs.iter(NS_MAIN + 'xf')):
+            codigo = formatos.get(int(xf.get('numFmtId', 0)))
+            if codigo and is_date_format(codigo):
+                datas.add(idx)
+                if is_timedelta_format(codigo):
+                    duracoes.add(idx)
+        return datas, duracoes
+
+    def _ler_strings(self):
+        strings = []
+        if not self._caminho_strings:
+            return strings
+        with self._zip.open(self._caminho_strings) as src:
+            eventos = iterparse(src, events=('start', 'end'))
+            _, raiz = next(eventos)
+            for evento, el in eventos:
+                if evento != 'end' or el.tag != _SI:
+                    continue
+                texto = el.findtext(_T)
+                if texto is None:
+                    # Rich text: concatena os trechos <r><t>, ignorando a fonética (<rPh>)
+                    texto = ''.join(r.findtext(_T) or '' for r in el.iter(_R))
+                strings.append(texto)
+                # Solta o <si> da raiz (só clear() deixaria um elemento vazio por string)
+                raiz.remove(el)
+        return strings
+
+    def caminho(self, nome):
+        for n, caminho in self._planilhas:
+            if n == nome:
+                return caminho
+        raise KeyError(nome)
+
+    def linhas(self, nome=None):
+        """Gera `(numero_linha, tupla_de_valores)` das linhas com algum valor."""
+        if self._strings is None:
+            self._strings = self._ler_strings()
+        strings = self._strings
+        datas, duracoes, epoch = self._datas, self._duracoes, self._epoch
+        numero = 0
+        with self._zip.open(self.caminho(nome or self.ativa)) as src:
+            pai = None
+            for evento, el in iterparse(src, events=('start', 'end')):
+                if evento == 'start':
+                    if el.tag == _SHEET_DATA:
+                        pai = el
+                    continue
+                if el.tag != _ROW:
+                    continue
+                r = el.get('r')
+                numero = int(r) if r else numero + 1
+                valores = []
+                pos = 0
+                for c in el:
+                    ref = c.get('r')
+                    pos = _indice_coluna(ref) if ref else pos
+                    tipo = c.get('t')
+                    if tipo == 'inlineStr':
+                        valor = ''.join(t.text or '' for t in c.iter(_T))
+                    else:
+                        valor = c.findtext(_V)
+                        if valor is None:
+                            pos += 1
+                            continue
+                        if tipo == 's':
+                            valor = strings[int(valor)]
+                        elif tipo is None or tipo == 'n':
+                            valor = _numero(valor)
+                            estilo = c.get('s')
+                            if estilo and int(estilo) in datas:
+                                try:
+                                    valor = from_excel(valor, epoch, timedelta=int(estilo) in duracoes)
+                                except (OverflowError, ValueError):
+                                    pass
+                        elif tipo == 'b':
+                            valor = valor == '1'
+                    if valor is not None and valor != '':
+                        if pos >= len(valores):
+                            valores.extend([None] * (pos + 1 - len(valores)))
+                        valores[pos] = valor
+                    pos += 1
+                # Solta a linha lida de <sheetData>: a memória não cresce com o tamanho da planilha
+                el.clear()
+                if pai is not None:
+                    pai.remove(el)
+                if valores:
+                    yield numero, tuple(valores)
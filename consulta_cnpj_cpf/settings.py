@@ -40,7 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise com caminho assíncrono: o original é só síncrono e serializaria as views ASGI
+    'consulta.middleware.WhiteNoiseAsyncMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'axes.middleware.AxesMiddleware',
@@ -48,10 +49,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Profiling por requisição para staff; sem PROFILING_ENABLED sai da cadeia (custo zero)
+    'consulta.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'consulta_cnpj_cpf.urls'
 
+# Profiling por requisição (?_profile=1 ou X-Profile: 1, só staff); desligado por padrão
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+try:
+    PROFILING_INTERVALO_MS = int(os.getenv('PROFILING_INTERVALO_MS', '5'))
+except ValueError:
+    PROFILING_INTERVALO_MS = 5
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -76,10 +87,12 @@ if os.getenv('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
             ssl_require=not RUN_LOCAL,  # em local não exige SSL
         )
     }
+    # sslmode é do PostgreSQL; o sqlite3 recusa a opção (DATABASE_URL=sqlite:///... do bench_carga)
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        DATABASES['default'].get('OPTIONS', {}).pop('sslmode', None)
 else:
     # Check PostgreSQL environment variables
     pg_name = os.getenv('PGDATABASE') or os.getenv('POSTGRES_DB')
@@ -112,6 +125,49 @@ else:
             }
         }
 
+# Conexões com o PostgreSQL (as duas formas acima). Sem pool (padrão), cada thread guarda
+# a sua por DB_CONN_MAX_AGE segundos (no ASGI, uma thread por requisição). Com DB_POOL=True
+# (opcional), cada processo mantém um pool (`consulta.banco`) compartilhado entre as
+# threads: a conexão é pega no primeiro acesso ao banco e devolvida no fim da requisição.
+# Conexões presas a threads de vida longa (pools de threads) só voltam quando a thread
+# termina, então ligue-o apenas depois de medir com `bench_banco`.
+DB_POOL = os.getenv('DB_POOL', 'False').lower() in ('1','true','yes')
+try:
+    DB_POOL_MAXIMO = int(os.getenv('DB_POOL_MAXIMO', '10'))  # conexões por processo
+except ValueError:
+    DB_POOL_MAXIMO = 10
+try:
+    DB_POOL_ESPERA = float(os.getenv('DB_POOL_ESPERA', '10'))  # s esperando uma conexão livre
+except ValueError:
+    DB_POOL_ESPERA = 10.0
+try:
+    DB_POOL_VIDA_MAXIMA = float(os.getenv('DB_POOL_VIDA_MAXIMA', '1800'))  # s até reciclar uma conexão
+except ValueError:
+    DB_POOL_VIDA_MAXIMA = 1800.0
+try:
+    DB_POOL_CHECAR_APOS = float(os.getenv('DB_POOL_CHECAR_APOS', '30'))  # s ociosa até o SELECT 1 na saída
+except ValueError:
+    DB_POOL_CHECAR_APOS = 30.0
+try:
+    DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+except ValueError:
+    DB_CONN_MAX_AGE = 600
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if DB_POOL:
+        DATABASES['default'].update(
+            ENGINE='consulta.banco',
+            CONN_MAX_AGE=0,
+            POOL={
+                'MAXIMO': DB_POOL_MAXIMO,
+                'ESPERA': DB_POOL_ESPERA,
+                'VIDA_MAXIMA': DB_POOL_VIDA_MAXIMA,
+                'CHECAR_APOS': DB_POOL_CHECAR_APOS,
+            },
+        )
+    else:
+        # Health check do Django: testa a conexão persistente no início de cada requisição
+        DATABASES['default'].update(CONN_MAX_AGE=DB_CONN_MAX_AGE, CONN_HEALTH_CHECKS=True)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -138,6 +194,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CNPJá PRO API
 CNPJA_API_KEY = os.getenv('CNPJA_API_KEY')
+# Várias chaves contratadas (separadas por vírgula); sem ela, só CNPJA_API_KEY. Cada chave tem
+# o seu orçamento por minuto e o seu saldo de créditos (ver consulta/chaves.py)
+CNPJA_API_KEYS = [k.strip() for k in os.getenv('CNPJA_API_KEYS', '').split(',') if k.strip()] or (
+    [CNPJA_API_KEY] if CNPJA_API_KEY else []
+)
+# Tempo (s) fora de rotação de uma chave que recebeu 429 (ou o `ttl` informado, se maior) e 401/403
+try:
+    CNPJA_CHAVE_PAUSA_429 = int(os.getenv('CNPJA_CHAVE_PAUSA_429', '60'))
+except ValueError:
+    CNPJA_CHAVE_PAUSA_429 = 60
+try:
+    CNPJA_CHAVE_PAUSA_401 = int(os.getenv('CNPJA_CHAVE_PAUSA_401', '900'))
+except ValueError:
+    CNPJA_CHAVE_PAUSA_401 = 900
 CNPJA_BASE_URL = os.getenv('CNPJA_BASE_URL', 'https://api.cnpja.com')
 CNPJA_STRATEGY = os.getenv('CNPJA_STRATEGY', 'CACHE_IF_FRESH')
 CNPJA_FORCE_CACHE_FIRST = os.getenv('CNPJA_FORCE_CACHE_FIRST', 'True').lower() in ('1','true','yes')
@@ -149,6 +219,167 @@ try:
     CNPJA_MAX_STALE_DAYS = int(os.getenv('CNPJA_MAX_STALE_DAYS', '30'))
 except ValueError:
     CNPJA_MAX_STALE_DAYS = 30
+# Cache compartilhado do JSON por CNPJ (segundos) e max-age HTTP de /cnpj/<cnpj>/
+try:
+    CNPJ_CACHE_TTL = int(os.getenv('CNPJ_CACHE_TTL', '86400'))
+except ValueError:
+    CNPJ_CACHE_TTL = 86400
+try:
+    CNPJ_HTTP_MAX_AGE = int(os.getenv('CNPJ_HTTP_MAX_AGE', '300'))
+except ValueError:
+    CNPJ_HTTP_MAX_AGE = 300
+# Custo estimado (créditos) por consulta online; usado pelo planejador de jobs
+try:
+    CNPJA_CREDITOS_POR_CONSULTA = int(os.getenv('CNPJA_CREDITOS_POR_CONSULTA', '1'))
+except ValueError:
+    CNPJA_CREDITOS_POR_CONSULTA = 1
+
+# Rastreamento de créditos: intervalo de reconciliação com /credit (background) e
+# cabeçalho opcional da resposta de /office com o custo da consulta
+try:
+    CNPJA_CREDITOS_RECONCILIAR_SEGUNDOS = int(os.getenv('CNPJA_CREDITOS_RECONCILIAR_SEGUNDOS', '900'))
+except ValueError:
+    CNPJA_CREDITOS_RECONCILIAR_SEGUNDOS = 900
+CNPJA_CREDIT_COST_HEADER = os.getenv('CNPJA_CREDIT_COST_HEADER', '')
+
+# Busca por raiz (CNPJ básico): com ao menos N filiais da mesma empresa a consultar online,
+# uma pesquisa de estabelecimentos da raiz substitui as consultas individuais (0 = desligada);
+# páginas por raiz e custo estimado (créditos) por página
+try:
+    CNPJ_RAIZ_MIN_FILIAIS = int(os.getenv('CNPJ_RAIZ_MIN_FILIAIS', '3'))
+except ValueError:
+    CNPJ_RAIZ_MIN_FILIAIS = 3
+try:
+    CNPJ_RAIZ_MAX_PAGINAS = int(os.getenv('CNPJ_RAIZ_MAX_PAGINAS', '3'))
+except ValueError:
+    CNPJ_RAIZ_MAX_PAGINAS = 3
+try:
+    CNPJA_CREDITOS_POR_BUSCA = int(os.getenv('CNPJA_CREDITOS_POR_BUSCA', '1'))
+except ValueError:
+    CNPJA_CREDITOS_POR_BUSCA = 1
+
+# Planejamento de jobs: passada CACHE-only concorrente antes das consultas online
+try:
+    JOB_PLAN_MAX_WORKERS = int(os.getenv('JOB_PLAN_MAX_WORKERS', '8'))
+except ValueError:
+    JOB_PLAN_MAX_WORKERS = 8
+try:
+    JOB_PLAN_BATCH_SIZE = int(os.getenv('JOB_PLAN_BATCH_SIZE', '50'))
+except ValueError:
+    JOB_PLAN_BATCH_SIZE = 50
+
+# Checkpoint de jobs no banco a cada N itens processados (retomada após crash/deploy)
+try:
+    JOB_CHECKPOINT_EVERY = int(os.getenv('JOB_CHECKPOINT_EVERY', '10'))
+except ValueError:
+    JOB_CHECKPOINT_EVERY = 10
+# Resultados gravados como linhas (ConsultaResultado) junto de cada checkpoint; tamanho do lote do bulk_create
+try:
+    JOB_RESULTS_BATCH_SIZE = int(os.getenv('JOB_RESULTS_BATCH_SIZE', '500'))
+except ValueError:
+    JOB_RESULTS_BATCH_SIZE = 500
+
+# Pipeline de extração de colunas do JSON do CNPJÁ (consulta.extracao): caminhos pontuados
+# separados por vírgula; vazio = extratores padrão
+CNPJ_EXTRATORES = [c.strip() for c in os.getenv('CNPJ_EXTRATORES', '').split(',') if c.strip()] or [
+    'consulta.extracao.extrair_situacao',
+    'consulta.extracao.extrair_atividade',
+    'consulta.extracao.extrair_endereco',
+    'consulta.extracao.extrair_contatos',
+    'consulta.extracao.extrair_atualizacao',
+]
+
+# Retenção do histórico (comando `retencao_historico` e, se > 0, execução automática ao fim dos jobs):
+# execuções com mais de N dias são arquivadas em NDJSON gzip e apagadas (0 = manter tudo)
+try:
+    HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '0'))
+except ValueError:
+    HISTORY_RETENTION_DAYS = 0
+HISTORY_ARCHIVE_DIR = os.getenv('HISTORY_ARCHIVE_DIR', str(BASE_DIR / 'arquivo_historico'))
+try:
+    HISTORY_DELETE_BATCH_SIZE = int(os.getenv('HISTORY_DELETE_BATCH_SIZE', '1000'))
+except ValueError:
+    HISTORY_DELETE_BATCH_SIZE = 1000
+# Intervalo mínimo (s) entre execuções automáticas da retenção (0 = só pelo comando)
+try:
+    HISTORY_RETENTION_INTERVAL = int(os.getenv('HISTORY_RETENTION_INTERVAL', '86400'))
+except ValueError:
+    HISTORY_RETENTION_INTERVAL = 86400
+
+# Renovação em background (comando `atualizar_cnpjs`) de CNPJs do histórico cujo dado
+# no CNPJÁ está a menos de N dias de passar de CNPJA_MAX_AGE_DAYS
+try:
+    CNPJ_REFRESH_ANTECEDENCIA_DIAS = int(os.getenv('CNPJ_REFRESH_ANTECEDENCIA_DIAS', '5'))
+except ValueError:
+    CNPJ_REFRESH_ANTECEDENCIA_DIAS = 5
+try:
+    CNPJ_REFRESH_JANELA_DIAS = int(os.getenv('CNPJ_REFRESH_JANELA_DIAS', '90'))
+except ValueError:
+    CNPJ_REFRESH_JANELA_DIAS = 90
+# Fração máxima do limite por minuto da API usada pela renovação (0 = desligada) e peso do fluxo
+try:
+    CNPJ_REFRESH_FRACAO = float(os.getenv('CNPJ_REFRESH_FRACAO', '0.2'))
+except ValueError:
+    CNPJ_REFRESH_FRACAO = 0.2
+try:
+    CNPJ_REFRESH_PESO = int(os.getenv('CNPJ_REFRESH_PESO', '1'))
+except ValueError:
+    CNPJ_REFRESH_PESO = 1
+# Horário local fora do pico em que a renovação roda ('22-6'; vazio = qualquer hora)
+CNPJ_REFRESH_HORARIO = os.getenv('CNPJ_REFRESH_HORARIO', '22-6')
+try:
+    CNPJ_REFRESH_MAX_POR_EXECUCAO = int(os.getenv('CNPJ_REFRESH_MAX_POR_EXECUCAO', '500'))
+except ValueError:
+    CNPJ_REFRESH_MAX_POR_EXECUCAO = 500
+
+# Divisão justa do orçamento da API entre fluxos ativos (pesos) e limite de itens
+# para uma entrada manual ser tratada como interativa (prioridade sobre uploads)
+try:
+    RATE_LIMIT_PESO_INTERATIVO = int(os.getenv('RATE_LIMIT_PESO_INTERATIVO', '4'))
+except ValueError:
+    RATE_LIMIT_PESO_INTERATIVO = 4
+try:
+    RATE_LIMIT_PESO_LOTE = int(os.getenv('RATE_LIMIT_PESO_LOTE', '1'))
+except ValueError:
+    RATE_LIMIT_PESO_LOTE = 1
+try:
+    RATE_LIMIT_INTERATIVO_MAX_ITENS = int(os.getenv('RATE_LIMIT_INTERATIVO_MAX_ITENS', '50'))
+except ValueError:
+    RATE_LIMIT_INTERATIVO_MAX_ITENS = 50
+
+# Projeção do JSON do CNPJÁ guardado em sessão/banco (caminhos pontuados separados por
+# vírgula; '*' guarda o documento inteiro; vazio = consulta.projecao.CAMPOS_PADRAO) e
+# armazenamento frio do documento completo
+CNPJ_CAMPOS_ARMAZENADOS = [c.strip() for c in os.getenv('CNPJ_CAMPOS_ARMAZENADOS', '').split(',') if c.strip()] or None
+CNPJ_DOCUMENTO_BRUTO = os.getenv('CNPJ_DOCUMENTO_BRUTO', 'False').lower() in ('1','true','yes')
+
+# Base local da Receita Federal (comando `importar_receita`): consultas respondidas por ela
+# antes do CNPJÁ, caminhos que o documento local precisa ter (vazio = os armazenados) e
+# idade máxima (dias) da referência dos arquivos (0 = sem limite)
+CNPJ_BASE_LOCAL = os.getenv('CNPJ_BASE_LOCAL', 'False').lower() in ('1','true','yes')
+CNPJ_BASE_LOCAL_CAMPOS = [c.strip() for c in os.getenv('CNPJ_BASE_LOCAL_CAMPOS', '').split(',') if c.strip()] or None
+try:
+    CNPJ_BASE_LOCAL_MAX_DIAS = int(os.getenv('CNPJ_BASE_LOCAL_MAX_DIAS', '60'))
+except ValueError:
+    CNPJ_BASE_LOCAL_MAX_DIAS = 60
+
+# Lote da API (POST /api/lote/): máximo de itens por requisição e consultas online simultâneas
+try:
+    API_LOTE_MAX_ITENS = int(os.getenv('API_LOTE_MAX_ITENS', '1000'))
+except ValueError:
+    API_LOTE_MAX_ITENS = 1000
+try:
+    API_LOTE_WORKERS = int(os.getenv('API_LOTE_WORKERS', '4'))
+except ValueError:
+    API_LOTE_WORKERS = 4
+
+# Views assíncronas (ASGI) para jobs, créditos, detalhes e /cnpj/<cnpj>/, e tamanho do
+# pool de threads que executa as chamadas bloqueantes ao CNPJÁ fora do event loop
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'True').lower() in ('1','true','yes')
+try:
+    ASYNC_UPSTREAM_THREADS = int(os.getenv('ASYNC_UPSTREAM_THREADS', '64'))
+except ValueError:
+    ASYNC_UPSTREAM_THREADS = 64
 
 # DRF
 REST_FRAMEWORK = {
@@ -177,29 +408,40 @@ AXES_LOCKOUT_PARAMETERS = ['username', 'ip_address', 'user_agent']
 AXES_BEHIND_REVERSE_PROXY = False if RUN_LOCAL else (os.getenv('AXES_BEHIND_REVERSE_PROXY', 'False').lower() in ('1','true','yes'))
 AXES_REVERSE_PROXY_HEADER = os.getenv('AXES_REVERSE_PROXY_HEADER', 'HTTP_X_FORWARDED_FOR')
 
-# Cache (LocMem in local; Redis if REDIS_URL in prod)
-if RUN_LOCAL:
+# Implantação escalada (vários workers gunicorn e/ou dynos): cache, sessões e travas de
+# job precisam ser compartilhados entre processos. Ligada por SCALE_OUT ou WEB_CONCURRENCY > 1;
+# a app recusa subir se o cache não for compartilhado (consulta/checks.py).
+try:
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+except ValueError:
+    WEB_CONCURRENCY = 1
+SCALE_OUT = os.getenv('SCALE_OUT', 'False').lower() in ('1','true','yes') or WEB_CONCURRENCY > 1
+
+# Cache (LocMem in local; Redis if REDIS_URL in prod or in scaled mode)
+if os.getenv('REDIS_URL') and (not RUN_LOCAL or SCALE_OUT):
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            'LOCATION': 'consulta-cnpj-cache',
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
         }
     }
 else:
-    if os.getenv('REDIS_URL'):
-        CACHES = {
-            'default': {
-                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-                'LOCATION': os.getenv('REDIS_URL'),
-            }
-        }
-    else:
-        CACHES = {
-            'default': {
-                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-                'LOCATION': 'consulta-cnpj-cache',
-            }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'consulta-cnpj-cache',
         }
+    }
+
+# Sessões (estado dos jobs): no banco; em modo escalado, banco com cache compartilhado na frente
+SESSION_ENGINE = os.getenv('SESSION_ENGINE') or (
+    'django.contrib.sessions.backends.cached_db' if SCALE_OUT else 'django.contrib.sessions.backends.db'
+)
+# Tempo máximo (s) da trava distribuída de um passo/lote de job (deve cobrir delay + consulta)
+try:
+    JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', '120'))
+except ValueError:
+    JOB_LOCK_TIMEOUT = 120
 
 # Auth URLs
 LOGIN_URL = 'login'
@@ -208,6 +450,8 @@ LOGOUT_REDIRECT_URL = 'login'
 
 # HTTPS & Security
 SECURE_SSL_REDIRECT = False if RUN_LOCAL else (os.getenv('SECURE_SSL_REDIRECT', 'True').lower() in ('1','true','yes'))
+# Health check da plataforma pode vir por HTTP interno
+SECURE_REDIRECT_EXEMPT = [r'^saude/$']
 # Cookies seguros: em dev (DEBUG=True) desabilita para evitar problemas em HTTP local
 if DEBUG:
     SESSION_COOKIE_SECURE = False
@@ -235,3 +479,44 @@ ALLOWED_UPLOAD_MIME_TYPES = [
     'application/vnd.ms-excel',
     'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
 ]
+
+# Logging estruturado da app (consulta.logs): fila não bloqueante até stdout, nível por
+# categoria (LOG_LEVELS="consulta.upload=DEBUG,consulta.api=WARNING") e amostragem das
+# linhas por item em DEBUG (1 a cada LOG_AMOSTRAGEM)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'texto').lower()
+try:
+    LOG_AMOSTRAGEM = int(os.getenv('LOG_AMOSTRAGEM', '100'))
+except ValueError:
+    LOG_AMOSTRAGEM = 100
+try:
+    LOG_FILA_TAMANHO = int(os.getenv('LOG_FILA_TAMANHO', '10000'))
+except ValueError:
+    LOG_FILA_TAMANHO = 10000
+LOG_LEVELS = {}
+for _par in os.getenv('LOG_LEVELS', '').split(','):
+    _categoria, _, _nivel = _par.partition('=')
+    if _categoria.strip() and _nivel.strip():
+        LOG_LEVELS[_categoria.strip()] = _nivel.strip().upper()
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'amostragem': {'()': 'consulta.logs.FiltroAmostragem', 'taxa': LOG_AMOSTRAGEM},
+    },
+    'formatters': {
+        'estruturado': {'()': 'consulta.logs.FormatadorEstruturado', 'como_json': LOG_FORMAT == 'json'},
+    },
+    'handlers': {
+        'fila': {
+            'class': 'consulta.logs.FilaHandler',
+            'tamanho': LOG_FILA_TAMANHO,
+            'formatter': 'estruturado',
+            'filters': ['amostragem'],
+        },
+    },
+    'loggers': {
+        'consulta': {'handlers': ['fila'], 'level': LOG_LEVEL, 'propagate': False},
+        **{categoria: {'level': nivel} for categoria, nivel in LOG_LEVELS.items()},
+    },
+}